@@ -0,0 +1,83 @@
+"""
+Benchmark of the refresh of each southbound driver against the local device stand-ins: the drivers talk to the
+stand-ins through their real protocols (SSH, RESTCONF, XML gateway, RouterOS and pfSense REST APIs), with the size and
+latency given on the command line.
+
+usage: python -m benchmarks.bench_drivers [--kinds K ...] [--ports N] [--vlans N] [--latency S] [--number N]
+"""
+import argparse
+import time
+from importlib import import_module
+from typing import Dict, List
+
+from benchmarks.standins import DeviceProfile, STANDIN_KINDS, start_standin
+
+# stand-in kind -> driver module and class
+_drivers = {
+    'hp_comware': ('switch.hp_comware', 'HpComware'),
+    'mellanox': ('switch.mellanox', 'Mellanox'),
+    'microtik': ('switch.microtik', 'Microtik'),
+    'sonic': ('switch.sonic', 'Sonic'),
+    'sonic_new': ('switch.sonic_new', 'SonicNew'),
+    'pfsense': ('firewall.pfsense', 'PfSense')
+}
+
+
+def _not_supported(self, *args, **kwargs):
+    raise NotImplementedError('not supported by the driver')
+
+
+def get_driver_class(kind: str) -> type:
+    # some drivers do not implement all the abstract operations (e.g. static routes): they are filled with methods
+    # raising NotImplementedError, so that the refresh can be measured anyway
+    module, class_name = _drivers[kind]
+    driver_class = getattr(import_module(module), class_name)
+    missing = getattr(driver_class, '__abstractmethods__', None)
+    if missing:
+        driver_class = type(class_name, (driver_class,), {name: _not_supported for name in missing})
+    return driver_class
+
+
+def bench_driver(kind: str, profile: DeviceProfile, number: int) -> Dict[str, float]:
+    standin = start_standin(kind, profile)
+    try:
+        driver_class = get_driver_class(kind)
+        if standin.status:
+            driver_class.ports_status_port = standin.status.server_address[1]
+        # the driver is built and refreshed directly, without the persistence layer
+        driver = driver_class(**dict(standin.device(), state='init'))
+        start = time.perf_counter()
+        driver._reinit_sbi_drivers()
+        connect = time.perf_counter() - start
+        durations = []
+        for _ in range(number):
+            start = time.perf_counter()
+            driver.update_info()
+            durations.append(time.perf_counter() - start)
+        return {'connect': connect, 'refresh_min': min(durations), 'refresh_avg': sum(durations) / len(durations),
+                'requests_per_refresh': (standin.requests() / number) if number else 0}
+    finally:
+        standin.stop()
+
+
+def run(kinds: List[str], profile: DeviceProfile, number: int) -> None:
+    print('{:<12} {:>10} {:>12} {:>12} {:>10}'.format('driver', 'connect', 'refresh min', 'refresh avg', 'requests'))
+    for kind in kinds:
+        res = bench_driver(kind, profile, number)
+        print('{:<12} {:>9.3f}s {:>11.3f}s {:>11.3f}s {:>10.1f}'.format(
+            kind, res['connect'], res['refresh_min'], res['refresh_avg'], res['requests_per_refresh']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='southbound driver refresh benchmark against the device stand-ins')
+    parser.add_argument('--kinds', nargs='+', choices=list(STANDIN_KINDS), default=list(STANDIN_KINDS))
+    parser.add_argument('--ports', type=int, default=48)
+    parser.add_argument('--vlans', type=int, default=64)
+    parser.add_argument('--vlans-per-port', type=int, default=8)
+    parser.add_argument('--vrfs', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--number', type=int, default=5)
+    args = parser.parse_args()
+    run(args.kinds, DeviceProfile(ports=args.ports, vlans=args.vlans, vlans_per_port=args.vlans_per_port,
+                                  vrfs=args.vrfs, latency=args.latency, jitter=args.jitter), args.number)
@@ -0,0 +1,85 @@
+"""
+Controller scale benchmark on a simulated leaf/spine fabric of "sim" switches: onboarding of the switches, graph
+build, vlan termination data, vlan overlays and throughput of port vlan operations, without any device.
+
+usage: python -m benchmarks.bench_fabric [--leaves N] [--spines N] [--server-ports N] [--vlans N] [--operations N]
+                                         [--latency S] [--failure-rate P]
+"""
+import argparse
+import random
+import time
+
+from switch.sim import SimSwitch, make_sim_fabric, clear_sim_devices
+from switch.switch_base import SwitchConfigurationException
+
+
+def _timed(label: str, func):
+    start = time.perf_counter()
+    res = func()
+    print('{:<28}{:>10.3f}s'.format(label, time.perf_counter() - start))
+    return res
+
+
+def run(leaves: int, spines: int, server_ports: int, vlans: int, vlans_per_port: int, operations: int,
+        latency: float, failure_rate: float) -> None:
+    from network.network import Network
+    from network.network_base import ManagedSwitches
+
+    clear_sim_devices()
+    devices = _timed('fabric generation', lambda: make_sim_fabric(
+        leaves=leaves, spines=spines, server_ports=server_ports, vlans=vlans, vlans_per_port=vlans_per_port,
+        latency=latency))
+
+    def onboard():
+        res = []
+        for device in devices:
+            switch = SimSwitch(**dict(device), state='ready')
+            switch._reinit_sbi_drivers()
+            switch.update_info()
+            res.append(switch)
+        return res
+
+    switches = _timed('onboarding ({} switches)'.format(len(devices)), onboard)
+    # the network is built directly on the simulated switches, without loading them from the database
+    net = Network.model_construct(switches=ManagedSwitches(root=switches))
+    _timed('build_graph', net.build_graph)
+    _timed('build_vlan_data', net.build_vlan_data)
+    _timed('vlan overlays ({})'.format(vlans), lambda: [net.get_vlan_overlay(vid) for vid in range(2, vlans + 2)])
+
+    leaf_switches = [item for item in switches if item.name.startswith('leaf')]
+    for switch in leaf_switches:
+        switch._device.failure_rate = failure_rate
+    random.seed(0)
+    failures = 0
+    start = time.perf_counter()
+    for i in range(operations):
+        switch = random.choice(leaf_switches)
+        port = switch.phy_ports[spines + random.randrange(server_ports)]
+        vid = 2 + random.randrange(vlans)
+        try:
+            if vid in port.trunk_vlans:
+                switch.del_vlan_to_port([vid], port.name)
+            else:
+                switch.add_vlans_to_port([vid], port.name)
+        except SwitchConfigurationException:
+            failures += 1
+        net.update_vlan_data([switch.name])
+        net.invalidate_overlays()
+    elapsed = time.perf_counter() - start
+    print('{:<28}{:>10.1f}/s ({} operations, {} failed)'.format(
+        'port vlan operations', operations / elapsed if elapsed else 0, operations, failures))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='controller scale benchmark on a simulated fabric')
+    parser.add_argument('--leaves', type=int, default=998)
+    parser.add_argument('--spines', type=int, default=2)
+    parser.add_argument('--server-ports', type=int, default=46)
+    parser.add_argument('--vlans', type=int, default=256)
+    parser.add_argument('--vlans-per-port', type=int, default=8)
+    parser.add_argument('--operations', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    run(args.leaves, args.spines, args.server_ports, args.vlans, args.vlans_per_port, args.operations, args.latency,
+        args.failure_rate)
@@ -0,0 +1,63 @@
+"""
+Microbenchmarks for the indexed switch lookups, compared with the former linear scans.
+
+usage: python -m benchmarks.bench_lookups [--ports N] [--vrfs N] [--vlan-interfaces N] [--number N]
+"""
+import argparse
+import random
+import timeit
+
+from benchmarks.synthetic import make_switch
+
+
+def _scan_port_by_name(switch, name):
+    return next((item for item in switch.phy_ports if item.name == name), None)
+
+
+def _scan_vrf_by_name(switch, name):
+    return next((item for item in switch.vrfs if item.name == name), None)
+
+
+def _scan_vrf_by_rd(switch, rd):
+    return next((item for item in switch.vrfs if item.rd == rd), None)
+
+
+def _scan_vlaninterface_from_vid(switch, vid):
+    return next((item for item in switch.vlan_l3_ports if item.vlan == vid), None)
+
+
+def run(ports: int, vrfs: int, vlan_interfaces: int, number: int) -> None:
+    switch = make_switch('bench-switch', n_ports=ports, n_vrfs=vrfs, n_vlan_interfaces=vlan_interfaces)
+    port_names = [item.name for item in switch.phy_ports]
+    vrf_names = [item.name for item in switch.vrfs]
+    vrf_rds = [item.rd for item in switch.vrfs]
+    vids = [item.vlan for item in switch.vlan_l3_ports]
+    random.seed(0)
+
+    cases = [
+        ('port by name', port_names, switch.get_port_by_name, lambda k: _scan_port_by_name(switch, k)),
+        ('vrf by name', vrf_names, switch.get_vrf_by_name, lambda k: _scan_vrf_by_name(switch, k)),
+        ('vrf by rd', vrf_rds, switch.get_vrf_by_rd, lambda k: _scan_vrf_by_rd(switch, k)),
+        ('vlan interface by vid', vids, switch.get_vlaninterface_from_vid,
+         lambda k: _scan_vlaninterface_from_vid(switch, k)),
+    ]
+
+    print('{:<24}{:>10}{:>16}{:>16}{:>10}'.format('lookup', 'items', 'scan (us)', 'index (us)', 'speedup'))
+    for label, keys, indexed, scan in cases:
+        if not keys:
+            continue
+        sample = [random.choice(keys) for _ in range(number)]
+        scan_time = timeit.timeit(lambda: [scan(k) for k in sample], number=1) / number * 1e6
+        index_time = timeit.timeit(lambda: [indexed(k) for k in sample], number=1) / number * 1e6
+        print('{:<24}{:>10}{:>16.3f}{:>16.3f}{:>9.1f}x'.format(
+            label, len(keys), scan_time, index_time, scan_time / index_time if index_time else 0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='switch lookup microbenchmarks')
+    parser.add_argument('--ports', type=int, default=256)
+    parser.add_argument('--vrfs', type=int, default=128)
+    parser.add_argument('--vlan-interfaces', type=int, default=1024)
+    parser.add_argument('--number', type=int, default=10000)
+    args = parser.parse_args()
+    run(args.ports, args.vrfs, args.vlan_interfaces, args.number)
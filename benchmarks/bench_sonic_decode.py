@@ -0,0 +1,122 @@
+"""
+Benchmark of the SONiC RESTCONF payload decoding: validation through the generated YANG models followed by the
+dump/reload used to build the configuration, compared with the lightweight decoding into compact records.
+
+usage: python -m benchmarks.bench_sonic_decode [--ports N] [--vlans N] [--vlans-per-port N] [--number N]
+"""
+import argparse
+import json
+import timeit
+from typing import Dict
+
+from switch.sonic_decoding import decode_ports, decode_portchannel_members, decode_vlans, decode_vlan_interfaces, \
+    decode_vrfs, decode_lldp, PORT_KEY, PORTCHANNEL_KEY, VLAN_KEY, VLAN_INTERFACE_KEY, VRF_KEY, LLDP_KEY
+from switch.sonic_portchannel_model import SonicPortchannelSonicPortchannel
+from switch.sonic_port_model import SonicPortSonicPort
+from switch.sonic_vlan_model import SonicVlanSonicVlan
+from switch.sonic_vlan_itf_model import SonicVlanInterfaceSonicVlanInterface
+from switch.sonic_vrf_model import SonicVrfSonicVrf
+from switch.sonic_lldp_model import SonicLLDPMsg
+
+
+def make_dump(ports: int, vlans: int, vlans_per_port: int, vrfs: int = 16) -> Dict[str, bytes]:
+    # raw RESTCONF bodies of a synthetic switch, keyed as the SonicNew fetch tasks
+    port_names = ['Ethernet{}'.format(4 * i) for i in range(ports)]
+    vlan_interfaces = vlans // 8
+    data = {
+        'port': {PORT_KEY: {'PORT': {'PORT_LIST': [{
+            'ifname': name, 'index': i + 1, 'alias': 'etp{}'.format(i + 1), 'lanes': ','.join(
+                str(4 * i + k) for k in range(4)), 'speed': 100000, 'mtu': 9100, 'admin_status': 'up',
+            'description': 'port {}'.format(name)} for i, name in enumerate(port_names)]}}},
+        'portchannel': {PORTCHANNEL_KEY: {
+            'PORTCHANNEL': {'PORTCHANNEL_LIST': [{'name': 'PortChannel1', 'admin_status': 'up', 'mtu': 9100}]},
+            'PORTCHANNEL_MEMBER': {'PORTCHANNEL_MEMBER_LIST': [
+                {'name': 'PortChannel1', 'ifname': name} for name in port_names[-2:]]}}},
+        'vlan': {VLAN_KEY: {
+            'VLAN': {'VLAN_LIST': [{'name': 'Vlan{}'.format(vid), 'vlanid': vid, 'mtu': 9100, 'admin_status': 'up'}
+                                   for vid in range(2, vlans + 2)]},
+            'VLAN_MEMBER': {'VLAN_MEMBER_LIST': [
+                {'name': 'Vlan{}'.format(2 + (i * vlans_per_port + k) % vlans), 'ifname': name,
+                 'tagging_mode': 'tagged'} for i, name in enumerate(port_names[:-2]) for k in range(vlans_per_port)
+            ]}}},
+        'vlan_interface': {VLAN_INTERFACE_KEY: {'VLAN_INTERFACE': {
+            'VLAN_INTERFACE_LIST': [{'vlanName': 'Vlan{}'.format(vid), 'vrf_name': 'Vrf{}'.format(vid % vrfs)}
+                                    for vid in range(2, vlan_interfaces + 2)],
+            'VLAN_INTERFACE_IPADDR_LIST': [{'vlanName': 'Vlan{}'.format(vid), 'ip_prefix': '10.{}.{}.1/24'.format(
+                vid // 256, vid % 256)} for vid in range(2, vlan_interfaces + 2)]}}},
+        'vrf': {VRF_KEY: {'VRF': {'VRF_LIST': [{'vrf_name': 'Vrf{}'.format(i), 'vni': 1000 + i}
+                                               for i in range(vrfs)]}}},
+        'lldp': {LLDP_KEY: {'interface': [{'name': name, 'neighbors': {'neighbor': [{'id': name, 'state': {
+            'port-description': 'eth0', 'port-id': '94:6d:ae:ac:1c:{:02x}'.format(i % 256),
+            'port-id-type': 'MAC_ADDRESS', 'system-name': 'server{}'.format(i)}}]}}
+            for i, name in enumerate(port_names)]}}
+    }
+    return {key: json.dumps(value).encode() for key, value in data.items()}
+
+
+def decode_models(dump: Dict[str, bytes]) -> None:
+    # former path: validate through the generated models and dump them back into plain dicts for the configuration
+    portchannel = SonicPortchannelSonicPortchannel.model_validate_json(dump['portchannel'])
+    members = {item.ifname: item.name for item in
+               portchannel.sonic_portchannel_sonic_portchannel.PORTCHANNEL_MEMBER.PORTCHANNEL_MEMBER_LIST}
+    port = SonicPortSonicPort.model_validate_json(dump['port'])
+    ports = [(members.get(item.ifname, item.ifname), item.index) for item in port.sonic_port_sonic_port.PORT.PORT_LIST]
+    vlan = SonicVlanSonicVlan.model_validate_json(dump['vlan'])
+    vlan_list = [(item.name, item.vlanid) for item in vlan.sonic_vlan_sonic_vlan.VLAN.VLAN_LIST]
+    vlan_members = [(item.name, item.ifname, item.tagging_mode) for item in
+                    vlan.sonic_vlan_sonic_vlan.VLAN_MEMBER.VLAN_MEMBER_LIST]
+    vlan_itf = SonicVlanInterfaceSonicVlanInterface.model_validate_json(dump['vlan_interface'])
+    vlan_itf_list = vlan_itf.sonic_vlan_interface_sonic_vlan_interface.VLAN_INTERFACE
+    vlan_l3 = [(item.vlanName, item.vrf_name) for item in vlan_itf_list.VLAN_INTERFACE_LIST]
+    vlan_ip = [(item.vlanName, item.ip_prefix) for item in vlan_itf_list.VLAN_INTERFACE_IPADDR_LIST]
+    vrf = SonicVrfSonicVrf.model_validate_json(dump['vrf'])
+    vrfs = [(item.vrf_name, item.vni) for item in vrf.sonic_vrf_sonic_vrf.VRF.VRF_LIST]
+    lldp = SonicLLDPMsg.model_validate_json(dump['lldp'])
+    neighbors = [(item.name, item.neighbors.neighbor[0].state.system_name) for item in
+                 lldp.openconfig_lldp_interfaces.interface]
+    cfg = json.loads(portchannel.sonic_portchannel_sonic_portchannel.model_dump_json(by_alias=True))
+    cfg.update(json.loads(port.sonic_port_sonic_port.model_dump_json(by_alias=True)))
+    cfg.update(json.loads(vlan.sonic_vlan_sonic_vlan.model_dump_json(by_alias=True)))
+    cfg.update(json.loads(vlan_itf.sonic_vlan_interface_sonic_vlan_interface.model_dump_json(by_alias=True)))
+    cfg.update(json.loads(vrf.model_dump_json(by_alias=True)))
+
+
+def decode_fast(dump: Dict[str, bytes]) -> None:
+    portchannel = json.loads(dump['portchannel'])
+    members = decode_portchannel_members(portchannel)
+    port = json.loads(dump['port'])
+    ports = [(members.get(item.ifname, item.ifname), item.index) for item in decode_ports(port)]
+    vlan = json.loads(dump['vlan'])
+    vlan_list, vlan_members = decode_vlans(vlan)
+    vlan_itf = json.loads(dump['vlan_interface'])
+    vlan_l3, vlan_ip = decode_vlan_interfaces(vlan_itf)
+    vrf = json.loads(dump['vrf'])
+    vrfs = decode_vrfs(vrf)
+    neighbors = decode_lldp(json.loads(dump['lldp']))
+    cfg = dict(portchannel[PORTCHANNEL_KEY])
+    cfg.update(port[PORT_KEY])
+    cfg.update(vlan[VLAN_KEY])
+    cfg.update(vlan_itf[VLAN_INTERFACE_KEY])
+    cfg.update(vrf)
+
+
+def run(ports: int, vlans: int, vlans_per_port: int, number: int) -> None:
+    dump = make_dump(ports, vlans, vlans_per_port)
+    print('synthetic dump: {} ports, {} vlans, {} vlans per port, {} KiB'.format(
+        ports, vlans, vlans_per_port, sum(len(item) for item in dump.values()) // 1024))
+    print('{:<28}{:>14}'.format('decoder', 'ms per dump'))
+    results = {}
+    for label, func in [('generated models', decode_models), ('compact records', decode_fast)]:
+        results[label] = min(timeit.repeat(lambda: func(dump), number=number, repeat=3)) / number
+        print('{:<28}{:>14.3f}'.format(label, results[label] * 1000))
+    print('speedup: {:.1f}x'.format(results['generated models'] / results['compact records']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ports', type=int, default=128)
+    parser.add_argument('--vlans', type=int, default=512)
+    parser.add_argument('--vlans-per-port', type=int, default=32)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+    run(args.ports, args.vlans, args.vlans_per_port, args.number)
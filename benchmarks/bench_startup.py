@@ -0,0 +1,84 @@
+"""
+Startup benchmark of the controller: import time of the application module, measured in fresh interpreters, with the
+slowest modules reported by "python -X importtime", and time until the server answers on /health/live. The network
+worker initialization runs in background and is not waited for (a MongoDB is not needed).
+
+usage: python -m benchmarks.bench_startup [--module M] [--rounds N] [--top N] [--no-server]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import requests
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_time(module: str) -> Tuple[float, Dict[str, int]]:
+    # wall time of the import in a new interpreter, and cumulative import time (us) of every module
+    res = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'import time; start = time.perf_counter(); import {}; print(time.perf_counter() - start)'.format(module)],
+        cwd=_root, capture_output=True, text=True, check=True)
+    cumulative = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = [item.strip() for item in line.split(':', 1)[1].split('|')]
+        cumulative[name] = int(cumulative_us)
+    return float(res.stdout.strip().splitlines()[-1]), cumulative
+
+
+def time_to_live(module: str, timeout: float = 60.0) -> float:
+    # from the launch of uvicorn to the first successful answer of the liveness endpoint
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', '{}:app'.format(module), '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'warning'], cwd=_root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if requests.get('http://127.0.0.1:{}/health/live'.format(port), timeout=1).ok:
+                    return time.perf_counter() - start
+            except requests.ConnectionError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError('server terminated with code {}'.format(process.returncode))
+            time.sleep(0.02)
+        raise RuntimeError('server not live after {}s'.format(timeout))
+    finally:
+        process.kill()
+        process.wait()
+
+
+def run(module: str, rounds: int, top: int, with_server: bool) -> None:
+    durations: List[float] = []
+    cumulative: Dict[str, int] = {}
+    for _ in range(rounds):
+        duration, cumulative = import_time(module)
+        durations.append(duration)
+    print('{:<28}min {:>8.3f}s  median {:>8.3f}s'.format(
+        'import {}'.format(module), min(durations), statistics.median(durations)))
+    print('slowest modules (cumulative, last round):')
+    for name, value in sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print('    {:<48}{:>8.3f}s'.format(name, value / 1e6))
+    if with_server:
+        print('{:<28}{:>12.3f}s'.format('time to /health/live', time_to_live(module)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='startup benchmark of the controller')
+    parser.add_argument('--module', default='main')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--no-server', action='store_true', help='skip the time to the liveness endpoint')
+    args = parser.parse_args()
+    run(args.module, args.rounds, args.top, not args.no_server)
@@ -0,0 +1,383 @@
+"""
+End-to-end benchmark suite of the controller: graph and overlays, vlan data, network state allocation, switch diff,
+configuration parsing, data model construction and serialization, and latency of the REST endpoints under concurrent
+load. Every case runs on each of the selected fabric sizes, built from simulated switches, and the timings are written
+as JSON, so that the results of two commits can be compared with --compare.
+
+The network cases run on a network built directly on the simulated switches: no MongoDB and no device is needed.
+
+usage: python -m benchmarks.run [--sizes S ...] [--cases C ...] [--repeat N] [--output FILE] [--compare FILE]
+                                [--concurrency N] [--requests N] [--keep-logging]
+"""
+import argparse
+import datetime
+import json
+import logging
+import platform
+import socket
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ipaddress import IPv4Network
+from typing import Any, Callable, Dict, List, Tuple
+
+import requests
+import textfsm
+from ntc_templates.parse import parse_output
+
+from benchmarks.bench_drivers import get_driver_class
+from benchmarks.standins import DeviceProfile
+from benchmarks.standins.comware import render_config, render_interface_brief, render_lldp
+from benchmarks.standins.frr import render_frr_config
+from benchmarks.synthetic import make_switch
+from models import ConfigItem, SwitchDataModel
+from sbi.frr_vtysh import FrrConfig
+from switch.sim import SimSwitch, make_sim_fabric, clear_sim_devices
+
+# fabric sizes: the leaf/spine fabric of simulated switches used by the network cases, and the size of the single
+# switch used by the data model and parsing cases
+SIZES = {
+    'small': {'leaves': 8, 'spines': 2, 'server_ports': 22, 'vlans': 64, 'vlans_per_port': 8, 'vrfs': 4,
+              'vlan_interfaces': 16, 'ports': 48, 'switch_vrfs': 8, 'switch_vlan_interfaces': 64},
+    'medium': {'leaves': 64, 'spines': 2, 'server_ports': 46, 'vlans': 256, 'vlans_per_port': 8, 'vrfs': 16,
+               'vlan_interfaces': 64, 'ports': 128, 'switch_vrfs': 32, 'switch_vlan_interfaces': 256},
+    'large': {'leaves': 256, 'spines': 4, 'server_ports': 46, 'vlans': 1024, 'vlans_per_port': 16, 'vrfs': 64,
+              'vlan_interfaces': 256, 'ports': 256, 'switch_vrfs': 64, 'switch_vlan_interfaces': 1024}
+}
+# vlans whose overlay is computed by the overlay case
+_overlay_sample = 64
+_rest_endpoints = ['/v1/api/device/leaf0', '/v1/api/device/spine0', '/v1/api/network/vrf',
+                   '/v1/api/network/topology/', '/v1/api/network/topology/vlan/2']
+
+# a case returns the setup, run untimed before each round, and the measured body
+Measurement = Tuple[Callable[[], Any], Callable[[], Any]]
+
+
+class CaseSkipped(Exception):
+    pass
+
+
+class Fabric:
+    # everything built once per size and shared by the cases
+    def __init__(self, name: str, params: Dict[str, int]):
+        self.name = name
+        self.params = params
+        self._switches = None
+        self._network = None
+
+    def switches(self) -> List[SimSwitch]:
+        if self._switches is None:
+            clear_sim_devices()
+            devices = make_sim_fabric(
+                leaves=self.params['leaves'], spines=self.params['spines'], server_ports=self.params['server_ports'],
+                vlans=self.params['vlans'], vlans_per_port=self.params['vlans_per_port'], vrfs=self.params['vrfs'],
+                vlan_interfaces=self.params['vlan_interfaces'])
+            self._switches = []
+            for device in devices:
+                switch = SimSwitch(**dict(device), state='ready')
+                switch._reinit_sbi_drivers()
+                switch.update_info()
+                self._switches.append(switch)
+        return self._switches
+
+    def network(self):
+        # the network is built directly on the simulated switches, without loading them from the database
+        if self._network is None:
+            network_classes = _import_network()
+            self._network = network_classes['Network'].model_construct(
+                switches=network_classes['ManagedSwitches'](root=self.switches()))
+            self._network.build_graph()
+            self._network.build_vlan_data()
+        return self._network
+
+    def profile(self) -> DeviceProfile:
+        return DeviceProfile(name=self.name, ports=self.params['ports'], vlans=self.params['switch_vlan_interfaces'],
+                             vlans_per_port=self.params['vlans_per_port'], vrfs=self.params['switch_vrfs'])
+
+    def big_switch(self, name: str = 'bench-switch'):
+        return make_switch(name, n_ports=self.params['ports'], n_vrfs=self.params['switch_vrfs'],
+                           n_vlan_interfaces=self.params['switch_vlan_interfaces'])
+
+
+def _import_network() -> Dict[str, Any]:
+    from network.network import Network
+    from network.network_base import ManagedSwitches
+    from network.network_models import NetworkConfig, NetworkState, VlanTerminationList
+    return {'Network': Network, 'ManagedSwitches': ManagedSwitches, 'NetworkConfig': NetworkConfig,
+            'NetworkState': NetworkState, 'VlanTerminationList': VlanTerminationList}
+
+
+def case_build_graph(fabric: Fabric) -> Measurement:
+    network_classes = _import_network()
+    switches = fabric.switches()
+    net = network_classes['Network'].model_construct(switches=network_classes['ManagedSwitches'](root=switches))
+    return lambda: None, net.build_graph
+
+
+def case_vlan_overlay(fabric: Fabric) -> Measurement:
+    net = fabric.network()
+    vlan_ids = list(range(2, fabric.params['vlans'] + 2))[:_overlay_sample]
+    return net.invalidate_overlays, lambda: [net.get_vlan_overlay(vid) for vid in vlan_ids]
+
+
+def case_l3_overlay(fabric: Fabric) -> Measurement:
+    net = fabric.network()
+    return net.invalidate_overlays, lambda: net.get_l3_overlay_topology('vrf0')
+
+
+def case_build_vlan_data(fabric: Fabric) -> Measurement:
+    network_classes = _import_network()
+    net = fabric.network()
+
+    def setup():
+        net.vlan_terminations = network_classes['VlanTerminationList']()
+        net.invalidate_overlays()
+    return setup, net.build_vlan_data
+
+
+def case_network_state(fabric: Fabric) -> Measurement:
+    # as in Network.build_network_state: pools from the configuration minus the items used by the switches, then a
+    # burst of reservations and the serialized status, without the database write
+    network_classes = _import_network()
+    config = network_classes['NetworkConfig'](
+        vrf_switch_name='spine0',
+        vrf_uplink_vlans=list(range(2000, 3000)),
+        vrf_uplink_ip_pool=list(IPv4Network('10.128.0.0/16').subnets(new_prefix=30)),
+        pnf_vlans_pool=list(range(3000, 4000)),
+        pnf_merging_vrf_name='vrf0',
+        pnf_ip_pool=list(IPv4Network('10.129.0.0/16').subnets(new_prefix=30))
+    )
+    switches = fabric.switches()
+    reservations = fabric.params['leaves']
+
+    def body():
+        state = network_classes['NetworkState'].from_config(config)
+        for switch in switches:
+            for vid in switch.vlans:
+                state.remove_used_vid(vid)
+            for vlan_itf in switch.vlan_l3_ports:
+                if vlan_itf.cidr:
+                    state.remove_used_subnet(IPv4Network(vlan_itf.cidr, strict=False))
+        for _ in range(reservations):
+            state.reserve_uplink()
+            state.get_and_reserve_pnf_vlan()
+            state.get_and_reserve_pnf_subnet()
+        json.loads(state.model_dump_json())
+    return lambda: None, body
+
+
+def case_switch_diff(fabric: Fabric) -> Measurement:
+    first = fabric.big_switch()
+    second = first.model_copy(deep=True)
+    # about a tenth of the ports changed, a few vlan interfaces and vrfs removed
+    for port in second.phy_ports[::10]:
+        port.trunk_vlans = port.trunk_vlans + [4000]
+    second.vlan_l3_ports = second.vlan_l3_ports[:-8]
+    second.vrfs = second.vrfs[:-2]
+    return lambda: None, lambda: first.get_diff(second)
+
+
+def case_comware_parsing(fabric: Fabric) -> Measurement:
+    # textfsm parsing of the running configuration and of the bgp sections, as done at each refresh
+    profile = fabric.profile()
+    switch = get_driver_class('hp_comware')(name=fabric.name, model='hp_comware', user=profile.user,
+                                            passwd=profile.passwd, address='127.0.0.1', state='init')
+    config = render_config(profile)
+
+    def setup():
+        switch.phy_ports = []
+        switch.vlan_l3_ports = []
+        switch.vrfs = []
+        switch.vlans = []
+        switch.last_config = ConfigItem(time=datetime.datetime.now(), config=config)
+    return setup, switch.parse_config
+
+
+def case_frr_parsing(fabric: Fabric) -> Measurement:
+    profile = fabric.profile()
+    config = render_frr_config(profile, ['default'] + profile.vrf_names())
+    return lambda: None, lambda: FrrConfig.from_raw_config(config)
+
+
+def case_textfsm_parsing(fabric: Fabric) -> Measurement:
+    # command outputs parsed with the repository template and with the ntc-templates used by netmiko
+    profile = fabric.profile()
+    interfaces = render_interface_brief(profile)
+    lldp = render_lldp(profile)
+
+    def body():
+        with open('fsm_templates/hp_comware_interface_template') as template:
+            textfsm.TextFSM(template).ParseText(interfaces)
+        parse_output(platform='hp_comware', command='display lldp neighbor-information list', data=lldp)
+    return lambda: None, body
+
+
+def case_model_construction(fabric: Fabric) -> Measurement:
+    data = json.loads(fabric.big_switch().to_switch_model().model_dump_json())
+    return lambda: None, lambda: SwitchDataModel.model_validate(data)
+
+
+def case_to_db_serialization(fabric: Fabric) -> Measurement:
+    # the document written by Switch.to_db, without the database round trip
+    switch = fabric.big_switch()
+    return lambda: None, lambda: json.loads(switch.to_switch_model().model_dump_json())
+
+
+CASES: Dict[str, Callable[[Fabric], Measurement]] = {
+    'build_graph': case_build_graph,
+    'get_vlan_overlay': case_vlan_overlay,
+    'get_l3_overlay_topology': case_l3_overlay,
+    'build_vlan_data': case_build_vlan_data,
+    'network_state': case_network_state,
+    'switch_diff': case_switch_diff,
+    'comware_parsing': case_comware_parsing,
+    'frr_parsing': case_frr_parsing,
+    'textfsm_parsing': case_textfsm_parsing,
+    'model_construction': case_model_construction,
+    'to_db_serialization': case_to_db_serialization
+}
+
+
+def _measure(measurement: Measurement, repeat: int) -> Dict[str, Any]:
+    setup, body = measurement
+    durations = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        body()
+        durations.append(time.perf_counter() - start)
+    return {'min': min(durations), 'median': statistics.median(durations), 'mean': statistics.mean(durations),
+            'rounds': repeat}
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def bench_rest(fabric: Fabric, concurrency: int, n_requests: int) -> List[Dict[str, Any]]:
+    # the API is served by uvicorn on a free local port, on the network of the simulated fabric
+    net = fabric.network()
+    import uvicorn
+    from main import create_app
+    from network import net_worker
+
+    # the worker is not started: the endpoints are served from the snapshot of the simulated network
+    app = create_app(start_network=False)
+    net_worker.net = net
+    net_worker.publish_snapshot()
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, name='bench_api', daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    results = []
+    try:
+        with requests.Session() as session:
+            for endpoint in _rest_endpoints:
+                url = 'http://127.0.0.1:{}{}'.format(port, endpoint)
+
+                def call(_):
+                    start = time.perf_counter()
+                    session.get(url).raise_for_status()
+                    return time.perf_counter() - start
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    latencies = list(executor.map(call, range(n_requests)))
+                elapsed = time.perf_counter() - start
+                results.append({'case': 'rest {}'.format(endpoint), 'size': fabric.name, 'concurrency': concurrency,
+                                'requests': n_requests, 'p50': _percentile(latencies, 0.5),
+                                'p95': _percentile(latencies, 0.95), 'max': max(latencies),
+                                'median': _percentile(latencies, 0.5), 'throughput': n_requests / elapsed})
+    finally:
+        server.should_exit = True
+        thread.join()
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _print_result(result: Dict[str, Any]) -> None:
+    if 'skipped' in result:
+        print('{:<44}{:<8}skipped: {}'.format(result['case'], result['size'], result['skipped']))
+    elif 'p95' in result:
+        print('{:<44}{:<8}p50 {:>9.4f}s  p95 {:>9.4f}s  {:>8.1f} req/s'.format(
+            result['case'], result['size'], result['p50'], result['p95'], result['throughput']))
+    else:
+        print('{:<44}{:<8}min {:>9.4f}s  median {:>9.4f}s'.format(
+            result['case'], result['size'], result['min'], result['median']))
+
+
+def run(sizes: List[str], cases: List[str], repeat: int, concurrency: int, n_requests: int,
+        with_rest: bool) -> Dict[str, Any]:
+    report = {'commit': _git_commit(), 'timestamp': datetime.datetime.now().isoformat(),
+              'python': platform.python_version(), 'platform': platform.platform(), 'repeat': repeat,
+              'sizes': {name: SIZES[name] for name in sizes}, 'results': []}
+    for size in sizes:
+        fabric = Fabric(size, SIZES[size])
+        for name in cases:
+            try:
+                result = dict(case=name, size=size, **_measure(CASES[name](fabric), repeat))
+            except CaseSkipped as e:
+                result = {'case': name, 'size': size, 'skipped': str(e)}
+            _print_result(result)
+            report['results'].append(result)
+        if with_rest:
+            try:
+                rest_results = bench_rest(fabric, concurrency, n_requests)
+            except CaseSkipped as e:
+                rest_results = [{'case': 'rest', 'size': size, 'skipped': str(e)}]
+            for result in rest_results:
+                _print_result(result)
+            report['results'] += rest_results
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    # ratio of the medians (latency for the REST cases): above 1 the current commit is slower
+    base_results = {(item['case'], item['size']): item for item in baseline['results'] if 'median' in item}
+    print('\ncomparison with commit {}'.format(baseline.get('commit')))
+    for item in report['results']:
+        base = base_results.get((item['case'], item['size']))
+        if 'median' not in item or not base:
+            continue
+        print('{:<44}{:<8}{:>9.4f}s -> {:>9.4f}s  x{:.2f}'.format(
+            item['case'], item['size'], base['median'], item['median'],
+            item['median'] / base['median'] if base['median'] else float('inf')))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='end-to-end benchmark suite of the controller')
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['small', 'medium'])
+    parser.add_argument('--cases', nargs='+', choices=list(CASES) + ['rest'], default=list(CASES) + ['rest'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--output', default=None, help='JSON file for the results')
+    parser.add_argument('--compare', default=None, help='JSON results of a previous run')
+    parser.add_argument('--keep-logging', action='store_true', help='keep the controller logs, which skew the timings')
+    args = parser.parse_args()
+
+    if not args.keep_logging:
+        logging.disable(logging.WARNING)
+    report = run(args.sizes, [name for name in args.cases if name != 'rest'], args.repeat, args.concurrency,
+                 args.requests, 'rest' in args.cases)
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump(report, stream, indent=2)
+    if args.compare:
+        with open(args.compare) as stream:
+            compare(report, json.load(stream))
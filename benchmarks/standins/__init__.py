@@ -0,0 +1,10 @@
+"""
+Protocol-level stand-ins of the managed devices, used to benchmark and regression-test the southbound drivers without
+hardware: SSH CLIs (Comware, Onyx, RouterOS, SONiC and pfSense shells), SONiC RESTCONF with the interface status
+service, the Mellanox XML gateway, the RouterOS REST API and the pfSense API. The size of the device and the latency
+of each request are set by a DeviceProfile.
+
+usage: python -m benchmarks.standins KIND [--ports N] [--vlans N] [--latency S] ...
+"""
+from .profile import DeviceProfile
+from .devices import Standin, STANDIN_KINDS, start_standin
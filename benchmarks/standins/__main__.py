@@ -0,0 +1,23 @@
+import argparse
+import time
+
+from .devices import STANDIN_KINDS, start_standin
+from .profile import DeviceProfile
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='run a device stand-in until interrupted')
+    parser.add_argument('kind', choices=list(STANDIN_KINDS))
+    parser.add_argument('--host', default='127.0.0.1')
+    for name, field in DeviceProfile.model_fields.items():
+        parser.add_argument('--{}'.format(name.replace('_', '-')), type=field.annotation, default=field.default)
+    args = parser.parse_args()
+    profile = DeviceProfile(**{name: getattr(args, name) for name in DeviceProfile.model_fields})
+    standin = start_standin(args.kind, profile, args.host)
+    print(standin.device().model_dump_json(exclude={'passwd'}))
+    if standin.status:
+        print('interface status service on port {}'.format(standin.status.server_address[1]))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        standin.stop()
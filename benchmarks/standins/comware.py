@@ -0,0 +1,128 @@
+from typing import List
+
+from .profile import DeviceProfile
+from .ssh_server import CliPersonality
+
+
+def _format_vlan_list(vlan_ids: List[int]) -> str:
+    # Comware vlan list, with "to" ranges
+    res = []
+    start = prev = None
+    for vid in sorted(vlan_ids):
+        if prev is not None and vid == prev + 1:
+            prev = vid
+            continue
+        if start is not None:
+            res.append(str(start) if start == prev else '{} to {}'.format(start, prev))
+        start = prev = vid
+    if start is not None:
+        res.append(str(start) if start == prev else '{} to {}'.format(start, prev))
+    return ' '.join(res)
+
+
+def render_config(profile: DeviceProfile) -> str:
+    lines = ['#', ' version 7.1.045, Release 3111P02', '#', ' sysname {}'.format(profile.name), '#']
+    for i, vrf in enumerate(profile.vrf_names()):
+        target = '{}:{}'.format(profile.local_as, i + 1)
+        lines += ['ip vpn-instance {}'.format(vrf), ' route-distinguisher {}'.format(target),
+                  ' description vrf {}'.format(vrf), ' vpn-target {} import-extcommunity'.format(target),
+                  ' vpn-target {} export-extcommunity'.format(target), '#']
+    for vid in [1] + profile.vlan_ids():
+        lines += ['vlan {}'.format(vid), '#']
+    for vid in profile.l3_vlans():
+        lines += ['interface Vlan-interface{}'.format(vid),
+                  ' ip binding vpn-instance {}'.format(profile.vrf_of_vlan(vid)),
+                  ' ip address {} 255.255.255.0'.format(profile.vlan_ip(vid)),
+                  ' description vlan {}'.format(vid), '#']
+    for i in range(profile.ports):
+        lines += ['interface GigabitEthernet1/0/{}'.format(i + 1), ' port link-mode bridge',
+                  ' port link-type trunk', ' port trunk permit vlan 1 {}'.format(
+                      _format_vlan_list(profile.port_vlans(i))), '#']
+    lines += ['bgp {}'.format(profile.local_as), ' address-family ipv4 unicast', '  import-route direct', ' #']
+    for i, vrf in enumerate(profile.vrf_names()):
+        peers = profile.bgp_peers(i + 1)
+        lines.append(' ip vpn-instance {}'.format(vrf))
+        lines += ['  peer {} as-number {}'.format(peer, profile.local_as + 100 + i) for peer in peers]
+        lines += ['  #', '  address-family ipv4 unicast', '   import-route direct']
+        lines += ['   peer {} enable'.format(peer) for peer in peers]
+        lines.append(' #')
+    lines += ['#', 'return']
+    return '\n'.join(lines)
+
+
+def render_interface_brief(profile: DeviceProfile) -> str:
+    lines = ['Brief information on interfaces in bridge mode:', 'Link: ADM - administratively down; Stby - standby',
+             'Speed: (a) - auto', 'Duplex: (a)/A - auto; H - half; F - full', 'Type: A - access; T - trunk',
+             'Interface            Link Speed   Duplex Type PVID Description']
+    for i in range(profile.ports):
+        if i % 4 == 3:
+            lines.append('GE1/0/{:<15}DOWN auto    A      T    1'.format(i + 1))
+        else:
+            lines.append('GE1/0/{:<15}UP   1G(a)   F(a)   T    1'.format(i + 1))
+    return '\n'.join(lines)
+
+
+def render_lldp(profile: DeviceProfile) -> str:
+    lines = ['System Name          Local Interface Chassis ID      Port ID']
+    for i in range(0, profile.ports, 2):
+        lines.append('peer-{:<15} GE1/0/{:<9} 0011-2233-{:04x}  GigabitEthernet1/0/{}'.format(i, i + 1, i, i + 1))
+    return '\n'.join(lines)
+
+
+def render_bgp_peers(profile: DeviceProfile, vrf: str) -> str:
+    if vrf not in profile.vrf_names():
+        return ''
+    index = profile.vrf_names().index(vrf) + 1
+    lines = ['', ' BGP local router ID: 10.255.0.1', ' Local AS number: {}'.format(profile.local_as),
+             ' Total number of peers: {}'.format(profile.bgp_peers_per_vrf), '', '  * - Dynamically created peer',
+             '  Peer                    AS  MsgRcvd  MsgSent OutQ PrefRcv Up/Down  State', '']
+    for peer in profile.bgp_peers(index):
+        lines.append('  {:<20}{:>6}{:>9}{:>9}{:>5}{:>8} 01:02:03 Established'.format(
+            peer, profile.local_as + 99 + index, 100, 110, 0, 3))
+    return '\n'.join(lines)
+
+
+class ComwareCli(CliPersonality):
+    # HP Comware CLI: user view "<name>", system view "[name]" and nested views "[name-view]"
+    def __init__(self, profile: DeviceProfile):
+        super().__init__(profile)
+        self.views: List[str] = []
+
+    def prompt(self) -> str:
+        if not self.views:
+            return '<{}>'.format(self.profile.name)
+        if len(self.views) == 1:
+            return '[{}]'.format(self.profile.name)
+        return '[{}-{}]'.format(self.profile.name, self.views[-1])
+
+    def handle(self, line: str) -> str:
+        if not line:
+            return ''
+        if line == 'system-view':
+            self.views = ['system']
+            return 'System View: return to User View with Ctrl+Z.'
+        if line == 'return':
+            self.views = []
+            return ''
+        if line == 'quit':
+            if self.views:
+                self.views.pop()
+            return ''
+        if line == 'save force':
+            return 'Validating file. Please wait...\nSaved the current configuration to mainboard device successfully.'
+        if line.startswith('display'):
+            return self._display(line)
+        if self.views and line.split()[0] in ['interface', 'vlan', 'bgp', 'ip', 'address-family']:
+            self.views.append(line.split()[0] + ''.join(line.split()[1:2]))
+        return ''
+
+    def _display(self, line: str) -> str:
+        if line == 'display current-configuration':
+            return render_config(self.profile)
+        if line == 'display interface brief':
+            return render_interface_brief(self.profile)
+        if line == 'display lldp neighbor-information list':
+            return render_lldp(self.profile)
+        if line.startswith('display bgp peer ipv4 vpn-instance '):
+            return render_bgp_peers(self.profile, line.split()[-1])
+        return ''
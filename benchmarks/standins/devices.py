@@ -0,0 +1,105 @@
+from typing import Callable, Dict, List, Union
+
+from pydantic import SecretStr
+
+from netdevice import Device
+from .comware import ComwareCli
+from .http_server import StandinHTTPServer
+from .onyx import OnyxCli, OnyxXtree
+from .pfsense import PfSenseApi, PfSenseShell
+from .profile import DeviceProfile
+from .routeros import RouterOsCli, RouterOsRest
+from .sonic import SonicData, SonicShell
+from .ssh_server import StandinSSHServer
+
+
+class Standin:
+    # running stand-in of a device: an SSH server and, for the REST drivers, an HTTP(S) server
+    def __init__(self, kind: str, model: str, profile: DeviceProfile, ssh: StandinSSHServer,
+                 http: Union[StandinHTTPServer, None] = None, status: Union[StandinHTTPServer, None] = None):
+        self.kind = kind
+        self.model = model
+        self.profile = profile
+        self.ssh = ssh
+        self.http = http
+        # SONiC interface status service, on its own port
+        self.status = status
+
+    def servers(self) -> List[Union[StandinHTTPServer, StandinSSHServer]]:
+        return [item for item in [self.ssh, self.http, self.status] if item]
+
+    def device(self, name: str = None) -> Device:
+        # management data of the stand-in: the address carries the HTTP port, the SSH port is given apart
+        return Device(
+            name=name or self.profile.name,
+            model=self.model,
+            user=self.profile.user,
+            passwd=SecretStr(self.profile.passwd),
+            address=self.http.address if self.http else '127.0.0.1',
+            ssh_port=self.ssh.port,
+            client_id=self.profile.user,
+            key=self.profile.passwd
+        )
+
+    def requests(self) -> int:
+        # HTTP requests and SSH commands served so far
+        return sum(item.requests if isinstance(item, StandinHTTPServer) else item.commands for item in self.servers())
+
+    def stop(self) -> None:
+        for item in self.servers():
+            item.stop()
+
+
+def _start_comware(profile: DeviceProfile, host: str) -> Standin:
+    ssh = StandinSSHServer(lambda: ComwareCli(profile), profile, host).start()
+    return Standin('hp_comware', 'hp_comware', profile, ssh)
+
+
+def _start_onyx(profile: DeviceProfile, host: str) -> Standin:
+    ssh = StandinSSHServer(lambda: OnyxCli(profile), profile, host).start()
+    http = StandinHTTPServer(OnyxXtree(profile).routes(), profile, host, tls=True).start()
+    return Standin('mellanox', 'mellanox', profile, ssh, http)
+
+
+def _start_routeros(profile: DeviceProfile, host: str) -> Standin:
+    rest = RouterOsRest(profile)
+    ssh = StandinSSHServer(lambda: RouterOsCli(profile, rest), profile, host).start()
+    http = StandinHTTPServer(rest.routes(), profile, host).start()
+    return Standin('microtik', 'microtik', profile, ssh, http)
+
+
+def _start_sonic(profile: DeviceProfile, host: str) -> Standin:
+    data = SonicData(profile)
+    ssh = StandinSSHServer(lambda: SonicShell(profile, data), profile, host).start()
+    return Standin('sonic', 'sonic', profile, ssh)
+
+
+def _start_sonic_new(profile: DeviceProfile, host: str) -> Standin:
+    # SonicNew.ports_status_port has to be set to the port of standin.status
+    data = SonicData(profile)
+    ssh = StandinSSHServer(lambda: SonicShell(profile, data), profile, host).start()
+    http = StandinHTTPServer(data.routes(), profile, host, tls=True).start()
+    status = StandinHTTPServer(data.status_routes(), profile, host).start()
+    return Standin('sonic_new', 'sonic', profile, ssh, http, status)
+
+
+def _start_pfsense(profile: DeviceProfile, host: str) -> Standin:
+    ssh = StandinSSHServer(lambda: PfSenseShell(profile), profile, host).start()
+    http = StandinHTTPServer(PfSenseApi(profile).routes(), profile, host).start()
+    return Standin('pfsense', 'pfsense', profile, ssh, http)
+
+
+STANDIN_KINDS: Dict[str, Callable[[DeviceProfile, str], Standin]] = {
+    'hp_comware': _start_comware,
+    'mellanox': _start_onyx,
+    'microtik': _start_routeros,
+    'sonic': _start_sonic,
+    'sonic_new': _start_sonic_new,
+    'pfsense': _start_pfsense
+}
+
+
+def start_standin(kind: str, profile: DeviceProfile = None, host: str = '127.0.0.1') -> Standin:
+    if kind not in STANDIN_KINDS:
+        raise ValueError('stand-in kind {} not supported, use one of {}'.format(kind, ', '.join(STANDIN_KINDS)))
+    return STANDIN_KINDS[kind](profile or DeviceProfile(), host)
@@ -0,0 +1,27 @@
+from typing import List, Tuple
+
+from .profile import DeviceProfile
+
+
+def render_frr_config(profile: DeviceProfile, vrf_names: List[str]) -> str:
+    # "show running-config" of FRR with one BGP instance per vrf, each with the peers of the profile
+    lines = ['Building configuration...', '', 'Current configuration:', '!', 'frr version 8.4.2',
+             'frr defaults traditional', 'hostname {}'.format(profile.name), 'service integrated-vtysh-config', '!']
+    for i, vrf in enumerate(vrf_names):
+        lines += ['router bgp {}'.format(profile.local_as) + ('' if vrf == 'default' else ' vrf {}'.format(vrf)),
+                  ' bgp router-id 10.255.{}.1'.format(i + 1)]
+        lines += [' neighbor {} remote-as {}'.format(peer, profile.local_as + 100 + i)
+                  for peer in profile.bgp_peers(i + 1)]
+        lines += [' !', ' address-family ipv4 unicast', '  redistribute connected', ' exit-address-family',
+                  'exit', '!']
+    lines += ['end']
+    return '\n'.join(lines)
+
+
+def execute_vtysh(profile: DeviceProfile, vrf_names: List[str], command: str) -> Tuple[str, str, int]:
+    # only the running configuration is printed, configuration sessions are accepted without output
+    if command == 'vtysh -c "show running-config"':
+        return render_frr_config(profile, vrf_names) + '\n', '', 0
+    if command.startswith('vtysh'):
+        return '', '', 0
+    return '', 'command not supported: {}\n'.format(command), 127
@@ -0,0 +1,146 @@
+import json
+import os
+import re
+import ssl
+import tempfile
+import threading
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, NamedTuple, Pattern, Tuple, Union
+from urllib.parse import urlsplit, parse_qsl
+
+from utils import create_logger
+from .profile import DeviceProfile
+
+logger = create_logger('standin_http')
+
+
+class StandinRequest(NamedTuple):
+    method: str
+    path: str
+    query: Dict[str, str]
+    body: bytes
+    match: Union[re.Match, None]
+
+    def json(self) -> Any:
+        return json.loads(self.body) if self.body else None
+
+
+# a handler returns the status code and the body: bytes and str are sent as they are, anything else as JSON
+StandinResponse = Tuple[int, Any]
+StandinRoute = Tuple[str, Pattern, Callable[[StandinRequest], StandinResponse]]
+
+_tls_files: Union[Tuple[str, str], None] = None
+_tls_lock = threading.Lock()
+
+
+def _get_tls_files() -> Tuple[str, str]:
+    # self-signed certificate, generated once per process
+    global _tls_files
+    with _tls_lock:
+        if _tls_files:
+            return _tls_files
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.x509.oid import NameOID
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'standin')])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key()) \
+            .serial_number(x509.random_serial_number()).not_valid_before(now) \
+            .not_valid_after(now + datetime.timedelta(days=365)).sign(key, hashes.SHA256())
+        folder = tempfile.mkdtemp(prefix='standin-tls-')
+        cert_file = os.path.join(folder, 'cert.pem')
+        key_file = os.path.join(folder, 'key.pem')
+        with open(cert_file, 'wb') as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+        with open(key_file, 'wb') as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                      serialization.NoEncryption()))
+        _tls_files = (cert_file, key_file)
+        return _tls_files
+
+
+class _StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug('{} {}'.format(self.address_string(), format % args))
+
+    def _dispatch(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        status, res = self.server.dispatch(self.command, url.path, dict(parse_qsl(url.query)), body)
+        if res is None:
+            payload = b''
+            content_type = 'application/json'
+        elif isinstance(res, bytes):
+            payload = res
+            content_type = 'application/json'
+        elif isinstance(res, str):
+            payload = res.encode()
+            content_type = 'text/xml' if res.startswith('<?xml') else 'text/plain'
+        else:
+            payload = json.dumps(res).encode()
+            content_type = 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_PUT = do_PATCH = do_POST = do_DELETE = _dispatch
+
+
+class StandinHTTPServer(ThreadingHTTPServer):
+    # HTTP(S) server answering through a list of (method, path regex, handler) routes, with the latency of the profile
+    daemon_threads = True
+
+    def __init__(self, routes: List[StandinRoute], profile: DeviceProfile, host: str = '127.0.0.1', port: int = 0,
+                 tls: bool = False):
+        super().__init__((host, port), _StandinHandler)
+        self.routes = routes
+        self.profile = profile
+        self.requests = 0
+        self._thread = None
+        if tls:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(*_get_tls_files())
+            # the handshake is done by the handler thread on the first read, not by the accepting thread
+            self.socket = context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+
+    @property
+    def address(self) -> str:
+        return '{}:{}'.format(*self.server_address[:2])
+
+    def dispatch(self, method: str, path: str, query: Dict[str, str], body: bytes) -> StandinResponse:
+        self.requests += 1
+        self.profile.delay()
+        for route_method, pattern, handler in self.routes:
+            if route_method != method:
+                continue
+            match = pattern.fullmatch(path)
+            if match:
+                try:
+                    return handler(StandinRequest(method, path, query, body, match))
+                except Exception as e:
+                    logger.exception('stand-in handler error on {} {}'.format(method, path))
+                    return 500, {'error': repr(e)}
+        return 404, {'error': 'no route for {} {}'.format(method, path)}
+
+    def start(self) -> 'StandinHTTPServer':
+        self._thread = threading.Thread(target=self.serve_forever, name='standin-http-{}'.format(self.address),
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def route(method: str, path: str, handler: Callable[[StandinRequest], StandinResponse]) -> StandinRoute:
+    return method, re.compile(path), handler
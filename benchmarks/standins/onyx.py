@@ -0,0 +1,131 @@
+from typing import Dict, List, Tuple
+from xml.sax.saxutils import escape
+
+import xmltodict
+
+from .http_server import StandinRequest, StandinResponse, StandinRoute, route
+from .profile import DeviceProfile
+from .ssh_server import CliPersonality
+
+_prefix = '/mlnxos/v1/vsr/vsr-default'
+# interface indexes: physical ports first, then the vlan interfaces
+_vlan_itf_base = 1000
+
+
+def render_config(profile: DeviceProfile) -> str:
+    lines = ['##', '## Running database "initial"', '## Generated at 2024/01/01 00:00:00 +0000', '##', '',
+             '##', '## VLAN configuration', '##']
+    lines += ['   vlan {}'.format(vid) for vid in profile.vlan_ids()]
+    lines += ['', '##', '## Interface Ethernet configuration', '##']
+    for i in range(profile.ports):
+        lines.append('   interface ethernet 1/{} switchport mode trunk'.format(i + 1))
+        lines += ['   interface ethernet 1/{} switchport trunk allowed-vlan add {}'.format(i + 1, vid)
+                  for vid in profile.port_vlans(i)]
+    lines += ['', '##', '## L3 configuration', '##']
+    for vid in profile.l3_vlans():
+        lines += ['   interface vlan {}'.format(vid),
+                  '   interface vlan {} ip address {}/24 primary'.format(vid, profile.vlan_ip(vid))]
+    return '\n'.join(lines)
+
+
+def render_lldp(profile: DeviceProfile) -> str:
+    lines = ['', 'Local Interface    Device ID          Port ID            System Name',
+             '-' * 80]
+    for i in range(0, profile.ports, 2):
+        lines.append('Eth1/{:<13} 0c:42:a1:00:{:02x}:00  Eth1/{:<13} peer-{}'.format(i + 1, i % 256, i + 1, i))
+    return '\n'.join(lines)
+
+
+class OnyxCli(CliPersonality):
+    # Mellanox Onyx CLI: "name [standalone: master] >" in user mode, "#" in enable mode and "(config) #" in config mode
+    def __init__(self, profile: DeviceProfile):
+        super().__init__(profile)
+        self.mode = 'user'
+
+    def prompt(self) -> str:
+        return '{} [standalone: master] {}'.format(self.profile.name, {
+            'user': '> ', 'enable': '# ', 'config': '(config) # '}[self.mode])
+
+    def handle(self, line: str) -> str:
+        if line == 'enable':
+            self.mode = 'enable'
+        elif line in ['config term', 'configure terminal']:
+            self.mode = 'config'
+        elif line in ['exit', 'disable']:
+            self.mode = {'config': 'enable', 'enable': 'user', 'user': 'user'}[self.mode]
+        elif line == 'show configuration':
+            return render_config(self.profile)
+        elif line == 'show lldp remote':
+            return render_lldp(self.profile)
+        return ''
+
+
+class OnyxXtree:
+    # Mellanox XML gateway (/xtree): answers the "get" requests of the switch tree and accepts any change
+    def __init__(self, profile: DeviceProfile):
+        self.profile = profile
+        self.tree: Dict[str, List[Tuple[str, str]]] = self._build_tree()
+
+    def _build_tree(self) -> Dict[str, List[Tuple[str, str]]]:
+        profile = self.profile
+        tree = {
+            '/mlnxos/api_version': [('/mlnxos/api_version', '1.0')],
+            '{}/vlans/*'.format(_prefix): [('{}/vlans/{}'.format(_prefix, vid), str(vid))
+                                           for vid in [1] + profile.vlan_ids()]
+        }
+        indexes = []
+        for i in range(profile.ports):
+            index = str(i + 1)
+            indexes.append(index)
+            base = '{}/interfaces/{}'.format(_prefix, index)
+            tree['{}/*'.format(base)] = [
+                ('{}/physical_location'.format(base), '1/{}'.format(i + 1)),
+                ('{}/enabled'.format(base), 'true'),
+                ('{}/operational_state'.format(base), 'Up' if i % 4 != 3 else 'Down'),
+                ('{}/actual_speed'.format(base), '100000' if i % 4 != 3 else '0'),
+                ('{}/description'.format(base), 'port {}'.format(i + 1)),
+                ('{}/type'.format(base), 'eth')
+            ]
+            tree['{}/vlans/**'.format(base)] = [
+                ('{}/vlans/mode'.format(base), 'trunk'), ('{}/vlans/pvid'.format(base), '1')
+            ] + [('{}/vlans/allowed/{}'.format(base, vid), str(vid)) for vid in profile.port_vlans(i)]
+        for vid in profile.l3_vlans():
+            index = str(_vlan_itf_base + vid)
+            indexes.append(index)
+            base = '{}/interfaces/{}'.format(_prefix, index)
+            tree['{}/*'.format(base)] = [
+                ('{}/physical_location'.format(base), 'Vlan {}'.format(vid)),
+                ('{}/enabled'.format(base), 'true'),
+                ('{}/operational_state'.format(base), 'Up'),
+                ('{}/description'.format(base), 'vlan {}'.format(vid)),
+                ('{}/type'.format(base), 'vlan')
+            ]
+            tree['{}/ipv4/**'.format(base)] = [
+                ('{}/ipv4/ip_address'.format(base), profile.vlan_ip(vid)),
+                ('{}/ipv4/net_mask'.format(base), '255.255.255.0')
+            ]
+        tree['{}/interfaces/*'.format(_prefix)] = [
+            ('{}/interfaces/{}'.format(_prefix, index), index) for index in indexes]
+        return tree
+
+    def answer(self, request: StandinRequest) -> StandinResponse:
+        # multi-node requests repeat the <nodes> element, each with one <node>
+        request_nodes = xmltodict.parse(request.body, force_list=('nodes', 'node'))['xg-request']['action-request']
+        reply = []
+        for node in [node for item in request_nodes['nodes'] for node in item['node']]:
+            if node['name'] == 'get':
+                reply += self.tree.get(node['value'], [(node['value'], '')])
+            else:
+                # changes are accepted and echoed back
+                reply.append((node['value'], ''))
+        return 200, '<?xml version="1.0" encoding="UTF-8"?>\n<xg-response><action-response><return-status>' \
+                    '<return-code>0</return-code><return-msg></return-msg></return-status><nodes>{}</nodes>' \
+                    '</action-response></xg-response>'.format(''.join(
+                        '<node><name>{}</name><type>string</type><value>{}</value></node>'.format(
+                            escape(name), escape(value)) for name, value in reply))
+
+    def routes(self) -> List[StandinRoute]:
+        return [
+            route('GET', '/admin/launch', lambda request: (200, 'logged in')),
+            route('POST', '/xtree', self.answer)
+        ]
@@ -0,0 +1,128 @@
+import threading
+from typing import Any, Dict, List, Tuple
+
+from .frr import execute_vtysh
+from .http_server import StandinRequest, StandinResponse, StandinRoute, route
+from .profile import DeviceProfile
+from .ssh_server import CliPersonality
+
+_api = '/api/v1'
+# physical interface carrying the vlan interfaces
+_trunk = 'vtnet1'
+
+
+def _reply(data: Any) -> Dict[str, Any]:
+    return {'status': 'ok', 'code': 200, 'return': 0, 'message': 'Success', 'data': data}
+
+
+class PfSenseApi:
+    # pfSense REST API (/api/v1/...). The firewall rules are mutable; the other writes are accepted but not applied
+    def __init__(self, profile: DeviceProfile):
+        self.profile = profile
+        self._lock = threading.Lock()
+        self.interfaces: Dict[str, Dict] = {
+            'wan': {'if': 'vtnet0', 'descr': 'WAN', 'enable': '', 'ipaddr': '192.168.0.1', 'subnet': '24'},
+            'lan': {'if': _trunk, 'descr': 'LAN', 'enable': '', 'ipaddr': '192.168.1.1', 'subnet': '24'}}
+        self.available: Dict[str, Dict] = {
+            'vtnet{}'.format(i): {'mac': '00:00:5e:00:53:{:02x}'.format(i % 256), 'up': i % 4 != 3,
+                                  'friendly': 'vtnet{}'.format(i), 'descr': 'port{}'.format(i), 'isvlan': False}
+            for i in range(max(profile.ports, 2))}
+        self.vlans: List[Dict] = []
+        for i, vid in enumerate(profile.l3_vlans()):
+            vlanif = '{}.{}'.format(_trunk, vid)
+            self.interfaces['opt{}'.format(i + 1)] = {'if': vlanif, 'descr': 'vlan{}'.format(vid), 'enable': '',
+                                                      'ipaddr': profile.vlan_ip(vid), 'subnet': '24'}
+            self.available[vlanif] = {'mac': self.available[_trunk]['mac'], 'up': True, 'friendly': vlanif,
+                                      'descr': 'vlan{}'.format(vid), 'isvlan': True, 'tag': vid, 'vlanif': vlanif}
+            self.vlans.append({'if': _trunk, 'tag': str(vid), 'pcp': '', 'descr': 'vlan{}'.format(vid),
+                               'vlanif': vlanif})
+        self.groups = [{'ifname': 'netcl', 'descr': 'interfaces managed by netcl',
+                        'members': ' '.join(k for k in self.interfaces if k.startswith('opt'))}]
+        self.rules: Dict[str, Dict] = {}
+        self._next_tracker = 1000000000
+        opt_interfaces = [k for k in self.interfaces if k.startswith('opt')] or ['lan']
+        for i in range(profile.firewall_rules):
+            interface = opt_interfaces[i % len(opt_interfaces)]
+            self._store_rule({'type': 'pass', 'interface': [interface], 'ipprotocol': 'inet',
+                              'src': '{}net'.format(interface), 'dst': '10.200.{}.0/24'.format(i % 256),
+                              'protocol': 'tcp', 'srcport': 'any', 'dstport': str(1024 + i),
+                              'descr': 'rule {}'.format(i)})
+
+    @staticmethod
+    def _endpoint(address: str, port: str) -> Dict[str, str]:
+        if address == 'any' and (not port or port == 'any'):
+            return {'any': ''}
+        res = {'network' if address.endswith('net') else 'address': address} if address != 'any' else {}
+        if port and port != 'any':
+            res['port'] = port
+        return res
+
+    def _store_rule(self, request: Dict[str, Any]) -> Dict:
+        tracker = str(request.get('tracker') or self._next_tracker)
+        self._next_tracker += 1
+        interfaces = request['interface']
+        rule = {'tracker': tracker, 'type': request.get('type', 'pass'),
+                'interface': ','.join(interfaces) if isinstance(interfaces, list) else interfaces,
+                'ipprotocol': request.get('ipprotocol', 'inet'), 'statetype': 'keep state',
+                'direction': 'out', 'floating': 'yes', 'os': '',
+                'source': self._endpoint(request.get('src', 'any'), request.get('srcport', '')),
+                'destination': self._endpoint(request.get('dst', 'any'), request.get('dstport', '')),
+                'descr': request.get('descr', '')}
+        if request.get('protocol') and request['protocol'] != 'any':
+            rule['protocol'] = request['protocol']
+        if request.get('disabled'):
+            rule['disabled'] = ''
+        self.rules[tracker] = rule
+        return rule
+
+    def _get_rules(self, request: StandinRequest) -> StandinResponse:
+        with self._lock:
+            return 200, _reply([dict(rule, id=i) for i, rule in enumerate(self.rules.values())])
+
+    def _post_rule(self, request: StandinRequest) -> StandinResponse:
+        with self._lock:
+            body = dict(request.json())
+            body.pop('tracker', None)
+            return 200, _reply(self._store_rule(body))
+
+    def _put_rule(self, request: StandinRequest) -> StandinResponse:
+        with self._lock:
+            body = request.json()
+            if str(body.get('tracker')) not in self.rules:
+                return 404, {'status': 'not found', 'code': 404, 'return': 4032, 'message': 'Rule not found',
+                             'data': []}
+            return 200, _reply(self._store_rule(body))
+
+    def _delete_rule(self, request: StandinRequest) -> StandinResponse:
+        with self._lock:
+            rule = self.rules.pop(request.query.get('tracker', ''), None)
+            if not rule:
+                return 404, {'status': 'not found', 'code': 404, 'return': 4032, 'message': 'Rule not found',
+                             'data': []}
+            return 200, _reply(rule)
+
+    def routes(self) -> List[StandinRoute]:
+        accept = lambda request: (200, _reply([]))
+        return [
+            route('GET', _api + '/interface', lambda request: (200, _reply(self.interfaces))),
+            route('GET', _api + '/interface/available', lambda request: (200, _reply(self.available))),
+            route('GET', _api + '/interface/group', lambda request: (200, _reply(self.groups))),
+            route('GET', _api + '/interface/vlan', lambda request: (200, _reply(self.vlans))),
+            route('GET', _api + '/system/config', lambda request: (200, _reply({
+                'system': {'hostname': self.profile.name, 'domain': 'standin'},
+                'interfaces': self.interfaces, 'vlans': {'vlan': self.vlans}}))),
+            route('GET', _api + '/firewall/rule', self._get_rules),
+            route('POST', _api + '/firewall/rule', self._post_rule),
+            route('PUT', _api + '/firewall/rule', self._put_rule),
+            route('DELETE', _api + '/firewall/rule', self._delete_rule),
+            route('POST', _api + '/firewall/apply', accept),
+            route('POST', _api + '/interface(/vlan)?', accept),
+            route('PUT', _api + '/interface/group', accept),
+            route('DELETE', _api + '/interface(/vlan)?', accept)
+        ]
+
+
+class PfSenseShell(CliPersonality):
+    # FreeBSD shell over SSH exec requests, used only for the FRR configuration through vtysh
+    def execute(self, command: str) -> Tuple[str, str, int]:
+        return execute_vtysh(self.profile, ['default'], command)
@@ -0,0 +1,56 @@
+import random
+import time
+from typing import List
+
+from pydantic import BaseModel
+
+
+class DeviceProfile(BaseModel):
+    # size and behaviour of a stand-in device; all the data are derived deterministically from these values
+    name: str = 'standin'
+    user: str = 'admin'
+    passwd: str = 'admin'
+    ports: int = 48
+    vlans: int = 64
+    vlans_per_port: int = 8
+    vrfs: int = 4
+    bgp_peers_per_vrf: int = 2
+    firewall_rules: int = 32
+    local_as: int = 65000
+    # seconds added to each request or command, plus a uniformly distributed random jitter
+    latency: float = 0.0
+    jitter: float = 0.0
+
+    def delay(self) -> None:
+        wait = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if wait > 0:
+            time.sleep(wait)
+
+    def vlan_ids(self) -> List[int]:
+        return list(range(2, self.vlans + 2))
+
+    def port_vlans(self, port: int) -> List[int]:
+        # trunk vlans of the port with the given position, spread over all the vlans
+        vlan_ids = self.vlan_ids()
+        if not vlan_ids:
+            return []
+        return sorted({vlan_ids[(port * self.vlans_per_port + k) % len(vlan_ids)] for k in range(self.vlans_per_port)})
+
+    def vrf_names(self) -> List[str]:
+        return ['vrf{}'.format(i + 1) for i in range(self.vrfs)]
+
+    def l3_vlans(self) -> List[int]:
+        # one vlan interface every 8 vlans, bound round robin to the vrfs
+        return self.vlan_ids()[::8]
+
+    def vrf_of_vlan(self, vlan_id: int) -> str:
+        names = self.vrf_names()
+        if not names:
+            return 'default'
+        return names[self.l3_vlans().index(vlan_id) % len(names)]
+
+    def vlan_ip(self, vlan_id: int) -> str:
+        return '10.{}.{}.1'.format(vlan_id // 256, vlan_id % 256)
+
+    def bgp_peers(self, vrf_index: int) -> List[str]:
+        return ['172.16.{}.{}'.format(vrf_index, i + 2) for i in range(self.bgp_peers_per_vrf)]
@@ -0,0 +1,134 @@
+import threading
+from typing import Dict, List
+
+from .http_server import StandinRequest, StandinResponse, StandinRoute, route
+from .profile import DeviceProfile
+from .ssh_server import CliPersonality
+
+_bridge = 'tnt'
+
+
+def _port_name(i: int) -> str:
+    return 'ether{}'.format(i + 1)
+
+
+class RouterOsRest:
+    # RouterOS REST API (/rest/...). The bridge vlan and port tables, the vlan interfaces and the ip addresses are
+    # mutable, so provisioning changes are visible in the following refresh
+    def __init__(self, profile: DeviceProfile):
+        self.profile = profile
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self.interfaces = [{'.id': '*{:X}'.format(i + 1), 'name': _port_name(i), 'type': 'ether',
+                            'disabled': 'false', 'running': 'true' if i % 4 != 3 else 'false'}
+                           for i in range(profile.ports)]
+        self.tables: Dict[str, Dict[str, Dict]] = {'bridge/vlan': {}, 'bridge/port': {}, 'vlan': {}, 'address': {}}
+        for vid in profile.vlan_ids():
+            tagged = [_bridge] + [_port_name(i) for i in range(profile.ports) if vid in profile.port_vlans(i)]
+            self._insert('bridge/vlan', {'bridge': _bridge, 'vlan-ids': str(vid), 'tagged': ','.join(tagged),
+                                         'untagged': '', 'disabled': 'false'})
+        for i in range(profile.ports):
+            self._insert('bridge/port', {'bridge': _bridge, 'interface': _port_name(i), 'pvid': '1',
+                                         'frame-types': 'admit-only-vlan-tagged', 'disabled': 'false'})
+        for vid in profile.l3_vlans():
+            name = 'vlan{}'.format(vid)
+            self._insert('vlan', {'name': name, 'interface': _bridge, 'vlan-id': str(vid), 'disabled': 'false'})
+            self._insert('address', {'address': '{}/24'.format(profile.vlan_ip(vid)), 'interface': name,
+                                     'network': profile.vlan_ip(vid)[:-1] + '0', 'disabled': 'false'})
+
+    def _insert(self, table: str, row: Dict) -> Dict:
+        row = dict(row, **{'.id': '*{:X}'.format(0x100 + self._next_id)})
+        self._next_id += 1
+        self.tables[table][row['.id']] = row
+        return row
+
+    def _list(self, table: str, request: StandinRequest) -> StandinResponse:
+        with self._lock:
+            return 200, [row for row in self.tables[table].values()
+                         if all(row.get(k) == v for k, v in request.query.items())]
+
+    def _put(self, table: str, request: StandinRequest) -> StandinResponse:
+        with self._lock:
+            return 201, self._insert(table, request.json())
+
+    def _patch(self, table: str, request: StandinRequest) -> StandinResponse:
+        with self._lock:
+            row = self.tables[table].get(request.match.group('id'))
+            if not row:
+                return 404, {'error': 404, 'message': 'Not Found'}
+            row.update(request.json())
+            return 200, row
+
+    def _delete(self, table: str, request: StandinRequest) -> StandinResponse:
+        with self._lock:
+            if not self.tables[table].pop(request.match.group('id'), None):
+                return 404, {'error': 404, 'message': 'Not Found'}
+            return 204, None
+
+    def _interfaces(self, request: StandinRequest) -> StandinResponse:
+        return 200, [itf for itf in self.interfaces if all(itf.get(k) == v for k, v in request.query.items())]
+
+    def _monitor(self, request: StandinRequest) -> StandinResponse:
+        numbers = request.json()['numbers'].split(',')
+        return 200, [{'name': itf['name'], 'status': 'link-ok' if itf['running'] == 'true' else 'no-link',
+                      'rate': '1Gbps', 'full-duplex': 'true'} for itf in self.interfaces if itf['.id'] in numbers]
+
+    def _neighbors(self, request: StandinRequest) -> StandinResponse:
+        return 200, [{'.id': '*{:X}'.format(i + 1), 'interface': _port_name(i),
+                      'identity': 'peer-{}'.format(i), 'mac-address': '00:11:22:33:{:02X}:00'.format(i % 256)}
+                     for i in range(0, self.profile.ports, 2)]
+
+    def routes(self) -> List[StandinRoute]:
+        routes = [
+            route('GET', '/', lambda request: (200, '')),
+            route('GET', '/rest/interface', self._interfaces),
+            route('POST', '/rest/interface/ethernet/monitor', self._monitor),
+            route('GET', '/rest/ip/neighbor', self._neighbors)
+        ]
+        for table, path in [('bridge/vlan', '/rest/interface/bridge/vlan'), ('vlan', '/rest/interface/vlan'),
+                            ('address', '/rest/ip/address'), ('bridge/port', '/rest/interface/bridge/port')]:
+            routes += [
+                route('GET', path, lambda request, table=table: self._list(table, request)),
+                route('PATCH', path + r'/(?P<id>\*[0-9A-F]+)', lambda request, table=table: self._patch(table, request))
+            ]
+            if table != 'bridge/port':
+                routes += [
+                    route('PUT', path, lambda request, table=table: self._put(table, request)),
+                    route('DELETE', path + r'/(?P<id>\*[0-9A-F]+)',
+                          lambda request, table=table: self._delete(table, request))
+                ]
+        return routes
+
+    def export(self) -> str:
+        with self._lock:
+            lines = ['# jan/01/2024 00:00:00 by RouterOS 7.12', '# software id = STND-0000', '#',
+                     '/interface bridge', 'add name={} vlan-filtering=yes'.format(_bridge), '/interface vlan']
+            lines += ['add interface={} name={} vlan-id={}'.format(row['interface'], row['name'], row['vlan-id'])
+                      for row in self.tables['vlan'].values()]
+            lines.append('/interface bridge port')
+            lines += ['add bridge={} frame-types={} interface={} pvid={}'.format(
+                row['bridge'], row['frame-types'], row['interface'], row['pvid'])
+                for row in self.tables['bridge/port'].values()]
+            lines.append('/interface bridge vlan')
+            lines += ['add bridge={} tagged={} vlan-ids={}'.format(row['bridge'], row['tagged'], row['vlan-ids'])
+                      for row in self.tables['bridge/vlan'].values()]
+            lines.append('/ip address')
+            lines += ['add address={} interface={} network={}'.format(row['address'], row['interface'], row['network'])
+                      for row in self.tables['address'].values()]
+            lines += ['/system identity', 'set name={}'.format(self.profile.name)]
+            return '\n'.join(lines)
+
+
+class RouterOsCli(CliPersonality):
+    # RouterOS terminal: "[user@name] > " prompt; "export" prints the configuration of the REST tables
+    def __init__(self, profile: DeviceProfile, rest: RouterOsRest):
+        super().__init__(profile)
+        self.rest = rest
+
+    def prompt(self) -> str:
+        return '[{}@{}] > '.format(self.profile.user, self.profile.name)
+
+    def handle(self, line: str) -> str:
+        if line == 'export':
+            return self.rest.export()
+        return ''
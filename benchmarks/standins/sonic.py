@@ -0,0 +1,106 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.bench_sonic_decode import make_dump
+from switch.sonic_decoding import PORT_KEY, PORTCHANNEL_KEY, VLAN_KEY, VLAN_INTERFACE_KEY, VRF_KEY, LLDP_KEY
+from .frr import execute_vtysh
+from .http_server import StandinRequest, StandinResponse, StandinRoute, route
+from .profile import DeviceProfile
+from .ssh_server import CliPersonality
+
+_restpath = '/restconf/data'
+# RESTCONF path (after /restconf/data/) -> payload
+_paths = {PORTCHANNEL_KEY: 'portchannel', PORT_KEY: 'port', VLAN_KEY: 'vlan', VLAN_INTERFACE_KEY: 'vlan_interface',
+          VRF_KEY: 'vrf', 'openconfig-lldp:lldp/interfaces': 'lldp'}
+
+
+class SonicData:
+    # configuration database of a SONiC switch, served both as RESTCONF payloads (SonicNew) and as the outputs of the
+    # SSH commands of the older Sonic driver. Writes are accepted but not applied
+    def __init__(self, profile: DeviceProfile):
+        self.profile = profile
+        self.restconf: Dict[str, bytes] = make_dump(profile.ports, profile.vlans, profile.vlans_per_port,
+                                                    max(profile.vrfs, 1))
+        self._decoded = {key: json.loads(value) for key, value in self.restconf.items()}
+        self.vrf_names = [item['vrf_name'] for item in self._decoded['vrf'][VRF_KEY]['VRF']['VRF_LIST']]
+
+    def port_names(self) -> List[str]:
+        return [item['ifname'] for item in self._decoded['port'][PORT_KEY]['PORT']['PORT_LIST']]
+
+    def ports_status(self) -> Dict[str, Dict[str, str]]:
+        # output of the interface status service, keyed by port and port channel name
+        res = {}
+        for i, name in enumerate(self.port_names()):
+            up = i % 4 != 3
+            res[name] = {'vlan': 'trunk', 'oper': 'up' if up else 'down', 'admin': 'up', 'speed': '100G'}
+        for item in self._decoded['portchannel'][PORTCHANNEL_KEY]['PORTCHANNEL']['PORTCHANNEL_LIST']:
+            res[item['name']] = {'vlan': 'trunk', 'oper': 'up', 'admin': 'up', 'speed': '200G'}
+        return res
+
+    def cfggen(self) -> Dict[str, Any]:
+        # the same data in the layout of "sonic-cfggen -d --print-data", where all the values are strings
+        decoded = self._decoded
+        cfg = {
+            'PORT': {item['ifname']: {k: str(v) for k, v in item.items() if k != 'ifname'}
+                     for item in decoded['port'][PORT_KEY]['PORT']['PORT_LIST']},
+            'PORTCHANNEL': {item['name']: {k: str(v) for k, v in item.items() if k != 'name'}
+                            for item in decoded['portchannel'][PORTCHANNEL_KEY]['PORTCHANNEL']['PORTCHANNEL_LIST']},
+            'PORTCHANNEL_MEMBER': {'{}|{}'.format(item['name'], item['ifname']): {} for item in
+                                   decoded['portchannel'][PORTCHANNEL_KEY]['PORTCHANNEL_MEMBER'][
+                                       'PORTCHANNEL_MEMBER_LIST']},
+            'VLAN': {item['name']: {'vlanid': str(item['vlanid'])}
+                     for item in decoded['vlan'][VLAN_KEY]['VLAN']['VLAN_LIST']},
+            'VLAN_MEMBER': {'{}|{}'.format(item['name'], item['ifname']): {'tagging_mode': item['tagging_mode']}
+                            for item in decoded['vlan'][VLAN_KEY]['VLAN_MEMBER']['VLAN_MEMBER_LIST']},
+            'VRF': {item['vrf_name']: {'vni': str(item['vni'])} for item in decoded['vrf'][VRF_KEY]['VRF']['VRF_LIST']}
+        }
+        vlan_itf = decoded['vlan_interface'][VLAN_INTERFACE_KEY]['VLAN_INTERFACE']
+        cfg['VLAN_INTERFACE'] = {item['vlanName']: {'vrf_name': item['vrf_name']}
+                                 for item in vlan_itf['VLAN_INTERFACE_LIST']}
+        cfg['VLAN_INTERFACE'].update({'{}|{}'.format(item['vlanName'], item['ip_prefix']): {}
+                                      for item in vlan_itf['VLAN_INTERFACE_IPADDR_LIST']})
+        return cfg
+
+    def lldpctl(self) -> Dict[str, Any]:
+        interfaces = []
+        for item in self._decoded['lldp'][LLDP_KEY]['interface']:
+            state = item['neighbors']['neighbor'][0]['state']
+            interfaces.append({item['name']: {
+                'chassis': {state['system-name']: {'id': {'type': 'mac', 'value': state['port-id']}}},
+                'port': {'id': {'type': 'mac', 'value': state['port-id']}, 'descr': state['port-description']}}})
+        return {'lldp': {'interface': interfaces}}
+
+    def _get(self, request: StandinRequest) -> StandinResponse:
+        task = _paths.get(request.match.group('key'))
+        if not task:
+            return 404, {'ietf-restconf:errors': {'error': [{'error-tag': 'invalid-value'}]}}
+        return 200, self.restconf[task]
+
+    def routes(self) -> List[StandinRoute]:
+        return [route('GET', _restpath + '/(?P<key>.+)', self._get)] + [
+            route(method, _restpath + '/.+', lambda request: (204, None))
+            for method in ['PATCH', 'PUT', 'POST', 'DELETE']]
+
+    def status_routes(self) -> List[StandinRoute]:
+        return [route('GET', '/interfaces_status', lambda request: (200, self.ports_status()))]
+
+
+class SonicShell(CliPersonality):
+    # SONiC bash over SSH exec requests: FRR through vtysh, the config database and the "sudo config" commands
+    def __init__(self, profile: DeviceProfile, data: SonicData):
+        super().__init__(profile)
+        self.data = data
+
+    def prompt(self) -> str:
+        return 'admin@{}:~$ '.format(self.profile.name)
+
+    def execute(self, command: str) -> Tuple[str, str, int]:
+        if command == '/usr/local/bin/sonic-cfggen -d --print-data':
+            return json.dumps(self.data.cfggen()), '', 0
+        if command == 'sudo lldpctl -f json':
+            return json.dumps(self.data.lldpctl()), '', 0
+        if command == './dump_itf_status':
+            return json.dumps(self.data.ports_status()), '', 0
+        if command.startswith('sudo config ') or command == 'export':
+            return '', '', 0
+        return execute_vtysh(self.profile, self.data.vrf_names, command)
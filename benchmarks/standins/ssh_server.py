@@ -0,0 +1,192 @@
+import socket
+import threading
+from typing import Callable, Tuple, Union
+
+import paramiko
+
+from utils import create_logger
+from .profile import DeviceProfile
+
+logger = create_logger('standin_ssh')
+
+_host_key: Union[paramiko.RSAKey, None] = None
+_host_key_lock = threading.Lock()
+
+
+def _get_host_key() -> paramiko.RSAKey:
+    global _host_key
+    with _host_key_lock:
+        if not _host_key:
+            _host_key = paramiko.RSAKey.generate(2048)
+        return _host_key
+
+
+class CliPersonality:
+    # behaviour of a device CLI: interactive shells are served through prompt() and handle(), exec requests through
+    # execute(). A new personality is created for each connection, so it can hold the CLI mode
+    def __init__(self, profile: DeviceProfile):
+        self.profile = profile
+
+    def banner(self) -> str:
+        return ''
+
+    def prompt(self) -> str:
+        return '{}> '.format(self.profile.name)
+
+    def handle(self, line: str) -> str:
+        return ''
+
+    def execute(self, command: str) -> Tuple[str, str, int]:
+        # stdout, stderr and exit status of a non interactive command
+        return '', 'command not supported: {}\n'.format(command), 127
+
+
+class _StandinServerInterface(paramiko.ServerInterface):
+    def __init__(self, profile: DeviceProfile):
+        self.profile = profile
+        self.event = threading.Event()
+        self.command: Union[str, None] = None
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        # RouterOS clients append terminal options to the user name (e.g. "admin+ct511w4098h")
+        if username.split('+')[0] == self.profile.user and password == self.profile.passwd:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        self.event.set()
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        self.command = command.decode() if isinstance(command, bytes) else command
+        self.event.set()
+        return True
+
+
+class StandinSSHServer:
+    # SSH server handling each connection in its own thread with a new personality instance
+    def __init__(self, personality: Callable[[], CliPersonality], profile: DeviceProfile, host: str = '127.0.0.1',
+                 port: int = 0):
+        self.personality = personality
+        self.profile = profile
+        self.commands = 0
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._socket.listen(100)
+        self._running = False
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._socket.getsockname()[1]
+
+    def start(self) -> 'StandinSSHServer':
+        self._running = True
+        self._thread = threading.Thread(target=self._accept_loop, name='standin-ssh-{}'.format(self.port),
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+        self._socket.close()
+
+    def _accept_loop(self) -> None:
+        while self._running:
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client: socket.socket) -> None:
+        # the reachability checks of the drivers connect and close without sending their banner
+        try:
+            probe = client.recv(1, socket.MSG_PEEK)
+        except OSError:
+            probe = b''
+        if not probe:
+            client.close()
+            return
+        transport = paramiko.Transport(client)
+        transport.add_server_key(_get_host_key())
+        try:
+            # each connection can open more channels, e.g. one per exec request
+            server = None
+            transport.start_server(server=_StandinServerInterface(self.profile))
+            while transport.is_active():
+                server = _StandinServerInterface(self.profile)
+                transport.server_object = server
+                channel = transport.accept(timeout=1)
+                if channel is None:
+                    continue
+                if not server.event.wait(10):
+                    channel.close()
+                    continue
+                if server.command is not None:
+                    threading.Thread(target=self._exec, args=(channel, server.command), daemon=True).start()
+                else:
+                    threading.Thread(target=self._shell, args=(channel,), daemon=True).start()
+        except (paramiko.SSHException, EOFError, OSError) as e:
+            logger.debug('stand-in ssh connection closed: {}'.format(repr(e)))
+        finally:
+            transport.close()
+
+    def _exec(self, channel: paramiko.Channel, command: str) -> None:
+        try:
+            self.commands += 1
+            self.profile.delay()
+            stdout, stderr, status = self.personality().execute(command)
+            if stdout:
+                channel.sendall(stdout.encode())
+            if stderr:
+                channel.sendall_stderr(stderr.encode())
+            channel.send_exit_status(status)
+        finally:
+            channel.close()
+
+    def _shell(self, channel: paramiko.Channel) -> None:
+        cli = self.personality()
+        try:
+            channel.sendall((cli.banner() + cli.prompt()).encode())
+            line = ''
+            last = ''
+            while True:
+                data = channel.recv(4096)
+                if not data:
+                    break
+                for char in data.decode(errors='replace'):
+                    if char == '\n' and last == '\r':
+                        last = char
+                        continue
+                    last = char
+                    if char in '\r\n':
+                        self.commands += 1
+                        self.profile.delay()
+                        output = cli.handle(line.strip())
+                        reply = '\r\n'
+                        if output:
+                            reply += output.replace('\n', '\r\n') + '\r\n'
+                        channel.sendall((reply + cli.prompt()).encode())
+                        line = ''
+                    elif char in '\x08\x7f':
+                        line = line[:-1]
+                    elif char >= ' ' or char == '\t':
+                        line += char
+                        channel.sendall(char.encode())
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            channel.close()
@@ -0,0 +1,99 @@
+from typing import List
+
+from models import PhyPort, VlanL3Port, Vrf, LldpNeighbor, LinkModes
+from switch import Switch
+
+
+class BenchSwitch(Switch):
+    # switch without any southbound driver, used only to populate the data model with synthetic items
+
+    def _retrieve_info(self):
+        pass
+
+    def _update_info(self):
+        pass
+
+    def _reinit_sbi_drivers(self) -> None:
+        pass
+
+    def commit_and_save(self):
+        pass
+
+    def _add_vlan(self, vlan_ids: List[int]):
+        return True
+
+    def _del_vlan(self, vlan_ids: List[int]):
+        return True
+
+    def _set_port_mode(self, port, port_mode) -> bool:
+        return True
+
+    def _add_vlan_to_port(self, vlan_id, port, pvid=False) -> bool:
+        return True
+
+    def _del_vlan_to_port(self, vlan_ids, port) -> bool:
+        return True
+
+    def _bind_vrf(self, vrf1, vrf2) -> bool:
+        return True
+
+    def _unbind_vrf(self, vrf1, vrf2) -> bool:
+        return True
+
+    def _add_vlan_to_vrf(self, vrf, vlan_interface) -> bool:
+        return True
+
+    def _add_route(self, *args, **kwargs):
+        return True
+
+    def _del_route(self, *args, **kwargs):
+        return True
+
+    def _add_vrf(self, *args, **kwargs):
+        return True
+
+    def _del_vrf(self, *args, **kwargs):
+        return True
+
+    def _del_vlan_to_vrf(self, *args, **kwargs):
+        return True
+
+
+def make_switch(name: str, n_ports: int = 128, n_vrfs: int = 64, n_vlan_interfaces: int = 512,
+                neighbors: List[str] = None) -> BenchSwitch:
+    phy_ports = []
+    for i in range(n_ports):
+        neighbor = None
+        if neighbors:
+            neighbor = LldpNeighbor(neighbor=neighbors[i % len(neighbors)], remote_interface='Ethernet{}'.format(i))
+        phy_ports.append(PhyPort(
+            index='Ethernet{}'.format(i),
+            name='Ethernet{}'.format(i),
+            trunk_vlans=list(range(100, 100 + i % 32)),
+            access_vlan=1,
+            neighbor=neighbor,
+            speed=100000,
+            mode=LinkModes.trunk
+        ))
+    vlan_l3_ports = [
+        VlanL3Port(index='Vlan{}'.format(vid), name='Vlan{}'.format(vid), vlan=vid,
+                   cidr='10.{}.{}.1/24'.format(vid // 256, vid % 256), vrf='vrf{}'.format(vid % max(n_vrfs, 1)))
+        for vid in range(2, 2 + n_vlan_interfaces)
+    ]
+    vrfs = [
+        Vrf(name='vrf{}'.format(i), rd='65000:{}'.format(i), ports=[]) for i in range(n_vrfs)
+    ]
+    switch = BenchSwitch(
+        name=name,
+        model='bench',
+        user='admin',
+        passwd='admin',
+        address='127.0.0.1',
+        phy_ports=phy_ports,
+        vlan_l3_ports=vlan_l3_ports,
+        vrfs=vrfs,
+        vlans=[item.vlan for item in vlan_l3_ports],
+        state='ready'
+    )
+    switch.rebuild_indexes()
+    return switch
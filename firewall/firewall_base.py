@@ -1,15 +1,21 @@
 from __future__ import annotations  # needed to annotate class methods returning instances
 from netdevice import Device
 from models import ConfigItem, LldpNeighbor, PhyPort, FirewallL3Port, Vrf, FirewallDataModel, FirewallRequestL3Port, \
-    LinkModes, BGPNeighbor
+    LinkModes, BGPNeighbor, FirewallRule, SwitchStates, INITIALIZING_STATES
 from switch.switch_base import SwitchNotConnectedException, SwitchNotAuthenticatedException, \
     SwitchConfigurationException
 import abc
 import json
-from typing import List, Literal, Union, Tuple
+from typing import List, Literal, Union, Tuple, Iterable
 import traceback
 from importlib import import_module
 from utils import persistency, create_logger
+from utils.metrics import refresh_seconds
+from utils.tracing import traced
+from utils.operation_control import checkpointed
+from netdevice import changes_device
+from utils.device_events import DeviceStateEvent, device_events
+from .rules import FirewallRuleSet, RuleSetDiff
 import datetime
 from threading import Thread
 
@@ -23,6 +29,34 @@ fw_os_models = {
 
 class Firewall(FirewallDataModel):
 
+    def set_state(self, state: SwitchStates) -> None:
+        # every state transition is published on the device event bus
+        old_state = self.state
+        self.state = state
+        if old_state != state:
+            self.mark_changed()
+            device_events.publish(DeviceStateEvent(device=self.name, kind='firewall', old_state=old_state,
+                                                   new_state=state))
+
+    def initialize(self) -> None:
+        # loads the information of a firewall restored from the database, run by the thread started by from_db
+        try:
+            self.retrieve_info()
+        except SwitchNotAuthenticatedException:
+            logger.error("firewall %s passed into auth_error state", self.name)
+            self.set_state('auth_error')
+        except SwitchNotConnectedException:
+            logger.error("firewall %s passed into net_error state", self.name)
+            self.set_state('net_error')
+        except Exception:
+            logger.error("firewall %s initialization failed: %s", self.name, traceback.format_exc())
+            self.set_state('config_error')
+        else:
+            if self.state in INITIALIZING_STATES:
+                self.set_state('ready')
+                logger.info("firewall %s passed into ready state", self.name)
+
+    @changes_device
     def retrieve_info(self):
         self.l3_ports = []
         self.phy_ports = []
@@ -36,13 +70,16 @@ class Firewall(FirewallDataModel):
     def _retrieve_info(self):
         pass
 
+    @changes_device
+    @traced()
     def update_info(self):
-        logger.info('updating information for firewall {}'.format(self.name))
+        logger.info('updating information for firewall %s', self.name)
         self.vrfs = []
         self.phy_ports = []
         self.l3_ports = []
         self.port_groups = []
-        self._update_info()
+        with refresh_seconds.time(driver=type(self).__name__, device=self.name):
+            self._update_info()
 
     @abc.abstractmethod
     def _update_info(self):
@@ -61,13 +98,14 @@ class Firewall(FirewallDataModel):
         ).model_validate(input_data.model_dump())
         try:
             firewall.retrieve_info()
-            firewall.state = "ready"
+            if firewall.state in INITIALIZING_STATES:
+                firewall.set_state('ready')
         except SwitchNotAuthenticatedException:
-            logger.error("firewall {} authentication failed".format(input_data.name))
-            firewall.state = "auth_error"
+            logger.error("firewall %s authentication failed", input_data.name)
+            firewall.set_state('auth_error')
         except SwitchNotConnectedException:
-            logger.error("firewall {} not reachable".format(input_data.name))
-            firewall.state = "net_error"
+            logger.error("firewall %s not reachable", input_data.name)
+            firewall.set_state('net_error')
         return firewall
 
     @classmethod
@@ -80,13 +118,13 @@ class Firewall(FirewallDataModel):
         if db_data['model'] not in fw_os_models:
             raise ValueError('OS type {} for switch {} not found'.format(db_data['model'], device_name))
         firewall_os = fw_os_models[db_data['model']]
-        logger.debug("trying to reinitialize object from fw_os_model: {}".format(firewall_os))
+        logger.debug("trying to reinitialize object from fw_os_model: %s", firewall_os)
         try:
             firewall_obj = getattr(import_module("firewall.{}".format(firewall_os['module'])), firewall_os['class'])(**db_data)
-            firewall_obj.state = "reinit"
+            firewall_obj.set_state('reinit')
             firewall_obj.to_db()
             # sbi_thread = Thread(target=switch_obj.reinit_sbi_drivers)
-            sbi_thread = Thread(target=firewall_obj.retrieve_info, name=firewall_obj.name)
+            sbi_thread = Thread(target=firewall_obj.initialize, name=firewall_obj.name)
             sbi_thread.start()
             # switch_obj.reinit_sbi_drivers()
             return firewall_obj, sbi_thread
@@ -94,6 +132,7 @@ class Firewall(FirewallDataModel):
             logger.error(traceback.format_exc())
             raise ValueError('re-initialization for firewall {} failed'.format(device_name))
 
+    @traced()
     def to_db(self) -> None:
         if _db.exists_DB("firewalls", {'name': self.name}):
             _db.update_DB("firewalls", json.loads(self.to_firewall_model().model_dump_json()), {'name': self.name})
@@ -111,7 +150,7 @@ class Firewall(FirewallDataModel):
 
     def store_config(self, cfg: str) -> bool:
         if not self.last_config or cfg != self.last_config.config:
-            logger.info("firewall {} changed its configuration. Updating data".format(self.name))
+            logger.info("firewall %s changed its configuration. Updating data", self.name)
             self.last_config = ConfigItem(time=datetime.datetime.now(), config=cfg)
             self.config_history.append(self.last_config)
             if len(self.config_history) > 100:
@@ -122,14 +161,17 @@ class Firewall(FirewallDataModel):
     def reinit_sbi_drivers(self) -> None:
         try:
             self._reinit_sbi_drivers()
-            self.state = 'ready'
-            logger.info("firewall {} passed into ready state".format(self.name))
+            # the ready state is set once the information is retrieved, see initialize()
+            logger.info("firewall %s drivers initialized", self.name)
         except SwitchNotConnectedException:
-            self.state = 'net_error'
-            logger.error("firewall {} passed into net_error state".format(self.name))
+            self.set_state('net_error')
+            logger.error("firewall %s passed into net_error state", self.name)
+            # the information cannot be retrieved without drivers: the caller (initialize, create) stops here
+            raise
         except SwitchNotAuthenticatedException:
-            self.state = 'auth_error'
-            logger.error("firewall {} passed into auth_error state".format(self.name))
+            self.set_state('auth_error')
+            logger.error("firewall %s passed into auth_error state", self.name)
+            raise
         finally:
             # FixMe: do we need to raise an tread event to notify the network topology in case of errors?
             self.to_db()
@@ -146,16 +188,19 @@ class Firewall(FirewallDataModel):
         try:
             return next(item for item in self.phy_ports if item.name == port_name)
         except StopIteration:
-            logger.error("Port {} not found".format(port_name))
+            logger.error("Port %s not found", port_name)
             return None
 
+    @changes_device
+    @checkpointed
+    @traced()
     def add_vlan_to_port(self, vlan_id: int, port_name: str, port_mode: LinkModes = LinkModes.trunk,
                          pvid: bool = False, description: str = '') -> bool:
         port = self.get_port_by_name(port_name)
         if not port:
             return False
         if port.mode != port_mode:
-            logger.error("Port {} is not in mode {}. aborting!".format(port_name, port_mode))
+            logger.error("Port %s is not in mode %s. aborting!", port_name, port_mode)
             return False
 
         return self._add_vlan_to_port(vlan_id, port, pvid, description)
@@ -164,17 +209,20 @@ class Firewall(FirewallDataModel):
     def _add_vlan_to_port(self, vlan_id: int, port: PhyPort, pvid: bool = False, description: str = '') -> bool:
         pass
 
+    @changes_device
+    @checkpointed
+    @traced()
     def del_vlan_to_port(self, vlan_ids: List[int], port_name: str, port_mode: LinkModes = LinkModes.trunk,
                          description: str = '') -> bool:
         port = self.get_port_by_name(port_name)
         if not port:
             return False
         if port.mode != port_mode:
-            logger.error("Port {} is not in mode {}. aborting!".format(port_name, port_mode))
+            logger.error("Port %s is not in mode %s. aborting!", port_name, port_mode)
             return False
         for vid in vlan_ids:
             if vid in port.trunk_vlans or vid == port.access_vlan:
-                logger.warn("vlan {} already configured  in port {}, aborting operation.".format(vid, port_name))
+                logger.warning("vlan %s already configured  in port %s, aborting operation.", vid, port_name)
                 return False
         return self._del_vlan_to_port(vlan_ids, port, description)
 
@@ -182,6 +230,9 @@ class Firewall(FirewallDataModel):
     def _del_vlan_to_port(self, vlan_ids: List[int], port: PhyPort, description: str = '') -> bool:
         pass
 
+    @changes_device
+    @checkpointed
+    @traced()
     def add_l3port_to_vrf(self, vrf: Vrf, vlan_interface: FirewallRequestL3Port) -> bool:
         if not self.check_status():
             raise ValueError("Firewall {} is in {} status".format(self.name, self.state))
@@ -192,7 +243,7 @@ class Firewall(FirewallDataModel):
             raise ValueError("Vrf {} not found".format(vrf.name))
 
         if vlan_interface.vlan not in port.trunk_vlans or int(vlan_interface.vlan) != port.access_vlan:
-            logger.warn("vlan {} not configured on port {}. Adding it.".format(vlan_interface.vlan, port.name))
+            logger.warning("vlan %s not configured on port %s. Adding it.", vlan_interface.vlan, port.name)
             self.add_vlan_to_port(
                 vlan_id=vlan_interface.vlan,
                 port_name=vlan_interface.intf,
@@ -206,6 +257,9 @@ class Firewall(FirewallDataModel):
     def _add_l3port_to_vrf(self, vrf: Vrf, vlan_interface: FirewallRequestL3Port) -> bool:
         pass
 
+    @changes_device
+    @checkpointed
+    @traced()
     def del_vlan_to_vrf(self, vrf_name: str, vlan_id: int) -> bool:
         if not self.check_status():
             raise ValueError("switch {} is in {} status".format(self.name, self.state))
@@ -246,6 +300,9 @@ class Firewall(FirewallDataModel):
     def get_last_config(self) -> str:
         return self.last_config.config
 
+    @changes_device
+    @checkpointed
+    @traced()
     def add_bgp_peering(self, msg: BGPNeighbor):
         self._add_bgp_peering(msg)
 
@@ -253,6 +310,9 @@ class Firewall(FirewallDataModel):
     def _add_bgp_peering(self, msg: BGPNeighbor):
         pass
 
+    @changes_device
+    @checkpointed
+    @traced()
     def del_bgp_peering(self, msg: BGPNeighbor):
         self._del_bgp_peering(msg)
 
@@ -267,3 +327,31 @@ class Firewall(FirewallDataModel):
     @abc.abstractmethod
     def _del_l3port_to_group(self, vlan_interface: FirewallRequestL3Port, fw_port_group: str):
         pass
+
+    def get_rule_set(self, refresh: bool = False) -> FirewallRuleSet:
+        return self._get_rule_set(refresh)
+
+    @abc.abstractmethod
+    def _get_rule_set(self, refresh: bool = False) -> FirewallRuleSet:
+        pass
+
+    @changes_device
+    @checkpointed
+    @traced()
+    def sync_rules(self, rules: Iterable[FirewallRule], interfaces: Iterable[str] = None,
+                   dry_run: bool = False) -> RuleSetDiff:
+        # aligns the rules on the given interfaces to the requested ones with the minimal set of changes, applied
+        # with a single filter reload
+        if not self.check_status():
+            raise ValueError("Firewall {} is in {} status".format(self.name, self.state))
+        diff = self.get_rule_set().diff(rules, interfaces)
+        logger.info("firewall %s rules sync: %s to create, %s to update, %s to delete",
+            self.name, len(diff.create), len(diff.update), len(diff.delete))
+        if dry_run or diff.is_empty():
+            return diff
+        self._apply_rule_diff(diff)
+        return diff
+
+    @abc.abstractmethod
+    def _apply_rule_diff(self, diff: RuleSetDiff) -> None:
+        pass
@@ -1,16 +1,21 @@
+import hashlib
 import json
-from pydantic import IPvAnyInterface
+import time
+from pydantic import IPvAnyInterface, PrivateAttr
 from sbi.pfsense_rest import PfSenseRestSbi
 from sbi.paramiko_sbi import ParamikoSbi
 from sbi.frr_vtysh import FrrConfig
 from .firewall_base import Firewall, FirewallRequestL3Port
+from .rules import FirewallRuleSet, RuleSetDiff
 from .pfsense_models import PfSenseInterfaceMap, PfSenseAvailableInterfaceMap, PfSense_GroupList, PfSense_RuleList, \
     PfSenseInterface
 from models import PhyPort, Vrf, FirewallL3Port, FirewallPortGroup, \
-    BGPNeighbor, BGPRoutingProtocol, RoutingProtocols, LinkModes
+    BGPNeighbor, BGPRoutingProtocol, RoutingProtocols, LinkModes, FirewallRule
 from ipaddress import IPv4Network, IPv4Interface
 from utils import create_logger
-from typing import List, Tuple, Dict
+from utils.concurrency import run_concurrently
+from utils.metrics import observe_refresh_timings
+from typing import List, Tuple, Dict, Any, Callable, ClassVar, Union
 
 logger = create_logger('pfsense')
 
@@ -19,18 +24,147 @@ class PfSense(Firewall):
     _sbi_rest_driver: PfSenseRestSbi = None
     _sbi_ssh_driver: ParamikoSbi = None
     frr_config: FrrConfig = None
+    # slow-changing tables cached by command: (fetch time, payload digest, parsed data)
+    _table_cache: Dict[str, Tuple[float, str, Any]] = PrivateAttr(default_factory=dict)
+    _rules: Union[PfSense_RuleList, None] = PrivateAttr(default=None)
+    _rule_set: Union[FirewallRuleSet, None] = PrivateAttr(default=None)
+    _refresh_timings: Dict[str, float] = PrivateAttr(default_factory=dict)
+    # seconds before the cached tables are requested again; their payload is parsed again only if it changed
+    slow_tables_ttl: ClassVar[float] = 300
+    slow_tables: ClassVar[List[str]] = ['interface/available', 'interface/group']
+    # the firewall rules are not used to build the firewall data, and they are fetched at refresh only if True
+    fetch_rules: ClassVar[bool] = False
+
+    def _get_fetch_tasks(self) -> Dict[str, Callable[[], Any]]:
+        # requests towards the firewall needed at each refresh; they do not depend on each other
+        tasks = {
+            'interface': lambda: self._sbi_rest_driver.get("interface", parsing_class=PfSenseInterfaceMap),
+            'available': lambda: self._get_table("interface/available", PfSenseAvailableInterfaceMap),
+            'groups': lambda: self._get_table("interface/group", PfSense_GroupList),
+            'routing': lambda: FrrConfig.from_raw_config(
+                self._sbi_ssh_driver.stream_command("vtysh -c \"show running-config\"")),
+            'config': lambda: self._sbi_rest_driver.get("system/config")
+        }
+        if self.fetch_rules:
+            tasks['rules'] = self.retrieve_rules
+        return tasks
+
+    def _get_table(self, command: str, parsing_class=None) -> Any:
+        now = time.monotonic()
+        cached = self._table_cache.get(command)
+        if cached and now - cached[0] < self.slow_tables_ttl:
+            return cached[2]
+        raw = self._sbi_rest_driver.get_raw(command)
+        digest = hashlib.sha256(raw).hexdigest()
+        if cached and cached[1] == digest:
+            logger.debug('table %s unchanged on firewall %s', command, self.name)
+            data = cached[2]
+        else:
+            data = self._sbi_rest_driver.parse(raw, parsing_class)
+        self._table_cache[command] = (now, digest, data)
+        return data
+
+    def invalidate_tables(self, *commands: str) -> None:
+        # to be called after the firewall has been changed, so that the next refresh reads the tables again
+        for command in commands or self.slow_tables:
+            self._table_cache.pop(command, None)
+
+    def retrieve_rules(self) -> PfSense_RuleList:
+        self._rules = self._sbi_rest_driver.get("firewall/rule", parsing_class=PfSense_RuleList)
+        self._rule_set = None
+        return self._rules
+
+    def get_rules(self) -> PfSense_RuleList:
+        return self._rules if self._rules is not None else self.retrieve_rules()
 
     def _update_info(self):
-        self.retrieve_data()
+        start = time.perf_counter()
+        raw, timings = run_concurrently(self._get_fetch_tasks(), name='{}-fetch'.format(self.name))
+        timings['fetch_total'] = time.perf_counter() - start
+        self.retrieve_data(raw)
 
-        config = self._sbi_rest_driver.get("system/config")
+        config = raw['config']
         # Note: pfsense config also contains the complete Frr configuration
         if 'rrddata' in config.keys():
             config.pop('rrddata')
 
         str_config = json.dumps(config)
-        logger.warn("the size of the config is {} MB".format(len(str_config)/1024/1024))
+        logger.debug("the size of the config is %s MB", len(str_config)/1024/1024)
         self.store_config(str_config)
+        timings['total'] = time.perf_counter() - start
+        self._refresh_timings = timings
+        observe_refresh_timings(type(self).__name__, self.name, timings)
+        logger.info('firewall %s refreshed in %.3fs (%s)', self.name, timings['total'], ', '.join(
+            '{} {:.3f}s'.format(k, v) for k, v in timings.items() if k != 'total'))
+
+    def _get_rule_set(self, refresh: bool = False) -> FirewallRuleSet:
+        if refresh or self._rule_set is None:
+            rules = self.retrieve_rules() if refresh else self.get_rules()
+            self._rule_set = FirewallRuleSet(rules.to_firewall_rules())
+        return self._rule_set
+
+    @staticmethod
+    def _to_rule_request(rule: FirewallRule) -> Dict[str, Any]:
+        # the filter is not reloaded at each rule change, but once at the end of the batch
+        request = {
+            'type': rule.action,
+            'interface': rule.interfaces,
+            'ipprotocol': rule.ipprotocol,
+            'src': rule.source.address,
+            'dst': rule.destination.address,
+            'descr': rule.description,
+            'disabled': rule.disabled,
+            'apply': False
+        }
+        if rule.protocol:
+            request['protocol'] = rule.protocol
+            if rule.protocol in ['tcp', 'udp', 'tcp/udp']:
+                request['srcport'] = rule.source.port or 'any'
+                request['dstport'] = rule.destination.port or 'any'
+        else:
+            request['protocol'] = 'any'
+        if rule.id:
+            request['tracker'] = rule.id
+        return request
+
+    def _apply_rule_diff(self, diff: RuleSetDiff) -> None:
+        rule_set = self._get_rule_set()
+        changed = False
+        failed = False
+        try:
+            for rule in diff.delete:
+                self._sbi_rest_driver.delete("firewall/rule?tracker={}&apply=false".format(rule.id))
+                rule_set.remove(rule.id)
+                changed = True
+            for rule in diff.update:
+                self._sbi_rest_driver.put("firewall/rule", self._to_rule_request(rule))
+                rule_set.add(rule)
+                changed = True
+            for rule in diff.create:
+                self._sbi_rest_driver.post("firewall/rule", self._to_rule_request(rule))
+                changed = True
+        except Exception:
+            # the outcome of the failed request is unknown: the rules are read again when needed
+            self._rule_set = None
+            failed = True
+            raise
+        finally:
+            self._rules = None
+            # the trackers of the created rules are assigned by the device
+            if diff.create:
+                self._rule_set = None
+            # the changes accepted so far are applied with a single filter reload; after a failed request, a failure
+            # of the reload is only logged, so that it does not hide the original error
+            if changed:
+                try:
+                    self.commit_and_save()
+                except Exception:
+                    if not failed:
+                        raise
+                    logger.exception('filter reload after a failed rule change on firewall %s failed', self.name)
+
+    def get_refresh_timings(self) -> Dict[str, float]:
+        return dict(self._refresh_timings)
 
     def _reinit_sbi_drivers(self) -> None:
         if not self._sbi_rest_driver:
@@ -44,60 +178,69 @@ class PfSense(Firewall):
         self.reinit_sbi_drivers()
         self.update_info()
 
-    def retrieve_data(self) -> None:
-        pf_sense_l3_ports = self._sbi_rest_driver.get("interface", parsing_class=PfSenseInterfaceMap)
-        pf_sense_phy_ports = self._sbi_rest_driver.get(
-            "interface/available", parsing_class=PfSenseAvailableInterfaceMap)
+    def retrieve_data(self, raw: Dict[str, Any] = None) -> None:
+        if raw is None:
+            raw, _ = run_concurrently(
+                {k: v for k, v in self._get_fetch_tasks().items() if k != 'config'}, name='{}-fetch'.format(self.name))
+        pf_sense_l3_ports = raw['interface']
+        pf_sense_phy_ports = raw['available']
+        if any(l3_port.intf and l3_port.intf not in pf_sense_phy_ports.root
+               for l3_port in pf_sense_l3_ports.root.values()):
+            # the cached table is older than the interfaces (e.g. created outside the controller): it is read again
+            logger.info('interfaces of firewall %s changed, reading the available interfaces again', self.name)
+            self.invalidate_tables('interface/available')
+            pf_sense_phy_ports = self._get_table("interface/available", PfSenseAvailableInterfaceMap)
         self.phy_ports = pf_sense_phy_ports.to_phy_port_list()
+        phy_ports_by_index = {item.index: item for item in self.phy_ports}
 
-        for port_name in pf_sense_l3_ports.root.keys():
+        for port_name, l3_port in pf_sense_l3_ports.root.items():
             vlan = 1
-            if pf_sense_l3_ports.root[port_name].intf:
-                current_phy_port = pf_sense_phy_ports.root[pf_sense_l3_ports.root[port_name].intf]
-                if current_phy_port.isvlan:
-
+            if l3_port.intf:
+                current_phy_port = pf_sense_phy_ports.root.get(l3_port.intf)
+                if current_phy_port is None:
+                    logger.warning('interface %s of port %s not available on firewall %s',
+                        l3_port.intf, port_name, self.name)
+                elif current_phy_port.isvlan:
                     vlan = current_phy_port.tag
-                    fw_parent_port = next(item for item in self.phy_ports
-                                          if item.index == current_phy_port.vlanif.split('.')[0])
-                    fw_parent_port.trunk_vlans.append(vlan)
+                    fw_parent_port = phy_ports_by_index.get(current_phy_port.vlanif.split('.')[0])
+                    if fw_parent_port:
+                        fw_parent_port.trunk_vlans.append(vlan)
+                    else:
+                        logger.warning('parent port of vlan interface %s not found', current_phy_port.vlanif)
             _ipaddr = None
             _cidr = None
-            if pf_sense_l3_ports.root[port_name].ipaddr:
-                _ipaddr = pf_sense_l3_ports.root[port_name].ipaddr
-                _cidr = IPvAnyInterface("{}/{}".format(
-                    pf_sense_l3_ports.root[port_name].ipaddr, pf_sense_l3_ports.root[port_name].subnet))
+            if l3_port.ipaddr:
+                _ipaddr = l3_port.ipaddr
+                _cidr = IPvAnyInterface("{}/{}".format(l3_port.ipaddr, l3_port.subnet))
             self.l3_ports.append(FirewallL3Port(
                 index=port_name,
-                name=pf_sense_l3_ports.root[port_name].descr,
+                name=l3_port.descr,
                 vlan=vlan,
                 ipaddress=_ipaddr,
                 cidr=_cidr,
                 vrf="default",
-                interface_assignment=pf_sense_l3_ports.root[port_name].intf.split('.')[0]
+                interface_assignment=l3_port.intf.split('.')[0]
             ))
         for port in self.phy_ports:
             if len(port.trunk_vlans) > 1:
                 port.mode = LinkModes.trunk
 
-        pfsense_groups = self._sbi_rest_driver.get("interface/group", parsing_class=PfSense_GroupList)
-        print(pfsense_groups)
-        for g in pfsense_groups:
+        for g in raw['groups']:
             self.port_groups.append(FirewallPortGroup(
                 name=g.ifname,
                 description=g.descr,
                 members=g.members.split()
             ))
 
-        pfsense_rules = self._sbi_rest_driver.get("firewall/rule", parsing_class=PfSense_RuleList)
-        for r in pfsense_rules:
-            logger.debug(r.model_dump())
-
         self.vrfs.append(Vrf(name='default', rd='default', description="Default VRF", ports=self.l3_ports))
+        vrfs_by_name = {item.name: item for item in self.vrfs}
 
-        raw_config = self._sbi_ssh_driver.send_command(commands=["vtysh -c \"show running-config\""])
-        self.frr_config = FrrConfig.from_raw_config(raw_config[-1]['_stdout'])
+        self.frr_config = raw['routing']
         for frr_vrf in self.frr_config.routers:
-            device_vrf = next(item for item in self.vrfs if item.name == frr_vrf.vrf)
+            device_vrf = vrfs_by_name.get(frr_vrf.vrf)
+            if not device_vrf:
+                logger.warning('FRR vrf %s not found on firewall %s', frr_vrf.vrf, self.name)
+                continue
             if not device_vrf.protocols:
                 device_vrf.protocols = RoutingProtocols()
             device_vrf.protocols.bgp = BGPRoutingProtocol(
@@ -120,7 +263,8 @@ class PfSense(Firewall):
             'apply': True
         }
         res = self._sbi_rest_driver.post('interface', itf_request)
-        logger.debug("Operation result: {}".format(res))
+        self.invalidate_tables('interface/available')
+        logger.debug("Operation result: %s", res)
 
     def _add_vlan_to_port(self, vlan_id: int, port: PhyPort, pvid: bool = False, description: str = '') -> bool:
         msg = {
@@ -130,17 +274,20 @@ class PfSense(Firewall):
         }
         if not self._sbi_rest_driver.post("interface/vlan", msg):
             raise ValueError('Vlan {} cannot be set on port {}'.format(vlan_id, port.name))
+        self.invalidate_tables('interface/available')
 
     def _del_vlan_to_port(self, vlan_ids: List[int], port: PhyPort) -> bool:
         data = self._sbi_rest_driver.get("interface/vlan")
-        logger.warn(data)
+        logger.warning(data)
         for vid in vlan_ids:
             itf_index = next(i for i, x in enumerate(data) if x['if'] == port.name and int(x['tag']) == vid)
             res = self._sbi_rest_driver.delete("interface/vlan?id={}".format(itf_index))
-            logger.debug("Vlan {} deleted on interface {}: {}".format(vid, port.name, res))
+            logger.debug("Vlan %s deleted on interface %s: %s", vid, port.name, res)
+        self.invalidate_tables('interface/available')
 
     def _del_vlan_to_vrf(self, vrf: Vrf, vlan_interface: FirewallL3Port) -> bool:
         self._sbi_rest_driver.delete('interface?if={}'.format(vlan_interface.description))
+        self.invalidate_tables('interface/available')
         port = next(item for item in self.phy_ports if item.name == vlan_interface.interface_assignment)
         self._del_vlan_to_port([vlan_interface.vlan], port)
 
@@ -161,24 +308,26 @@ class PfSense(Firewall):
             vlan_interface, fw_port_group)
 
         if interface_key in itfs_in_group:
-            logger.warn("interface {} already in the group {}".format(interface_name, fw_port_group))
+            logger.warning("interface %s already in the group %s", interface_name, fw_port_group)
             return
 
         itfs_in_group.append(interface_key)
         group_to_update['members'] = " ".join(itfs_in_group)
         self._sbi_rest_driver.put('interface/group', group_to_update)
+        self.invalidate_tables('interface/group')
 
     def _del_l3port_to_group(self, vlan_interface: FirewallRequestL3Port, fw_port_group: str):
         interface_key, interface_name, itfs_in_group, group_to_update = self._get_data_for_group_mgt(
             vlan_interface, fw_port_group)
 
         if interface_key not in itfs_in_group:
-            logger.warn("interface {} is not in the group {}. Skipping".format(interface_name, fw_port_group))
+            logger.warning("interface %s is not in the group %s. Skipping", interface_name, fw_port_group)
             return
 
         itfs_in_group.remove(interface_key)
         group_to_update['members'] = " ".join(itfs_in_group)
         self._sbi_rest_driver.put('interface/group', group_to_update)
+        self.invalidate_tables('interface/group')
 
     def _get_data_for_group_mgt(self, vlan_interface: FirewallRequestL3Port, fw_port_group: str) -> Tuple[str, str,
                                                                                                           List, Dict]:
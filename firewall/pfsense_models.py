@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, IPvAnyAddress, RootModel, model_validator, ValidationError
 from typing import List, Optional, Any, Dict, Literal, Union
-from models import PhyPort
+from models import PhyPort, FirewallRule, FirewallRuleEndpoint
 from enum import Enum
 
 
@@ -120,12 +120,13 @@ class PfSense_Rule_EndpointWildcard(BaseModel):
 
 class PfSense_Rule_Endpoint(BaseModel):
     address: str = ""
+    network: str = ""
     port: str = ""
 
     @model_validator(mode='after')
     def check_address_and_port(cls, values):
-        if not values.address and not values.port:
-            raise ValidationError('Both address and port cannot be empty')
+        if not values.address and not values.network and not values.port:
+            raise ValueError('Both address and port cannot be empty')
         return values
 
 
@@ -153,6 +154,7 @@ class YesNo(Enum):
 class RuleActionType(Enum):
     block = "block"
     accept = "pass"
+    reject = "reject"
 
 class RuleStateType(Enum):
     keep = "keep state"
@@ -162,7 +164,7 @@ class PfSense_Rule(BaseModel):
     tracker: Optional[str] = None
     type: RuleActionType = None
     interface: List[str]  # "opt7,opt8,opt9,opt10,opt11,opt12,opt13,opt14,opt15,opt16",
-    ipprotocol: IPProtocol = IPProtocol.inet,
+    ipprotocol: IPProtocol = IPProtocol.inet
     tag: Optional[str] = None
     tagged: Optional[str] = None
     direction: Direction = Direction.egress
@@ -190,6 +192,26 @@ class PfSense_Rule(BaseModel):
         self["interface"] = self["interface"].split(',')
         return handler(self)
 
+    @staticmethod
+    def _to_endpoint(endpoint: Union[PfSense_Rule_Endpoint, PfSense_Rule_EndpointWildcard]) -> FirewallRuleEndpoint:
+        if isinstance(endpoint, PfSense_Rule_EndpointWildcard):
+            return FirewallRuleEndpoint()
+        return FirewallRuleEndpoint(address=endpoint.address or endpoint.network or 'any', port=endpoint.port)
+
+    def to_firewall_rule(self) -> FirewallRule:
+        return FirewallRule(
+            id=self.tracker,
+            description=self.descr,
+            interfaces=self.interface,
+            action=self.type.value if self.type else 'pass',
+            protocol=self.protocol,
+            ipprotocol=self.ipprotocol.value,
+            source=self._to_endpoint(self.source),
+            destination=self._to_endpoint(self.destination),
+            # the key is present, with an empty value, only for disabled rules
+            disabled='disabled' in self.model_fields_set
+        )
+
 
 class PfSense_RuleList(RootModel):
     root: List[PfSense_Rule]
@@ -199,3 +221,6 @@ class PfSense_RuleList(RootModel):
 
     def __getitem__(self, item):
         return self.root[item]
+
+    def to_firewall_rules(self) -> List[FirewallRule]:
+        return [item.to_firewall_rule() for item in self.root if item.tracker]
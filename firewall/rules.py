@@ -0,0 +1,97 @@
+# In-memory firewall rule set, indexed by id, interface and endpoints, and minimal diff between a desired rule set and
+# the rules on the device. Rule order is not taken into account: new rules are appended by the device
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple, Union
+from models import FirewallRule
+
+
+class RuleSetDiff(NamedTuple):
+    create: List[FirewallRule]
+    # desired content of the updated rules, carrying the id of the device rule to be replaced
+    update: List[FirewallRule]
+    delete: List[FirewallRule]
+
+    def is_empty(self) -> bool:
+        return not (self.create or self.update or self.delete)
+
+
+class FirewallRuleSet:
+    def __init__(self, rules: Iterable[FirewallRule] = ()):
+        self._by_id: Dict[str, FirewallRule] = {}
+        self._by_interface: Dict[str, Dict[str, FirewallRule]] = {}
+        self._by_endpoints: Dict[Tuple[str, str], Dict[str, FirewallRule]] = {}
+        for rule in rules:
+            self.add(rule)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[FirewallRule]:
+        return iter(self._by_id.values())
+
+    def add(self, rule: FirewallRule) -> None:
+        if not rule.id:
+            raise ValueError('firewall rule "{}" has no id'.format(rule.description))
+        if rule.id in self._by_id:
+            self.remove(rule.id)
+        self._by_id[rule.id] = rule
+        for interface in rule.interfaces:
+            self._by_interface.setdefault(interface, {})[rule.id] = rule
+        self._by_endpoints.setdefault((rule.source.address, rule.destination.address), {})[rule.id] = rule
+
+    def remove(self, rule_id: str) -> Union[FirewallRule, None]:
+        rule = self._by_id.pop(rule_id, None)
+        if not rule:
+            return None
+        for interface in rule.interfaces:
+            self._by_interface[interface].pop(rule_id, None)
+        self._by_endpoints[(rule.source.address, rule.destination.address)].pop(rule_id, None)
+        return rule
+
+    def get(self, rule_id: str) -> Union[FirewallRule, None]:
+        return self._by_id.get(rule_id)
+
+    def by_interface(self, interface: str) -> List[FirewallRule]:
+        return list(self._by_interface.get(interface, {}).values())
+
+    def by_endpoints(self, source: str, destination: str) -> List[FirewallRule]:
+        return list(self._by_endpoints.get((source, destination), {}).values())
+
+    def diff(self, desired: Iterable[FirewallRule], interfaces: Iterable[str] = None) -> RuleSetDiff:
+        # rules are managed only on the given interfaces (all of them if None): device rules applied also to other
+        # interfaces are never matched, updated or deleted. Desired rules equal to a device rule are kept, the ones
+        # with the description of a device rule left unmatched become updates, the others are created; unmatched
+        # device rules are deleted
+        if interfaces is None:
+            managed = dict(self._by_id)
+        else:
+            interfaces = set(interfaces)
+            managed = {}
+            for interface in interfaces:
+                managed.update({rule_id: rule for rule_id, rule in self._by_interface.get(interface, {}).items()
+                                if interfaces.issuperset(rule.interfaces)})
+
+        by_key: Dict[tuple, List[str]] = {}
+        for rule_id, rule in managed.items():
+            by_key.setdefault(rule.match_key(), []).append(rule_id)
+
+        unmatched = []
+        for rule in desired:
+            candidates = by_key.get(rule.match_key())
+            if candidates:
+                managed.pop(candidates.pop(0))
+            else:
+                unmatched.append(rule)
+
+        by_description = {}
+        for rule_id, rule in managed.items():
+            if rule.description:
+                by_description.setdefault(rule.description, []).append(rule_id)
+
+        create, update = [], []
+        for rule in unmatched:
+            candidates = by_description.get(rule.description) if rule.description else None
+            if candidates:
+                update.append(rule.model_copy(update={'id': managed.pop(candidates.pop(0)).id}))
+            else:
+                create.append(rule)
+        return RuleSetDiff(create=create, update=update, delete=list(managed.values()))
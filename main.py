@@ -1,25 +1,48 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from rest_endpoints.rest_switch import device_api_router
 from rest_endpoints.rest_network import net_api_router
 from rest_endpoints.rest_operation import operation_router
 from rest_endpoints.rest_tools import network_tools_router
-from server_implementation import server_ip_address, server_port_number
+from rest_endpoints.rest_metrics import metrics_router
+from rest_endpoints.rest_health import health_router
+from network import net_worker
 import uvicorn
 
-app = FastAPI(
-    title="NetCL",
-    # description=description,
-    version="0.0.1",
-    license_info={
-        "name": "Apache 2.0",
-        "url": "https://www.apache.org/licenses/LICENSE-2.0.html",
-    },
-)
 
-app.include_router(device_api_router)
-app.include_router(net_api_router)
-app.include_router(operation_router)
-app.include_router(network_tools_router)
+def create_app(start_network: bool = True) -> FastAPI:
+    # importing this module does no I/O: the configuration, the database and the devices are loaded by the network
+    # worker, started in background when the application starts serving
+    @asynccontextmanager
+    async def lifespan(_app: FastAPI):
+        if start_network:
+            net_worker.start()
+        yield
+        net_worker.stop()
 
-# Server ip address and port address should be defined in config.json file
-# uvicorn.run(app, host=server_ip_address, port=server_port_number)
+    app = FastAPI(
+        title="NetCL",
+        # description=description,
+        version="0.0.1",
+        license_info={
+            "name": "Apache 2.0",
+            "url": "https://www.apache.org/licenses/LICENSE-2.0.html",
+        },
+        lifespan=lifespan,
+    )
+
+    app.include_router(device_api_router)
+    app.include_router(net_api_router)
+    app.include_router(operation_router)
+    app.include_router(network_tools_router)
+    app.include_router(metrics_router)
+    app.include_router(health_router)
+    return app
+
+
+app = create_app()
+
+if __name__ == '__main__':
+    # Server ip address and port address should be defined in config.json file
+    from server_implementation import server_ip_address, server_port_number
+    uvicorn.run(app, host=server_ip_address or '127.0.0.1', port=server_port_number or 8000)
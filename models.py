@@ -1,7 +1,7 @@
 from __future__ import annotations
 import datetime
 from datetime import datetime
-from typing import Literal, List, Union, Optional, Tuple
+from typing import Literal, List, Union, Optional, Tuple, Set
 from enum import Enum
 
 from ipaddress import IPv4Network
@@ -22,7 +22,7 @@ NetWorkerOperationType = Literal[
     'del_port_vlan',
     'mod_port_vlan'
 ]
-NetWorkerOperationStates = Literal['InProgress', 'Failed', 'Success']
+NetWorkerOperationStates = Literal['InProgress', 'Failed', 'Success', 'Cancelled', 'Expired']
 
 class LinkModes(Enum):
     access = 'ACCESS'
@@ -35,6 +35,8 @@ class LinkModes(Enum):
 LinkStates = Literal['UP', 'DOWN', 'NA']
 LinkAdminStates = Literal['ENABLED', 'DISABLED', 'NA']
 SwitchStates = Literal["init", "reinit", "ready", "config_error", "auth_error", "net_error", "executing"]
+# states of a device whose information is still being loaded
+INITIALIZING_STATES = ["init", "reinit"]
 
 
 class PollingOperationLinks(BaseModel):
@@ -53,7 +55,7 @@ class NetVlanReport(BaseModel):
 
 class PortVlanReport(BaseModel):
     trunk: List[int]
-    pvid: int
+    pvid: Union[int, None] = None
     mode: str
 
 
@@ -260,9 +262,21 @@ class PhyPort(BaseModel):
                self.access_vlan == other.access_vlan and self.mode == other.mode and \
                self.admin_status == other.admin_status
 
+    def _get_mode_value(self) -> str:
+        return self.mode.value if isinstance(self.mode, LinkModes) else self.mode
+
     def check_vlan(self, vid: int) -> bool:
-        return (vid in self.trunk_vlans and self.mode in ['TRUNK', 'HYBRID']) or \
-                   (vid == self.access_vlan and self.mode in ['ACCESS', 'HYBRID'])
+        mode = self._get_mode_value()
+        return (vid in self.trunk_vlans and mode in ['TRUNK', 'HYBRID']) or \
+                   (vid == self.access_vlan and mode in ['ACCESS', 'HYBRID'])
+
+    def get_vlans(self) -> Set[int]:
+        # vlans carried by the port, according to the same rules of check_vlan
+        mode = self._get_mode_value()
+        res = set(self.trunk_vlans) if mode in ['TRUNK', 'HYBRID'] else set()
+        if self.access_vlan is not None and mode in ['ACCESS', 'HYBRID']:
+            res.add(self.access_vlan)
+        return res
 
     def get_neighbor_name(self) -> str:
         if self.neighbor:
@@ -293,24 +307,29 @@ class SwitchDataModel(Device):
                self.vrfs == other.vrfs and self.vlans == other.vlans
 
     def get_diff(self, other: SwitchDataModel) -> DiffResult:
-        result = DiffResult()
+        def empty_model() -> SwitchDataModel:
+            return SwitchDataModel(name=self.name, model=self.model, user=self.user, passwd=self.passwd,
+                                   address=self.address)
 
-        def check_difference(first: List, second: List, discr_name: dict) -> dict:
+        result = DiffResult(added=empty_model(), changed=empty_model(), deleted=empty_model())
+
+        def check_difference(first: List, second: List, discr_name: str) -> dict:
             res = {'added': [], 'changed': [], 'deleted': []}
             if first != second:
+                # items are matched by key through a dict, the first item with a given key wins as in a linear scan
+                second_by_key = {}
+                for item in second:
+                    second_by_key.setdefault(getattr(item, discr_name), item)
+                first_keys = set()
                 for first_element in first:
-                    other_element = next((item for item in second if
-                                          getattr(item, discr_name) == getattr(first_element, discr_name)), None)
+                    key = getattr(first_element, discr_name)
+                    first_keys.add(key)
+                    other_element = second_by_key.get(key)
                     if not other_element:
                         res['added'].append(first_element)
-                    else:
-                        if first_element != other_element:
-                            res['changed'].append(first_element)
-                for other_element in second:
-                    first_element = next((item for item in first if
-                                          getattr(item, discr_name) == getattr(other_element, discr_name)), None)
-                    if not first_element:
-                        res['deleted'].append(other_element)
+                    elif first_element != other_element:
+                        res['changed'].append(first_element)
+                res['deleted'] = [item for item in second if getattr(item, discr_name) not in first_keys]
             return res
 
         port_diff = check_difference(self.phy_ports, other.phy_ports, 'index')
@@ -327,6 +346,7 @@ class SwitchDataModel(Device):
         result.added.vrfs = vrf_diff['added']
         result.changed.vrfs = vrf_diff['changed']
         result.deleted.vrfs = vrf_diff['deleted']
+        return result
 
 
 
@@ -361,6 +381,30 @@ class FirewallPortGroup(BaseModel):
     description: str
     name: str
 
+class FirewallRuleEndpoint(BaseModel):
+    # address is 'any', an address or network, an alias or an interface network name
+    address: str = 'any'
+    port: str = ''
+
+
+class FirewallRule(BaseModel):
+    # id is the device identifier of the rule (the tracker on pfSense), None for rules not yet created
+    id: Optional[str] = None
+    description: str = ''
+    interfaces: List[str]
+    action: Literal['pass', 'block', 'reject'] = 'pass'
+    protocol: Optional[Literal['tcp', 'udp', 'icmp', 'tcp/udp']] = None
+    ipprotocol: Literal['inet', 'inet6', 'inet46'] = 'inet'
+    source: FirewallRuleEndpoint = FirewallRuleEndpoint()
+    destination: FirewallRuleEndpoint = FirewallRuleEndpoint()
+    disabled: bool = False
+
+    def match_key(self) -> tuple:
+        # content of the rule, regardless of its id and description
+        return (tuple(sorted(self.interfaces)), self.action, self.protocol, self.ipprotocol, self.source.address,
+                self.source.port, self.destination.address, self.destination.port, self.disabled)
+
+
 class FirewallDataModel(Device):
     phy_ports: List[PhyPort] = []
     l3_ports: List[FirewallL3Port] = []
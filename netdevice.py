@@ -1,6 +1,12 @@
 from __future__ import annotations
-from pydantic import BaseModel, SecretStr, field_serializer
-from typing import Optional
+import functools
+import itertools
+from pydantic import BaseModel, PrivateAttr, SecretStr, field_serializer
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+# revisions of the device data, unique among all the devices
+_revisions = itertools.count(1)
 
 
 class Device(BaseModel):
@@ -11,6 +17,11 @@ class Device(BaseModel):
     address: str
     client_id: Optional[str] = None
     key: Optional[str] = None
+    # SSH port, if not the default one
+    ssh_port: Optional[int] = None
+    # changed at every change of the device data, so that what is derived from it (e.g. the encoded fragments of the
+    # network snapshot) is rebuilt only when needed
+    _revision: int = PrivateAttr(default_factory=lambda: next(_revisions))
 
     """class Config:
         json_encoders = {
@@ -21,5 +32,32 @@ class Device(BaseModel):
     def dump_secret(self, v):
         return v.get_secret_value() #  if type[v] is SecretStr else v
 
+    def get_host(self) -> str:
+        # address without the port, which may be part of the address for the REST drivers
+        return urlsplit('//{}'.format(self.address)).hostname or self.address
+
+    def get_port(self, default: int) -> int:
+        # port part of the address, if any
+        return urlsplit('//{}'.format(self.address)).port or default
+
     def to_device_model(self) -> Device:
         return Device.model_validate(self, from_attributes=True)
+
+    @property
+    def revision(self) -> int:
+        return self._revision
+
+    def mark_changed(self) -> None:
+        self._revision = next(_revisions)
+
+
+def changes_device(func: Callable) -> Callable:
+    # decorator of the device methods changing its data; the device is marked as changed also if the method fails
+    # midway, since the data may have been partially updated
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.mark_changed()
+    return wrapper
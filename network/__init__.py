@@ -1,3 +1,4 @@
 from .networker import NetworkWorker
 
-net_worker = NetworkWorker()
\ No newline at end of file
+# the worker is created idle: the network is loaded when the application starts it (see main.create_app)
+net_worker = NetworkWorker()
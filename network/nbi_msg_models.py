@@ -3,7 +3,7 @@ from __future__ import annotations
 import datetime
 import ipaddress
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from typing import Union, List, Literal, Optional
 from uuid import uuid4
@@ -15,6 +15,9 @@ from models import PollingOperationLinks, NetWorkerOperationType, NetWorkerOpera
     NetVlanReport, IpV4Route, SwitchRequestVlanL3Port
 from netdevice import Device
 from network.network_models import VlanRange, NetworkConfig
+from network.operation_registry import operation_registry, callback_dispatcher, FINAL_STATES
+from utils.tracing import OperationTrace
+from utils.util import get_config
 
 
 class CallbackModel(BaseModel):
@@ -35,6 +38,18 @@ class RestAnswer202(BaseModel):
     links: List[PollingOperationLinks]
 
 
+class BootstrapStatus(BaseModel):
+    # progress of the network worker initialization, reported by the readiness endpoint
+    phase: Literal['pending', 'configuration', 'network', 'snapshot', 'ready', 'failed'] = 'pending'
+    start_time: Union[datetime, None] = None
+    end_time: Union[datetime, None] = None
+    # managed devices (switches and firewall), and those whose initialization terminated: the worker is ready before
+    # the devices, the operations involving a device still initializing wait for it
+    devices_total: int = 0
+    devices_loaded: int = 0
+    error: Union[str, None] = None
+
+
 class WorkerMsg(BaseModel):
     # this class is the mother class to inherit rest messages and transform them into
     # messages to be elaborated by the main worker thread
@@ -43,7 +58,23 @@ class WorkerMsg(BaseModel):
     status: NetWorkerOperationStates = 'InProgress'
     start_time: datetime = Field(default_factory=datetime.now)
     end_time: Union[datetime, None] = None
-    # error_detail: Union[None, str] = str
+    # reason of the failure, e.g. a device unreachable with its circuit open
+    error_detail: Union[str, None] = None
+    # seconds granted to the operation (the default of its type if not set in the request), and the resulting deadline
+    timeout: Union[float, None] = Field(default=None, gt=0)
+    deadline: Union[datetime, None] = None
+    # spans of the operation steps, with their device and duration
+    trace: Union[OperationTrace, None] = None
+
+    @model_validator(mode='after')
+    def _set_deadline(self):
+        if self.deadline is None:
+            self.deadline = self.start_time + timedelta(
+                seconds=self.timeout or get_config().operations.get_timeout(self.operation))
+        return self
+
+    def is_expired(self) -> bool:
+        return self.deadline is not None and datetime.now() >= self.deadline
 
     def produce_rest_answer_202(self) -> RestAnswer202:
         self.to_db()
@@ -55,13 +86,22 @@ class WorkerMsg(BaseModel):
         else:
             _db.insert_DB("operations", json.loads(self.model_dump_json()))
 
-    def update_status(self, status: Literal['Failed', 'Success']) -> None:
+    def to_registry(self) -> None:
+        operation_registry.update(self.operation_id, json.loads(self.model_dump_json()))
+
+    def update_status(self, status: NetWorkerOperationStates, error_detail: str = None) -> None:
         self.status = status
+        self.error_detail = error_detail
         self.end_time = datetime.now()
         self.to_db()
-        if hasattr(self, 'callback') and status in ['Failed', 'Success']:
-            # FIXME: implement callback
-            pass
+        self.to_registry()
+        if getattr(self, 'callback', None) and status in FINAL_STATES:
+            callback_dispatcher.send(str(self.callback), CallbackModel(
+                id=self.operation_id,
+                operation=self.operation,
+                status=status,
+                detailed_status=error_detail or 'operation {} terminated with status {}'.format(self.operation, status)
+            ).model_dump())
 
 
 class AddSwitchRequest(Device):
@@ -143,6 +183,8 @@ class SetNetworkConfigRequestMsg(WorkerMsg):
             pnf_vlans_pool=vlanpool_from_ranges(self.pnf_vlans_pool),
             pnf_merging_vrf_name=self.pnf_merging_vrf_name,
             pnf_ip_pool=ip_pool_from_ranges(self.pnf_ip_pool, self.pnf_ipnet_mask),
+            vrf_uplink_ip_prefixlen=self.uplink_ipnet_mask,
+            pnf_ip_prefixlen=self.pnf_ipnet_mask,
             as_number=self.as_number,
             firewall_uplink_vlan_port=self.firewall_uplink_vlan_port,
             firewall_uplink_neighbor=self.firewall_uplink_neighbor
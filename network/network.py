@@ -3,6 +3,8 @@ from models import *
 from network.nbi_msg_models import NetVlanMsg, PortToNetVlansMsg
 from network.network_base import _db, logger
 from network.network_graph import NetworkGraph
+from utils.metrics import graph_build_seconds
+from utils.tracing import traced
 from network.network_models import *
 from network.nbi_msg_models import AddPnfRequestMsg, DelPnfRequestMsg, AddRouteRequestMsg, DelRouteRequestMsg
 
@@ -32,9 +34,9 @@ class Network(NetworkGraph):
             return False
 
         if operation == BackboneVlanOps.add:
-            return len(vlan_termination_item.get_switch_names().union(set(switch_name))) > 1
+            return len(vlan_termination_item.get_switch_names().union({switch_name})) > 1
         elif operation == BackboneVlanOps.delete:
-            return len(vlan_termination_item.get_switch_names().difference(set(switch_name))) < 1
+            return len(vlan_termination_item.get_switch_names().difference({switch_name})) < 1
         else:  # operation ==  as_is
             return len(vlan_termination_item.get_switch_names()) > 1
 
@@ -47,48 +49,79 @@ class Network(NetworkGraph):
                 link_missing.append(edge)
         return link_missing, len(link_missing) > 0
 
+    @traced()
+    @graph_build_seconds.time(kind='vlan_data')
     def build_vlan_data(self):
-        managed_switch_names = [item.name for item in self.switches]
+        managed_switch_names = self.switches.get_switch_names()
         for _s in self.switches:
-            for vid in _s.vlans:
-                self.vlan_terminations.set_vlan_interface(switch=_s, vid=vid)
-                self.vlan_terminations.set_vlan_server(switch=_s, vid=vid, managed_switch_names=managed_switch_names)
-                self.vlan_terminations.get_by_vid(vid).topology = self.get_vlan_overlay(vid, only_managed_nodes=True)
+            self.vlan_terminations.update_switch(_s, managed_switch_names)
 
         all_vlans = set()
         for _s in self.switches:
             all_vlans.update(_s.vlans)
-        logger.info("used vlans {}".format(self.vlan_terminations.get_all_vids()))
-        logger.info(" all vlans {}".format(all_vlans))
-        logger.info("configured but unused vlans {}".format(all_vlans - set(self.vlan_terminations.get_all_vids())))
+        logger.info("used vlans %s", self.vlan_terminations.get_all_vids())
+        logger.info(" all vlans %s", all_vlans)
+        logger.info("configured but unused vlans %s", all_vlans - set(self.vlan_terminations.get_all_vids()))
+
+    @traced()
+    @graph_build_seconds.time(kind='vlan_data_update')
+    def update_vlan_data(self, switch_names: List[str]):
+        # incremental update of the vlan terminations: only the listed switches and their neighbors are rescanned,
+        # since the ports towards a switch which has been added or removed change from backbone to server ports
+        managed_switch_names = self.switches.get_switch_names()
+        to_be_updated = set(switch_names)
+        for switch_name in switch_names:
+            if self.graph.has_node(switch_name):
+                to_be_updated.update(self.graph.neighbors(switch_name))
+        for switch_name in to_be_updated:
+            switch = self.switches.get_switch_by_attribute('name', switch_name)
+            if switch:
+                self.vlan_terminations.update_switch(switch, managed_switch_names)
+            else:
+                self.vlan_terminations.remove_switch(switch_name)
+
+    @traced()
+    def refresh_switch(self, switch: Switch):
+        switch.update_info()
+        self.vlan_terminations.update_switch(switch, self.switches.get_switch_names())
+        self.invalidate_overlays()
 
+    @traced()
     def onboard_switch(self, node: Device):
         new_switch = Switch.create(node)
         new_switch.to_db()
         if new_switch.state != 'ready':
-            logger.warn('switch {} is in {} state'.format(new_switch.name, new_switch.state))
+            logger.warning('switch %s is in %s state', new_switch.name, new_switch.state)
         self.switches.append(new_switch)
         self.build_graph()
+        self.update_vlan_data([new_switch.name])
 
+    @traced()
     def onboard_firewall(self, node: Device):
         if self.firewall:
             raise ValueError("Firewall already declared. Please remove the current firewall before adding a new one")
         new_firewall = Firewall.create(node)
         new_firewall.to_db()
         if new_firewall.state != 'ready':
-            logger.warn('switch {} is in {} state'.format(new_firewall.name, new_firewall.state))
+            logger.warning('switch %s is in %s state', new_firewall.name, new_firewall.state)
         self.firewall = new_firewall
         self.build_graph()
 
+    @traced()
     def delete_switch(self, switch_name: str):
+        # neighbors are taken from the graph before its rebuild
+        neighbors = list(self.graph.neighbors(switch_name)) if self.graph.has_node(switch_name) else []
         self.switches.delete(switch_name)
         self.build_graph()
+        self.update_vlan_data([switch_name] + neighbors)
 
+    @traced()
     def delete_firewall(self):
         self.firewall.destroy()
         self.firewall = None
         self.build_graph()
 
+    @traced()
     def configure_new_vrf(self, expected_vrf: VrfRequest, vid: int, subnet: IPv4Network, group_name: str):
         self.groups.add(name=group_name, vrf_name=expected_vrf.name)
         # Step 1: crete the vrf
@@ -145,16 +178,18 @@ class Network(NetworkGraph):
         )
         self.firewall.add_bgp_peering(fw_bgp_neighbor_request)
 
+    @traced()
     def find_available_vrf(self, group_name: str) -> str:
         for v in self.vrf_switch.vrfs:
             if v.name not in self.groups.get_names_of_reserved_vrfs() and v.name[:4] == 'proj' and len(v.ports) < 2:
-                logger.info("VRF {} selected for group {}".format(v.name, group_name))
+                logger.info("VRF %s selected for group %s", v.name, group_name)
                 self.groups.add(group_name, vrf_name=v.name)
                 return v.name
 
         if self._check_fw_vrf_management():
             # Step 0: reserve vid and subnet for the uplink and crete and expected VRF object
             vid, subnet = self.status.reserve_uplink()
+            self.store_status()
             expected_vrf = VrfRequest(
                 name=group_name,
                 description="vrf for {}".format(group_name),
@@ -179,6 +214,7 @@ class Network(NetworkGraph):
         else:
             raise ValueError('no VRFs available')
 
+    @traced()
     def create_net_vlan(self, msg: NetVlanMsg):
         # Vlan interfaces should be unique over all the network
         if self.get_switch_by_vlan_interface(msg.vid):
@@ -186,88 +222,92 @@ class Network(NetworkGraph):
             raise ValueError("Vlan interface for vlan id {} already existing".format(msg.vid))
         # check if it is a new group, in the case it will need a new vrf
         if self.groups.exist(msg.group):
-            logger.info("group {} is mapped to VRF {}")
-            selected_vrf_name = self.groups[msg.group]
+            selected_vrf_name = self.groups.get(msg.group).vrf_name
+            logger.info("group %s is mapped to VRF %s", msg.group, selected_vrf_name)
         else:
-            logger.info("group {} is not mapped to any switch VRFs, trying to select an available VRF"
-                    .format(msg.group))
+            logger.info("group %s is not mapped to any switch VRFs, trying to select an available VRF",
+                    msg.group)
             selected_vrf_name = self.find_available_vrf(msg.group)
         # selecting switch and vrf and then applying
         selected_vrf = self.vrf_switch.get_vrf_by_name(selected_vrf_name)
         res = self.vrf_switch.add_vlan_to_vrf(
             selected_vrf, msg.to_switch_request_vlan_l3port(vrf_name=selected_vrf_name))
         if res:
-            self.vrf_switch.update_info()  # FixMe: put it in a thread?
+            self.refresh_switch(self.vrf_switch)  # FixMe: put it in a thread?
         else:
             raise ValueError('create_net_vlan failed')
         return res
 
+    @traced()
     def delete_net_vlan(self, msg: NetVlanMsg):
         group = self.groups.get(msg.group)
         if not group:
             raise ValueError('Group {} not existing'.format(msg.group))
-        logger.info("group {} is mapped to VRF {}")
-        switch, vrf = self.switches.get_attribute_by_selector('vrf', 'name', group.vrf_name)
+        logger.info("group %s is mapped to VRF %s", msg.group, group.vrf_name)
+        switch, vrf = self.switches.get_attribute_by_selector('vrfs', 'name', group.vrf_name)
 
         res = switch.del_vlan_itf(msg.vid)
         # check if VRF is now empty
         if len(vrf.ports) < 3:  # Note: the switch info has not yet been updated
-            logger.info("group {} is empty (no vlan interfaces), freeing vrf {}".format(msg.group, vrf.name))
+            logger.info("group %s is empty (no vlan interfaces), freeing vrf %s", msg.group, vrf.name)
             self.groups.pop(msg.group)
         # the configuration is changed on the device, retrieve the new config from the switch
-        switch.update_info()
+        self.refresh_switch(switch)
         return res
 
+    @traced()
     def modify_net_vlan(self, msg: NetVlanMsg):
         if self.delete_net_vlan(msg):
             return self.create_net_vlan(msg)
         return False
 
+    @traced()
     def assert_net_vlan(self, msg: NetVlanMsg) -> bool:
         if msg.operation == "add_net_vlan":
             group = self.groups.get(msg.group)
             if not group:
-                logger.warn("group {} not existing".format(msg.group))
+                logger.warning("group %s not existing", msg.group)
                 return False
 
-            switch, vrf = self.switches.get_attribute_by_selector('vrf', 'name', group.vrf_name)
+            switch, vrf = self.switches.get_attribute_by_selector('vrfs', 'name', group.vrf_name)
             if not switch or not vrf:
-                logger.warn("vrf {} not found".format(group.vrf_name))
+                logger.warning("vrf %s not found", group.vrf_name)
                 return False
 
             l3intf = next((item for item in vrf.ports if item.vlan == int(msg.vid)), None)
             if not l3intf:
-                logger.warn("interface with vlan {} on vrf {} not found".format(msg.vid, group.vrf_name))
+                logger.warning("interface with vlan %s on vrf %s not found", msg.vid, group.vrf_name)
                 return False
 
             if l3intf.ipaddress == msg.ipaddress and l3intf.cidr == msg.cidr:
                 return True
             else:
-                logger.warn("interface with vlan {} on vrf {} does not have ip address {}".format(
-                    msg.vid, group.vrf_name, msg.ipaddress))
+                logger.warning("interface with vlan %s on vrf %s does not have ip address %s",
+                    msg.vid, group.vrf_name, msg.ipaddress)
                 return False
         elif msg.operation == "del_net_vlan":
             group = self.groups.get(msg.group)
             if not group:
-                logger.info("group {} has been successfully deleted".format(msg.group))
+                logger.info("group %s has been successfully deleted", msg.group)
                 # check if any vrf has a vlan interface with that vid
                 vlan_itf = next((item for item in self.vrf_switch.vlan_l3_ports if item.vlan == int(msg.vid)), None)
                 if vlan_itf:
-                    logger.error('a vlan interface with vlan id {} is still existing')
+                    logger.error('a vlan interface with vlan id %s is still existing', msg.vid)
                     return False
                 return True
             else:
-                switch, vrf = self.switches.get_attribute_by_selector('vrf', 'name', group.vrf_name)
+                switch, vrf = self.switches.get_attribute_by_selector('vrfs', 'name', group.vrf_name)
                 if not switch or not vrf:
-                    logger.warn("vrf {} not found".format(group.vrf_name))
+                    logger.warning("vrf %s not found", group.vrf_name)
                     return False
                 vlan_itf = next((item for item in vrf.ports if item.vlan == int(msg.vid)), None)
                 if vlan_itf:
-                    logger.error('a vlan interface with vlan id {} is still existing in vrf {}'.format(
-                        msg.vid, group.vrf_name))
+                    logger.error('a vlan interface with vlan id %s is still existing in vrf %s',
+                        msg.vid, group.vrf_name)
                     return False
                 return True
 
+    @traced()
     def add_port_vlan(self, msg: PortToNetVlansMsg):
             # note: this method adds incrementally trunk vlans on the specified port.
             # Already existing Vlans will be mantained.
@@ -284,28 +324,35 @@ class Network(NetworkGraph):
             # create vlan on the switch
             node.add_vlan(msg.vids)
 
-            logger.info("[{}] Setting TRUNK VLANs {} on port {} of switch {}".format(
+            logger.info("[%s] Setting TRUNK VLANs %s on port %s of switch %s",
                 msg.operation_id, msg.vids, port.name, node.name
-            ))
+            )
 
-            for vlan_id in msg.vids:
-                node.add_vlan_to_port(vlan_id, port.name)
+            if isinstance(node, Switch):
+                node.add_vlans_to_port(msg.vids, port.name)
+            else:
+                for vlan_id in msg.vids:
+                    node.add_vlan_to_port(vlan_id, port.name)
+
+            if isinstance(node, Switch):
+                self.vlan_terminations.update_switch(node, self.switches.get_switch_names())
 
             # check if vlan connectivity among switches should be provided
             for vlan_id in msg.vids:
                 if self._check_vlan_backbone_needed(vlan_id, node.name, operation=BackboneVlanOps.add):
-                    logger.info("[{}] backbone connectivity needed for VLAN {}".format(
-                        msg.operation_id, vlan_id))
+                    logger.info("[%s] backbone connectivity needed for VLAN %s",
+                        msg.operation_id, vlan_id)
                     self._set_vlan_backbone_connectivity(vlan_id)
 
     def _set_vlan_backbone_connectivity(self, vlan_id: int):
         unconfigured_links, need_change = self._get_backbone_links_for_vlan_connectivity(vlan_id)
         if need_change:
             for edge in unconfigured_links:
-                logger.info("adding VLAN {} to backbone link {}".format(vlan_id, edge))
+                logger.info("adding VLAN %s to backbone link %s", vlan_id, edge)
                 backbone_switch, backbone_port = self._from_topology_link_to_switch_port(edge)
                 backbone_switch.add_vlan_to_port(vlan_id, backbone_port.name)
 
+    @traced()
     def del_port_vlan(self, msg: PortToNetVlansMsg):
         # note: this method incrementally deletes trunk vlans on the specified port.
         # Other Vlans will be maintained.
@@ -314,15 +361,17 @@ class Network(NetworkGraph):
         if len(msg.vids) < 1:
             raise ValueError("no vlan ids in message add_port")
 
-        logger.info("[{}] deleting TRUNK VLANs {} on port {} of switch {}".format(
+        logger.info("[%s] deleting TRUNK VLANs %s on port %s of switch %s",
             msg.operation_id, msg.vids, port.name, switch.name
-        ))
+        )
         vlans_to_be_removed_from_trunk = [item for item in msg.vids if item in port.trunk_vlans]
         switch.del_vlan_to_port(vlans_to_be_removed_from_trunk, port.name)
 
         # check if vlan connectivity among switches should be removed
         for vlan_id in msg.vids:
             vlan_term = self.vlan_terminations.get_by_vid(vlan_id)
+            if not vlan_term:
+                continue
             # is the port the only termination of this vlan in this switch?
             if len(vlan_term.get_tagged_ports_in_switch(switch.name)) > 1:
                 # no backbone modifications are needed, because the switch should be mantained in the Vlan
@@ -330,8 +379,8 @@ class Network(NetworkGraph):
             else:
                 # the vlan has no further termination in the switch, testing if backbone connectivity should be removed
                 if not self._check_vlan_backbone_needed(vlan_id, switch.name, operation=BackboneVlanOps.delete):
-                    logger.info("[{}] backbone connectivity not needed anymore for VLAN {}".format(
-                        msg.operation_id, vlan_id))
+                    logger.info("[%s] backbone connectivity not needed anymore for VLAN %s",
+                        msg.operation_id, vlan_id)
                     backbone = self.get_backbone_topology()
                     for edge in backbone.edges(data=True):
                         bb_switch, bb_port = self._from_topology_link_to_switch_port(edge)
@@ -340,9 +389,14 @@ class Network(NetworkGraph):
                         if vlan_term.check_vlan_need_on_switch(bb_switch.name):
                             bb_switch.del_vlan([vlan_id])
 
+        if isinstance(switch, Switch):
+            self.vlan_terminations.update_switch(switch, self.switches.get_switch_names())
+
+    @traced()
     def mod_port_vlan(self, msg: PortToNetVlansMsg):
         pass
 
+    @traced()
     def assert_port_vlan(self, msg: PortToNetVlansMsg) -> bool:
         if msg.operation == 'add_port_vlan':
             switch, port = self._get_port_node_objs(msg)
@@ -351,8 +405,8 @@ class Network(NetworkGraph):
                 if vlan_id not in port.trunk_vlans or vlan_id != port.access_vlan:
                     missing_vlans.append(vlan_id)
             if len(missing_vlans) > 0:
-                logger.error("Vlans {} missing on port {} of switch {}".format(
-                    missing_vlans, port.name, switch.name))
+                logger.error("Vlans %s missing on port %s of switch %s",
+                    missing_vlans, port.name, switch.name)
                 # TODO: add check on backbone
                 return False
             return True
@@ -364,19 +418,20 @@ class Network(NetworkGraph):
                 if vlan_id in port.trunk_vlans or vlan_id == port.access_vlan:
                     not_deleted_vlans.append(vlan_id)
                 if len(not_deleted_vlans) > 0:
-                    logger.error("Vlans {} still configured on port {} of switch {}".format(
-                        not_deleted_vlans, port.name, switch.name))
+                    logger.error("Vlans %s still configured on port %s of switch %s",
+                        not_deleted_vlans, port.name, switch.name)
                     # TODO: add check on backbone
                     return False
                 return True
         else:
-            logger.warn("Config assert not yet supported for msg type {}".format(msg.operation))
+            logger.warning("Config assert not yet supported for msg type %s", msg.operation)
             return True
 
+    @traced()
     def add_pnf(self, msg: AddPnfRequestMsg):
         self.create_vrf(vrf_name=msg.name)
         # update info? otherwise the vrf will not exist in the switch obj
-        self.vrf_switch.update_info()
+        self.refresh_switch(self.vrf_switch)
         if not msg.vid:
             msg.vid = self.status.get_and_reserve_pnf_vlan()
         else:
@@ -407,15 +462,19 @@ class Network(NetworkGraph):
         self.add_port_vlan(port_msg)
 
 
+    @traced()
     def del_pnf(self, msg: DelPnfRequestMsg):
         pass
 
+    @traced()
     def bind_vrf(self, vrf1_name: str, vrf2_name: str):
         self.vrf_switch.bind_vrf(vrf1_name, vrf2_name)
 
+    @traced()
     def unbind_vrf(self, vrf1_name: str, vrf2_name: str):
         self.vrf_switch.unbind_vrf(vrf1_name, vrf2_name)
 
+    @traced()
     def add_route_to_vrf(self, msg: AddRouteRequestMsg):
         group = self.groups.get(msg.group)
         if not group:
@@ -425,6 +484,7 @@ class Network(NetworkGraph):
             raise ValueError("vrf {} not found".format(group.vrf_name))
         self.vrf_switch.add_route(vrf, msg.to_IpV4Route())
 
+    @traced()
     def del_route_to_vrf(self, msg: DelRouteRequestMsg):
         group = self.groups.get(msg.group)
         if not group:
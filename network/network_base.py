@@ -1,7 +1,8 @@
+import json
 from ipaddress import IPv4Network
-from typing import List, Tuple, Union, Any
+from typing import List, Tuple, Union, Any, Dict
 
-from pydantic import BaseModel, RootModel
+from pydantic import BaseModel, RootModel, PrivateAttr
 
 from firewall.firewall_base import Firewall
 from models import PhyPort, VrfRequest
@@ -9,6 +10,7 @@ from network.network_models import NetworkConfig, NetworkState
 from network.nbi_msg_models import SetNetworkConfigRequestMsg, PortToNetVlansMsg
 from switch import Switch
 from utils import persistency, create_logger
+from utils.tracing import traced
 
 _db = persistency.DB()
 logger = create_logger('network')
@@ -16,8 +18,20 @@ logger = create_logger('network')
 class ManagedSwitches(RootModel):
     # model_config = ConfigDict(arbitrary_types_allowed=True)
     root: List[Switch] = []
+    # (indexed list, indexed list length, switch name -> switch)
+    _by_name: Tuple[Union[list, None], int, Dict[str, Switch]] = PrivateAttr(default=(None, 0, {}))
+
+    def _get_name_index(self) -> Dict[str, Switch]:
+        if self._by_name[0] is not self.root or self._by_name[1] != len(self.root):
+            index = {}
+            for item in self.root:
+                index.setdefault(item.name, item)
+            self._by_name = (self.root, len(self.root), index)
+        return self._by_name[2]
 
     def get_switch_by_attribute(self, attribute: str, value: Any) -> Switch:
+        if attribute == 'name':
+            return self._get_name_index().get(value)
         return next((item for item in self.root if hasattr(item, attribute) and getattr(item, attribute) == value),
                     None)
 
@@ -28,32 +42,18 @@ class ManagedSwitches(RootModel):
             selector_value: Any,
             switch_name: str = None
     ) -> Tuple[Union[Switch, None], Any]:
-
-        def _get_attribute_by_selector_single_switch(
-                switch: Switch,
-                attribute_name: str,
-                selector_name: str,
-                selector_value: Any
-        ) -> Any:
-            if not hasattr(switch, attribute_name):
-                raise ValueError("Switch {} doesn't have attribute {}".format(switch.name, attribute_name))
-            for attribute_item in getattr(switch, attribute_name):
-                if getattr(attribute_item, selector_name) == selector_value:
-                    return getattr(switch, selector_name)
-            return None
-
         if switch_name is None:
             # we should look into the attributes of all switches
             for switch in self.root:
-                attribute = _get_attribute_by_selector_single_switch(
-                    switch, attribute_name, selector_name, selector_value)
+                attribute = switch.lookup(attribute_name, selector_name, selector_value)
                 if attribute:
                     return switch, attribute
             return None, None
         else:
             switch = self.get_switch_by_attribute('name', switch_name)
-            return switch, _get_attribute_by_selector_single_switch(
-                switch, attribute_name, selector_name, selector_value)
+            if not switch:
+                return None, None
+            return switch, switch.lookup(attribute_name, selector_name, selector_value)
 
     def get_switch_names(self):
         return [item.name for item in self.root]
@@ -88,6 +88,8 @@ class NetworkBase(BaseModel):
     config: NetworkConfig = None
     status: NetworkState = NetworkState()
     unconfigured: bool = True
+    # restored devices whose initialization thread is running, by name
+    _initializing_devices: Dict[str, Union[Switch, Firewall]] = PrivateAttr(default_factory=dict)
 
     def __init__(self):
         super().__init__()
@@ -97,41 +99,61 @@ class NetworkBase(BaseModel):
             self.unconfigured = False
         db_status = _db.findone_DB('status', {})
         if db_status:
-            self.status = NetworkState.model_validate(db_status)
+            self.status = NetworkState.model_validate(db_status, context={
+                'subnet_prefixlens': self.config.get_subnet_prefixlens() if self.config else {}})
             #FixMe: rebuild the network state
 
+        # the devices are initialized by their own threads, which are not awaited: each device publishes its state
+        # transitions on the device event bus. Meanwhile their data is being changed by those threads, so they are kept
+        # out of the network (graph, vlan data, snapshot) until the worker settles them, see settle_device()
         db_switches = _db.find_DB('switches', {})
-        threads = []
         for sw in db_switches:
-            switch_obj, switch_thread = Switch.from_db(device_name=sw['name'])
-            self.switches.append(switch_obj)
-            threads.append(switch_thread)
+            switch_obj, _ = Switch.from_db(device_name=sw['name'])
+            self._initializing_devices[switch_obj.name] = switch_obj
 
         db_fw = _db.findone_DB('firewall', {})
         if db_fw:
-            firewall, fw_thread = Firewall.from_db(device_name=db_fw['name'])
-            self.firewall = firewall
-            threads.append(fw_thread)
+            firewall, _ = Firewall.from_db(device_name=db_fw['name'])
+            self._initializing_devices[firewall.name] = firewall
 
-        for t in threads:
-            t.join()
-            logger.info('init for device thread {} terminated'.format(t.name))
+    def get_initializing_devices(self) -> List[Union[Switch, Firewall]]:
+        return list(self._initializing_devices.values())
 
+    def settle_device(self, device_name: str) -> bool:
+        # called by the worker once the initialization thread of a restored device has ended (the device left the
+        # initializing states): from now on the device is changed only by the worker thread
+        device = self._initializing_devices.pop(device_name, None)
+        if device is None:
+            return False
+        if isinstance(device, Firewall):
+            self.firewall = device
+        else:
+            self.switches.append(device)
+        return True
+
+    @traced()
     def set_config(self, msg: SetNetworkConfigRequestMsg):
         self.config = NetworkConfig.from_config_msg(msg)
 
+    @traced()
     def build_network_state(self):
         self.status = NetworkState.from_config(self.config)
         for switch_item in self.switches:
             for vid in switch_item.vlans:
                 self.status.remove_used_vid(vid)
             for vlan_itf in switch_item.vlan_l3_ports:
-                self.status.remove_used_subnet(IPv4Network(vlan_itf.cidr, strict=False))
+                if vlan_itf.cidr:
+                    self.status.remove_used_subnet(IPv4Network(vlan_itf.cidr, strict=False))
             # FixMe: add also routing table items?
         if self.config.vrf_switch_name:
             self.vrf_switch = self.switches.get_switch_by_attribute('name', self.config.vrf_switch_name)
             if not self.vrf_switch:
                 raise ValueError("vrf_switch {} does not exists".format(self.config.vrf_switch_name))
+        self.store_status()
+
+    def store_status(self):
+        # pools are serialized in their compact form (vlan ranges and summarized free subnets)
+        _db.update_DB('status', json.loads(self.status.model_dump_json()), {})
 
     def _check_fw_vrf_management(self) -> bool:
         switch_names = self.switches.get_switch_names()
@@ -155,16 +177,21 @@ class NetworkBase(BaseModel):
             s.to_db(backup=True)
 
     def _get_port_node_objs(self, msg: PortToNetVlansMsg) -> Tuple[Union[Switch, Firewall], PhyPort]:
-        managed_nodes = [s for s in self.switches]
-        if self.firewall:
-            managed_nodes.append(self.firewall)
-        node = next(item for item in managed_nodes if item.name == msg.node)
-        port = next(item for item in node.phy_ports if item.name == msg.port or item.index == msg.port)
+        node = self.switches.get_switch_by_attribute('name', msg.node)
+        if node:
+            port = node.lookup('phy_ports', 'name', msg.port) or node.get_port_by_index(msg.port)
+        elif self.firewall and self.firewall.name == msg.node:
+            node = self.firewall
+            port = next((item for item in node.phy_ports if item.name == msg.port or item.index == msg.port), None)
+        else:
+            raise ValueError("node {} not found".format(msg.node))
+        if not port:
+            raise ValueError("port {} not found on node {}".format(msg.port, msg.node))
         return node, port
 
     def _get_switch_by_vrf(self, vrf_name: str) -> Switch:
         switch, vrf = self.switches.get_attribute_by_selector(
-            attribute_name='vrf', selector_name='name', selector_value=vrf_name
+            attribute_name='vrfs', selector_name='name', selector_value=vrf_name
         )
         return switch
 
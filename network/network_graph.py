@@ -1,4 +1,4 @@
-from typing import Dict, Tuple, Union, Optional
+from typing import Callable, Collection, Dict, List, Tuple, Union, Optional
 
 import networkx as nx
 import networkx.classes.multigraph
@@ -6,6 +6,8 @@ from pydantic import ConfigDict, PrivateAttr, Field, RootModel
 from models import PhyPort
 from network.network_base import NetworkBase, logger
 from switch import Switch
+from utils.metrics import graph_build_seconds
+from utils.tracing import traced
 
 
 def compare_graph_edges(e1_src: str, e1_dst: str, e1_data: Dict[str, str], e2_src: str, e2_dst: str,
@@ -16,15 +18,58 @@ def compare_graph_edges(e1_src: str, e1_dst: str, e1_data: Dict[str, str], e2_sr
            and e1_data['ports'] == e2_data['ports']
 
 
+def build_vlan_overlay(graph: nx.MultiGraph, vlan_id: int, vlan_nodes: Dict[str, Dict],
+                       managed_nodes: Collection[str] = None) -> nx.MultiGraph:
+    # topology of the vlan: the switches where it is configured (with their attributes) and the links carrying it,
+    # restricted to the links among managed_nodes if given. The returned graph is frozen
+    vlan_graph = nx.MultiGraph()
+    for name, attrs in vlan_nodes.items():
+        vlan_graph.add_node(name, **attrs)
+    for e in graph.edges(data=True):
+        if managed_nodes is not None and (e[0] not in managed_nodes or e[1] not in managed_nodes):
+            continue
+        if vlan_id in e[2]['vlans']:
+            vlan_graph.add_edge(e[0], e[1], ports=e[2]['ports'], weight=e[2]['weight'])
+    return nx.freeze(vlan_graph)
+
+
+def build_vrf_overlay(vrf_name: str, vrf_switch: str, vrf_vlans: List[int],
+                      vlan_overlay: Callable[[int], nx.MultiGraph]) -> nx.MultiGraph:
+    # l3 topology of the vrf: the union of the overlays of its vlans
+    vrf_graph = nx.MultiGraph()
+    vrf_graph.add_node(vrf_switch, vrf=vrf_name, vlans=vrf_vlans)
+    for vlan_id in vrf_vlans:
+        overlay = vlan_overlay(vlan_id)
+        vrf_graph.add_nodes_from(overlay.nodes)
+        for edge in overlay.edges(data=True):
+            # a link shared by several vlans of the vrf is added once: only its parallel edges are checked
+            parallel_edges = vrf_graph.get_edge_data(edge[0], edge[1]) or {}
+            if not any(data['ports'] == edge[2]['ports'] for data in parallel_edges.values()):
+                vrf_graph.add_edge(edge[0], edge[1], ports=edge[2]['ports'], vlans=set.intersection(
+                    set(vrf_vlans), set(edge[2]['vlans']) if 'vlans' in edge[2] else set()))
+    return nx.freeze(vrf_graph)
+
+
 class GraphModel(RootModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     root: nx.classes.multigraph.MultiGraph = nx.MultiGraph()
 
+    def __getattr__(self, item):
+        # delegates the networkx methods (add_node, has_edge, subgraph, ...) to the wrapped graph
+        if item.startswith('__') or item == 'root':
+            raise AttributeError(item)
+        return getattr(self.root, item)
+
 
 class NetworkGraph(NetworkBase):
 
     graph: GraphModel = GraphModel()
+    # memoized vlan overlays (frozen graphs), keyed by (vlan id, only_managed_nodes). Populated and read only by the
+    # network worker thread, the REST handlers read the overlays serialized in the network snapshot
+    _overlay_cache: Dict[Tuple[int, bool], nx.MultiGraph] = PrivateAttr(default_factory=dict)
+    # changed at every rebuild of the graph, the only place where it is modified
+    _graph_revision: int = PrivateAttr(default=0)
     #Optional[nx.MultiGraph] = None  # possible FIXME: LLDP neighbor with SR-IOV enabled??
 
     def __init__(self):
@@ -34,25 +79,37 @@ class NetworkGraph(NetworkBase):
 
     def _from_topology_link_to_switch_port(self, edge: Tuple) -> Tuple[Switch, PhyPort]:
         switch = self.switches.get_switch_by_attribute('name', edge[0])
-        port = next(item for item in switch.phy_ports if item.name == edge[2][switch.name])
+        port = switch.get_port_by_name(edge[2][switch.name])
         return switch, port
 
+    def invalidate_overlays(self) -> None:
+        self._overlay_cache = {}
+
+    @property
+    def graph_revision(self) -> int:
+        return self._graph_revision
+
+    @traced()
+    @graph_build_seconds.time(kind='graph')
     def build_graph(self) -> None:
+        self.invalidate_overlays()
+        self._graph_revision += 1
+        self.graph.clear()
         for s in self.switches:
             self.graph.add_node(s.name, vlans=s.vlans, managed=True)
 
         for s in self.switches:
             for p in s.phy_ports:
-                logger.debug("checking port {}".format(p.index))
+                logger.debug("checking port %s", p.index)
                 neigh_info = s.get_neighbors(p.index)
                 if neigh_info:
                     edge = self._get_topology_link(neigh_info.neighbor, s.name, neigh_info.remote_interface, p.name)
                     if self.graph.has_edge(s.name, neigh_info.neighbor):
-                        logger.debug("found another link between {} and {}... checking".format(
-                            s.name, neigh_info.neighbor))
+                        logger.debug("found another link between %s and %s... checking",
+                            s.name, neigh_info.neighbor)
                     if edge:
-                        logger.debug("edge between switch {} and {} already existing: {}".format(
-                            s.name, s.get_neighbors(p.index), edge))
+                        logger.debug("edge between switch %s and %s already existing: %s",
+                            s.name, s.get_neighbors(p.index), edge)
                         # checking vlans on the two switches
                         vlans_only_in_p = set(p.trunk_vlans + [p.access_vlan]) - set(edge[2]['vlans'])
                         vlans_only_in_neigh = set(edge[2]['vlans']) - set(p.trunk_vlans + [p.access_vlan])
@@ -60,9 +117,9 @@ class NetworkGraph(NetworkBase):
                             edge[2]['missing_vlan_errors'][neigh_info.neighbor] = vlans_only_in_p
                         if vlans_only_in_neigh:
                             edge[2]['missing_vlan_errors'][s.name] = vlans_only_in_neigh
-                        edge[2]['vlans'] = list[set(p.trunk_vlans + [p.access_vlan]) | set(edge[2]['vlans'])]
+                        edge[2]['vlans'] = list(set(p.trunk_vlans + [p.access_vlan]) | set(edge[2]['vlans']))
                     else:
-                        logger.debug("found edge between switch {} and {}".format(s.name, s.get_neighbors(p.index)))
+                        logger.debug("found edge between switch %s and %s", s.name, s.get_neighbors(p.index))
                         self.graph.add_edge(
                             s.name,
                             neigh_info.neighbor,
@@ -72,69 +129,58 @@ class NetworkGraph(NetworkBase):
                             weight=1000000 / p.speed if p.speed else 1000
                         )
                         if not p.speed:
-                            logger.warning("link {}-{} ports={} has not a valid speed!".format(
+                            logger.warning("link %s-%s ports=%s has not a valid speed!",
                                 s.name,
                                 neigh_info.neighbor,
-                                {s.name: p.name, neigh_info.neighbor: neigh_info.remote_interface})
+                                {s.name: p.name, neigh_info.neighbor: neigh_info.remote_interface}
                             )
 
     def get_topology_dict(self, managed=False) -> Dict:
         if managed:
             return nx.convert.to_dict_of_dicts(self.graph.subgraph([s.name for s in self.switches]))
         else:
-            return nx.convert.to_dict_of_dicts(self.graph)
+            return nx.convert.to_dict_of_dicts(self.graph.root)
 
     def get_backbone_topology(self) -> nx.MultiGraph:
         # return the topology among managed switches
         return self.graph.subgraph(self.switches.get_switch_names())
 
     def _get_topology_link(self, node1: str, node2: str, port1: str, port2: str) -> Union[Tuple[str, str, Dict], None]:
-        return next((e for e in self.graph.edges(data=True)
-                     if compare_graph_edges(*e, node1, node2, {node1: port1, node2: port2})), None)
+        # only the parallel edges between the two nodes are checked, instead of scanning all the graph edges
+        edges = self.graph.get_edge_data(node1, node2) or {}
+        for data in edges.values():
+            if compare_graph_edges(node1, node2, data, node1, node2, {node1: port1, node2: port2}):
+                return node1, node2, data
+        return None
 
     def get_vlan_overlay(self, vlan_id: int, only_managed_nodes: bool = False) -> nx.MultiGraph:
-        managed_nodes = [item.name for item in self.switches]
-        vlan_graph = nx.MultiGraph()
+        # overlays are computed on demand and memoized until the graph is rebuilt or the overlays are invalidated;
+        # the returned graph is frozen, being shared by the callers
+        cached = self._overlay_cache.get((vlan_id, only_managed_nodes))
+        if cached is not None:
+            return cached
+        vlan_nodes = {}
         for switch in self.switches:
             if vlan_id in switch.vlans:
-                logger.debug('add switch {} to the topology of vlan {}'.format(switch.name, vlan_id))
-                vlan_interface = next((item for item in switch.vlan_l3_ports if item.vlan == vlan_id), None)
-                vlan_graph.add_node(switch.name, vlan_interface=vlan_interface, vlan_configured=True)
-
-        for e in self.graph.edges(data=True):
-            if only_managed_nodes:
-                if e[0] in managed_nodes and e[1] in managed_nodes and vlan_id in e[2]['vlans']:
-                    vlan_graph.add_edge(e[0], e[1], ports=e[2]['ports'], weight=e[2]['weight'])
-            else:
-                if vlan_id in e[2]['vlans']:
-                    vlan_graph.add_edge(e[0], e[1], ports=e[2]['ports'], weight=e[2]['weight'])
+                logger.debug('add switch %s to the topology of vlan %s', switch.name, vlan_id)
+                vlan_nodes[switch.name] = {'vlan_interface': switch.get_vlaninterface_from_vid(vlan_id),
+                                           'vlan_configured': True}
+        managed_nodes = set(self.switches.get_switch_names()) if only_managed_nodes else None
+        vlan_graph = build_vlan_overlay(self.graph.root, vlan_id, vlan_nodes, managed_nodes)
+        self._overlay_cache[(vlan_id, only_managed_nodes)] = vlan_graph
         return vlan_graph
 
     def get_l3_overlay_topology(self, vrf_name: str) -> nx.MultiGraph:
-        vrf_graph = nx.MultiGraph()
         selected_vrf = None
         vrf_switch = None
         for switch in self.switches:
             for vrf in switch.vrfs:
-
                 if vrf.name == vrf_name:
-                    logger.debug('vrf {} is on switch {}'.format(vrf_name, switch.name))
+                    logger.debug('vrf %s is on switch %s', vrf_name, switch.name)
                     selected_vrf = vrf
                     vrf_switch = switch
                     break
         if not selected_vrf:
-            return vrf_graph
-
-        vrf_vlans = [item.vlan for item in selected_vrf.ports]
-        vrf_graph.add_node(vrf_switch.name, vrf=vrf_name, vlans=vrf_vlans)
-        for vlan_id in vrf_vlans:
-            vlan_overlay = self.get_vlan_overlay(vlan_id)
-            vrf_graph.add_nodes_from(vlan_overlay.nodes)
-            for edge in vlan_overlay.edges(data=True):
-                existing_edge = next((e for e in vrf_graph.edges(data=True) if e[0] == edge[0] and e[1] == edge[1] and
-                                      e[2]['ports'] == edge[2]['ports']), None)
-                if not existing_edge:
-                    vrf_graph.add_edge(edge[0], edge[1], ports=edge[2]['ports'], vlans=set.intersection(
-                        set(vrf_vlans), set(edge[2]['vlans']) if 'vlans' in edge[2] else set()))
-
-        return vrf_graph
+            return nx.freeze(nx.MultiGraph())
+        return build_vrf_overlay(vrf_name, vrf_switch.name, [item.vlan for item in selected_vrf.ports],
+                                 self.get_vlan_overlay)
@@ -1,10 +1,10 @@
-from pydantic import RootModel, BaseModel, ConfigDict, IPvAnyNetwork, IPvAnyInterface, IPvAnyAddress
-from typing import Union, List, Tuple
+from pydantic import RootModel, BaseModel, ConfigDict, Field, PrivateAttr, IPvAnyNetwork, IPvAnyInterface, IPvAnyAddress
+from typing import Optional, Union, List, Tuple, Dict, Set
 from models import VlanInterfaceTermination, LldpNeighbor
 from switch.switch_base import Switch
-import networkx as nx
 from utils import create_logger
 from ipaddress import IPv4Network
+from network.network_pools import VlanBitmap, SubnetPool, VlanPool, IPv4SubnetPool
 from enum import Enum
 
 logger = create_logger('network')
@@ -28,11 +28,26 @@ class NetworkConfig(BaseModel):  # set config da sergio
     pnf_vlans_pool: List[int] = []
     pnf_merging_vrf_name: str
     pnf_ip_pool: List[IPv4Network]
+    # prefix length of the subnets handed out from the ip pools; if not set, the one of the subnets of the pool
+    vrf_uplink_ip_prefixlen: Optional[int] = None
+    pnf_ip_prefixlen: Optional[int] = None
     as_number: int = 1000
     firewall_uplink_vlan_port: str = None
     firewall_uplink_neighbor: LldpNeighbor = None
     firewall_port_group: str = 'projects'
 
+    def get_subnet_prefixlens(self) -> Dict[str, int]:
+        # block sizes of the ip pools of the network state, by field, for the pools stored without them
+        res = {}
+        for field, prefixlen, pool in [('available_vrf_uplink_subnets', self.vrf_uplink_ip_prefixlen,
+                                        self.vrf_uplink_ip_pool),
+                                       ('available_pnf_subnets', self.pnf_ip_prefixlen, self.pnf_ip_pool)]:
+            if prefixlen is None and pool:
+                prefixlen = pool[0].prefixlen
+            if prefixlen is not None:
+                res[field] = prefixlen
+        return res
+
     """@classmethod
     def from_config_msg(cls, msg: SetNetworkConfigRequestMsg):
         def vlanpool_from_ranges(ranges: List[VlanRange]) -> List[int]:
@@ -121,16 +136,18 @@ class NetworkPnfs(NetworkGroups):
 
 
 class NetworkState(BaseModel):
-    available_vrf_uplink_vlans: List[int] = []
-    available_vrf_uplink_subnets: List[IPv4Network] = []
-    available_pnf_vlans: List[int] = []
-    available_pnf_subnets: List[IPv4Network] = []
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    available_vrf_uplink_vlans: VlanPool = Field(default_factory=VlanBitmap)
+    available_vrf_uplink_subnets: IPv4SubnetPool = Field(default_factory=SubnetPool)
+    available_pnf_vlans: VlanPool = Field(default_factory=VlanBitmap)
+    available_pnf_subnets: IPv4SubnetPool = Field(default_factory=SubnetPool)
 
     def check_available_vlan(self, vid: int) -> bool:
         return vid in self.available_vrf_uplink_vlans or vid in self.available_pnf_vlans
 
     def reserve_uplink(self) -> Tuple[int, IPv4Network]:
-        return self.available_vrf_uplink_vlans.pop(0), self.available_vrf_uplink_subnets.pop(0)
+        return self.available_vrf_uplink_vlans.pop_first(), self.available_vrf_uplink_subnets.pop_first()
 
     def release_uplink(self, vid: int, cidr: Union[IPv4Network, str]):
         if type(cidr) is str:
@@ -139,39 +156,44 @@ class NetworkState(BaseModel):
             raise ValueError('vlan Id {} already available!'.format(vid))
         if cidr in self.available_vrf_uplink_subnets:
             raise ValueError('IP subnet {} already available!'.format(cidr))
-        self.available_vrf_uplink_vlans.append(vid)
-        self.available_vrf_uplink_vlans.sort()
-        self.available_vrf_uplink_subnets.append(cidr)
-        self.available_vrf_uplink_subnets.sort()
+        self.available_vrf_uplink_subnets.add(cidr)
+        self.available_vrf_uplink_vlans.add(vid)
+
+    def reserve_vlan(self, vid: int):
+        if vid in self.available_pnf_vlans:
+            self.available_pnf_vlans.discard(vid)
+        elif vid in self.available_vrf_uplink_vlans:
+            self.available_vrf_uplink_vlans.discard(vid)
+        else:
+            raise ValueError('vlan Id {} is not available!'.format(vid))
 
     def remove_used_vid(self, vid):
         if vid in self.available_vrf_uplink_vlans:
-            self.available_vrf_uplink_vlans.remove(vid)
+            self.available_vrf_uplink_vlans.discard(vid)
         elif vid in self.available_pnf_vlans:
-            self.available_pnf_vlans.remove(vid)
+            self.available_pnf_vlans.discard(vid)
 
     def remove_used_subnet(self, subnet: Union[IPv4Network, str]):
         if type(subnet) is str:
-            subnet = IPv4Network(subnet)
+            subnet = IPv4Network(subnet, strict=False)
 
-        self.available_vrf_uplink_subnets = [
-            item for item in self.available_vrf_uplink_subnets if not item.overlaps(subnet)]
-
-        self.available_pnf_subnets = [
-            item for item in self.available_pnf_subnets if not item.overlaps(subnet)]
+        self.available_vrf_uplink_subnets.remove_overlapping(subnet)
+        self.available_pnf_subnets.remove_overlapping(subnet)
 
     def get_and_reserve_pnf_vlan(self):
-        return self.available_pnf_vlans.pop(0)
+        return self.available_pnf_vlans.pop_first()
 
     def get_and_reserve_pnf_subnet(self):
-        return self.available_pnf_subnets.pop(0)
+        return self.available_pnf_subnets.pop_first()
 
     @classmethod
     def from_config(cls, network_config: NetworkConfig):
         return cls(
-            available_vrf_uplink_vlans=network_config.vrf_uplink_vlans,
-            available_vrf_uplink_ip_pool=network_config.vrf_uplink_ip_pool,
-            available_pnf_vlans_pool=network_config.pnf_vlans_pool
+            available_vrf_uplink_vlans=VlanBitmap(network_config.vrf_uplink_vlans),
+            available_vrf_uplink_subnets=SubnetPool.from_networks(
+                network_config.vrf_uplink_ip_pool, network_config.vrf_uplink_ip_prefixlen),
+            available_pnf_vlans=VlanBitmap(network_config.pnf_vlans_pool),
+            available_pnf_subnets=SubnetPool.from_networks(network_config.pnf_ip_pool, network_config.pnf_ip_prefixlen)
         )
 
 
@@ -200,37 +222,48 @@ class VlanTerminationItemServerPortList(RootModel):
         if termination_switch:
             termination_switch.port_names.remove(port_name)
 
+    def delete_switch(self, switch_name: str):
+        self.root = [item for item in self.root if item.switch_name != switch_name]
+
     def empty(self, switch_name: str) -> bool:
-        return len(self.get_by_switch(switch_name).port_names) == 0
+        termination_switch = self.get_by_switch(switch_name)
+        return not termination_switch or len(termination_switch.port_names) == 0
 
 
 class VlanTerminationItem(BaseModel):
     # Attention: This class should not be stored into mongo
-    model_config = ConfigDict(arbitrary_types_allowed=True)
-
+    # the topology of the vlan is not stored here, it is computed on demand by NetworkGraph.get_vlan_overlay
     vid: int
     vlan_interface: Union[VlanInterfaceTermination, None] = None
     server_ports: VlanTerminationItemServerPortList = VlanTerminationItemServerPortList()
-    topology: Union[nx.MultiGraph, None] = None
 
     def get_switch_names(self) -> set:
         res = set()
         if self.vlan_interface:
             res.add(self.vlan_interface.switch_name)
-        for p in self.server_ports.keys():
-            res.add(self.server_ports[p])
+        for item in self.server_ports.root:
+            if item.port_names:
+                res.add(item.switch_name)
         return res
 
+    def is_empty(self) -> bool:
+        return not self.vlan_interface and not any(item.port_names for item in self.server_ports.root)
+
     def check_vlan_need_on_switch(self, switch_name: str):
-        return len(self.server_ports[switch_name]) < 1 and self.vlan_interface and \
+        return self.server_ports.empty(switch_name) and self.vlan_interface and \
                             self.vlan_interface.switch_name != switch_name
 
     def get_tagged_ports_in_switch(self, switch_name: str) -> List[str]:
-        return self.server_ports.get_by_switch(switch_name).port_names
+        termination_switch = self.server_ports.get_by_switch(switch_name)
+        return termination_switch.port_names if termination_switch else []
 
 
 class VlanTerminationList(RootModel):
     root: List[VlanTerminationItem] = []
+    # vid -> termination item, rebuilt if the list is replaced or resized outside the methods of this class
+    _by_vid: Tuple[Union[list, None], int, Dict[int, VlanTerminationItem]] = PrivateAttr(default=(None, 0, {}))
+    # switch name -> vids having a termination (vlan interface or server port) on the switch
+    _vids_by_switch: Dict[str, Set[int]] = PrivateAttr(default_factory=dict)
 
     def __iter__(self):
         return iter(self.root)
@@ -238,26 +271,83 @@ class VlanTerminationList(RootModel):
     def __getitem__(self, item) -> VlanTerminationItem:
         return self.root[item]
 
+    def _get_vid_index(self) -> Dict[int, VlanTerminationItem]:
+        if self._by_vid[0] is not self.root or self._by_vid[1] != len(self.root):
+            index = {}
+            vids_by_switch = {}
+            for item in self.root:
+                index.setdefault(item.vid, item)
+                for switch_name in item.get_switch_names():
+                    vids_by_switch.setdefault(switch_name, set()).add(item.vid)
+            self._by_vid = (self.root, len(self.root), index)
+            self._vids_by_switch = vids_by_switch
+        return self._by_vid[2]
+
     def get_by_vid(self, vid: int, create_if_missing: bool = False) -> VlanTerminationItem:
-        result = next((item for item in self.root if item.vid == vid), None)
+        result = self._get_vid_index().get(vid)
         if not result and create_if_missing:
-            result = VlanTerminationItem()
+            result = VlanTerminationItem(vid=vid)
             self.root.append(result)
+            self._by_vid[2][vid] = result
+            self._by_vid = (self.root, len(self.root), self._by_vid[2])
         return result
 
     def get_all_vids(self):
         return [item.vid for item in self.root]
 
+    def get_vids_by_switch(self, switch_name: str) -> Set[int]:
+        self._get_vid_index()
+        return set(self._vids_by_switch.get(switch_name, set()))
+
     def set_vlan_interface(self, switch: Switch, vid: int):
-        termination_item = self.get_by_vid(vid, create_if_missing=True)
         vlan_interface = switch.get_vlaninterface_from_vid(vid)
+        if not vlan_interface:
+            return
+        termination_item = self.get_by_vid(vid, create_if_missing=True)
         termination_item.vlan_interface = VlanInterfaceTermination(name=vlan_interface.index, switch_name=switch.name)
+        self._vids_by_switch.setdefault(switch.name, set()).add(vid)
 
     def set_vlan_server(self, switch: Switch, vid: int, managed_switch_names: List[str]):
         for phy_port in switch.phy_ports:
             if phy_port.is_up() and phy_port.get_neighbor_name() not in managed_switch_names and \
                     phy_port.check_vlan(vid):
-                logger.debug('found Vlan {} termination on switch {} port {} towards server {}'
-                             .format(vid, switch.name, phy_port.name, phy_port.get_neighbor_name()))
+                logger.debug('found Vlan %s termination on switch %s port %s towards server %s',
+                             vid, switch.name, phy_port.name, phy_port.get_neighbor_name())
+                termination_item = self.get_by_vid(vid, create_if_missing=True)
+                termination_item.server_ports.add(switch_name=switch.name, port_name=phy_port.name)
+                self._vids_by_switch.setdefault(switch.name, set()).add(vid)
+
+    def remove_switch(self, switch_name: str):
+        # drops all the terminations of the switch, and the termination items left without any termination
+        self._get_vid_index()
+        emptied = False
+        for vid in self._vids_by_switch.pop(switch_name, set()):
+            termination_item = self._by_vid[2].get(vid)
+            if not termination_item:
+                continue
+            if termination_item.vlan_interface and termination_item.vlan_interface.switch_name == switch_name:
+                termination_item.vlan_interface = None
+            termination_item.server_ports.delete_switch(switch_name)
+            if termination_item.is_empty():
+                del self._by_vid[2][vid]
+                emptied = True
+        if emptied:
+            self.root = [item for item in self.root if item.vid in self._by_vid[2]]
+            self._by_vid = (self.root, len(self.root), self._by_vid[2])
+
+    def update_switch(self, switch: Switch, managed_switch_names: List[str]):
+        # recomputes the terminations of a single switch with one pass over its vlan interfaces and ports
+        self.remove_switch(switch.name)
+        switch_vlans = set(switch.vlans)
+        for vlan_interface in switch.vlan_l3_ports:
+            if vlan_interface.vlan in switch_vlans:
+                self.set_vlan_interface(switch, vlan_interface.vlan)
+        for phy_port in switch.phy_ports:
+            if not phy_port.is_up() or phy_port.get_neighbor_name() in managed_switch_names:
+                continue
+            for vid in phy_port.get_vlans() & switch_vlans:
+                logger.debug('found Vlan %s termination on switch %s port %s towards server %s',
+                             vid, switch.name, phy_port.name, phy_port.get_neighbor_name())
                 termination_item = self.get_by_vid(vid, create_if_missing=True)
                 termination_item.server_ports.add(switch_name=switch.name, port_name=phy_port.name)
+                self._vids_by_switch.setdefault(switch.name, set()).add(vid)
@@ -0,0 +1,271 @@
+from __future__ import annotations
+from bisect import bisect_right
+from ipaddress import IPv4Address, IPv4Network, summarize_address_range
+from typing import Annotated, Dict, Iterable, Iterator, List, Union
+
+from pydantic import PlainSerializer, PlainValidator, ValidationInfo
+
+MAX_VLAN_ID = 4096
+# block size of an exhausted pool stored in the list format (used before the introduction of the pool), when it is not
+# given by the network configuration: the list has no subnets to take it from
+LEGACY_EMPTY_POOL_PREFIXLEN = 32
+
+
+class VlanBitmap:
+    # set of vlan ids stored as a 4096-bit integer: membership, insertion, deletion and extraction of the lowest vlan id
+    # do not depend on the number of vlans in the pool
+    __slots__ = ('_bits',)
+
+    def __init__(self, vids: Iterable[int] = ()):
+        self._bits = 0
+        for vid in vids:
+            self.add(vid)
+
+    @staticmethod
+    def _check_vid(vid: int) -> None:
+        if not 0 <= vid < MAX_VLAN_ID:
+            raise ValueError('vlan id {} out of range'.format(vid))
+
+    def __contains__(self, vid: int) -> bool:
+        return 0 <= vid < MAX_VLAN_ID and bool((self._bits >> vid) & 1)
+
+    def __len__(self) -> int:
+        return bin(self._bits).count('1')
+
+    def __iter__(self) -> Iterator[int]:
+        bits = self._bits
+        while bits:
+            lowest = bits & -bits
+            yield lowest.bit_length() - 1
+            bits ^= lowest
+
+    def __eq__(self, other: VlanBitmap) -> bool:
+        return isinstance(other, VlanBitmap) and self._bits == other._bits
+
+    def __repr__(self) -> str:
+        return 'VlanBitmap({})'.format(self.to_ranges())
+
+    def add(self, vid: int) -> None:
+        self._check_vid(vid)
+        self._bits |= 1 << vid
+
+    def discard(self, vid: int) -> None:
+        if 0 <= vid < MAX_VLAN_ID:
+            self._bits &= ~(1 << vid)
+
+    def remove(self, vid: int) -> None:
+        if vid not in self:
+            raise ValueError('vlan id {} not available'.format(vid))
+        self.discard(vid)
+
+    def pop_first(self) -> int:
+        if not self._bits:
+            raise ValueError('vlan pool exhausted')
+        lowest = self._bits & -self._bits
+        self._bits ^= lowest
+        return lowest.bit_length() - 1
+
+    def to_ranges(self) -> str:
+        # compact representation used for persistency, e.g. "10-20,30,40-49"
+        ranges = []
+        first = last = None
+        for vid in self:
+            if last is not None and vid == last + 1:
+                last = vid
+                continue
+            if first is not None:
+                ranges.append(str(first) if first == last else '{}-{}'.format(first, last))
+            first = last = vid
+        if first is not None:
+            ranges.append(str(first) if first == last else '{}-{}'.format(first, last))
+        return ','.join(ranges)
+
+    @classmethod
+    def from_ranges(cls, ranges: str) -> VlanBitmap:
+        res = cls()
+        for item in ranges.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            if '-' in item:
+                first, last = item.split('-')
+                res._check_vid(int(first))
+                res._check_vid(int(last))
+                # all the bits between first and last at once
+                res._bits |= ((1 << (int(last) - int(first) + 1)) - 1) << int(first)
+            else:
+                res.add(int(item))
+        return res
+
+    @classmethod
+    def validate(cls, value: Union[VlanBitmap, str, Iterable[int]]) -> VlanBitmap:
+        if isinstance(value, VlanBitmap):
+            return value
+        if isinstance(value, str):
+            return cls.from_ranges(value)
+        if isinstance(value, (list, tuple, set)):
+            # format used before the introduction of the bitmap
+            return cls(value)
+        raise ValueError('unsupported vlan pool format {}'.format(type(value)))
+
+
+class SubnetPool:
+    # free IPv4 address space, kept as sorted and disjoint [first, last] address intervals aligned to the block size.
+    # Subnets are handed out in blocks with a fixed prefix length; lookups are binary searches on the interval starts.
+    __slots__ = ('prefixlen', '_starts', '_ends')
+
+    def __init__(self, prefixlen: int = 32):
+        self.prefixlen = prefixlen
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+
+    @property
+    def block_size(self) -> int:
+        return 1 << (32 - self.prefixlen)
+
+    def __len__(self) -> int:
+        # number of available blocks
+        return sum((e - s + 1) // self.block_size for s, e in zip(self._starts, self._ends))
+
+    def __bool__(self) -> bool:
+        return len(self._starts) > 0
+
+    def __eq__(self, other: SubnetPool) -> bool:
+        return isinstance(other, SubnetPool) and self.prefixlen == other.prefixlen and \
+            self._starts == other._starts and self._ends == other._ends
+
+    def __repr__(self) -> str:
+        return 'SubnetPool({})'.format(self.to_dict())
+
+    def __contains__(self, network: Union[IPv4Network, str]) -> bool:
+        network = IPv4Network(network)
+        first, last = int(network.network_address), int(network.broadcast_address)
+        i = bisect_right(self._starts, first) - 1
+        return i >= 0 and self._ends[i] >= last
+
+    def __iter__(self) -> Iterator[IPv4Network]:
+        for s, e in zip(self._starts, self._ends):
+            for block_start in range(s, e + 1, self.block_size):
+                yield IPv4Network((block_start, self.prefixlen))
+
+    def _insert_range(self, first: int, last: int) -> None:
+        i = bisect_right(self._starts, last) - 1
+        if i >= 0 and self._ends[i] >= first:
+            raise ValueError('IP subnet {} already available!'.format(
+                list(summarize_address_range(IPv4Address(first), IPv4Address(last)))))
+        i += 1
+        # merge with the adjacent intervals, if any
+        if i > 0 and self._ends[i - 1] + 1 == first:
+            i -= 1
+            first = self._starts[i]
+            del self._starts[i]
+            del self._ends[i]
+        if i < len(self._starts) and last + 1 == self._starts[i]:
+            last = self._ends[i]
+            del self._starts[i]
+            del self._ends[i]
+        self._starts.insert(i, first)
+        self._ends.insert(i, last)
+
+    def _remove_range(self, first: int, last: int) -> None:
+        i = bisect_right(self._starts, last) - 1
+        while i >= 0 and self._ends[i] >= first:
+            interval_start, interval_end = self._starts[i], self._ends[i]
+            del self._starts[i]
+            del self._ends[i]
+            if interval_end > last:
+                self._starts.insert(i, last + 1)
+                self._ends.insert(i, interval_end)
+            if interval_start < first:
+                self._starts.insert(i, interval_start)
+                self._ends.insert(i, first - 1)
+            i -= 1
+
+    def add(self, network: Union[IPv4Network, str]) -> None:
+        network = IPv4Network(network)
+        if network.prefixlen > self.prefixlen:
+            raise ValueError('IP subnet {} is smaller than the pool block size /{}'.format(network, self.prefixlen))
+        self._insert_range(int(network.network_address), int(network.broadcast_address))
+
+    def reserve(self, network: Union[IPv4Network, str]) -> IPv4Network:
+        network = IPv4Network(network)
+        if network not in self:
+            raise ValueError('IP subnet {} not available'.format(network))
+        self._remove_range(int(network.network_address), int(network.broadcast_address))
+        return network
+
+    def remove_overlapping(self, network: Union[IPv4Network, str]) -> None:
+        # removes all the blocks overlapping with the network
+        network = IPv4Network(network, strict=False)
+        mask = self.block_size - 1
+        first = int(network.network_address) & ~mask
+        last = int(network.broadcast_address) | mask
+        self._remove_range(first, last)
+
+    def pop_first(self) -> IPv4Network:
+        if not self._starts:
+            raise ValueError('IP subnet pool exhausted')
+        first = self._starts[0]
+        self._remove_range(first, first + self.block_size - 1)
+        return IPv4Network((first, self.prefixlen))
+
+    def to_dict(self) -> Dict:
+        # compact representation used for persistency: adjacent free blocks are summarized in larger networks
+        free = []
+        for s, e in zip(self._starts, self._ends):
+            free.extend(str(item) for item in summarize_address_range(IPv4Address(s), IPv4Address(e)))
+        return {'prefixlen': self.prefixlen, 'free': free}
+
+    @classmethod
+    def from_networks(cls, networks: Iterable[Union[IPv4Network, str]], prefixlen: int = None) -> SubnetPool:
+        # the block size is the prefix length of the networks, unless given; it must be given for an empty pool
+        networks = [IPv4Network(str(item)) for item in networks]
+        if prefixlen is None:
+            prefix_lengths = set(item.prefixlen for item in networks)
+            if not prefix_lengths:
+                raise ValueError('the prefix length of an empty IP subnet pool must be given')
+            if len(prefix_lengths) > 1:
+                raise ValueError('IP subnet pools with different prefix lengths {} are not supported'.format(
+                    prefix_lengths))
+            prefixlen = prefix_lengths.pop()
+        res = cls(prefixlen=prefixlen)
+        for item in sorted(networks):
+            res.add(item)
+        return res
+
+    @classmethod
+    def validate(cls, value: Union[SubnetPool, Dict, Iterable], prefixlen: int = None) -> SubnetPool:
+        # prefixlen is the block size of the pool in the configuration, used for the list format
+        if isinstance(value, SubnetPool):
+            return value
+        if isinstance(value, dict):
+            res = cls(prefixlen=value['prefixlen'])
+            for item in value.get('free', []):
+                res.add(item)
+            return res
+        if isinstance(value, (list, tuple, set)):
+            # format used before the introduction of the pool
+            if not value and prefixlen is None:
+                prefixlen = LEGACY_EMPTY_POOL_PREFIXLEN
+            return cls.from_networks(value, prefixlen)
+        raise ValueError('unsupported IP subnet pool format {}'.format(type(value)))
+
+
+def _validate_subnet_pool(value: Union[SubnetPool, Dict, Iterable], info: ValidationInfo) -> SubnetPool:
+    # the block sizes of the pools may be passed by field name in the validation context, e.g.
+    # NetworkState.model_validate(data, context={'subnet_prefixlens': {'available_pnf_subnets': 30}})
+    prefixlens = (info.context or {}).get('subnet_prefixlens', {})
+    return SubnetPool.validate(value, prefixlens.get(info.field_name))
+
+
+VlanPool = Annotated[
+    VlanBitmap,
+    PlainValidator(VlanBitmap.validate),
+    PlainSerializer(lambda x: x.to_ranges(), return_type=str, when_used='always')
+]
+
+IPv4SubnetPool = Annotated[
+    SubnetPool,
+    PlainValidator(_validate_subnet_pool),
+    PlainSerializer(lambda x: x.to_dict(), return_type=dict, when_used='always')
+]
@@ -0,0 +1,228 @@
+from __future__ import annotations
+import datetime
+import threading
+from types import MappingProxyType
+from typing import Any, Dict, List, NamedTuple, Tuple, Union
+
+import networkx as nx
+from pydantic import TypeAdapter
+
+from models import NetworkVrf, NetVlanReport, PortVlanReport, LinkModes
+from network.network_graph import build_vlan_overlay, build_vrf_overlay
+from utils import create_logger
+
+logger = create_logger('network-snapshot')
+_any_adapter = TypeAdapter(Any)
+
+
+class _SwitchFragment(NamedTuple):
+    # encoded data of a switch, valid as long as the switch revision does not change
+    revision: int
+    switch: bytes
+    vlans: Tuple[int, ...]
+    vrfs: List[Tuple[str, bytes]]
+    vrf_vlans: List[Tuple[str, Tuple[str, List[int]]]]
+    net_vlans: List[Tuple[int, bytes]]
+    ports: List[Tuple[Tuple[str, str], bytes]]
+
+
+def _encode_switch(s) -> _SwitchFragment:
+    # the revision is read before encoding: a change during the encoding is caught by the next snapshot
+    revision = s.revision
+    vrfs = []
+    vrf_vlans = []
+    for v in s.vrfs:
+        vrf_vlans.append((v.name, (s.name, [item.vlan for item in v.ports])))
+        vrf_item = v.model_dump()
+        vrf_item['device'] = s.name
+        vrfs.append((v.name, NetworkVrf.model_validate(vrf_item).model_dump_json().encode()))
+
+    net_vlans = []
+    for vlan_intf in s.vlan_l3_ports:
+        try:
+            net_vlans.append((vlan_intf.vlan, NetVlanReport.model_validate({
+                'vid': vlan_intf.vlan,
+                'cidr': vlan_intf.cidr,
+                'gateway': vlan_intf.ipaddress,
+                'group': vlan_intf.vrf,
+                'description': vlan_intf.description
+            }).model_dump_json().encode()))
+        except ValueError:
+            logger.warning('vlan interface %s on switch %s cannot be reported', vlan_intf.index, s.name)
+
+    ports = []
+    for p in s.phy_ports:
+        port_report = PortVlanReport(
+            trunk=p.trunk_vlans,
+            pvid=p.access_vlan,
+            mode=p.mode.value if isinstance(p.mode, LinkModes) else str(p.mode)
+        ).model_dump_json().encode()
+        ports.append(((s.name, p.index), port_report))
+        if p.name:
+            ports.append(((s.name, p.name), port_report))
+
+    return _SwitchFragment(
+        revision=revision,
+        switch=s.to_switch_model().model_dump_json().encode(),
+        vlans=tuple(dict.fromkeys(s.vlans)),
+        vrfs=vrfs,
+        vrf_vlans=vrf_vlans,
+        net_vlans=net_vlans,
+        ports=ports
+    )
+
+
+class NetworkSnapshot:
+    # Read-only, pre-serialized view of the network state. A new snapshot is built by the network worker
+    # after every operation and atomically swapped in, so that REST handlers can read it without locks
+    # and without touching the Switch objects that the worker thread is modifying.
+    # The vlan and vrf overlays are too many to be serialized in advance: the snapshot keeps a frozen copy of the
+    # links and of the vlan and vrf membership of the switches, and the overlays are built from them on request and
+    # memoized for the lifetime of the snapshot.
+    __slots__ = ('version', 'created', '_switches', '_vrfs', '_vrf_list', '_net_vlans', '_ports', '_topology',
+                 '_links', '_vlan_switches', '_vrf_vlans', '_overlays', '_overlays_lock', '_sources', '_fragments')
+
+    def __init__(
+            self,
+            version: int = 0,
+            switches: Dict[str, bytes] = None,
+            vrfs: Dict[str, bytes] = None,
+            vrf_list: bytes = b'[]',
+            net_vlans: Dict[int, bytes] = None,
+            ports: Dict[Tuple[str, str], bytes] = None,
+            topology: bytes = b'{}',
+            links: nx.MultiGraph = None,
+            vlan_switches: Dict[int, Tuple[str, ...]] = None,
+            vrf_vlans: Dict[str, Tuple[str, List[int]]] = None
+    ):
+        self.version = version
+        self.created = datetime.datetime.now()
+        self._switches = MappingProxyType(switches or {})
+        self._vrfs = MappingProxyType(vrfs or {})
+        self._vrf_list = vrf_list
+        self._net_vlans = MappingProxyType(net_vlans or {})
+        self._ports = MappingProxyType(ports or {})
+        self._topology = topology
+        self._links = nx.freeze(links if links is not None else nx.MultiGraph())
+        self._vlan_switches = MappingProxyType(vlan_switches or {})
+        self._vrf_vlans = MappingProxyType(vrf_vlans or {})
+        self._overlays: Dict[Tuple[str, Union[int, str]], bytes] = {}
+        self._overlays_lock = threading.Lock()
+        # graph revision and (name, revision) of the switches the snapshot was built from, with their fragments
+        self._sources: Tuple = (None, ())
+        self._fragments: Dict[str, _SwitchFragment] = {}
+
+    @classmethod
+    def from_network(cls, net, version: int = 0, previous: NetworkSnapshot = None) -> NetworkSnapshot:
+        # to be called only by the network worker thread (or before the thread is started). The encoded fragments of
+        # the switches not changed since the previous snapshot, and the links if the graph was not rebuilt, are reused;
+        # if nothing changed, the previous snapshot itself is returned
+        previous_fragments = previous._fragments if previous is not None else {}
+        sources = (net.graph_revision, tuple((s.name, s.revision) for s in net.switches))
+        if previous is not None and previous._sources == sources:
+            return previous
+
+        fragments = {}
+        for s in net.switches:
+            fragment = previous_fragments.get(s.name)
+            if fragment is None or fragment.revision != s.revision:
+                fragment = _encode_switch(s)
+            fragments[s.name] = fragment
+
+        switches = {}
+        vrfs = {}
+        vrf_list = []
+        net_vlans = {}
+        ports = {}
+        vlan_switches = {}
+        vrf_vlans = {}
+        for name, fragment in fragments.items():
+            switches[name] = fragment.switch
+            for vid in fragment.vlans:
+                vlan_switches.setdefault(vid, []).append(name)
+            for vrf_name, vrf_json in fragment.vrfs:
+                vrf_list.append(vrf_json)
+                vrfs.setdefault(vrf_name, vrf_json)
+            # as in NetworkGraph.get_l3_overlay_topology, the last switch of the vrf is its root node
+            vrf_vlans.update(fragment.vrf_vlans)
+            for vid, report in fragment.net_vlans:
+                net_vlans.setdefault(vid, report)
+            ports.update(fragment.ports)
+
+        if previous is not None and previous._sources[0] == net.graph_revision:
+            topology = previous._topology
+            links = previous._links
+        else:
+            topology = _any_adapter.dump_json(net.get_topology_dict())
+            # the graph is modified in place by the worker: the links are copied
+            links = nx.MultiGraph()
+            for u, v, data in net.graph.edges(data=True):
+                links.add_edge(u, v, ports=dict(data['ports']), weight=data['weight'],
+                               vlans=frozenset(data['vlans']))
+        snapshot = cls(
+            version=version,
+            switches=switches,
+            vrfs=vrfs,
+            vrf_list=b'[' + b','.join(vrf_list) + b']',
+            net_vlans=net_vlans,
+            ports=ports,
+            topology=topology,
+            links=links,
+            vlan_switches={vid: tuple(names) for vid, names in vlan_switches.items()},
+            vrf_vlans=vrf_vlans
+        )
+        snapshot._sources = sources
+        snapshot._fragments = fragments
+        return snapshot
+
+    def has_switch(self, switch_name: str) -> bool:
+        return switch_name in self._switches
+
+    def get_switch(self, switch_name: str) -> Union[bytes, None]:
+        return self._switches.get(switch_name)
+
+    def get_vrf(self, vrf_name: str) -> Union[bytes, None]:
+        return self._vrfs.get(vrf_name)
+
+    def get_vrf_list(self) -> bytes:
+        return self._vrf_list
+
+    def has_net_vlan(self, vid: int) -> bool:
+        return vid in self._net_vlans
+
+    def get_net_vlan(self, vid: int) -> Union[bytes, None]:
+        return self._net_vlans.get(vid)
+
+    def has_port(self, switch_name: str, port_name: str) -> bool:
+        return (switch_name, port_name) in self._ports
+
+    def get_port(self, switch_name: str, port_name: str) -> Union[bytes, None]:
+        return self._ports.get((switch_name, port_name))
+
+    def get_topology(self) -> bytes:
+        return self._topology
+
+    def _vlan_overlay(self, vlan_id: int) -> nx.MultiGraph:
+        vlan_nodes = {name: {'vlan_configured': True} for name in self._vlan_switches.get(vlan_id, ())}
+        return build_vlan_overlay(self._links, vlan_id, vlan_nodes)
+
+    def _get_overlay(self, key: Tuple[str, Union[int, str]], build) -> bytes:
+        # the overlays depend only on the frozen data of the snapshot: concurrent requests may build the same overlay
+        # twice, but they always get the same content
+        overlay = self._overlays.get(key)
+        if overlay is None:
+            overlay = _any_adapter.dump_json(nx.convert.to_dict_of_dicts(build()))
+            with self._overlays_lock:
+                overlay = self._overlays.setdefault(key, overlay)
+        return overlay
+
+    def get_vlan_topology(self, vlan_id: int) -> bytes:
+        return self._get_overlay(('vlan', vlan_id), lambda: self._vlan_overlay(vlan_id))
+
+    def get_vrf_topology(self, vrf_name: str) -> bytes:
+        def build() -> nx.MultiGraph:
+            if vrf_name not in self._vrf_vlans:
+                return nx.MultiGraph()
+            vrf_switch, vrf_vlans = self._vrf_vlans[vrf_name]
+            return build_vrf_overlay(vrf_name, vrf_switch, vrf_vlans, self._vlan_overlay)
+        return self._get_overlay(('vrf', vrf_name), build)
@@ -2,117 +2,402 @@ import queue
 import threading
 import time
 import traceback
-from typing import Dict
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Set, Tuple, Union
 
-import networkx as nx
 
-from .nbi_msg_models import WorkerMsg
+from .nbi_msg_models import BootstrapStatus, WorkerMsg
+from models import INITIALIZING_STATES
 from netdevice import Device
+from sbi.circuit_breaker import circuit_breakers
 from .network import Network
 from .network_base import logger
+from .network_snapshot import NetworkSnapshot
+from utils.device_events import DeviceStateEvent, device_events
+from utils.metrics import worker_queue_depth, worker_parked_operations, worker_operation_seconds, worker_operations
+from utils.operation_control import OperationControl, OperationAbortedException, operation_control
+from utils.tracing import start_trace
+from utils.util import get_config
+
+# operations acting on a single device, with the message attribute naming it: they wait only for that device. The
+# other operations, apart from add_switch, involve the whole network and wait for all the devices being initialized
+_DEVICE_OPERATIONS = {
+    'del_switch': 'switch_name',
+    'add_port_vlan': 'node',
+    'del_port_vlan': 'node',
+    'mod_port_vlan': 'node'
+}
+_INDEPENDENT_OPERATIONS = ['add_switch']
 
 
 class NetworkWorker:
-    queue: queue.Queue[WorkerMsg]
-    net: Network
+    queue: queue.Queue[Union[WorkerMsg, DeviceStateEvent]]
+    net: Union[Network, None]
+    snapshot: NetworkSnapshot
+    bootstrap: BootstrapStatus
 
     def __init__(self):
-        logger.info("initializing the network")
-        self.net = Network()
-        logger.info("initializing the network worker")
+        # nothing is loaded here: the network is initialized by the worker thread launched with start(), so that the
+        # REST server can answer (health endpoints) while the devices are connected
+        self.net = None
+        self.snapshot = NetworkSnapshot()
+        self.bootstrap = BootstrapStatus()
+        # operations sent by the REST endpoints and state transitions of the devices, both handled by the worker thread
         self.queue = queue.Queue()
-        thread = threading.Thread(target=self.next_msg, name="network_thread")
+        worker_queue_depth.set_function(self.queue.qsize)
+        # devices restored from the database whose initialization has not yet been notified to the worker
+        self._initializing: Set[str] = set()
+        # operations waiting for some devices to be initialized, with the names of those devices
+        self._parked: List[Tuple[WorkerMsg, Set[str]]] = []
+        worker_parked_operations.set_function(lambda: len(self._parked))
+        # parked operations whose devices are now initialized, processed before the queue
+        self._resumed: Deque[WorkerMsg] = deque()
+        # devices initialized since the last rebuild of the network data
+        self._settled: Set[str] = set()
+        # operations submitted and not yet started, which can be cancelled by the REST threads, and the control of the
+        # running operation (deadline and cancellation)
+        self._pending: Dict[str, WorkerMsg] = {}
+        self._running: Union[OperationControl, None] = None
+        self._lock = threading.Lock()
+        self._thread: Union[threading.Thread, None] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        device_events.subscribe(self._on_device_event)
+        self._thread = threading.Thread(target=self.run, name="network_thread")
         # thread.daemon = True
-        thread.start()
-        logger.info("initialization complete")
+        self._thread.start()
+
+    def stop(self) -> None:
+        # the worker terminates once the operations already queued are processed
+        if self._thread is not None:
+            self.queue.put(WorkerMsg.model_construct(operation='stop'))
+
+    def is_ready(self) -> bool:
+        return self.bootstrap.phase == 'ready'
+
+    def run(self) -> None:
+        try:
+            self._bootstrap()
+        except Exception as e:
+            self.bootstrap.phase = 'failed'
+            self.bootstrap.error = str(e) or repr(e)
+            self.bootstrap.end_time = datetime.now()
+            logger.error('network initialization failed: %s', traceback.format_exc())
+            return
+        self.next_msg()
+
+    def _bootstrap(self) -> None:
+        self.bootstrap.start_time = datetime.now()
+        self.bootstrap.phase = 'configuration'
+        get_config()
+        logger.info("initializing the network")
+        self.bootstrap.phase = 'network'
+        # the devices are still being initialized by their threads: they are added to the network data, and the
+        # operations involving them are resumed, when their state transitions are received
+        self.net = Network()
+        self._initializing = {device.name for device in self.net.get_initializing_devices()}
+        self._update_device_counters()
+        self.bootstrap.phase = 'snapshot'
+        self.publish_snapshot()
+        self.bootstrap.phase = 'ready'
+        self.bootstrap.end_time = datetime.now()
+        logger.info("initialization complete in %.3fs, %s devices being initialized",
+                    (self.bootstrap.end_time - self.bootstrap.start_time).total_seconds(), len(self._initializing))
+
+    def _get_devices(self) -> List:
+        devices = list(self.net.switches) + self.net.get_initializing_devices()
+        if self.net.firewall:
+            devices.append(self.net.firewall)
+        return devices
+
+    def _update_device_counters(self) -> None:
+        names = {device.name for device in self._get_devices()}
+        self.bootstrap.devices_total = len(names)
+        self.bootstrap.devices_loaded = len(names - self._initializing)
+
+    def publish_snapshot(self) -> None:
+        # the new snapshot is fully built before replacing the reference, so that readers never see a partial state
+        try:
+            snapshot = NetworkSnapshot.from_network(self.net, version=self.snapshot.version + 1,
+                                                    previous=self.snapshot)
+            if snapshot is self.snapshot:
+                logger.debug('network unchanged, keeping snapshot version %s', self.snapshot.version)
+                return
+            # the switches or the graph changed: the memoized overlays are no longer valid
+            self.net.invalidate_overlays()
+            self.snapshot = snapshot
+            logger.debug('published network snapshot version %s', self.snapshot.version)
+        except Exception:
+            self.net.invalidate_overlays()
+            logger.error('error building the network snapshot, keeping version %s', self.snapshot.version)
+            logger.error(traceback.format_exc())
 
     def send_message(self, worker_msg: WorkerMsg):
+        if self.bootstrap.phase == 'failed':
+            raise ValueError('network worker not available: initialization failed')
+        # operations sent during the initialization wait in the queue
         worker_msg.to_db()
+        worker_msg.to_registry()
+        with self._lock:
+            self._pending[worker_msg.operation_id] = worker_msg
         self.queue.put(worker_msg)
 
-    def next_msg(self):
-        # Fixme: wait for switches to be ready
-        counter = 0
-        while self.net.switches.check_switch_ready():
-            logger.info("switches are noy yet ready. Awaiting 30 seconds.")
-            time.sleep(30)
-            counter += 1
-            if counter == 20:
-                raise ValueError("swithes are not ready. Timeout expiring")
+    def cancel(self, operation_id: str) -> bool:
+        # a queued or parked operation is cancelled at once, the running one stops before its next device
+        # configuration step. Returns False if the operation is neither waiting nor running
+        with self._lock:
+            s_input = self._pending.pop(operation_id, None)
+            if s_input is None:
+                if self._running is None or self._running.operation_id != operation_id:
+                    return False
+                self._running.cancel()
+                logger.info('cancellation of the running operation %s requested', operation_id)
+                return True
+        logger.info('operation %s %s cancelled before its execution', s_input.operation, operation_id)
+        s_input.update_status('Cancelled', error_detail='operation cancelled before its execution')
+        worker_operations.inc(operation=s_input.operation, result='cancelled')
+        return True
 
-        while True:
+    def _is_pending(self, s_input: WorkerMsg) -> bool:
+        with self._lock:
+            return s_input.operation_id in self._pending
+
+    def _expire(self, s_input: WorkerMsg) -> None:
+        with self._lock:
+            if self._pending.pop(s_input.operation_id, None) is None:
+                return
+        logger.warning('operation %s %s expired before its execution', s_input.operation, s_input.operation_id)
+        s_input.update_status('Expired', error_detail='deadline {} passed before the execution'.format(
+            s_input.deadline.isoformat(timespec='seconds')))
+        worker_operations.inc(operation=s_input.operation, result='expired')
+
+    def _on_device_event(self, event: DeviceStateEvent) -> None:
+        # executed by the thread of the device: the event is handed over to the worker thread
+        self.queue.put(event)
+
+    def _next_item(self) -> Union[WorkerMsg, DeviceStateEvent, None]:
+        # None when woken up by the deadline of a parked operation
+        if self._resumed:
+            return self._resumed.popleft()
+        try:
+            item = self.queue.get_nowait()
+        except queue.Empty:
+            # a burst of device events is applied to the network data once, before waiting for new jobs
+            self._apply_settled_devices()
             logger.info('network worker awaiting for new job')
-            s_input = self.queue.get()
-            logger.info('network worker received new job {}'.format(s_input.operation))
+            try:
+                item = self.queue.get(timeout=self._parked_timeout())
+            except queue.Empty:
+                return None
+        self.queue.task_done()
+        return item
+
+    def next_msg(self):
+        while True:
+            self._sweep_parked()
+            s_input = self._next_item()
+            if s_input is None:
+                continue
+            if isinstance(s_input, DeviceStateEvent):
+                self._handle_device_event(s_input)
+                continue
             if s_input.operation == 'stop':
+                self._fail_parked()
                 self.destroy()
                 logger.info('removing the network worker thread')
                 break
-            try:
-                result = False
-                match s_input.operation:
-                    case 'set_config':
-                        self.net.set_config(s_input)
-                        result = True
-                    case 'add_switch':
-                        self.net.onboard_switch(Device.model_validate(s_input.model_dump()))
-                        result = self.net.assert_add_switch(Device.model_validate(s_input.model_dump()))
-                    case 'del_switch':
-                        self.net.delete_switch(s_input.switch_name)
-                        result = self.net.assert_del_switch(Device.model_validate(s_input.model_dump()))
-                    case 'del_net_vlan':
-                        self.net.delete_net_vlan(s_input)
-                        result = self.net.assert_net_vlan(s_input)
-                    case 'add_net_vlan':
-                        self.net.create_net_vlan(s_input)
-                        result = self.net.assert_net_vlan(s_input)
-                    case 'mod_net_vlan':
-                        self.net.modify_net_vlan(s_input)
-                        result = self.net.assert_net_vlan(s_input)
-                    case 'add_port_vlan':
-                        self.net.add_port_vlan(s_input)
-                        result = self.net.assert_port_vlan(s_input)
-                    case 'del_port_vlan':
-                        self.net.del_port_vlan(s_input)
-                        result = self.net.assert_port_vlan(s_input)
-                    case 'mod_port_vlan':
-                        self.net.mod_port_vlan(s_input)
-                        result = self.net.assert_port_vlan(s_input)
-                    case 'add_pnf':
-                        self.net.add_pnf(s_input)
-                        result = self.net.assert_pnf(s_input)
-                    case 'del_pnf':
-                        self.net.del_pnf(s_input)
-                        result = self.net.assert_pnf(s_input)
-                    case 'bind_groups':
-                        self.net.bind_groups(s_input)
-                        result = self.net.assert_bind_groups(s_input)
-                    case 'unbind_groups':
-                        self.net.unbind_groups(s_input)
-                        result = self.net.assert_unbind_groups(s_input)
-
-                    case _:
-                        raise ValueError('msg operation {} not supported'.format(s_input.operation))
-                if result:
-                    s_input.update_status('Success')
-                else:
-                    raise ValueError('msg operation {} verification failed'.format(s_input.operation))
-            except Exception as e:
-                s_input.update_status('Failed')
-                logger.error(traceback.format_tb(e.__traceback__))
-                logger.error(str(e))
-            finally:
-                # ToDo: block until message
-                self.queue.task_done()
+            # operations cancelled while queued are skipped, the expired ones are not executed
+            if not self._is_pending(s_input):
+                continue
+            if s_input.is_expired():
+                self._expire(s_input)
+                continue
+            if self._park(s_input):
+                continue
+            self._process(s_input)
 
-    def get_topology(self) -> Dict:
-        return self.net.get_topology_dict()
+    def _handle_device_event(self, event: DeviceStateEvent) -> None:
+        logger.info('%s %s passed from %s into %s state', event.kind, event.device, event.old_state, event.new_state)
+        if event.new_state in INITIALIZING_STATES:
+            return
+        # the thread of a restored device has completed its initialization: the device joins the network data
+        self.net.settle_device(event.device)
+        self._initializing.discard(event.device)
+        self._settled.add(event.device)
+        self._update_device_counters()
+        parked = []
+        for s_input, devices in self._parked:
+            devices.discard(event.device)
+            if devices:
+                parked.append((s_input, devices))
+            else:
+                logger.info('resuming operation %s %s', s_input.operation, s_input.operation_id)
+                self._resumed.append(s_input)
+        self._parked = parked
+
+    def _apply_settled_devices(self) -> None:
+        # the information of the devices initialized meanwhile is added to the graph and to the vlan data
+        if not self._settled:
+            return
+        names = list(self._settled)
+        self._settled = set()
+        try:
+            self.net.build_graph()
+            self.net.update_vlan_data(names)
+        except Exception:
+            logger.error('error updating the network data for devices %s', names)
+            logger.error(traceback.format_exc())
+        self.publish_snapshot()
 
-    def get_vrf_topology(self, vrf_name: str):
-        return nx.convert.to_dict_of_dicts(self.net.get_l3_overlay_topology(vrf_name))
+    def _park(self, s_input: WorkerMsg) -> bool:
+        # an operation involving devices not yet initialized waits for them, without blocking the other operations
+        if not self._initializing or s_input.operation in _INDEPENDENT_OPERATIONS:
+            return False
+        attribute = _DEVICE_OPERATIONS.get(s_input.operation)
+        if attribute:
+            waiting_for = self._initializing & {getattr(s_input, attribute, None)}
+        else:
+            waiting_for = set(self._initializing)
+        if not waiting_for:
+            return False
+        logger.info('operation %s %s parked, waiting for devices %s', s_input.operation, s_input.operation_id,
+                    sorted(waiting_for))
+        self._parked.append((s_input, waiting_for))
+        return True
 
-    def get_vlan_topology(self, vlan_id: int):
-        return nx.convert.to_dict_of_dicts(self.net.get_vlan_overlay(vlan_id))
+    def _parked_timeout(self) -> Union[float, None]:
+        # seconds to the first deadline of the parked operations
+        deadlines = [s_input.deadline for s_input, _ in self._parked if s_input.deadline]
+        if not deadlines:
+            return None
+        return max((min(deadlines) - datetime.now()).total_seconds(), 0)
+
+    def _sweep_parked(self) -> None:
+        # parked operations cancelled or expired meanwhile
+        if not self._parked:
+            return
+        parked = []
+        for s_input, devices in self._parked:
+            if not self._is_pending(s_input):
+                continue
+            if s_input.is_expired():
+                self._expire(s_input)
+                continue
+            parked.append((s_input, devices))
+        self._parked = parked
+
+    def _fail_parked(self) -> None:
+        for s_input, devices in self._parked:
+            with self._lock:
+                if self._pending.pop(s_input.operation_id, None) is None:
+                    continue
+            logger.warning('operation %s %s dropped, devices %s never initialized', s_input.operation,
+                           s_input.operation_id, sorted(devices))
+            s_input.update_status('Failed', error_detail='devices {} never initialized'.format(sorted(devices)))
+        self._parked = []
+
+    def _process(self, s_input: WorkerMsg) -> None:
+        with self._lock:
+            if self._pending.pop(s_input.operation_id, None) is None:
+                # cancelled meanwhile
+                return
+            control = self._running = OperationControl(s_input.operation_id, s_input.deadline)
+        logger.info('network worker received new job %s', s_input.operation)
+        self._apply_settled_devices()
+        start = time.perf_counter()
+        outcome = 'failed'
+        try:
+            # the steps of the operation are traced, and check the deadline and the cancellation of the operation;
+            # the trace is stored with the operation status
+            with operation_control(control), \
+                    start_trace(s_input.operation, operation_id=s_input.operation_id) as trace:
+                s_input.trace = trace
+                result = self._execute(s_input)
+            if result:
+                s_input.update_status('Success')
+                outcome = 'success'
+            else:
+                raise ValueError('msg operation {} verification failed'.format(s_input.operation))
+        except OperationAbortedException as e:
+            logger.warning('operation %s %s aborted: %s', s_input.operation, s_input.operation_id, e)
+            s_input.update_status(e.status, error_detail=str(e))
+            outcome = e.status.lower()
+        except Exception as e:
+            # a step failing after the deadline, e.g. on a driver timeout reduced to the remaining time, expires the
+            # operation
+            if s_input.is_expired():
+                s_input.update_status('Expired', error_detail='operation expired: {}'.format(str(e) or repr(e)))
+                outcome = 'expired'
+            else:
+                s_input.update_status('Failed', error_detail=str(e) or repr(e))
+            logger.error(traceback.format_tb(e.__traceback__))
+            logger.error(str(e))
+        finally:
+            with self._lock:
+                self._running = None
+            # a new snapshot is published only if the operation modified the switches or the graph
+            self.publish_snapshot()
+            worker_operation_seconds.observe(time.perf_counter() - start, operation=s_input.operation)
+            worker_operations.inc(operation=s_input.operation, result=outcome)
+
+    def _execute(self, s_input: WorkerMsg) -> bool:
+        match s_input.operation:
+            case 'set_config':
+                self.net.set_config(s_input)
+                return True
+            case 'add_switch':
+                # a new device starts with a closed circuit, also if a device with the same name was unreachable
+                circuit_breakers.reset(s_input.name)
+                self.net.onboard_switch(Device.model_validate(s_input.model_dump()))
+                return self.net.assert_add_switch(Device.model_validate(s_input.model_dump()))
+            case 'del_switch':
+                self.net.delete_switch(s_input.switch_name)
+                circuit_breakers.reset(s_input.switch_name)
+                return self.net.assert_del_switch(Device.model_validate(s_input.model_dump()))
+            case 'del_net_vlan':
+                self.net.delete_net_vlan(s_input)
+                return self.net.assert_net_vlan(s_input)
+            case 'add_net_vlan':
+                self.net.create_net_vlan(s_input)
+                return self.net.assert_net_vlan(s_input)
+            case 'mod_net_vlan':
+                self.net.modify_net_vlan(s_input)
+                return self.net.assert_net_vlan(s_input)
+            case 'add_port_vlan':
+                self.net.add_port_vlan(s_input)
+                return self.net.assert_port_vlan(s_input)
+            case 'del_port_vlan':
+                self.net.del_port_vlan(s_input)
+                return self.net.assert_port_vlan(s_input)
+            case 'mod_port_vlan':
+                self.net.mod_port_vlan(s_input)
+                return self.net.assert_port_vlan(s_input)
+            case 'add_pnf':
+                self.net.add_pnf(s_input)
+                return self.net.assert_pnf(s_input)
+            case 'del_pnf':
+                self.net.del_pnf(s_input)
+                return self.net.assert_pnf(s_input)
+            case 'bind_groups':
+                self.net.bind_groups(s_input)
+                return self.net.assert_bind_groups(s_input)
+            case 'unbind_groups':
+                self.net.unbind_groups(s_input)
+                return self.net.assert_unbind_groups(s_input)
+
+            case _:
+                raise ValueError('msg operation {} not supported'.format(s_input.operation))
+
+    def _get_net(self) -> Network:
+        if self.net is None:
+            raise ValueError('network not yet initialized')
+        return self.net
+
+    def get_topology(self) -> Dict:
+        return self._get_net().get_topology_dict()
 
     def destroy(self):
         pass
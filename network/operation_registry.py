@@ -0,0 +1,110 @@
+import itertools
+import queue
+import random
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from typing import Callable, Dict, List, Union
+
+import requests
+
+from utils import create_logger
+
+logger = create_logger('operation-registry')
+
+FINAL_STATES = ['Failed', 'Success', 'Cancelled', 'Expired']
+
+
+class OperationRegistry:
+    # in-memory copy of the status of the latest operations, updated by the network worker. Status queries, long
+    # polling and event streams are served from here, the DB is queried only for operations evicted from the registry
+    def __init__(self, max_operations: int = 10000):
+        self._lock = threading.Lock()
+        self._operations: OrderedDict[str, Dict] = OrderedDict()
+        self._subscribers: List[Callable[[Dict], None]] = []
+        self._max_operations = max_operations
+
+    def update(self, operation_id: str, data: Dict) -> None:
+        with self._lock:
+            self._operations[operation_id] = data
+            self._operations.move_to_end(operation_id)
+            while len(self._operations) > self._max_operations:
+                self._operations.popitem(last=False)
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(data)
+            except Exception:
+                logger.error('error notifying operation %s to a subscriber', operation_id)
+                logger.error(traceback.format_exc())
+
+    def get(self, operation_id: str) -> Union[Dict, None]:
+        with self._lock:
+            return self._operations.get(operation_id)
+
+    def subscribe(self, callback: Callable[[Dict], None]) -> None:
+        # callbacks are executed by the thread updating the operation, they should only hand over the data
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[Dict], None]) -> None:
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+
+class CallbackDispatcher:
+    # delivers the operation callbacks from a dedicated thread, so that the network worker is never blocked by slow
+    # or unreachable clients. Failed deliveries are rescheduled with exponential backoff and jitter.
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 timeout: float = 5.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        # items are (due time, sequence number, url, payload, attempt)
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._thread: Union[threading.Thread, None] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        with self._lock:
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="callback_thread", daemon=True)
+                self._thread.start()
+
+    def send(self, url: str, payload: Dict) -> None:
+        self._start()
+        self._queue.put((time.monotonic(), next(self._counter), url, payload, 1))
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        while True:
+            due, seq, url, payload, attempt = self._queue.get()
+            delay = due - time.monotonic()
+            if delay > 0:
+                # not yet due: put it back, an item due earlier may arrive in the meantime
+                self._queue.put((due, seq, url, payload, attempt))
+                time.sleep(min(delay, 0.5))
+                continue
+            try:
+                res = requests.post(url, json=payload, timeout=self.timeout)
+                res.raise_for_status()
+                logger.info('callback for operation %s delivered to %s', payload.get('id'), url)
+            except Exception as e:
+                if attempt >= self.max_attempts:
+                    logger.error('callback for operation %s to %s failed after %s attempts: %s',
+                        payload.get('id'), url, attempt, e)
+                    continue
+                backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                logger.warning('callback for operation %s to %s failed (%s), retrying in %.1fs',
+                    payload.get('id'), url, e, backoff)
+                self._queue.put((time.monotonic() + backoff, next(self._counter), url, payload, attempt + 1))
+
+
+operation_registry = OperationRegistry()
+callback_dispatcher = CallbackDispatcher()
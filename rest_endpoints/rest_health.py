@@ -0,0 +1,30 @@
+import json
+from typing import Dict
+
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from network.nbi_msg_models import BootstrapStatus
+from network import net_worker
+
+health_router = APIRouter(
+    prefix="/health",
+    tags=["Health"],
+)
+
+
+@health_router.get("/live")
+async def get_liveness() -> Dict:
+    # the process is up and serving requests, whatever the state of the network initialization
+    return {'status': 'alive'}
+
+
+@health_router.get("/ready", response_model=BootstrapStatus,
+                   responses={status.HTTP_503_SERVICE_UNAVAILABLE: {"model": BootstrapStatus}})
+async def get_readiness() -> JSONResponse:
+    # 200 once the network worker has loaded the network, 503 with the initialization progress before
+    bootstrap = net_worker.bootstrap
+    return JSONResponse(
+        content=json.loads(bootstrap.model_dump_json()),
+        status_code=status.HTTP_200_OK if net_worker.is_ready() else status.HTTP_503_SERVICE_UNAVAILABLE
+    )
@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Response
+
+from utils.metrics import REGISTRY, CONTENT_TYPE
+
+metrics_router = APIRouter(
+    tags=["Metrics"],
+)
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    # Prometheus text exposition of the in-process metrics
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
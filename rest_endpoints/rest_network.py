@@ -1,7 +1,8 @@
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Response
 from models import NetworkVrf, PortVlanReport, \
     NetVlanReport
 from network.nbi_msg_models import RestAnswer202, NetVlan, NetVlanMsg, PortToNetVlans, PortToNetVlansMsg
+from rest_endpoints.rest_operation import OperationTimeout
 from typing import List, Dict, Union
 from utils import persistency, create_logger
 from network import net_worker
@@ -17,31 +18,22 @@ net_api_router = APIRouter(
 )
 
 
-@net_api_router.get("/vrf")
-async def get_vrf(name: str | None = None) -> Union[NetworkVrf, List[NetworkVrf]]:
+@net_api_router.get("/vrf", response_model=Union[NetworkVrf, List[NetworkVrf]])
+async def get_vrf(name: str | None = None) -> Response:
+    snapshot = net_worker.snapshot
     if name:
-        for s in net_worker.net.switches:
-            vrf = next((item for item in s.vrfs if item.name == name))
-            if vrf:
-                vrf_model = vrf.model_dump()
-                vrf_model['device'] = s.name
-                return NetworkVrf.model_validate(vrf_model)
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        vrf = snapshot.get_vrf(name)
+        if not vrf:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+        return Response(content=vrf, media_type='application/json')
     else:
-        vrfs = []
-        for s in net_worker.net.switches:
-            for v in s.vrfs:
-                vrf_item = v.model_dump()
-                vrf_item['device'] = s.name
-                vrfs.append(NetworkVrf.model_validate(vrf_item))
-        return vrfs
+        return Response(content=snapshot.get_vrf_list(), media_type='application/json')
 
 
 @net_api_router.get("/topology/")
-async def get_topology() -> Dict:
+async def get_topology() -> Response:
     try:
-        net_worker.net.build_graph()  # to be removed, here only for debug
-        return net_worker.get_topology()
+        return Response(content=net_worker.snapshot.get_topology(), media_type='application/json')
     except Exception:
         logger.error(traceback.format_exc())
         data = {
@@ -53,10 +45,9 @@ async def get_topology() -> Dict:
 
 
 @net_api_router.get("/topology/vrf/{vrf_name}", status_code=status.HTTP_200_OK)
-async def get_vrf_topology(vrf_name: str) -> Dict:
+async def get_vrf_topology(vrf_name: str) -> Response:
     try:
-        # net_worker.net.get_l3_overlay_topology(vrf_name)
-        return net_worker.get_vrf_topology(vrf_name)
+        return Response(content=net_worker.snapshot.get_vrf_topology(vrf_name), media_type='application/json')
     except Exception:
         logger.error(traceback.format_exc())
         data = {'status': 'error', 'resource': 'switch',
@@ -65,10 +56,9 @@ async def get_vrf_topology(vrf_name: str) -> Dict:
 
 
 @net_api_router.get("/topology/vlan/{vlan_id}", status_code=status.HTTP_200_OK)
-async def get_vlan_topology(vlan_id: int) -> Dict:
+async def get_vlan_topology(vlan_id: int) -> Response:
     try:
-        # net_worker.net.get_l3_overlay_topology(vrf_name)
-        return net_worker.get_vlan_topology(vlan_id)
+        return Response(content=net_worker.snapshot.get_vlan_topology(vlan_id), media_type='application/json')
     except Exception:
         logger.error(traceback.format_exc())
         data = {'status': 'error', 'resource': 'switch',
@@ -78,25 +68,25 @@ async def get_vlan_topology(vlan_id: int) -> Dict:
 
 def check_vlan_exists(msg: NetVlan, not_: bool = False) -> None:
     if not_:
-        if not net_worker.net.get_switch_by_vlan_interface(msg.vid):
+        if not net_worker.snapshot.has_net_vlan(msg.vid):
             data = {'status': 'error', 'resource': 'vlan',
                     'description': "vlan {} not existing".format(msg.vid)}
             raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=data)
     else:
-        if net_worker.net.get_switch_by_vlan_interface(msg.vid):
+        if net_worker.snapshot.has_net_vlan(msg.vid):
             data = {'status': 'error', 'resource': 'vlan',
                     'description': "vlan {} already existing".format(msg.vid)}
             raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=data)
 
 
 @net_api_router.post("/vlan", response_model=RestAnswer202, status_code=status.HTTP_202_ACCEPTED)
-async def create_net_vlan(msg: NetVlan) -> RestAnswer202:
+async def create_net_vlan(msg: NetVlan, timeout: OperationTimeout = None) -> RestAnswer202:
     if not msg.cidr or not msg.gateway:
         data = {'status': 'error', 'resource': 'vlan',
                 'description': "Cidr and gateway are mandatory field to creat a Net vlan {}".format(msg.vid)}
         raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=data)
 
-    worker_msg = NetVlanMsg(**msg.model_dump(), operation='add_net_vlan')
+    worker_msg = NetVlanMsg(**msg.model_dump(), operation='add_net_vlan', timeout=timeout)
     check_vlan_exists(msg)
 
     try:
@@ -108,8 +98,8 @@ async def create_net_vlan(msg: NetVlan) -> RestAnswer202:
 
 
 @net_api_router.delete("/vlan", response_model=RestAnswer202, status_code=status.HTTP_202_ACCEPTED)
-async def del_net_vlan(msg: NetVlan) -> RestAnswer202:
-    worker_msg = NetVlanMsg(**msg.model_dump(), operation='del_net_vlan')
+async def del_net_vlan(msg: NetVlan, timeout: OperationTimeout = None) -> RestAnswer202:
+    worker_msg = NetVlanMsg(**msg.model_dump(), operation='del_net_vlan', timeout=timeout)
     check_vlan_exists(msg, not_=True)
     try:
         net_worker.send_message(worker_msg)
@@ -120,8 +110,8 @@ async def del_net_vlan(msg: NetVlan) -> RestAnswer202:
 
 
 @net_api_router.put("/vlan", response_model=RestAnswer202, status_code=status.HTTP_202_ACCEPTED)
-async def mod_net_vlan(msg: NetVlan) -> RestAnswer202:
-    worker_msg = NetVlanMsg(**msg.model_dump(), operation='mod_net_vlan')
+async def mod_net_vlan(msg: NetVlan, timeout: OperationTimeout = None) -> RestAnswer202:
+    worker_msg = NetVlanMsg(**msg.model_dump(), operation='mod_net_vlan', timeout=timeout)
     check_vlan_exists(msg)
     try:
         net_worker.send_message(worker_msg)
@@ -132,46 +122,33 @@ async def mod_net_vlan(msg: NetVlan) -> RestAnswer202:
 
 
 @net_api_router.get("/vlan/{vid}", response_model=NetVlanReport, status_code=status.HTTP_200_OK)
-async def get_net_vlan(vid: int):
-    switch = net_worker.net.get_switch_by_vlan_interface(vid)
-    if not switch:
+async def get_net_vlan(vid: int) -> Response:
+    net_vlan = net_worker.snapshot.get_net_vlan(vid)
+    if not net_vlan:
         data = {'status': 'error', 'resource': 'vlan',
                 'description': "vlan {} not existing".format(vid)}
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=data)
-    try:
-        vlan_intf = next((item for item in switch.vlan_l3_ports if item.vlan == vid), None)
-        logger.warn(vlan_intf.model_dump())
-        return NetVlanReport.model_validate({
-            'vid': vid,
-            'cidr': vlan_intf.cidr,
-            'gateway': vlan_intf.ipaddress,
-            'group': vlan_intf.vrf,
-            'description': vlan_intf.description
-        })
-    except Exception:
-        logger.error(traceback.format_exc())
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response(content=net_vlan, media_type='application/json')
 
 
 def check_switch_and_port(msg: PortToNetVlans):
-    switch = next((item for item in net_worker.net.switches if item.name == msg.node), None)
-    if not switch:
+    snapshot = net_worker.snapshot
+    if not snapshot.has_switch(msg.node):
         data = {'status': 'error', 'resource': 'vlan',
                 'description': "switch {} not existing".format(msg.node)}
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=data)
-    port = next((item for item in switch.phy_ports if item.name == msg.port or item.index == msg.port), None)
-    if not port:
+    if not snapshot.has_port(msg.node, msg.port):
         data = {'status': 'error', 'resource': 'vlan',
                 'description': "port {} at switch {} not existing".format(msg.port, msg.node)}
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=data)
 
 
 @net_api_router.post("/vlan/port", response_model=RestAnswer202, status_code=status.HTTP_202_ACCEPTED)
-async def create_port_vlan_assignment(msg: PortToNetVlans) -> RestAnswer202:
+async def create_port_vlan_assignment(msg: PortToNetVlans, timeout: OperationTimeout = None) -> RestAnswer202:
     # check if switch exists
     check_switch_and_port(msg)
     try:
-        worker_msg = PortToNetVlansMsg(**msg.model_dump(), operation='add_port_vlan')
+        worker_msg = PortToNetVlansMsg(**msg.model_dump(), operation='add_port_vlan', timeout=timeout)
         net_worker.send_message(worker_msg)
         return worker_msg.produce_rest_answer_202()
     except Exception:
@@ -180,11 +157,11 @@ async def create_port_vlan_assignment(msg: PortToNetVlans) -> RestAnswer202:
 
 
 @net_api_router.delete("/vlan/port", response_model=RestAnswer202, status_code=status.HTTP_202_ACCEPTED)
-async def delete_port_vlan_assignment(msg: PortToNetVlans) -> RestAnswer202:
+async def delete_port_vlan_assignment(msg: PortToNetVlans, timeout: OperationTimeout = None) -> RestAnswer202:
     # check if switch exists
     check_switch_and_port(msg)
     try:
-        worker_msg = PortToNetVlansMsg(**msg.model_dump(), operation='del_port_vlan')
+        worker_msg = PortToNetVlansMsg(**msg.model_dump(), operation='del_port_vlan', timeout=timeout)
         net_worker.send_message(worker_msg)
         return worker_msg.produce_rest_answer_202()
     except Exception:
@@ -193,11 +170,11 @@ async def delete_port_vlan_assignment(msg: PortToNetVlans) -> RestAnswer202:
 
 
 @net_api_router.put("/vlan/port", response_model=RestAnswer202, status_code=status.HTTP_202_ACCEPTED)
-async def modify_port_vlan_assignment(msg: PortToNetVlans) -> RestAnswer202:
+async def modify_port_vlan_assignment(msg: PortToNetVlans, timeout: OperationTimeout = None) -> RestAnswer202:
     # check if switch exists
     check_switch_and_port(msg)
     try:
-        worker_msg = PortToNetVlansMsg(**msg.model_dump(), operation='mod_port_vlan')
+        worker_msg = PortToNetVlansMsg(**msg.model_dump(), operation='mod_port_vlan', timeout=timeout)
         net_worker.send_message(worker_msg)
         return worker_msg.produce_rest_answer_202()
     except Exception:
@@ -205,16 +182,17 @@ async def modify_port_vlan_assignment(msg: PortToNetVlans) -> RestAnswer202:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@net_api_router.get("/vlan/port/{}/{}", response_model=PortVlanReport, status_code=status.HTTP_200_OK)
-async def get_port_vlan_assignment(switch_name: str, port_name: str) -> PortVlanReport:
-    switch = next((item for item in net_worker.net.switches if item.name == switch_name), None)
-    if not switch:
+@net_api_router.get("/vlan/port/{switch_name}/{port_name}", response_model=PortVlanReport,
+                    status_code=status.HTTP_200_OK)
+async def get_port_vlan_assignment(switch_name: str, port_name: str) -> Response:
+    snapshot = net_worker.snapshot
+    if not snapshot.has_switch(switch_name):
         data = {'status': 'error', 'resource': 'vlan',
                 'description': "switch {} not existing".format(switch_name)}
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=data)
-    port = next((item for item in switch.phy_ports if item.name == port_name), None)
+    port = snapshot.get_port(switch_name, port_name)
     if not port:
         data = {'status': 'error', 'resource': 'vlan',
                 'description': "port {} at switch {} not existing".format(port_name, switch_name)}
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=data)
-    return PortVlanReport(trunk=port.trunk_vlans, pvid=port.access_vlan, mode=port.mode)
+    return Response(content=port, media_type='application/json')
@@ -1,6 +1,10 @@
-from fastapi import APIRouter, status, HTTPException
+import asyncio
+import json
+from fastapi import APIRouter, status, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse
 from network.nbi_msg_models import WorkerMsg
-from typing import List, Dict, Union
+from network.operation_registry import operation_registry, FINAL_STATES
+from typing import List, Dict, Union, Annotated
 from utils import persistency, create_logger
 from network import net_worker
 import traceback
@@ -8,6 +12,13 @@ import traceback
 _db = persistency.DB()
 logger = create_logger('rest-operation')
 
+# upper bound for the long polling, in seconds
+MAX_WAIT = 60
+# interval between keepalive comments on the event stream, in seconds
+EVENT_KEEPALIVE = 15
+
+# query parameter of the endpoints submitting an operation, overriding the default timeout of its type (seconds)
+OperationTimeout = Annotated[Union[float, None], Query(gt=0)]
 
 operation_router = APIRouter(
     prefix="/v1/api/operation",
@@ -16,13 +27,79 @@ operation_router = APIRouter(
 )
 
 
-@operation_router.get("/{}")
-async def get_operation_status(operation_id: str) -> WorkerMsg:
+async def _wait_for_completion(operation_id: str, timeout: float) -> Union[Dict, None]:
+    loop = asyncio.get_running_loop()
+    completed = loop.create_future()
+
+    def _notify(data: Dict) -> None:
+        # executed in the network worker thread
+        if data.get('operation_id') == operation_id and data.get('status') in FINAL_STATES:
+            loop.call_soon_threadsafe(lambda: completed.done() or completed.set_result(data))
+
+    operation_registry.subscribe(_notify)
     try:
-        res = _db.findone_DB('operations', {'operation_id': operation_id})
+        # the status is checked after subscribing, so that a completion cannot be missed
+        data = operation_registry.get(operation_id)
+        if data is None or data.get('status') in FINAL_STATES:
+            return data
+        try:
+            return await asyncio.wait_for(completed, timeout=timeout)
+        except asyncio.TimeoutError:
+            return operation_registry.get(operation_id)
+    finally:
+        operation_registry.unsubscribe(_notify)
+
+
+@operation_router.get("/events")
+async def get_operation_events(request: Request, operation_id: str | None = None) -> StreamingResponse:
+    # Server-Sent Events stream of the operation state changes, optionally filtered by operation id
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue(maxsize=1000)
+
+    def _put(data: Dict) -> None:
+        try:
+            events.put_nowait(data)
+        except asyncio.QueueFull:
+            logger.warning('event stream queue full, dropping event for operation %s', data.get('operation_id'))
+
+    def _notify(data: Dict) -> None:
+        # executed in the network worker thread
+        if operation_id is None or data.get('operation_id') == operation_id:
+            loop.call_soon_threadsafe(_put, data)
+
+    async def _stream():
+        operation_registry.subscribe(_notify)
+        try:
+            if operation_id:
+                current = operation_registry.get(operation_id)
+                if current:
+                    yield 'event: operation\ndata: {}\n\n'.format(json.dumps(current))
+            while not await request.is_disconnected():
+                try:
+                    data = await asyncio.wait_for(events.get(), timeout=EVENT_KEEPALIVE)
+                    yield 'event: operation\ndata: {}\n\n'.format(json.dumps(data))
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+        finally:
+            operation_registry.unsubscribe(_notify)
+
+    return StreamingResponse(_stream(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@operation_router.get("/{operation_id}")
+async def get_operation_status(operation_id: str, wait: float = 0) -> WorkerMsg:
+    try:
+        if wait > 0:
+            res = await _wait_for_completion(operation_id, min(wait, MAX_WAIT))
+        else:
+            res = operation_registry.get(operation_id)
+        if not res:
+            res = _db.findone_DB('operations', {'operation_id': operation_id})
         if not res:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
         return WorkerMsg(**res)
+    except HTTPException:
+        raise
     except Exception:
         logger.error(traceback.format_exc())
         data = {
@@ -32,3 +109,20 @@ async def get_operation_status(operation_id: str) -> WorkerMsg:
             'detail': ' '.join(traceback.format_exc())
         }
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=data)
+
+
+@operation_router.delete("/{operation_id}", status_code=status.HTTP_202_ACCEPTED)
+async def cancel_operation(operation_id: str) -> WorkerMsg:
+    # queued operations are cancelled at once, the running one is aborted before its next device configuration step:
+    # its final status (Cancelled, or the one reached meanwhile) is reported by the operation status
+    res = operation_registry.get(operation_id) or _db.findone_DB('operations', {'operation_id': operation_id})
+    if not res:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if res.get('status') in FINAL_STATES or not net_worker.cancel(operation_id):
+        data = {
+            'status': 'error',
+            'resource': 'operation',
+            'description': "Operation {} already terminated with status {}".format(operation_id, res.get('status'))
+        }
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=data)
+    return WorkerMsg(**(operation_registry.get(operation_id) or res))
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, status, HTTPException
+from fastapi import APIRouter, status, HTTPException, Response
 from models import SwitchDataModel
 from network.nbi_msg_models import RestAnswer202, AddSwitchRequestMsg, DelSwitchRequestMsg
+from rest_endpoints.rest_operation import OperationTimeout
 from switch import Switch
 from typing import List, Dict, Literal
 from netdevice import Device
@@ -27,21 +28,13 @@ class SwitchListItem(BaseModel):
 
 
 @device_api_router.get("/{switch_name}", response_model=SwitchDataModel)
-async def get_switch(switch_name: str) -> Dict:
-    try:
-        switch, thread = Switch.from_db(switch_name)
-        if not switch:
-            data = {'status': 'error', 'resource': 'switch',
-                    'description': "Switch {} not found".format(switch_name)}
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=data)
-        else:
-            thread.join()
-            return switch.model_dump()
-    except Exception:
-        logger.error(traceback.format_exc())
+async def get_switch(switch_name: str) -> Response:
+    switch = net_worker.snapshot.get_switch(switch_name)
+    if not switch:
         data = {'status': 'error', 'resource': 'switch',
-                'description': "Error retrieving Switch {}".format(switch_name)}
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=data)
+                'description': "Switch {} not found".format(switch_name)}
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=data)
+    return Response(content=switch, media_type='application/json')
 
 
 @device_api_router.get("/", response_model=List[SwitchListItem])
@@ -58,10 +51,10 @@ async def get_switch_list() -> List[SwitchListItem]:
 
 
 @device_api_router.post('/', response_model=RestAnswer202, status_code=status.HTTP_202_ACCEPTED)
-async def onboard_switch(msg: Device) -> RestAnswer202:
+async def onboard_switch(msg: Device, timeout: OperationTimeout = None) -> RestAnswer202:
     try:
-        logger.info('received add switch msg: {}'.format(msg.model_dump()))
-        worker_msg = AddSwitchRequestMsg(**msg.model_dump(), operation='add_switch')
+        logger.info('received add switch msg: %s', msg.model_dump())
+        worker_msg = AddSwitchRequestMsg(**msg.model_dump(), operation='add_switch', timeout=timeout)
         net_worker.send_message(worker_msg)
         # reply with submitted code
         return worker_msg.produce_rest_answer_202()
@@ -74,7 +67,7 @@ async def onboard_switch(msg: Device) -> RestAnswer202:
 
 
 @device_api_router.delete("/{switch_name}", response_model=RestAnswer202, status_code=status.HTTP_200_OK)
-async def del_switch(switch_name: str) -> RestAnswer202:
+async def del_switch(switch_name: str, timeout: OperationTimeout = None) -> RestAnswer202:
     try:
         switch = Switch.from_db(switch_name)
         if not switch:
@@ -82,7 +75,7 @@ async def del_switch(switch_name: str) -> RestAnswer202:
                     'description': "Switch {} not found".format(switch_name)}
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=data)
 
-        worker_msg = DelSwitchRequestMsg.model_validate({'operation': 'del_switch', 'switch': switch})
+        worker_msg = DelSwitchRequestMsg.model_validate({'operation': 'del_switch', 'switch': switch, 'timeout': timeout})
         net_worker.send_message(worker_msg)
         return worker_msg.produce_rest_answer_202()
     except Exception:
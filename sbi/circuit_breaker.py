@@ -0,0 +1,209 @@
+import functools
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Literal, Tuple, Type, Union
+
+from tenacity import Retrying, stop_after_attempt, wait_exponential_jitter, retry_if_exception
+
+from switch.switch_base import SwitchNotConnectedException
+from utils import create_logger
+from utils.util import get_config
+from utils.metrics import sbi_circuit_state
+from utils.operation_control import checkpoint
+
+logger = create_logger('circuit-breaker')
+
+CircuitState = Literal['closed', 'open', 'half_open']
+_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+class CircuitOpenException(SwitchNotConnectedException):
+    # raised without contacting the device, while its circuit is open or while it is probed (retry_at None)
+    def __init__(self, device: str, retry_at: Union[datetime, None] = None):
+        if retry_at is None:
+            super().__init__('device {} unreachable, circuit half-open: calls fail fast while it is probed'.format(
+                device))
+        else:
+            super().__init__('device {} unreachable, circuit open: calls fail fast until {}'.format(
+                device, retry_at.isoformat(timespec='seconds')))
+        self.device = device
+        self.retry_at = retry_at
+
+
+class CircuitBreaker:
+    # connection health of a device, shared by all its southbound drivers. After failure_threshold consecutive
+    # connection failures the circuit opens and the calls fail immediately; when the open time expires the circuit is
+    # half-open, the next call is a probe: a success closes the circuit, a failure opens it again for a doubled time.
+    # While the probe runs, the calls of the other threads fail fast; the nested driver calls of the probe go through
+    def __init__(self, device: str, failure_threshold: int, open_timeout: float, open_timeout_max: float,
+                 clock: Callable[[], float] = time.monotonic, jitter: Callable[[], float] = None):
+        self.device = device
+        self.failure_threshold = failure_threshold
+        self.open_timeout = open_timeout
+        self.open_timeout_max = open_timeout_max
+        # time source and random factor of the reopening timeout, replaceable in tests
+        self._clock = clock
+        self._jitter = jitter or (lambda: random.uniform(0.9, 1.1))
+        self.state: CircuitState = 'closed'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._current_timeout = open_timeout
+        # thread running the probe of the half-open circuit
+        self._probe_in_flight: Union[int, None] = None
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: CircuitState) -> None:
+        if state != self.state:
+            logger.warning('circuit of device %s: %s -> %s', self.device, self.state, state)
+            self.state = state
+        sbi_circuit_state.set(_STATE_VALUES[state], device=self.device)
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == 'open' and self._clock() - self._opened_at < self._current_timeout
+
+    def before_call(self) -> bool:
+        # returns True if the call is the probe of the circuit: the caller releases it if the call ends without
+        # recording a success or a failure
+        with self._lock:
+            if self.state == 'closed':
+                return False
+            if self.state == 'open':
+                remaining = self._current_timeout - (self._clock() - self._opened_at)
+                if remaining > 0:
+                    raise CircuitOpenException(self.device, datetime.now() + timedelta(seconds=remaining))
+                self._set_state('half_open')
+            elif self._probe_in_flight == threading.get_ident():
+                return False
+            elif self._probe_in_flight is not None:
+                raise CircuitOpenException(self.device)
+            self._probe_in_flight = threading.get_ident()
+            return True
+
+    def release_probe(self) -> None:
+        # the probe ended with an error unrelated to the connection: the circuit stays half-open for the next call
+        with self._lock:
+            if self._probe_in_flight == threading.get_ident():
+                self._probe_in_flight = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._probe_in_flight = None
+            self.failures = 0
+            self._current_timeout = self.open_timeout
+            self._set_state('closed')
+
+    def record_failure(self, error: Exception = None) -> None:
+        # an error propagated through nested driver calls is counted once
+        if error is not None:
+            if getattr(error, '_circuit_recorded', False):
+                return
+            error._circuit_recorded = True
+        with self._lock:
+            self._probe_in_flight = None
+            self.failures += 1
+            if self.state == 'half_open':
+                # the probe failed: the device is still unreachable, wait longer before the next one (with jitter,
+                # so that the devices lost together are not probed together)
+                self._current_timeout = min(self._current_timeout * 2, self.open_timeout_max) * self._jitter()
+            elif self.failures < self.failure_threshold:
+                return
+            self._opened_at = self._clock()
+            self._set_state('open')
+
+
+class CircuitBreakerRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, device: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(device)
+            if breaker is None:
+                config = get_config().sbi
+                breaker = self._breakers[device] = CircuitBreaker(
+                    device, config.failure_threshold, config.open_timeout, config.open_timeout_max)
+            return breaker
+
+    def states(self) -> Dict[str, CircuitState]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.device: breaker.state for breaker in breakers}
+
+    def reset(self, device: str) -> None:
+        # e.g. when the device is removed or its address changes
+        with self._lock:
+            self._breakers.pop(device, None)
+
+
+circuit_breakers = CircuitBreakerRegistry()
+
+
+def _device_key(sbi: Any) -> str:
+    device = sbi.device
+    return device.name or device.address
+
+
+def check_reachable(sbi: Any, port: int) -> None:
+    # TCP pre-check of the device port, failing in connect_timeout instead of the (much longer) timeouts of the SSH
+    # and HTTPS clients
+    breaker = circuit_breakers.get(_device_key(sbi))
+    probe = breaker.before_call()
+    host = sbi.device.get_host()
+    try:
+        with socket.create_connection((host, port), timeout=get_config().sbi.connect_timeout):
+            pass
+    except OSError as e:
+        logger.error('device %s unreachable on %s:%s: %s', _device_key(sbi), host, port, e)
+        error = SwitchNotConnectedException('device {} unreachable on {}:{}'.format(_device_key(sbi), host, port))
+        breaker.record_failure(error)
+        raise error
+    # the port is open, but the device is not usable yet: the circuit is closed by the call of the driver
+    if probe:
+        breaker.release_probe()
+
+
+def sbi_retry(*retry_on: Type[Exception]) -> Callable[[Callable], Callable]:
+    # retry policy of the southbound driver methods: the call is attempted only if the circuit of the device is not
+    # open, connection errors are recorded by the circuit and retried with exponential backoff and jitter, until the
+    # attempts are exhausted or the circuit opens. Other exceptions (e.g. authentication) are raised at once
+    retry_types: Tuple[Type[Exception], ...] = retry_on or (SwitchNotConnectedException,)
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            breaker = circuit_breakers.get(_device_key(self))
+            config = get_config().sbi
+            retrying = Retrying(
+                retry=retry_if_exception(lambda e: isinstance(e, retry_types) and
+                                         not isinstance(e, CircuitOpenException) and not breaker.is_open()),
+                stop=stop_after_attempt(config.attempts),
+                wait=wait_exponential_jitter(initial=config.backoff_initial, max=config.backoff_max),
+                reraise=True
+            )
+            for attempt in retrying:
+                with attempt:
+                    # a cancelled or expired operation is not retried
+                    if attempt.retry_state.attempt_number > 1:
+                        checkpoint()
+                    probe = breaker.before_call()
+                    try:
+                        res = func(self, *args, **kwargs)
+                    except SwitchNotConnectedException as e:
+                        if not isinstance(e, CircuitOpenException):
+                            breaker.record_failure(e)
+                        elif probe:
+                            breaker.release_probe()
+                        raise
+                    except BaseException:
+                        if probe:
+                            breaker.release_probe()
+                        raise
+                    breaker.record_success()
+                    return res
+        return wrapper
+    return decorator
@@ -1,42 +1,61 @@
 import json
-from pydantic import BaseModel, Field
-from typing import List, Optional, Callable, Any
+from pydantic import BaseModel, Field, ConfigDict
+from typing import List, Optional, Callable, Any, Union, Iterable
 import paramiko
 from .frr_models import BGPStatusData, FRRRoutingTable
-from models import Vrf, RoutingProtocols, BGPRoutingProtocol, BGPNeighbor, BGPAddressFamily, SwitchDataModel
+from models import Vrf, RoutingProtocols, BGPRoutingProtocol, BGPNeighbor, BGPAddressFamily, SwitchDataModel, \
+    BGPRedistribute, IpV4Route
 
 
 class BGPRouters(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
     as_number: int = Field(..., alias='as')
     vrf: str = 'default'
     neighbors: List[BGPNeighbor] = []
     address_families: List[BGPAddressFamily] = []
 
 
+class FrrStaticRoute(BaseModel):
+    prefix: str
+    nexthop: Optional[str] = None
+    vrf: str = 'default'
+
+
+def _vrf_part(vrfname: Union[str, None]) -> str:
+    return "" if not vrfname or vrfname == "default" else " vrf {}".format(vrfname)
+
+
+def to_vtysh_command(commands: List[str], save: bool = True) -> str:
+    # renders a list of configuration lines as a single vtysh invocation, so that the whole change is applied in one
+    # session and the configuration is saved once
+    commands = ["configure terminal"] + commands + ["end"]
+    if save:
+        commands.append("write memory")
+    return "vtysh" + "".join(" -c \"{}\"".format(cmd) for cmd in commands)
+
+
 def frr_configterm_and_save(func: Callable[..., List[Any]]) -> Callable[..., List[Any]]:
     def wrapper(*args, **kwargs) -> List[Any]:
         commands = func(*args, **kwargs)
         if not isinstance(commands, list):
             raise TypeError("The decorated function must return a list.")
-        commands.insert(0, "configure terminal")
-        commands.append('do write memory')
-        result = "vtysh"
-        for cmd in commands:
-            result += " -c \"{}\"".format(cmd)
-        return [result]
+        # nothing to change: no vtysh session is needed
+        return [to_vtysh_command(commands)] if commands else []
     return wrapper
 
 
 class FrrConfig(BaseModel):
-    frr_version: Optional[str]
-    frr_defaults: Optional[str]
-    hostname: Optional[str]
-    service: Optional[str]
-    routers: List[BGPRouters]
+    frr_version: Optional[str] = None
+    frr_defaults: Optional[str] = None
+    hostname: Optional[str] = None
+    service: Optional[str] = None
+    routers: List[BGPRouters] = []
+    static_routes: List[FrrStaticRoute] = []
 
     @classmethod
-    def from_raw_config(cls, config: str):
-        lines = config.splitlines()
+    def from_raw_config(cls, config: Union[str, Iterable[str]]):
+        # config is either the whole text or an iterable of lines, e.g. a streamed command output
+        lines = config.splitlines() if isinstance(config, str) else config
         config_dict = {'routers': []}
         static_routes = []
 
@@ -63,11 +82,12 @@ class FrrConfig(BaseModel):
                     elif parts[2] == 'description':
                         neighbor.update({'description': parts[3] if len(parts) == 3 else " ".join(parts[3:])})
                     elif parts[2] == 'update-source':
-                        neighbor.update({'ip_source': parts[3]})
+                        neighbor.update({'update-source': parts[3]})
                 elif current_af:
                     if line.startswith("redistribute"):
                         protocol = parts[1]
-                        current_af['redistribute'].append(protocol)
+                        if protocol in [item.value for item in BGPRedistribute]:
+                            current_af['redistribute'].append(protocol)
                     elif line.startswith("import vrf"):
                         current_af['imports'].append(parts[2])
                     elif line == "exit-address-family":
@@ -114,35 +134,117 @@ class FrrConfig(BaseModel):
             elif line.startswith('exit-vrf'):
                 current_vrf = None
 
-        print(static_routes)  # FIXME! to be integrate in the parsed config
+        config_dict['static_routes'] = static_routes
         return FrrConfig.model_validate(config_dict)
 
+    def get_router(self, vrfname: str = 'default') -> Union[BGPRouters, None]:
+        return next((item for item in self.routers if item.vrf == (vrfname or 'default')), None)
+
+    # configuration line builders: each builder returns only the lines changing the parsed running configuration,
+    # so that an empty list means that the requested change is a no-op
+    def bgp_instance_lines(self, vrfname: str, as_number: int, afs: List[BGPAddressFamily] = [],
+                           neighbors: List[BGPNeighbor] = []) -> List[str]:
+        router = self.get_router(vrfname)
+        if router and router.as_number != as_number:
+            raise ValueError("BGP instance for vrf {} already exists with AS {}".format(vrfname, router.as_number))
+        cmd = []
+        for neigh in neighbors:
+            cmd.extend(self._bgp_peer_lines(router, neigh))
+        for af in afs:
+            current_af = next((item for item in router.address_families if item.protocol == af.protocol and
+                               item.protocol_type == af.protocol_type), None) if router else None
+            af_cmd = ["import vrf {}".format(item) for item in af.imports if not current_af or
+                      item not in current_af.imports]
+            af_cmd += ["redistribute {}".format(BGPRedistribute(item).value) for item in af.redistribute if
+                       not current_af or BGPRedistribute(item) not in current_af.redistribute]
+            if current_af and not af_cmd:
+                continue
+            cmd.append("address-family {} {}".format(af.protocol, af.protocol_type))
+            cmd.extend(af_cmd)
+            cmd.append("exit-address-family")
+        if router and not cmd:
+            return []
+        return ["router bgp {}{}".format(as_number, _vrf_part(vrfname))] + cmd + ["exit"]
+
+    def _bgp_peer_lines(self, router: Union[BGPRouters, None], neigh: BGPNeighbor) -> List[str]:
+        current = next((item for item in router.neighbors if item.ip == neigh.ip), None) if router else None
+        cmd = []
+        if not current or current.remote_as != neigh.remote_as:
+            cmd.append("neighbor {} remote-as {}".format(neigh.ip, neigh.remote_as))
+        if neigh.description and (not current or current.description != neigh.description):
+            cmd.append("neighbor {} description {}".format(neigh.ip, neigh.description))
+        if neigh.ip_source and (not current or current.ip_source != neigh.ip_source):
+            cmd.append("neighbor {} update-source {}".format(neigh.ip, neigh.ip_source))
+        return cmd
+
+    def bgp_peer_lines(self, neigh: BGPNeighbor, vrfname: str = 'default', as_number: int = 1000) -> List[str]:
+        cmd = self._bgp_peer_lines(self.get_router(vrfname), neigh)
+        if not cmd:
+            return []
+        return ["router bgp {}{}".format(as_number, _vrf_part(vrfname))] + cmd + ["exit"]
+
+    def del_bgp_peer_lines(self, neigh: BGPNeighbor, vrfname: str = 'default', as_number: int = 1000) -> List[str]:
+        router = self.get_router(vrfname)
+        if router and not next((item for item in router.neighbors if item.ip == neigh.ip), None):
+            return []
+        return ["router bgp {}{}".format(as_number, _vrf_part(vrfname)),
+                "no neighbor {} remote-as {}".format(neigh.ip, neigh.remote_as), "exit"]
+
+    def vrf_import_lines(self, vrf_name1: str, vrf_name2: str, as_number: int = 1000, protocol: str = 'ipv4',
+                         protocol_type: str = 'unicast') -> List[str]:
+        if vrf_name1 == vrf_name2:
+            raise ValueError("the two Vrfs have the same name {}!".format(vrf_name2))
+        # the import of Vrfs should be bidirectional otherwise routing will be asymmetrical
+        cmd = []
+        for importing, imported in [(vrf_name1, vrf_name2), (vrf_name2, vrf_name1)]:
+            af = BGPAddressFamily.model_validate({'protocol': protocol, 'type': protocol_type,
+                                                  'imports': [imported or 'default']})
+            cmd.extend(self.bgp_instance_lines(importing or 'default', as_number, afs=[af]))
+        return cmd
+
+    def _has_static_route(self, route: FrrStaticRoute) -> bool:
+        return next((item for item in self.static_routes if item == route), None) is not None
+
+    def static_route_lines(self, routes: List[IpV4Route], vrfname: str = 'default', delete: bool = False) -> \
+            List[str]:
+        cmd = []
+        for route in routes:
+            if route.nexthop == 'local':
+                # directly connected networks do not need a static route
+                continue
+            frr_route = FrrStaticRoute(prefix=str(route.network), nexthop=str(route.nexthop),
+                                       vrf=vrfname or 'default')
+            if self._has_static_route(frr_route) != delete:
+                continue
+            cmd.append("{}ip route {} {}".format("no " if delete else "", frr_route.prefix, frr_route.nexthop))
+        if not cmd or _vrf_part(vrfname) == "":
+            return cmd
+        return ["vrf {}".format(vrfname)] + cmd + ["exit-vrf"]
+
+    def vrf_routing_lines(self, vrfname: str, bgp: Union[BGPRoutingProtocol, None] = None,
+                          static_routes: List[IpV4Route] = []) -> List[str]:
+        # consolidated configuration of a vrf: bgp instance, address families, neighbors and static routes
+        cmd = []
+        if bgp:
+            cmd.extend(self.bgp_instance_lines(vrfname, bgp.as_number, bgp.address_families, bgp.neighbors))
+        cmd.extend(self.static_route_lines(static_routes, vrfname))
+        return cmd
+
     @frr_configterm_and_save
-    def add_static_route_cmd(self, route, vrfname: str = 'default', as_number: int = 1000) -> List[str]:
-        pass
+    def add_static_route_cmd(self, route: IpV4Route, vrfname: str = 'default') -> List[str]:
+        return self.static_route_lines([route], vrfname)
 
     @frr_configterm_and_save
-    def del_static_route_cmd(self, route, vrfname: str = 'default', as_number: int = 1000) -> List[str]:
-        pass
+    def del_static_route_cmd(self, route: IpV4Route, vrfname: str = 'default') -> List[str]:
+        return self.static_route_lines([route], vrfname, delete=True)
 
     @frr_configterm_and_save
     def add_bgp_instance_cmd(self, vrfname: str, as_number: int = 1000, afs: List[BGPAddressFamily] = []) -> List[str]:
-        cmd = []
-        vrf_part = "" if vrfname == "default" else "vrf {}".format(vrfname)
-        cmd.append("router bgp {} {}".format(as_number, vrf_part))
-        for af in afs:
-            cmd.append("address family {} {}".format(af.protocol, af.protocol_type))
-            for import_item in af.imports:
-                cmd.append("import vrf {}".format(import_item))
-            for redistribute_item in af.redistribute:
-                cmd.append("redistribute {}".format(redistribute_item))
-            cmd.append('exit-address-family')
-        return cmd
+        return self.bgp_instance_lines(vrfname, as_number, afs)
 
     @frr_configterm_and_save
     def del_bgp_instance_cmd(self, vrfname: str, as_number: int = 1000) -> List[str]:
-        vrf_part = "" if vrfname == "default" else "vrf {}".format(vrfname)
-        return ["no router bgp {} {}".format(as_number, vrf_part)]
+        return ["no router bgp {}{}".format(as_number, _vrf_part(vrfname))]
 
     @frr_configterm_and_save
     def add_bgp_instance_routing_advertise_cmd(self) -> List[str]:
@@ -156,41 +258,15 @@ class FrrConfig(BaseModel):
 
     @frr_configterm_and_save
     def add_bgp_peer_cmd(self, neigh: BGPNeighbor, vrfname: str = 'default', as_number: int = 1000) -> List[str]:
-        cmd = []
-        vrf_part = "" if vrfname == "default" else "vrf {}".format(vrfname)
-        cmd.append("router bgp {} {}".format(as_number, vrf_part))
-        cmd.append("neighbor {} remote-as {}".format(neigh.ip, neigh.remote_as))
-        if neigh.description:
-            cmd.append("neighbor {} description {}".format(neigh.ip, neigh.description))
-        if neigh.ip_source:
-            cmd.append("neighbor {} update-source {}".format(neigh.ip, neigh.ip_source))
-        return cmd
+        return self.bgp_peer_lines(neigh, vrfname, as_number)
 
     @frr_configterm_and_save
     def del_bgp_peer_cmd(self, neigh: BGPNeighbor, vrfname: str = 'default', as_number: int = 1000) -> List[str]:
-        cmd = []
-        vrf_part = "" if vrfname == "default" else "vrf {}".format(vrfname)
-        cmd.append("router bgp {} {}".format(as_number, vrf_part))
-        cmd.append("no neighbor {} remote-as {}".format(neigh.ip, neigh.remote_as))
-        return cmd
+        return self.del_bgp_peer_lines(neigh, vrfname, as_number)
 
     @frr_configterm_and_save
     def add_vrf_binding(self, vrf_name1: str, vrf_name2: str, as_number=1000, protocol='ipv4', protocol_type='unicast'):
-        if vrf_name1 == vrf_name2:
-            raise ValueError("the two Vrfs have the same name {}!".format(vrf_name2))
-        # the import of Vrfs should be bidirectional otherwise routing will be asymmetrical
-        cmd = []
-        vrf_part_1 = "" if vrf_name1 == "default" or not vrf_name1 else "vrf {}".format(vrf_name1)
-        vrf_part_2 = "" if vrf_name2 == "default" or not vrf_name2 else "vrf {}".format(vrf_name2)
-        cmd.append("router bgp {} {}".format(as_number, vrf_part_1))
-        cmd.append("address-family {} {}".format(protocol, protocol_type))
-        cmd.append("import {}".format(vrf_part_2))
-        cmd.append("exit")
-        cmd.append("router bgp {} {}".format(as_number, vrf_part_2))
-        cmd.append("address-family {} {}".format(protocol, protocol_type))
-        cmd.append("import {}".format(vrf_part_1))
-        cmd.append("exit")
-        return cmd
+        return self.vrf_import_lines(vrf_name1, vrf_name2, as_number, protocol, protocol_type)
 
     def to_switch_vrf_protocols(self) -> dict[str, RoutingProtocols]:
         res = {}  # res will have vrf names as keys and models.vrf.protocols as content
@@ -1,8 +1,13 @@
-from typing import List, Union, Any
+from typing import List, Union, Any, Iterator
 import netmiko
-from tenacity import retry, stop_after_attempt, retry_if_exception_type
+import time
 import textfsm
+import re
 from utils import create_logger
+from utils.util import get_config
+from utils.metrics import timed_sbi_call
+from utils.operation_control import bounded_timeout, checkpoint
+from .circuit_breaker import sbi_retry, check_reachable
 from netdevice import Device
 from switch.switch_base import SwitchNotConnectedException, SwitchNotAuthenticatedException, \
     SwitchConfigurationException
@@ -22,16 +27,20 @@ class NetmikoSbi:
         self.device = device
         self.create_session()
 
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def create_session(self):
+        check_reachable(self, self.device.ssh_port or 22)
         try:
             self._netmiko_session = netmiko.ConnectHandler(
                 device_type=self.device.model,
                 username=self.device.user,
                 password=self.device.passwd.get_secret_value(),
-                ip=str(self.device.address),
-                auth_timeout=90,
-                timeout=210,
+                ip=self.device.get_host(),
+                port=self.device.ssh_port or 22,
+                conn_timeout=get_config().sbi.connect_timeout,
+                auth_timeout=30,
+                timeout=60,
                 keepalive=30
             )
         except netmiko.exceptions.NetmikoTimeoutException:
@@ -46,16 +55,13 @@ class NetmikoSbi:
         except Exception as e:
             traceback.print_stack()
 
-    @retry(
-        retry=retry_if_exception_type(Union[SwitchNotConnectedException, textfsm.parser.TextFSMError]),
-        stop=stop_after_attempt(3),
-        reraise=True
-    )
+    @timed_sbi_call
+    @sbi_retry(SwitchNotConnectedException, textfsm.parser.TextFSMError)
     def send_config(self, commands: List[str]):
-        logger.debug("config command: {}".format(commands))
+        logger.debug("config command: %s", commands)
         try:
-            res = self._netmiko_session.send_config_set(commands, read_timeout=45)
-            logger.debug("received output {}".format(res))
+            res = self._netmiko_session.send_config_set(commands, read_timeout=bounded_timeout(45))
+            logger.debug("received output %s", res)
             if self._netmiko_session.device_type == 'hp_comware' and "\'^\' position" in res:
                 raise ValueError("Error in commandline operations: {}".format(res))
         except netmiko.exceptions.NetmikoTimeoutException:
@@ -68,21 +74,18 @@ class NetmikoSbi:
             logger.error("AuthenticationException")
             raise SwitchNotAuthenticatedException()
 
-    @retry(
-        retry=retry_if_exception_type(Union[SwitchNotConnectedException, textfsm.parser.TextFSMError]),
-        stop=stop_after_attempt(3),
-        reraise=True
-    )
+    @timed_sbi_call
+    @sbi_retry(SwitchNotConnectedException, textfsm.parser.TextFSMError)
     def send_command(self, commands: List[str], enable=True) -> List:
-        logger.debug("send command: {}".format(commands))
+        logger.debug("send command: %s", commands)
         try:
             if enable:
                 self._netmiko_session.enable()
             output = []
             for command in commands:
-                logger.debug("sending command {}".format(command))
-                res = self._netmiko_session.send_command(command, read_timeout=45)
-                logger.debug("received output {}".format(res))
+                logger.debug("sending command %s", command)
+                res = self._netmiko_session.send_command(command, read_timeout=bounded_timeout(45))
+                logger.debug("received output %s", res)
                 output.append(res)
             logger.debug(output)
             return output
@@ -98,19 +101,94 @@ class NetmikoSbi:
         except textfsm.parser.TextFSMError:
             logger.warning(traceback.format_stack())
             return self.send_command(commands, enable)
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def get_info(self, command: str, use_textfsm: bool = True, enable=False) -> Union[dict[str, Any], str, list]:
-        logger.debug("getting info command: {}".format(command))
+        logger.debug("getting info command: %s", command)
         try:
             if enable:
                 self._netmiko_session.enable()
-            return self._netmiko_session.send_command(command, use_textfsm=use_textfsm, read_timeout=45)
+            return self._netmiko_session.send_command(command, use_textfsm=use_textfsm, read_timeout=bounded_timeout(45))
         except netmiko.exceptions.NetmikoTimeoutException:
-            logger.error('NetmikoTimeoutException in get_info with command: {}'.format(command))
+            logger.error('NetmikoTimeoutException in get_info with command: %s', command)
             raise SwitchNotConnectedException()
         except netmiko.exceptions.AuthenticationException:
-            logger.error('AuthenticationException in get_info with command: {}'.format(command))
+            logger.error('AuthenticationException in get_info with command: %s', command)
             raise SwitchNotAuthenticatedException()
         except netmiko.exceptions.ReadTimeout:
-            logger.error('ReadTimeout in get_info with command: {}'.format(command))
+            logger.error('ReadTimeout in get_info with command: %s', command)
+            raise SwitchNotConnectedException()
+
+    @timed_sbi_call
+    @sbi_retry()
+    def get_info_pipelined(self, commands: List[str], read_timeout: float = 120) -> str:
+        # writes all the commands to the channel at once and reads the whole output in a single pass, avoiding a
+        # round trip per command. The output contains the echo of each command, followed by its result
+        logger.debug("getting pipelined info commands: %s", commands)
+        if not commands:
+            return ''
+        try:
+            prompt = self._netmiko_session.find_prompt()
+            self._netmiko_session.write_channel(
+                ''.join(command + self._netmiko_session.RETURN for command in commands))
+            return self._netmiko_session.read_until_pattern(
+                pattern='{}.*{}'.format(re.escape(commands[-1]), re.escape(prompt)),
+                read_timeout=bounded_timeout(read_timeout),
+                re_flags=re.DOTALL
+            )
+        except netmiko.exceptions.NetmikoTimeoutException:
+            logger.error('NetmikoTimeoutException in get_info_pipelined with commands: %s', commands)
+            raise SwitchNotConnectedException()
+        except netmiko.exceptions.AuthenticationException:
+            logger.error('AuthenticationException in get_info_pipelined with commands: %s', commands)
+            raise SwitchNotAuthenticatedException()
+        except netmiko.exceptions.ReadTimeout:
+            logger.error('ReadTimeout in get_info_pipelined with commands: %s', commands)
+            raise SwitchNotConnectedException()
+
+    @timed_sbi_call
+    def get_info_lines(self, command: str, enable=False, read_timeout: float = 45) -> Iterator[str]:
+        # yields the output lines of a command as they are received from the channel, so that the caller can parse
+        # them while the transfer is still running, without buffering the whole output. The command echo and the
+        # final prompt are not yielded; read_timeout is the maximum idle time between two chunks, reduced to the time
+        # left to the operation, which is checked for cancellation and expiry before every read
+        logger.debug("streaming info command: %s", command)
+        try:
+            if enable:
+                self._netmiko_session.enable()
+            prompt = self._netmiko_session.find_prompt().strip()
+            self._netmiko_session.write_channel(command + self._netmiko_session.RETURN)
+            pending = ''
+            echo_found = False
+            last_read = time.monotonic()
+            idle_timeout = bounded_timeout(read_timeout)
+            while True:
+                checkpoint()
+                chunk = self._netmiko_session.read_channel()
+                if not chunk:
+                    if time.monotonic() - last_read > idle_timeout:
+                        logger.error('ReadTimeout in get_info_lines with command: %s', command)
+                        raise SwitchNotConnectedException()
+                    time.sleep(0.02)
+                    continue
+                last_read = time.monotonic()
+                idle_timeout = bounded_timeout(read_timeout)
+                lines = (pending + chunk).split('\n')
+                pending = lines.pop()
+                for line in lines:
+                    line = line.rstrip('\r')
+                    if not echo_found:
+                        echo_found = command in line
+                        continue
+                    yield line
+                if echo_found and pending.strip() == prompt:
+                    return
+        except netmiko.exceptions.NetmikoTimeoutException:
+            logger.error('NetmikoTimeoutException in get_info_lines with command: %s', command)
+            raise SwitchNotConnectedException()
+        except netmiko.exceptions.AuthenticationException:
+            logger.error('AuthenticationException in get_info_lines with command: %s', command)
+            raise SwitchNotAuthenticatedException()
+        except (OSError, EOFError):
+            logger.error('connection lost in get_info_lines with command: %s', command)
             raise SwitchNotConnectedException()
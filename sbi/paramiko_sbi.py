@@ -1,8 +1,11 @@
-from typing import List, Union, Any
+from typing import List, Union, Any, Iterator
 import paramiko
 import json
-from tenacity import retry, stop_after_attempt, retry_if_exception_type
 from utils import create_logger
+from utils.util import get_config
+from utils.metrics import timed_sbi_call
+from utils.operation_control import bounded_timeout
+from .circuit_breaker import sbi_retry, check_reachable
 from netdevice import Device
 from switch.switch_base import SwitchNotConnectedException, SwitchNotAuthenticatedException, \
     SwitchConfigurationException
@@ -20,14 +23,17 @@ class ParamikoSbi:
         self.device = device
         self.create_session()
 
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def create_session(self):
         self._ssh_session = paramiko.client.SSHClient()
         self._ssh_session.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
+        check_reachable(self, self.device.ssh_port or 22)
         try:
-            self._ssh_session.connect(str(self.device.address), username=self.device.user,
-                                      password=self.device.passwd.get_secret_value())
+            self._ssh_session.connect(self.device.get_host(), port=self.device.ssh_port or 22,
+                                      username=self.device.user, password=self.device.passwd.get_secret_value(),
+                                      timeout=get_config().sbi.connect_timeout, auth_timeout=30, banner_timeout=30)
             logger.debug('connected')
         except paramiko.ssh_exception.NoValidConnectionsError:
             logger.error('NetmikoTimeoutException in authentication')
@@ -39,18 +45,19 @@ class ParamikoSbi:
             logger.error('ReadTimeout in authentication')
             raise SwitchNotConnectedException()
 
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def send_command(self, commands: List[str], json_parse: bool =False) -> List:
-        logger.debug("send command: {}".format(commands))
+        logger.debug("send command: %s", commands)
         try:
             output = []
             for command in commands:
-                logger.debug("sending command {}".format(command))
-                _stdin, _stdout, _stderr = self._ssh_session.exec_command(command)
+                logger.debug("sending command %s", command)
+                _stdin, _stdout, _stderr = self._ssh_session.exec_command(command, timeout=bounded_timeout(None))
                 r_stdout = _stdout.read().decode()
                 r_stderr = _stderr.read().decode()
-                logger.debug("received  _stdin {}, _stdout {}, _stderr {}".format(
-                    _stdin, r_stdout, r_stderr))
+                logger.debug("received  _stdin %s, _stdout %s, _stderr %s",
+                    _stdin, r_stdout, r_stderr)
                 output.append({
                     '_stdin': _stdin,
                     '_stdout': r_stdout if not json_parse else json.loads(r_stdout),
@@ -65,3 +72,21 @@ class ParamikoSbi:
             logger.error("AuthenticationException")
             raise SwitchNotAuthenticatedException()
 
+    @timed_sbi_call
+    def stream_command(self, command: str) -> Iterator[str]:
+        # yields the stdout lines of a command (without line terminators) as they are received, without buffering
+        # the whole output. A ValueError is raised at the end of the stream if the command wrote on stderr
+        logger.debug("streaming command %s", command)
+        try:
+            _stdin, _stdout, _stderr = self._ssh_session.exec_command(command)
+            for line in _stdout:
+                yield line.rstrip('\r\n')
+            r_stderr = _stderr.read().decode()
+        except paramiko.ssh_exception.NoValidConnectionsError:
+            logger.error("TimeoutException")
+            raise SwitchNotConnectedException()
+        except paramiko.ssh_exception.SSHException:
+            logger.error("AuthenticationException")
+            raise SwitchNotAuthenticatedException()
+        if r_stderr:
+            raise ValueError(r_stderr)
@@ -1,8 +1,12 @@
+import json
+import logging
 import requests
 # from requests.auth import HTTPBasicAuth
-from tenacity import retry, stop_after_attempt, retry_if_exception_type
 from netdevice import Device
 from utils import create_logger
+from utils.metrics import timed_sbi_call
+from utils.operation_control import bounded_timeout
+from .circuit_breaker import sbi_retry, check_reachable
 from switch.switch_base import SwitchNotConnectedException, SwitchNotAuthenticatedException, SwitchConfigurationException
 from pydantic import ValidationError
 
@@ -30,79 +34,93 @@ class PfSenseRestSbi:
             'Content-Type': 'application/json'
         }
 
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def authenticate(self):
-        pass
+        check_reachable(self, self.device.get_port(443))
 
     # GET
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
-    def get(self, command, parsing_class=None) -> dict:
-
-        logger.debug('{}{}'.format(self.base_url, command))
+    @timed_sbi_call
+    @sbi_retry()
+    def get_raw(self, command) -> bytes:
+        # returns the undecoded response body, used by callers that detect changes on the payload before parsing it
+        logger.debug('%s%s', self.base_url, command)
         try:
             res = self._rest_session.get(
                 '{}{}'.format(self.base_url, command),
                 headers=self.get_headers(),
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
         # logger.debug('REST status {} {}'.format(res.status_code, res.text))
         if res.status_code == 401:
             raise SwitchNotAuthenticatedException()
+        return res.content
 
+    @staticmethod
+    def parse(raw: bytes, parsing_class=None):
+        data = json.loads(raw)['data']
         if parsing_class:
             try:
-                return parsing_class.model_validate(res.json()['data'])
+                return parsing_class.model_validate(data)
             except ValidationError as e:
                 print(f"Failed to parsing data with model {parsing_class}:", e)
                 raise SwitchConfigurationException
         else:
-            return res.json()['data']
+            return data
+
+    def get(self, command, parsing_class=None) -> dict:
+        return self.parse(self.get_raw(command), parsing_class)
 
     # PUT
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def put(self, command, data) -> dict:
-        logger.debug("data: {}".format(data))
+        logger.debug("data: %s", data)
         try:
             res = self._rest_session.put(
                 '{}{}'.format(self.base_url, command),
                 json=data,
                 headers=self.get_headers(),
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
-        logger.debug('REST status {} {}'.format(res.status_code, res.text))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('REST status %s %s', res.status_code, res.text)
         if res.status_code not in [200, 201, 202]:
             raise SwitchNotAuthenticatedException()
         # res = json.dumps(res.text)
         return True
 
     # POST
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def post(self, command: str, data: dict) -> bool:
-        logger.debug("data: {}".format(data))
+        logger.debug("data: %s", data)
         try:
             res = self._rest_session.post(
                 '{}{}'.format(self.base_url, command),
                 json=data,
                 headers=self.get_headers(),
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
-        logger.debug('REST status {} {}'.format(res.status_code, res.text))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('REST status %s %s', res.status_code, res.text)
         if res.status_code not in [200, 201, 202]:
             raise SwitchNotAuthenticatedException()
         # res = json.dumps(res.text)
         return True
 
     # DELETE
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def delete(self, url):
         headers = {
             'Authorization': f'{self.device.client_id} {self.device.key}',
@@ -113,11 +131,12 @@ class PfSenseRestSbi:
                 '{}{}'.format(self.base_url, url),
                 headers=headers,
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
-        logger.debug('REST status {} {}'.format(res.status_code, res.text))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('REST status %s %s', res.status_code, res.text)
         if res.status_code not in [200, 202, 204]:
             raise SwitchNotAuthenticatedException()
         # res = json.dumps(res.text)
@@ -1,14 +1,21 @@
+import json
+import logging
 import requests
 # from requests.auth import HTTPBasicAuth
-from tenacity import retry, stop_after_attempt, retry_if_exception_type
+from typing import List
 from netdevice import Device
 from utils import create_logger
+from utils.metrics import timed_sbi_call
+from utils.operation_control import bounded_timeout
+from utils.util import get_config
+from .circuit_breaker import sbi_retry, check_reachable
 from switch.switch_base import SwitchNotConnectedException, SwitchNotAuthenticatedException
 
 
 logger = create_logger('rest_sbi')
 GETHEADERS = {"Accept": "application/yang-data+json"}
 POSTHEADERS = {'Content-Type': 'application/yang-data+json'}
+YANGPATCHHEADERS = {'Content-Type': 'application/yang-patch+json', 'Accept': 'application/yang-data+json'}
 
 
 class RestSbi:
@@ -25,116 +32,151 @@ class RestSbi:
         self._rest_session = requests.Session()
         self.authenticate()
 
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def authenticate(self):
-        pass
+        check_reachable(self, self.device.get_port(443))
 
     # GET
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
-    def get(self, command) -> dict:
-        logger.debug('https://{}/{}'.format(self.device.address, command))
+    @timed_sbi_call
+    @sbi_retry()
+    def get_raw(self, command) -> bytes:
+        # returns the undecoded response body, the caller chooses how (and whether) to parse it
+        logger.debug('https://%s/%s', self.device.address, command)
         try:
             res = self._rest_session.get(
                 'https://{}/{}'.format(self.device.address, command),
                 headers=GETHEADERS,
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
-        logger.debug('REST status {} {}'.format(res.status_code, res.text))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('REST status %s %s', res.status_code, res.text)
         if res.status_code != 200:
             raise SwitchNotAuthenticatedException()
-        # res = json.dumps(res.text)
-        return res.json()
+        return res.content
 
-    # PUT
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
-    def put(self, command, data) -> dict:
-        pass
+    def get(self, command) -> dict:
+        return json.loads(self.get_raw(command))
 
-        """try:
-            res = self._rest_session.put(
-                'http://{}/rest{}'.format(self.device.address, command),
+    # GET on a plain HTTP service of the device listening on another port (e.g. the port status service of SONiC)
+    @timed_sbi_call
+    @sbi_retry()
+    def get_service(self, port: int, path: str) -> dict:
+        url = 'http://{}:{}/{}'.format(self.device.get_host(), port, path)
+        try:
+            res = self._rest_session.get(url, timeout=bounded_timeout((get_config().sbi.connect_timeout, 60)))
+            if not res.ok:
+                logger.error('REST status %s %s', res.status_code, res.text)
+                raise ValueError('REST GET on {} failed with code {}'.format(url, res.status_code))
+            return res.json()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise SwitchNotConnectedException('REST GET on {} failed: {}'.format(url, e))
+        except requests.RequestException as e:
+            raise ValueError('REST GET on {} failed: {}'.format(url, e))
+
+    # PUT
+    @timed_sbi_call
+    @sbi_retry()
+    def put(self, command: str, data: dict) -> bool:
+        return self._write('put', command, data)
+
+    # PATCH: merges the payload into the target resource, existing entries are updated in place
+    @timed_sbi_call
+    @sbi_retry()
+    def patch(self, command: str, data: dict) -> bool:
+        return self._write('patch', command, data)
+
+    def _write(self, method: str, command: str, data: dict) -> bool:
+        logger.debug("%s data: %s", method, data)
+        try:
+            res = getattr(self._rest_session, method)(
+                'https://{}/{}'.format(self.device.address, command),
                 json=data,
-                auth=HTTPBasicAuth(self.device.user, self.device.passwd.get_secret_value()),
-                headers={'Content-Type': 'application/json'},
+                headers=POSTHEADERS,
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
-            logger.debug('REST status {} {}'.format(res.status_code, res.text))
-            res.raise_for_status()
-        except requests.HTTPError as ex:
-            if ex.response.status_code == 401 or ex.response.status_code == 403:
-                raise SwitchNotAuthenticatedException()
-            else:
-                logger.exception('[RouterOS] got exception in Rest Put')
-                raise ValueError('[RouterOS: got other error with code {}'.format(ex.response.status_code))
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('REST status %s %s', res.status_code, res.text)
+        if res.status_code in [401, 403]:
+            raise SwitchNotAuthenticatedException()
+        if res.status_code not in [200, 201, 204]:
+            raise ValueError('REST {} on {} failed with code {}: {}'.format(
+                method.upper(), command, res.status_code, res.text))
+        return True
 
-        return res.json()"""
-
-    # PATCH
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
-    def patch(self, command, data) -> dict:
-        pass
-        """
+    # YANG PATCH (RFC 8072): several edits on the target datastore resource applied atomically in one request.
+    # Returns False if the server does not support the yang-patch media type
+    @timed_sbi_call
+    @sbi_retry()
+    def yang_patch(self, command: str, patch_id: str, edits: List[dict]) -> bool:
+        data = {'ietf-yang-patch:yang-patch': {'patch-id': patch_id, 'edit': edits}}
+        logger.debug("yang-patch data: %s", data)
         try:
             res = self._rest_session.patch(
-                'http://{}/rest{}'.format(self.device.address, command),
+                'https://{}/{}'.format(self.device.address, command),
                 json=data,
-                auth=HTTPBasicAuth(self.device.user, self.device.passwd.get_secret_value()),
-                headers={'Content-Type': 'application/json'},
+                headers=YANGPATCHHEADERS,
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
-            logger.debug('REST status {} {}'.format(res.status_code, res.text))
-            res.raise_for_status()
-        except requests.HTTPError as ex:
-            if ex.response.status_code == 401 or ex.response.status_code == 403:
-                raise SwitchNotAuthenticatedException()
-            else:
-                logger.exception('[RouterOS] got exception in Rest Patch')
-                raise ValueError('[RouterOS: got other error with code {}'.format(ex.response.status_code))
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
-
-        return res.json()"""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('REST status %s %s', res.status_code, res.text)
+        if res.status_code in [401, 403]:
+            raise SwitchNotAuthenticatedException()
+        if res.status_code in [405, 415, 501]:
+            return False
+        if res.status_code not in [200, 204]:
+            raise ValueError('REST YANG PATCH on {} failed with code {}: {}'.format(
+                command, res.status_code, res.text))
+        return True
 
     # POST
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def post(self, command: str, data: dict) -> bool:
-        logger.debug("data: {}".format(data))
+        logger.debug("data: %s", data)
         try:
             res = self._rest_session.post(
                 'https://{}/{}'.format(self.device.address, command),
                 json=data,
                 headers=POSTHEADERS,
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
-        logger.debug('REST status {} {}'.format(res.status_code, res.text))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('REST status %s %s', res.status_code, res.text)
         if res.status_code not in [200, 201, 202]:
             raise SwitchNotAuthenticatedException()
         # res = json.dumps(res.text)
         return True
 
     # DELETE
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
-    def delete(self, url):
+    @timed_sbi_call
+    @sbi_retry()
+    def delete(self, url, missing_ok: bool = False):
         try:
             res = self._rest_session.delete(
                 'https://{}/{}'.format(self.device.address, url),
                 headers=GETHEADERS,
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
-        logger.debug('REST status {} {}'.format(res.status_code, res.text))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('REST status %s %s', res.status_code, res.text)
+        if missing_ok and res.status_code == 404:
+            return res.status_code
         if res.status_code not in [200, 202, 204]:
             raise SwitchNotAuthenticatedException()
         # res = json.dumps(res.text)
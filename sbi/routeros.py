@@ -1,8 +1,11 @@
+import logging
 import requests
 from requests.auth import HTTPBasicAuth
-from tenacity import retry, stop_after_attempt, retry_if_exception_type
 from netdevice import Device
 from utils import create_logger
+from utils.metrics import timed_sbi_call
+from utils.operation_control import bounded_timeout
+from .circuit_breaker import sbi_retry, check_reachable
 from switch.switch_base import SwitchNotConnectedException, SwitchNotAuthenticatedException
 
 
@@ -24,21 +27,24 @@ class RosRestSbi:
         self.authenticate()
 
     # fai un test
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def authenticate(self):
+        check_reachable(self, self.device.get_port(80))
         try:
             res = self._rest_session.get(
                 'http://{}'.format(self.device.address),
                 auth=HTTPBasicAuth(self.device.user, self.device.passwd.get_secret_value()),
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
-        logger.debug('code {}, {}'.format(res.status_code, res.content))
+        logger.debug('code %s, %s', res.status_code, res.content)
 
     # GET
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def get(self, command) -> dict:
         try:
             res = self._rest_session.get(
@@ -46,18 +52,20 @@ class RosRestSbi:
                 auth=HTTPBasicAuth(self.device.user, self.device.passwd.get_secret_value()),
                 headers={'Content-Type': 'application/json'},
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
-        logger.debug('REST status {} {}'.format(res.status_code, res.text))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('REST status %s %s', res.status_code, res.text)
         if res.status_code != 200:
             raise SwitchNotAuthenticatedException()
         # res = json.dumps(res.text)
         return res.json()
 
     # PUT
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def put(self, command, data) -> dict:
         try:
             res = self._rest_session.put(
@@ -66,9 +74,10 @@ class RosRestSbi:
                 auth=HTTPBasicAuth(self.device.user, self.device.passwd.get_secret_value()),
                 headers={'Content-Type': 'application/json'},
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
-            logger.debug('REST status {} {}'.format(res.status_code, res.text))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('REST status %s %s', res.status_code, res.text)
             res.raise_for_status()
         except requests.HTTPError as ex:
             if ex.response.status_code == 401 or ex.response.status_code == 403:
@@ -82,7 +91,8 @@ class RosRestSbi:
         return res.json()
 
     # PATCH
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def patch(self, command, data) -> dict:
         try:
             res = self._rest_session.patch(
@@ -91,9 +101,10 @@ class RosRestSbi:
                 auth=HTTPBasicAuth(self.device.user, self.device.passwd.get_secret_value()),
                 headers={'Content-Type': 'application/json'},
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
-            logger.debug('REST status {} {}'.format(res.status_code, res.text))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('REST status %s %s', res.status_code, res.text)
             res.raise_for_status()
         except requests.HTTPError as ex:
             if ex.response.status_code == 401 or ex.response.status_code == 403:
@@ -107,7 +118,8 @@ class RosRestSbi:
         return res.json()
 
     # POST
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def post(self, command, data) -> dict:
         try:
             res = self._rest_session.post(
@@ -116,9 +128,10 @@ class RosRestSbi:
                 auth=HTTPBasicAuth(self.device.user, self.device.passwd.get_secret_value()),
                 headers={'Content-Type': 'application/json'},
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
-            logger.debug('REST status {} {}'.format(res.status_code, res.text))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('REST status %s %s', res.status_code, res.text)
             res.raise_for_status()
         except requests.HTTPError as ex:
             if ex.response.status_code == 401 or ex.response.status_code == 403:
@@ -132,7 +145,8 @@ class RosRestSbi:
         return res.json()
 
     # DELETE
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def delete(self, url):
         try:
             res = self._rest_session.delete(
@@ -140,9 +154,10 @@ class RosRestSbi:
                 auth=HTTPBasicAuth(self.device.user, self.device.passwd.get_secret_value()),
                 headers={'Content-Type': 'application/json'},
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
-            logger.debug('REST status {} {}'.format(res.status_code, res.text))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('REST status %s %s', res.status_code, res.text)
             res.raise_for_status()
         except requests.HTTPError as ex:
             if ex.response.status_code == 401 or ex.response.status_code == 403:
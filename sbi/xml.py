@@ -3,15 +3,16 @@ from typing import Literal, Union, List, Optional
 import requests
 import xmltodict
 from pydantic import BaseModel, Field
-from tenacity import retry, stop_after_attempt, retry_if_exception_type
 from netdevice import Device
 from utils import create_logger
+from utils.metrics import timed_sbi_call
+from utils.operation_control import bounded_timeout
+from .circuit_breaker import sbi_retry, check_reachable
 # from requests.packages.urllib3.exceptions import InsecureRequestWarning
 from switch.switch_base import SwitchNotConnectedException, SwitchNotAuthenticatedException, \
     SwitchConfigurationException
 
 logger = create_logger('xml_driver')
-logger.setLevel(logging.INFO)
 XmlNodeRequestType = Literal['get', 'action', 'set-create', 'set-delete', 'set-modify']
 requests.packages.urllib3.disable_warnings(requests.packages.urllib3.exceptions.InsecureRequestWarning)
 
@@ -86,9 +87,9 @@ class XgResponse(BaseModel):
 
     @classmethod
     def parse(cls, msg: str):
-        logger.debug(xmltodict.parse(msg, force_list='node')['xg-response'])
-        return cls.model_validate(
-            xmltodict.parse(msg, force_list='node')['xg-response'])
+        data = xmltodict.parse(msg, force_list='node')['xg-response']
+        logger.debug('xg-response: %s', data)
+        return cls.model_validate(data)
 
 
 class XmlRestSbi:
@@ -105,15 +106,17 @@ class XmlRestSbi:
         self._rest_session = requests.Session()
         self.authenticate()
 #fai un test
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def authenticate(self):
+        check_reachable(self, self.device.get_port(443))
         data = {'f_user_id': self.device.user, 'f_password': self.device.passwd.get_secret_value()}
         try:
             self._rest_session.get(
                 'https://{}/admin/launch?script=rh&template=login&action=login'.format(self.device.address),
                 data=data,
                 verify=False,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException
@@ -130,7 +133,8 @@ class XmlRestSbi:
 #due parametri, usare anche la post
     # comando /ip/address
     # data {data}
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def post(self, msg: MlnxOsXgRequest) -> XgResponse:
         xmlstr = xmltodict.unparse(msg.dump())
         # print(xmlstr)
@@ -141,11 +145,12 @@ class XmlRestSbi:
                 data=xmlstr,
                 verify=False,
                 headers=headers,
-                timeout=(30, 60)
+                timeout=bounded_timeout((30, 60))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException()
-        logger.debug('REST status {}\n{}'.format(output.status_code, output.text))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('REST status %s\n%s', output.status_code, output.text)
         if output.status_code != 200:
             raise SwitchNotAuthenticatedException()
         # print(output.text)
@@ -158,7 +163,8 @@ class XmlRestSbi:
                     res.xgStatus.statusCode, res.xgStatus.statusMsg))
         return res
 
-    @retry(retry=retry_if_exception_type(SwitchNotConnectedException), stop=stop_after_attempt(3), reraise=True)
+    @timed_sbi_call
+    @sbi_retry()
     def multi_post(self, msg: List[MlnxOsXgRequestNode]) -> List[MlnxOsXgResponseNode]:
         xmlstr = xmltodict.unparse(MlnxOsXgRequest.create_multinode_node_request(msg).dump())
         headers = {'Content-Type': 'text/xml'}
@@ -168,11 +174,12 @@ class XmlRestSbi:
                 data=xmlstr,
                 verify=False,
                 headers=headers,
-                timeout=(45, 120)
+                timeout=bounded_timeout((45, 120))
             )
         except requests.exceptions.ConnectionError:
             raise SwitchNotConnectedException()
-        logger.debug('REST status {}\n{}'.format(output.status_code, output.text))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('REST status %s\n%s', output.status_code, output.text)
         if output.status_code != 200:
             raise SwitchNotAuthenticatedException()
         res = XgResponse.parse(output.text)
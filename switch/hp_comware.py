@@ -5,17 +5,78 @@ from .switch_base import Switch
 from models import SwitchRequestVlanL3Port, LldpNeighbor, PhyPort, VlanL3Port, Vrf, VrfRequest, \
     IpV4Route, RoutingProtocols, BGPRoutingProtocol, BGPNeighbor, BGPAddressFamily, BGPRedistribute
 import textfsm
+import io
 import ipaddress
-from pydantic import IPvAnyInterface, IPvAnyAddress
+import re
+from pydantic import IPvAnyInterface, IPvAnyAddress, PrivateAttr
 from netaddr import IPAddress, IPNetwork
 from utils import create_logger
-from typing import List, Literal, Any, Callable, Tuple
+from utils.metrics import timed_refresh_phase
+from typing import List, Literal, Any, Callable, Tuple, ClassVar, Dict, NamedTuple, Union
 
 logger = create_logger('hp_comware')
 
+# short interface name prefixes as reported by "display" commands, and the corresponding full names
+_interface_prefixes = [
+    ('GE', 'GigabitEthernet'),
+    ('XGE', 'Ten-GigabitEthernet'),
+    ('FGE', 'FortyGigE'),
+    ('M-GE', 'M-GigabitEthernet')
+]
+
+_bgp_peer_command = 'display bgp peer ipv4 vpn-instance {}'
+_bgp_peer_command_re = re.compile(r'display bgp peer ipv4 vpn-instance (\S+)\s*$')
+_bgp_router_id_re = re.compile(r'^\s+BGP local router ID: (\S+)')
+_bgp_peer_re = re.compile(r'^\s+(\S+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\S+)\s+(\S+)\s*$')
+
+
+class BgpPeerStatus(NamedTuple):
+    router_id: str
+    ip: str
+    remote_as: int
+    msgrcvd: int
+    msgsent: int
+    outq: int
+    prefrcv: int
+    updowntime: str
+    state: str
+
+
+def parse_bgp_peer_status(output: str, vrf_name: Union[str, None] = None) -> Dict[str, List[BgpPeerStatus]]:
+    # single pass over the output of one or more "display bgp peer ipv4 vpn-instance" commands. With pipelined
+    # commands the output is split in sections on the command echo, otherwise vrf_name gives the only section
+    res: Dict[str, List[BgpPeerStatus]] = {}
+    current = res.setdefault(vrf_name, []) if vrf_name else None
+    router_id = ''
+    for line in output.splitlines():
+        match = _bgp_peer_command_re.search(line)
+        if match:
+            current = res.setdefault(match.group(1), [])
+            router_id = ''
+            continue
+        if current is None:
+            continue
+        match = _bgp_router_id_re.match(line)
+        if match:
+            router_id = match.group(1)
+            continue
+        match = _bgp_peer_re.match(line)
+        if match:
+            current.append(BgpPeerStatus(
+                router_id, match.group(1), int(match.group(2)), int(match.group(3)), int(match.group(4)),
+                int(match.group(5)), int(match.group(6)), match.group(7), match.group(8)))
+    return res
+
 
 class HpComware(Switch):
     _sbi_driver: NetmikoSbi = None
+    # when True, the bgp peer tables of all the vrfs are requested with a single pipelined channel write instead of
+    # one command round trip per vrf
+    bgp_peer_pipelining: ClassVar[bool] = True
+    # textfsm records and lines of the bgp section of the configuration, produced while it is streamed and consumed by
+    # parse_config
+    _config_records: Union[List[List[Any]], None] = PrivateAttr(default=None)
+    _bgp_lines: Union[List[str], None] = PrivateAttr(default=None)
 
     def send_cmd_and_save(func: Callable[..., List[Any]]) -> Callable[..., List[Any]]:
         def wrapper(self, *args, **kwargs) -> List[Any]:
@@ -34,7 +95,7 @@ class HpComware(Switch):
             self._sbi_driver = NetmikoSbi(self.to_device_model())
 
     def _retrieve_info(self) -> None:
-        logger.info('retrieving information for switch {}'.format(self.name))
+        logger.info('retrieving information for switch %s', self.name)
         self.reinit_sbi_drivers()
         self._update_info()
 
@@ -44,29 +105,22 @@ class HpComware(Switch):
         self.retrieve_runtime_ports()
         self.retrieve_bgp_peer_status()
         self.retrieve_neighbors()
-        logger.info('retrieved all the information for switch {}'.format(self.name))
+        logger.info('retrieved all the information for switch %s', self.name)
 
     def _check_config_changed(self, cfg) -> bool:
         return cfg != self.last_config.config
 
     def _get_port_by_shortname(self, shortname: str) -> PhyPort:
         interface = None
-        if shortname[:2] == 'GE':
-            interface = next(
-                (item for item in self.phy_ports if item.index == 'GigabitEthernet{}'.format(shortname[2:])), None)
-        elif shortname[:3] == 'XGE':
-            interface = next(
-                (item for item in self.phy_ports if item.index == 'Ten-GigabitEthernet{}'.format(shortname[3:])), None)
-        elif shortname[:3] == 'FGE':
-            interface = next(
-                (item for item in self.phy_ports if item.index == 'FortyGigE{}'.format(shortname[3:])), None)
-        elif shortname[:4] == 'M-GE':
-            interface = next(
-                (item for item in self.phy_ports if item.index == 'M-GigabitEthernet' + shortname[4:]), None)
+        for short_prefix, long_prefix in _interface_prefixes:
+            if shortname.startswith(short_prefix):
+                interface = self.get_port_by_index(long_prefix + shortname[len(short_prefix):])
+                break
         if not interface:
             raise ValueError('interface {} not found'.format(shortname))
         return interface
 
+    @timed_refresh_phase('ports')
     def retrieve_runtime_ports(self) -> None:
         ports = self._sbi_driver.get_info("display interface brief", use_textfsm=False)
         fsm = textfsm.TextFSM(open("fsm_templates/hp_comware_interface_template"))
@@ -89,35 +143,67 @@ class HpComware(Switch):
             elif r[3][0] == 'H':
                 interface.duplex = 'HALF'
 
+    @timed_refresh_phase('bgp')
     def retrieve_bgp_peer_status(self):
-
-        for vrf in self.vrfs:
-            if vrf.protocols and vrf.protocols.bgp:
-                res = self._sbi_driver.get_info(
-                    "display bgp peer ipv4 vpn-instance {}".format(vrf.name), use_textfsm=False)
-                fsm = textfsm.TextFSM(open("fsm_templates/hp_comware_bgp_peer_template"))
-                parsed_res = fsm.ParseText(res)
-                for peer in parsed_res:
-                    if peer[1] and peer[2]:
-                        if not vrf.protocols.bgp.router_id:
-                            vrf.protocols.bgp.router_id = peer[0]
-                        configured_peer = next(
-                            item for item in vrf.protocols.bgp.neighbors if
-                                str(item.ip) == str(peer[1]) and int(item.remote_as) == int(peer[2])
-                        )
-                        configured_peer.msgrcvd = int(peer[3])
-                        configured_peer.msgsent = int(peer[4])
-                        configured_peer.outq = int(peer[5])
-                        configured_peer.prefrcv = int(peer[6])
-                        configured_peer.updowntime = peer[7]
-                        configured_peer.status = peer[8].lower()
-
+        bgp_vrfs = {vrf.name: vrf for vrf in self.vrfs if vrf.protocols and vrf.protocols.bgp}
+        if not bgp_vrfs:
+            return
+
+        statuses = {}
+        if self.bgp_peer_pipelining:
+            res = self._sbi_driver.get_info_pipelined([_bgp_peer_command.format(name) for name in bgp_vrfs])
+            statuses = parse_bgp_peer_status(res)
+        # serial mode, or vrfs whose section was not found in the pipelined output
+        for name in bgp_vrfs:
+            if name not in statuses:
+                res = self._sbi_driver.get_info(_bgp_peer_command.format(name), use_textfsm=False)
+                statuses.update(parse_bgp_peer_status(res, name))
+
+        for name, peers in statuses.items():
+            if name not in bgp_vrfs:
+                continue
+            bgp = bgp_vrfs[name].protocols.bgp
+            configured_peers = {(str(item.ip), int(item.remote_as)): item for item in bgp.neighbors}
+            for peer in peers:
+                if not bgp.router_id:
+                    bgp.router_id = peer.router_id
+                configured_peer = configured_peers.get((peer.ip, peer.remote_as))
+                if not configured_peer:
+                    logger.warning('bgp peer %s AS %s in vrf %s not configured', peer.ip, peer.remote_as, name)
+                    continue
+                configured_peer.msgrcvd = peer.msgrcvd
+                configured_peer.msgsent = peer.msgsent
+                configured_peer.outq = peer.outq
+                configured_peer.prefrcv = peer.prefrcv
+                configured_peer.updowntime = peer.updowntime
+                configured_peer.status = peer.state.lower()
+
+    @timed_refresh_phase('config')
     def retrieve_config(self) -> None:
-        _config = self._sbi_driver.get_info("display current-configuration")
-        self.store_config(_config)
+        # the configuration lines are fed to the textfsm parser as they arrive, overlapping transfer and parsing
+        # the lines are written to the stored configuration as they arrive, only those of the bgp section are kept
+        fsm = textfsm.TextFSM(open("fsm_templates/hp_comware_config_template"))
+        config = io.StringIO()
+        bgp_lines = []
+        in_bgp_section = False
+        separator = ''
+        for line in self._sbi_driver.get_info_lines("display current-configuration"):
+            config.write(separator)
+            config.write(line)
+            separator = '\n'
+            fsm.ParseText(line + '\n', eof=False)
+            if line.startswith('bgp'):
+                in_bgp_section = True
+            elif not line.startswith(' '):
+                in_bgp_section = False
+            if in_bgp_section:
+                bgp_lines.append(line)
+        self._config_records = fsm.ParseText('', eof=True)
+        self._bgp_lines = bgp_lines
+        self.store_config(config.getvalue())
 
     def parse_bgp_config(self) -> None:
-        config_to_parse = self.last_config.config
+        config_to_parse = self._bgp_lines if self._bgp_lines is not None else self.last_config.config.splitlines()
         local_as = None
         in_bgp_section = False
         parsing_vrf = None
@@ -126,7 +212,7 @@ class HpComware(Switch):
         default_vrf = next((item for item in self.vrfs if item.name == 'default'), None)
         default_address_family = None
 
-        for line in config_to_parse.splitlines():
+        for line in config_to_parse:
             if line.startswith('bgp') and not in_bgp_section:
                 in_bgp_section = True
                 local_as = line.split()[1]
@@ -176,9 +262,12 @@ class HpComware(Switch):
                 redistributed = BGPRedistribute.connected if parsed_route_type == 'direct' else parsed_route_type
                 parsing_address_family.redistribute.append(redistributed)
 
+    @timed_refresh_phase('parse')
     def parse_config(self) -> None:
-        fsm = textfsm.TextFSM(open("fsm_templates/hp_comware_config_template"))
-        res = fsm.ParseText(self.last_config.config)
+        res = self._config_records
+        if res is None:
+            fsm = textfsm.TextFSM(open("fsm_templates/hp_comware_config_template"))
+            res = fsm.ParseText(self.last_config.config)
         for r in res:
             if r[0]:
                 # interface
@@ -204,7 +293,7 @@ class HpComware(Switch):
                         if not found_to and v != 'to':
                             trunk_vlans.append(int(v))
                         elif found_to and v != 'to':
-                            trunk_vlans = trunk_vlans + [int(index) for index in range(trunk_vlans[-1] + 1, int(v))]
+                            trunk_vlans = trunk_vlans + [int(index) for index in range(trunk_vlans[-1] + 1, int(v) + 1)]
                             found_to = False
                         elif v == 'to':
                             found_to = True
@@ -212,7 +301,7 @@ class HpComware(Switch):
                             raise ValueError('error in parsing trunk vlans')
 
                     vlan_mode = r[1] if r[1] else 'ACCESS'
-                    logger.debug('adding phy port {}'.format(r[0]))
+                    logger.debug('adding phy port %s', r[0])
                     self.phy_ports.append(PhyPort(
                         index=r[0],
                         name=r[0],
@@ -227,7 +316,7 @@ class HpComware(Switch):
                     ))
             elif r[13]:  # a Vlan item is parsed
                 if 'to' in r[13]:
-                    self.vlans = self.vlans + [v for v in range(int(r[13].split()[0]), int(r[13].split()[-1]))]
+                    self.vlans = self.vlans + [v for v in range(int(r[13].split()[0]), int(r[13].split()[-1]) + 1)]
                 else:
                     self.vlans.append(int(r[13]))
             elif r[8]:  # a VRF item is found
@@ -278,21 +367,24 @@ class HpComware(Switch):
                     default_vrf.ports.append(vlan_interface)
 
         self.parse_bgp_config()
+        self._config_records = None
+        self._bgp_lines = None
 
+    @timed_refresh_phase('lldp')
     def retrieve_neighbors(self) -> None:
         _neighbors = self._sbi_driver.get_info("display lldp neighbor-information list", use_textfsm=True)
 
         for n in _neighbors:
             interface = self._get_port_by_shortname(n['local_interface'])
-            interface.neighbor = LldpNeighbor(neighbor=n['neighbor'], remote_interface=n['neighbor_interface'])
-            logger.debug('interface {} neighbours: {}, remote port {}'.format(interface.index, n['neighbor'],
-                                                                              n['neighbor_interface']))
+            interface.neighbor = LldpNeighbor(neighbor=n['neighbor_name'], remote_interface=n['neighbor_interface'])
+            logger.debug('interface %s neighbours: %s, remote port %s', interface.index, n['neighbor_name'],
+                                                                              n['neighbor_interface'])
     """def retrieve_bgp_neighbors(self):
         for vrf in self.vrfs:
             parsing_peers = self._sbi_driver.get_info(
                 "display bgp peer ipv4 vpn-instance {}".format(vrf.name), use_textfsm=True)
             for p in parsing_peers:
-                logger.warn(p)
+                logger.warning(p)
                 switch_peer = next(item for item in vrf.protocols.bgp.neighbors
                                    if item.ip == p[1] and item.remote_as == p[2])
                 switch_peer.msgrcvd = p[3]
@@ -4,13 +4,13 @@ from models import LldpNeighbor, PhyPort, VlanL3Port, Vrf, SwitchRequestVlanL3Po
 from pydantic import IPvAnyInterface, IPvAnyAddress
 from netaddr import IPAddress, IPNetwork
 from utils import create_logger
+from utils.metrics import timed_refresh_phase
 from sbi.netmiko import NetmikoSbi
 from typing import List, Literal
 import textfsm
 import logging
 
 logger = create_logger('mlnx_os')
-logger.setLevel(logging.INFO)
 
 
 class Mellanox(Switch):
@@ -35,8 +35,9 @@ class Mellanox(Switch):
         self.retrieve_ports()
         self.retrieve_config()
         self.retrieve_neighbors()
-        logger.info('retrieved all the information for switch {}'.format(self.name))
+        logger.info('retrieved all the information for switch %s', self.name)
 
+    @timed_refresh_phase('config')
     def retrieve_config(self):
         _config = self._sbi_ssh_driver.get_info("show configuration", enable=True)
         self.store_config(_config[6:])
@@ -46,9 +47,10 @@ class Mellanox(Switch):
         last_cfg = ''.join(self.last_config.config.splitlines(keepends=True)[2:])
         return new_cfg != last_cfg
 
+    @timed_refresh_phase('lldp')
     def retrieve_neighbors(self):
         neighdata = self._sbi_ssh_driver.get_info("show lldp remote")
-        logger.debug('{}'.format(neighdata))
+        logger.debug('%s', neighdata)
         fsm = textfsm.TextFSM(open("fsm_templates/mlnx_lldp_template"))
         res = fsm.ParseText(neighdata)
         logger.debug(res)
@@ -56,17 +58,21 @@ class Mellanox(Switch):
             port = next(item for item in self.phy_ports if item.name == line[0])
             port.neighbor = LldpNeighbor(neighbor=line[3], remote_interface=line[2])
 
+    @timed_refresh_phase('vlans')
     def retrieve_vlans(self):
         vlans_request = self._sbi_xml_driver.post(
             MlnxOsXgRequest.create_single_node_request('/mlnxos/v1/vsr/vsr-default/vlans/*'))
-        logger.debug(vlans_request.model_dump())
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(vlans_request.model_dump())
         self.vlans = [int(item.value) for item in vlans_request.actionResponse.nodes.node if item]
-        logger.debug("VLANs defined: {}".format(self.vlans))
+        logger.debug("VLANs defined: %s", self.vlans)
 
+    @timed_refresh_phase('ports')
     def retrieve_ports(self):
         ports = self._sbi_xml_driver.post(
             MlnxOsXgRequest.create_single_node_request('/mlnxos/v1/vsr/vsr-default/interfaces/*'))
-        logger.debug(ports.model_dump())
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(ports.model_dump())
 
         port_indexes = [item.value for item in ports.actionResponse.nodes.node]
 
@@ -121,16 +127,16 @@ class Mellanox(Switch):
                 self.vlan_l3_ports.append(VlanL3Port.model_validate(port_map[k]))
             else:
                 logger.warning(
-                    'found unclassified interface with index {} and type {}'.format(k, port_map[k]['type']))
+                    'found unclassified interface with index %s and type %s', k, port_map[k]['type'])
 
     def retrieve_port_vlan(self, port_index: str) -> dict:
         # retrieving info on vlans
         port_data = {}
         port_vlan_requests = create_multinode_request(
             '/mlnxos/v1/vsr/vsr-default/interfaces/{}/vlans/**', [port_index])
-        logger.debug('port_vlan_requests {}'.format(port_vlan_requests))
+        logger.debug('port_vlan_requests %s', port_vlan_requests)
         port_vlan_replies = self._sbi_xml_driver.multi_post(port_vlan_requests)
-        logger.debug('port_vlan_replies {}'.format(port_vlan_replies))
+        logger.debug('port_vlan_replies %s', port_vlan_replies)
         port_data['trunk_vlans'] = []
         port_data['access_vlan'] = None
         for vlan_line in port_vlan_replies:
@@ -147,9 +153,9 @@ class Mellanox(Switch):
         # ipv4/ip_address
         ip_port_vlan_requests = create_multinode_request(
             '/mlnxos/v1/vsr/vsr-default/interfaces/{}/ipv4/**', [port_index])
-        logger.debug('ip_port_vlan_requests {}'.format(ip_port_vlan_requests))
+        logger.debug('ip_port_vlan_requests %s', ip_port_vlan_requests)
         ip_port_vlan_replies = self._sbi_xml_driver.multi_post(ip_port_vlan_requests)
-        logger.debug('ip_port_vlan_replies {}'.format(ip_port_vlan_replies))
+        logger.debug('ip_port_vlan_replies %s', ip_port_vlan_replies)
         _ip_addr = {}
         for ip_line in ip_port_vlan_replies:
             if '/{}/ipv4/ip_address'.format(port_index) in ip_line.name:
@@ -170,10 +176,10 @@ class Mellanox(Switch):
     def _add_vlan(self, vlan_ids: List[int]) -> bool:
         node_template = '/mlnxos/v1/vsr/vsr-default/vlans/add|vlan_id={}'
         port_vlan_requests = create_multinode_request(node_template, vlan_ids, request_type='action')
-        logger.debug('port_vlan_requests {}'.format(port_vlan_requests))
+        logger.debug('port_vlan_requests %s', port_vlan_requests)
         try:
             port_vlan_replies = self._sbi_xml_driver.multi_post(port_vlan_requests)
-            logger.debug('port_vlan_replies {}'.format(port_vlan_replies))
+            logger.debug('port_vlan_replies %s', port_vlan_replies)
             self.vlans = self.vlans + vlan_ids
             return True
         except Exception:
@@ -183,10 +189,10 @@ class Mellanox(Switch):
     def _del_vlan(self, vlan_ids: List[int]) -> bool:
         node_template = '/mlnxos/v1/vsr/vsr-default/vlans/delete|vlan_id={}'
         port_vlan_requests = create_multinode_request(node_template, vlan_ids, request_type='action')
-        logger.debug('port_vlan_requests {}'.format(port_vlan_requests))
+        logger.debug('port_vlan_requests %s', port_vlan_requests)
         try:
             port_vlan_replies = self._sbi_xml_driver.multi_post(port_vlan_requests)
-            logger.debug('port_vlan_replies {}'.format(port_vlan_replies))
+            logger.debug('port_vlan_replies %s', port_vlan_replies)
             self.vlans = list(set(self.vlans) - set(vlan_ids))
             return True
         except Exception:
@@ -200,14 +206,14 @@ class Mellanox(Switch):
                     please consider to switch the mode to HYBRID')
             node_template = '/mlnxos/v1/vsr/vsr-default/interfaces/' + port.index + '/vlans/pvid={}'
             port_vlan_requests = create_multinode_request(node_template, [vlan_id], request_type='action')
-            logger.debug('port_vlan_requests {}'.format(port_vlan_requests))
+            logger.debug('port_vlan_requests %s', port_vlan_requests)
             try:
                 port_vlan_replies = self._sbi_xml_driver.multi_post(port_vlan_requests)
-                logger.debug('port_vlan_replies {}'.format(port_vlan_replies))
+                logger.debug('port_vlan_replies %s', port_vlan_replies)
                 port.access_vlan = vlan_id
                 return True
             except Exception:
-                logger.error('problems in adding access vlan on Port {}'.format(port.name))
+                logger.error('problems in adding access vlan on Port %s', port.name)
                 return False
         else:
             if port.mode == 'ACCESS':
@@ -215,14 +221,14 @@ class Mellanox(Switch):
                                     please consider to switch the mode to TRUNK/HYBRID')
             node_template = '/mlnxos/v1/vsr/vsr-default/interfaces/' + port.index + '/vlans/allowed/add|vlan_ids={}'
             port_vlan_requests = create_multinode_request(node_template, [vlan_id], request_type='action')
-            logger.debug('port_vlan_requests {}'.format(port_vlan_requests))
+            logger.debug('port_vlan_requests %s', port_vlan_requests)
             try:
                 port_vlan_replies = self._sbi_xml_driver.multi_post(port_vlan_requests)
-                logger.debug('port_vlan_replies {}'.format(port_vlan_replies))
+                logger.debug('port_vlan_replies %s', port_vlan_replies)
                 port.trunk_vlans.append(vlan_id)
                 return True
             except Exception:
-                logger.error('problems in adding tagged vlan on Port {}'.format(port.name))
+                logger.error('problems in adding tagged vlan on Port %s', port.name)
                 return False
 
     def _del_vlan_to_port(self, vlan_ids: List[int], port: PhyPort) -> bool:
@@ -233,14 +239,14 @@ class Mellanox(Switch):
         for vid in vlan_ids:
             node_template = node_template + "|vlan_ids={}".format(vid)
         port_vlan_requests = create_multinode_request(node_template, [port.index], request_type='action')
-        logger.debug('port_vlan_requests {}'.format(port_vlan_requests))
+        logger.debug('port_vlan_requests %s', port_vlan_requests)
         try:
             port_vlan_replies = self._sbi_xml_driver.multi_post(port_vlan_requests)
-            logger.debug('port_vlan_replies {}'.format(port_vlan_replies))
+            logger.debug('port_vlan_replies %s', port_vlan_replies)
             port.trunk_vlans = list(set(port.trunk_vlans) - set(vlan_ids))
             return True
         except Exception:
-            logger.error('problems in adding tagged vlan on Port {}'.format(port.name))
+            logger.error('problems in adding tagged vlan on Port %s', port.name)
             return False
 
     def _del_vlan_itf(self, vlan_id: int):
@@ -249,14 +255,14 @@ class Mellanox(Switch):
     def _set_port_mode(self, port: PhyPort, port_mode: Literal['ACCESS', 'HYBRID', 'TRUNK']) -> bool:
         node_template = '/mlnxos/v1/vsr/vsr-default/interfaces/{}' + '/vlans/mode={}'.format(port_mode.lower())
         port_vlan_requests = create_multinode_request(node_template, [port.index], request_type='action')
-        logger.debug('port_vlan_requests {}'.format(port_vlan_requests))
+        logger.debug('port_vlan_requests %s', port_vlan_requests)
         try:
             port_vlan_replies = self._sbi_xml_driver.multi_post(port_vlan_requests)
-            logger.debug('port_vlan_replies {}'.format(port_vlan_replies))
+            logger.debug('port_vlan_replies %s', port_vlan_replies)
             port.mode = port_mode
             return True
         except Exception:
-            logger.error('problems in adding access vlan on Port {}'.format(port.name))
+            logger.error('problems in adding access vlan on Port %s', port.name)
             return False
 
     def _bind_vrf(self, vrf1: Vrf, vrf2: Vrf) -> bool:
@@ -1,10 +1,14 @@
+import requests
 from sbi.routeros import RosRestSbi
 from sbi.netmiko import NetmikoSbi
 from .switch_base import Switch
 from models import LldpNeighbor, PhyPort, VlanL3Port, Vrf, SwitchRequestVlanL3Port
+from .routeros_bridge import BridgeVlanTable, BridgeRowOp
 from ipaddress import IPv4Network, IPv4Interface
 from utils import create_logger
-from typing import List, Literal
+from utils.metrics import timed_refresh_phase
+from typing import List, Literal, Dict, Union
+from pydantic import PrivateAttr
 
 logger = create_logger('microtik')
 default_switch_name = 'tnt'
@@ -14,6 +18,10 @@ dummy_vrf_name = 'proj'
 class Microtik(Switch):
     _sbi_rest_driver: RosRestSbi = None
     _sbi_ssh_driver: NetmikoSbi = None
+    # cached bridge vlan table and bridge port rows (keyed by interface name), read at each refresh and kept aligned
+    # with the applied changes. They are read again from the device only if a write fails
+    _bridge_table: Union[BridgeVlanTable, None] = PrivateAttr(default=None)
+    _bridge_ports: Dict[str, Dict] = PrivateAttr(default_factory=dict)
 
     def _update_info(self):
         self.retrieve_ports()
@@ -43,19 +51,21 @@ class Microtik(Switch):
 
         print(self.model_dump())
 
+    @timed_refresh_phase('config')
     def retrieve_config(self) -> None:
-        _config = self._sbi_ssh_driver.get_info("export")
-        res = "{}".join(_config.split("\n")[1:])  # removing first lince since it contain the date of exporting
-        self.store_config(res)
+        lines = self._sbi_ssh_driver.get_info_lines("export")
+        next(lines, None)  # removing first line since it contains the date of exporting
+        self.store_config('\n'.join(lines))
 
+    @timed_refresh_phase('lldp')
     def retrieve_neighbors(self):
-        neighbours = self._sbi_rest_driver.get('ip/neighbor')
+        neighbours = self._sbi_rest_driver.get('/ip/neighbor')
         for neigh in neighbours:
             if 'interface' in neigh:
                 for i_name in neigh['interface'].split(','):
-                    port = next((item for item in self.phy_ports if item.name == i_name), None)
+                    port = self.lookup('phy_ports', 'name', i_name)
                     if not port:
-                        logger.warning("[lldp neigh] interface {} not found".format(i_name))
+                        logger.warning("[lldp neigh] interface %s not found", i_name)
                         continue
                     if 'identity' in neigh:
                         port.neighbor = LldpNeighbor(
@@ -73,28 +83,21 @@ class Microtik(Switch):
             ports=self.vlan_l3_ports
         )]
 
+    @timed_refresh_phase('vlans')
     def retrieve_vlans(self):
-        res = self._sbi_rest_driver.get('interface/bridge/vlan?bridge={}'.format(default_switch_name))
-        for item in res:
-            vlans_in_row = item["vlan-ids"].split(',')
-            for vlan_id in vlans_in_row:
-                if int(vlan_id) not in self.vlans:
-                    self.vlans.append(int(vlan_id))
-            for _port_name in item['tagged'].split(','):
-                port = next((p for p in self.phy_ports if p.name == _port_name), None)
-                if not port:
-                    logger.warning('port {} not found while retrieving vlans {}'.format(_port_name, vlans_in_row))
-                    continue
-                for vlan_id in vlans_in_row:
-                    port.trunk_vlans.append(vlan_id)
+        table = self._load_bridge_table()
+        self.vlans = table.get_vlans()
+        for port in self.phy_ports:
+            port.trunk_vlans = table.get_tagged_vlans(port.name)
 
+    @timed_refresh_phase('ports')
     def retrieve_ports(self):
-        res = self._sbi_rest_driver.get('interface?type=ether')
+        res = self._sbi_rest_driver.get('/interface?type=ether')
         logger.warning(res)
         for item in res:
             logger.warning(item)
             ports_data = self._sbi_rest_driver.post(
-                'interface/ethernet/monitor',
+                '/interface/ethernet/monitor',
                 {"once": "1", "numbers": "{}".format(item['.id'])}
             )
             port_data = next(p for p in ports_data if p['name'] == item['name'])
@@ -127,10 +130,14 @@ class Microtik(Switch):
                 )
             )
 
+    @timed_refresh_phase('port_vlans')
     def retrieve_port_vlan(self) -> None:
-        vlan_port_data = self._sbi_rest_driver.get("interface/bridge/port")
+        vlan_port_data = self._sbi_rest_driver.get('/interface/bridge/port')
+        self._bridge_ports = {item['interface']: item for item in vlan_port_data}
         for port in vlan_port_data:
-            phy_port = next(item for item in self.phy_ports if item.name == port['interface'])
+            phy_port = self.lookup('phy_ports', 'name', port['interface'])
+            if not phy_port:
+                continue
             phy_port.access_vlan = port['pvid'] if 'pvid' in port else None
             if 'frame-types' in port:
                 match port['frame-types']:
@@ -141,9 +148,10 @@ class Microtik(Switch):
                     case 'admit-only-vlan-tagged':
                         phy_port.mode = 'TRUNK'
 
+    @timed_refresh_phase('vlan_interfaces')
     def retrieve_vlan_interfaces(self) -> None:
-        vlan_itf_data = self._sbi_rest_driver.get("interface/vlan")
-        itf_ips = self._sbi_rest_driver.get("ip/address")
+        vlan_itf_data = self._sbi_rest_driver.get("/interface/vlan")
+        itf_ips = self._sbi_rest_driver.get("/ip/address")
         for itf in vlan_itf_data:
             if itf['interface'] == default_switch_name:
                 # it is a vlan interface on the managed bridge
@@ -169,95 +177,90 @@ class Microtik(Switch):
                     )
                 )
 
+    def _load_bridge_table(self) -> BridgeVlanTable:
+        if not self._bridge_table:
+            self._bridge_table = BridgeVlanTable(default_switch_name)
+        self._bridge_table.load(
+            self._sbi_rest_driver.get('/interface/bridge/vlan?bridge={}'.format(default_switch_name)))
+        return self._bridge_table
+
+    def _get_bridge_table(self) -> BridgeVlanTable:
+        if not self._bridge_table:
+            return self._load_bridge_table()
+        return self._bridge_table
+
+    def _commit_bridge_table(self, ports: List[PhyPort] = []) -> None:
+        table = self._get_bridge_table()
+        ops = table.plan()
+        logger.debug('bridge vlan table version %s: applying %s', table.version, ops)
+        try:
+            for op in ops:
+                res = self._apply_bridge_op(op)
+                table.applied(op, res)
+        except Exception:
+            logger.error('bridge vlan table update failed, reading it again from switch %s', self.name)
+            self._load_bridge_table()
+            raise
+        table.committed()
+        self.vlans = table.get_vlans()
+        for port in ports:
+            port.trunk_vlans = table.get_tagged_vlans(port.name)
+
+    def _apply_bridge_op(self, op: BridgeRowOp) -> Union[Dict, None]:
+        match op.method:
+            case 'put':
+                return self._sbi_rest_driver.put('/interface/bridge/vlan', op.data)
+            case 'patch':
+                return self._sbi_rest_driver.patch('/interface/bridge/vlan/{}'.format(op.row_id), op.data)
+            case 'delete':
+                self._sbi_rest_driver.delete('/interface/bridge/vlan/{}'.format(op.row_id))
+                return None
+
     def _add_vlan(self, vlan_ids: List[int]):
+        table = self._get_bridge_table()
         for _id in vlan_ids:
-            data = {
-                'vlan-ids': _id,
-                'bridge': default_switch_name,
-                'tagged': default_switch_name
-            }
-            self._sbi_rest_driver.put('/interface/bridge/vlan', data)
+            table.add_vlan(_id, tagged=[default_switch_name])
+        self._commit_bridge_table()
 
     def _del_vlan(self, vlan_ids: List[int]):
-        vlan_table = self._sbi_rest_driver.get('/interface/bridge/vlan?bridge={}'.format(default_switch_name))
+        table = self._get_bridge_table()
         for vlan_id in vlan_ids:
-            row = next((item for item in vlan_table if str(vlan_id) in item['vlan-ids'].split(',')), None)
-            if row:
-                row_vlan_ids = row['vlan-ids'].split(',')
-                if len(row_vlan_ids) == 1:
-                    self._sbi_rest_driver.delete('/interface/bridge/vlan/{}'.format(row['.id']))
-                else:
-                    logger.debug('this row contains more than one vlans')
-                    data = {'vlan-ids': ','.join(filter(lambda v: v != str(vlan_id), row_vlan_ids))}
-                    self._sbi_rest_driver.patch('/interface/bridge/vlan/{}'.format(row['.id']), data)
-            else:
-                logger.warn('vlan {} not existing'.format(vlan_id))
+            if not table.has_vlan(vlan_id):
+                logger.warning('vlan %s not existing', vlan_id)
+            table.del_vlan(vlan_id)
+        self._commit_bridge_table()
 
     def _add_vlan_to_port(self, vlan_id: int, port: PhyPort, pvid: bool = False):
-        row = self._get_vlan_row(vlan_id)
-
-        row_vlan_ids = row['vlan-ids'].split(',')
-        untagged_ports = row['untagged'].split(',')
-        tagged_ports = row['tagged'].split(',')
-
-        if len(row_vlan_ids) > 1:
-            # in this case, the old row should be updated without the vlan_id, and a new row should be added
-            row_to_update = {'vlan_ids': ",".join(filter(lambda x: str(x) != str(vlan_id), row_vlan_ids))}
-            self._sbi_rest_driver.patch('/interface/bridge/vlan/{}'.format(row['.id']), row_to_update)
-
-        if pvid:
-            if port.name in tagged_ports:
-                raise ValueError('delete vlan {} from tagged set of port {} before adding as untagged'.format(
-                    vlan_id, port.name))
-            untagged_ports.append(port.name)
-            data = {'untagged': ','.join(untagged_ports)}
-        else:
-            if port.name in untagged_ports:
-                raise ValueError('delete vlan {} from untagged set of port {} before adding as tagged'.format(
-                    vlan_id, port.name))
-            tagged_ports.append(port.name)
-            data = {'tagged': ','.join(tagged_ports)}
-
-        if len(row_vlan_ids) > 1:
-            # create a new row only for the vlan id under elaboration
-            data['vlan_ids'] = vlan_id
-            self._sbi_rest_driver.put('/interface/bridge/vlan', data)
-        else:
-            self._sbi_rest_driver.patch('/interface/bridge/vlan/{}'.format(row['.id']), data)
+        table = self._get_bridge_table()
+        try:
+            table.add_port(vlan_id, port.name, untagged=pvid)
+        except ValueError:
+            table.discard_pending()
+            raise
+        self._commit_bridge_table([port])
+
+    def _add_vlans_to_port(self, vlan_ids: List[int], port: PhyPort) -> bool:
+        table = self._get_bridge_table()
+        try:
+            for vlan_id in vlan_ids:
+                table.add_port(vlan_id, port.name)
+        except ValueError:
+            table.discard_pending()
+            raise
+        self._commit_bridge_table([port])
+        return True
 
     def _del_vlan_to_port(self, vlan_ids: List[int], port: PhyPort):
-        vlan_table = self._sbi_rest_driver.get('/interface/bridge/vlan?bridge={}'.format(default_switch_name))
-        for vlan_id in vlan_ids:
-            row = next((item for item in vlan_table if str(vlan_id) in item['vlan-ids'].split(',')), None)
-
-            if not row:
-                raise ValueError('vlan {} not declared'.format(vlan_id))
-
-            row_vlan_ids = row['vlan-ids'].split(',')
-            untagged_ports = row['untagged'].split(',')
-            tagged_ports = row['tagged'].split(',')
-
-            if len(row_vlan_ids) == 1:
-                # in this case we can simply patch row
-                updated_row = dict()
-                updated_row['tagged'] = ','.join(filter(lambda x: x != port.name, tagged_ports))
-                updated_row['untagged'] = ','.join(filter(lambda x: x != port.name, untagged_ports))
-                self._sbi_rest_driver.patch('/interface/bridge/vlan/{}'.format(row['.id']), updated_row)
-            else:
-                # in this case we should remove the vlan from the row, and add a new row with only that vlan and the
-                # remaining ports
-                data = {'vlan-ids': ','.join(filter(lambda x: str(x) != str(vlan_id), row_vlan_ids))}
-                self._sbi_rest_driver.patch('/interface/bridge/vlan/{}'.format(row['.id']), data)
-                vlan_row = dict(row)
-                vlan_row['vlan-ids'] = vlan_id
-                vlan_row['tagged'] = ','.join(filter(lambda x: x != port.name, tagged_ports))
-                vlan_row['untagged'] = ','.join(filter(lambda x: x != port.name, untagged_ports))
-                vlan_row.pop('.id')
-                self._sbi_rest_driver.put('/interface/bridge/vlan', vlan_row)
+        table = self._get_bridge_table()
+        try:
+            for vlan_id in vlan_ids:
+                table.del_port(vlan_id, port.name)
+        except ValueError:
+            table.discard_pending()
+            raise
+        self._commit_bridge_table([port])
 
     def _set_port_mode(self, port: PhyPort, port_mode: Literal['ACCESS', 'HYBRID', 'TRUNK']):
-        port_table = self._sbi_rest_driver.get('/interface/bridge/port')
-        port_row = next(item for item in port_table if item['interface'] == port.name)
         data = {}
         match port_mode:
             case 'ACCESS':
@@ -267,8 +270,23 @@ class Microtik(Switch):
             case 'TRUNK':
                 data['frame-types'] = 'admit-only-vlan-tagged'
 
+        port_row = self._bridge_ports.get(port.name)
+        try:
+            if not port_row:
+                raise ValueError('bridge port {} not cached'.format(port.name))
+            self._sbi_rest_driver.patch('/interface/bridge/port/{}'.format(port_row['.id']), data)
+        except (ValueError, requests.RequestException) as e:
+            # stale or missing cache: the bridge port table is read again and the write retried once
+            logger.warning('switch %s: setting the mode of bridge port %s failed (%s), reading the bridge ports again',
+                           self.name, port.name, e)
+            self._bridge_ports = {
+                item['interface']: item for item in self._sbi_rest_driver.get('/interface/bridge/port')}
+            port_row = self._bridge_ports.get(port.name)
+            if not port_row:
+                raise ValueError('port {} is not a bridge port of switch {}'.format(port.name, self.name)) from e
+            self._sbi_rest_driver.patch('/interface/bridge/port/{}'.format(port_row['.id']), data)
+        port_row.update(data)
         port.mode = port_mode
-        self._sbi_rest_driver.patch('interface/bridge/port/{}'.format(port_row['.id']), data)
 
     def _bind_vrf(self, vrf1: Vrf, vrf2: Vrf) -> bool:
         logger.warning('VRF not supported in this switch model')
@@ -278,24 +296,17 @@ class Microtik(Switch):
         logger.warning('VRF not supported in this switch model')
         return False
 
-    def _get_vlan_row(self, vid: int) -> dict:
-        vlan_table = self._sbi_rest_driver.get('/interface/bridge/vlan?bridge={}'.format(default_switch_name))
-        vlan_row = next((item for item in vlan_table if str(vid) in item['vlan-ids'].split(',')), None)
-        if not vlan_row:
-            raise ValueError('vlan {} not existing'.format(vid))
-        return vlan_row
-
     def _add_vlan_to_vrf(self, vrf: Vrf, vlan_interface: SwitchRequestVlanL3Port) -> bool:
         # create a vlan L3 interface and associate it to the dummy vrf
 
         # as first, we need to assure that the vlan id is enabled as trunk in the default bridge
-        vlan_row = self._get_vlan_row(vlan_interface.vlan)
-
-        bridge_tagged = vlan_row['tagged'].split(',')
-        if default_switch_name not in bridge_tagged:
-            bridge_tagged.append(default_switch_name)
-            data = {'tagged': ','.join(bridge_tagged)}
-            self._sbi_rest_driver.patch('/interface/bridge/vlan/{}'.format(vlan_row['.id']), data)
+        table = self._get_bridge_table()
+        membership = table.get_membership(vlan_interface.vlan)
+        if membership is None:
+            raise ValueError('vlan {} not existing'.format(vlan_interface.vlan))
+        if default_switch_name not in membership[0]:
+            table.add_port(vlan_interface.vlan, default_switch_name)
+            self._commit_bridge_table()
 
         # now we can create the vlan interface
         data = {
@@ -331,22 +342,10 @@ class Microtik(Switch):
             self._sbi_rest_driver.delete('/interface/vlan/{}'.format(vlan_itf_row['.id']))
 
         # finally remove bridge interface from tagged list
-        vlan_row = self._get_vlan_row(vlan_interface.vlan)
-        vlans_in_row = vlan_row['vlan-ids'].split(',')
-        tagged_itf = vlan_row['tagged'].split(',')
-        if len(vlans_in_row) > 1:
-            # remove vlan id from the original row if the row includes multiple vlans
-            data = {'vlan-ids': ','.join(filter(lambda x: x != str(vlan_interface.vlan), vlans_in_row))}
-            self._sbi_rest_driver.patch('/interface/bridge/vlan/{}'.format(vlan_row['.id']), data)
-            # now add a row for the vlan under elaboration
-            vlan_row['vlan-ids'] = vlan_interface.vlan
-            vlan_row['tagged'] = ','.join(filter(lambda x: x != default_switch_name, tagged_itf))
-            vlan_row.pop('.id')
-            self._sbi_rest_driver.put('/interface/bridge/vlan', vlan_row)
-        else:
-            # patch the vlan row to remove the default bridge from tagged
-            # data = {'tagged': ','.join(filter(lambda x: x != default_switch_name, tagged_itf))}
-            self._sbi_rest_driver.delete('/interface/bridge/vlan/{}'.format(vlan_row['.id']))
+        table = self._get_bridge_table()
+        if table.has_vlan(vlan_interface.vlan):
+            table.del_port(vlan_interface.vlan, default_switch_name)
+            self._commit_bridge_table()
 
     def commit_and_save(self):
         pass
@@ -0,0 +1,210 @@
+# Cached model of the RouterOS bridge VLAN table (/interface/bridge/vlan). Changes for a batch of vlans and ports are
+# applied to a desired per-vlan membership, then translated into the minimal set of row operations (PATCH of the
+# existing rows, PUT of new rows, DELETE of emptied rows)
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Set, Tuple, Union
+
+
+class BridgeRowOp(NamedTuple):
+    # method is one of 'put', 'patch' and 'delete'; row_id is None for 'put'
+    method: str
+    row_id: Union[str, None]
+    data: Dict[str, str]
+
+
+# (tagged ports, untagged ports) of a vlan
+Membership = Tuple[FrozenSet[str], FrozenSet[str]]
+
+
+def parse_vlan_ids(value: str) -> List[int]:
+    # RouterOS accepts both single ids and ranges, e.g. '10,20-25'
+    res = []
+    for item in str(value).split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '-' in item:
+            start, end = item.split('-', 1)
+            res.extend(range(int(start), int(end) + 1))
+        else:
+            res.append(int(item))
+    return res
+
+
+def format_vlan_ids(vids: Iterable[int]) -> str:
+    return ','.join(str(vid) for vid in sorted(vids))
+
+
+def _split(value: str) -> FrozenSet[str]:
+    return frozenset(item for item in str(value).split(',') if item) if value else frozenset()
+
+
+def _join(ports: Iterable[str]) -> str:
+    return ','.join(sorted(ports))
+
+
+class BridgeVlanTable:
+    def __init__(self, bridge: str):
+        self.bridge = bridge
+        # incremented at each load and at each applied batch
+        self.version = 0
+        self._rows: Dict[str, Dict] = {}
+        self._vids: Dict[str, Set[int]] = {}
+        self._membership: Dict[str, Membership] = {}
+        self._row_by_vid: Dict[int, str] = {}
+        # desired membership of the vlans modified since the last commit, None for deleted vlans
+        self._pending: Dict[int, Union[Membership, None]] = {}
+
+    def load(self, rows: List[Dict]) -> None:
+        self._rows = {}
+        self._vids = {}
+        self._membership = {}
+        self._row_by_vid = {}
+        self._pending = {}
+        for row in rows:
+            self._set_row(row['.id'], row)
+        self.version += 1
+
+    def _set_row(self, row_id: str, row: Dict) -> None:
+        self._rows[row_id] = row
+        self._vids[row_id] = set(parse_vlan_ids(row.get('vlan-ids', '')))
+        self._membership[row_id] = (_split(row.get('tagged', '')), _split(row.get('untagged', '')))
+        for vid in self._vids[row_id]:
+            self._row_by_vid[vid] = row_id
+
+    def _drop_row(self, row_id: str) -> None:
+        for vid in self._vids.pop(row_id, set()):
+            if self._row_by_vid.get(vid) == row_id:
+                self._row_by_vid.pop(vid)
+        self._rows.pop(row_id, None)
+        self._membership.pop(row_id, None)
+
+    # read access, including the pending changes
+    def get_vlans(self) -> List[int]:
+        vids = set(self._row_by_vid.keys())
+        for vid, membership in self._pending.items():
+            if membership is None:
+                vids.discard(vid)
+            else:
+                vids.add(vid)
+        return sorted(vids)
+
+    def has_vlan(self, vid: int) -> bool:
+        return self.get_membership(vid) is not None
+
+    def get_membership(self, vid: int) -> Union[Membership, None]:
+        if vid in self._pending:
+            return self._pending[vid]
+        row_id = self._row_by_vid.get(vid)
+        return self._membership[row_id] if row_id else None
+
+    def get_tagged_vlans(self, port_name: str) -> List[int]:
+        return [vid for vid in self.get_vlans() if port_name in self.get_membership(vid)[0]]
+
+    # changes, kept pending until commit
+    def add_vlan(self, vid: int, tagged: Iterable[str] = ()) -> None:
+        if not self.has_vlan(vid):
+            self._pending[vid] = (frozenset(tagged), frozenset())
+
+    def del_vlan(self, vid: int) -> None:
+        if self.has_vlan(vid):
+            self._pending[vid] = None
+
+    def add_port(self, vid: int, port_name: str, untagged: bool = False) -> None:
+        membership = self.get_membership(vid)
+        if membership is None:
+            raise ValueError('vlan {} not existing'.format(vid))
+        tagged, untagged_ports = membership
+        if untagged:
+            if port_name in tagged:
+                raise ValueError('delete vlan {} from tagged set of port {} before adding as untagged'.format(
+                    vid, port_name))
+            untagged_ports = untagged_ports | {port_name}
+        else:
+            if port_name in untagged_ports:
+                raise ValueError('delete vlan {} from untagged set of port {} before adding as tagged'.format(
+                    vid, port_name))
+            tagged = tagged | {port_name}
+        self._pending[vid] = (tagged, untagged_ports)
+
+    def del_port(self, vid: int, port_name: str) -> None:
+        membership = self.get_membership(vid)
+        if membership is None:
+            raise ValueError('vlan {} not declared'.format(vid))
+        self._pending[vid] = (membership[0] - {port_name}, membership[1] - {port_name})
+
+    def discard_pending(self) -> None:
+        self._pending = {}
+
+    def plan(self) -> List[BridgeRowOp]:
+        # minimal row operations moving the table to the desired state: vlans whose membership is unchanged stay in
+        # their row, the others are merged into a row with the same membership, reusing rows left empty before
+        # creating new ones
+        moving: Dict[Membership, Set[int]] = {}
+        new_vids: Dict[str, Set[int]] = {}
+        for vid, membership in self._pending.items():
+            row_id = self._row_by_vid.get(vid)
+            if row_id and membership == self._membership[row_id]:
+                continue
+            if row_id:
+                new_vids.setdefault(row_id, set(self._vids[row_id])).discard(vid)
+            if membership is not None:
+                moving.setdefault(membership, set()).add(vid)
+
+        new_membership: Dict[str, Membership] = {}
+        by_membership = {}
+        for row_id, membership in self._membership.items():
+            if new_vids.get(row_id, self._vids[row_id]):
+                by_membership.setdefault(membership, row_id)
+        free_rows = [row_id for row_id, vids in new_vids.items() if not vids]
+
+        # operations are ordered so that a vlan is never declared in two rows at the same time: deletions, rows
+        # losing vlans, reused rows, rows gaining vlans and finally new rows
+        deletes, shrinks, reused, grows, puts = [], [], [], [], []
+        for membership, vids in moving.items():
+            row_id = by_membership.get(membership)
+            if not row_id and free_rows:
+                row_id = free_rows.pop(0)
+                new_membership[row_id] = membership
+            if row_id:
+                new_vids[row_id] = new_vids.get(row_id, set(self._vids[row_id])) | vids
+            else:
+                puts.append(BridgeRowOp('put', None, {
+                    'bridge': self.bridge, 'vlan-ids': format_vlan_ids(vids),
+                    'tagged': _join(membership[0]), 'untagged': _join(membership[1])}))
+        for row_id, vids in new_vids.items():
+            old_vids = self._vids[row_id]
+            if not vids:
+                deletes.append(BridgeRowOp('delete', row_id, {}))
+            elif row_id in new_membership:
+                membership = new_membership[row_id]
+                reused.append(BridgeRowOp('patch', row_id, {
+                    'vlan-ids': format_vlan_ids(vids), 'tagged': _join(membership[0]),
+                    'untagged': _join(membership[1])}))
+            elif vids != old_vids:
+                if old_vids - vids:
+                    shrinks.append(BridgeRowOp('patch', row_id, {'vlan-ids': format_vlan_ids(old_vids & vids)}))
+                if vids - old_vids:
+                    grows.append(BridgeRowOp('patch', row_id, {'vlan-ids': format_vlan_ids(vids)}))
+        return deletes + shrinks + reused + grows + puts
+
+    def applied(self, op: BridgeRowOp, result: Union[Dict, None] = None) -> None:
+        # updates the cache after an operation has been accepted by the device
+        if op.method == 'delete':
+            self._drop_row(op.row_id)
+            return
+        if op.method == 'patch':
+            row = dict(self._rows[op.row_id])
+            row.update(op.data)
+            self._drop_row(op.row_id)
+            self._set_row(op.row_id, row)
+            return
+        row = dict(result) if isinstance(result, dict) and '.id' in result else None
+        if row is None:
+            # the created row id is unknown, the table has to be read again
+            raise ValueError('RouterOS did not return the created bridge vlan row')
+        row.update({key: value for key, value in op.data.items() if key not in row})
+        self._set_row(row['.id'], row)
+
+    def committed(self) -> None:
+        self._pending = {}
+        self.version += 1
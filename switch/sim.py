@@ -0,0 +1,335 @@
+import json
+import random
+import threading
+import time
+from typing import Callable, ClassVar, Dict, List, Union
+
+from pydantic import BaseModel, PrivateAttr
+
+from models import LinkModes, LldpNeighbor, PhyPort, SwitchRequestVlanL3Port, VlanL3Port, Vrf, VrfRequest, IpV4Route, \
+    RoutingProtocols, StaticRoutingProtocol
+from netdevice import Device
+from utils import create_logger
+from .switch_base import Switch, SwitchNotConnectedException, SwitchConfigurationException
+
+logger = create_logger('sim')
+
+
+class SimDeviceState(BaseModel):
+    # in-memory state of a simulated device, shared by all the SimSwitch objects with the same name, plus the
+    # latency and the failures injected in each driver call
+    phy_ports: List[PhyPort] = []
+    vlans: List[int] = []
+    vlan_l3_ports: List[VlanL3Port] = []
+    vrfs: List[Vrf] = []
+    # seconds added to each call, plus a uniformly distributed random jitter
+    latency: float = 0.0
+    jitter: float = 0.0
+    # probability of failure of each call, and driver operations always failing (e.g. '_add_vlan')
+    failure_rate: float = 0.0
+    failing_operations: List[str] = []
+    unreachable: bool = False
+    # number of calls per operation
+    calls: Dict[str, int] = {}
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def call(self, operation: str, device_name: str) -> None:
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+        wait = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if wait > 0:
+            time.sleep(wait)
+        if self.unreachable:
+            raise SwitchNotConnectedException()
+        if operation in self.failing_operations or (self.failure_rate and random.random() < self.failure_rate):
+            raise SwitchConfigurationException('simulated failure of {} on switch {}'.format(operation, device_name))
+
+    def get_port(self, port_name: str) -> PhyPort:
+        port = next((item for item in self.phy_ports if item.name == port_name), None)
+        if not port:
+            raise SwitchConfigurationException('port {} not found'.format(port_name))
+        return port
+
+    def get_vrf(self, vrf_name: str) -> Vrf:
+        vrf = next((item for item in self.vrfs if item.name == vrf_name), None)
+        if not vrf:
+            raise SwitchConfigurationException('vrf {} not found'.format(vrf_name))
+        return vrf
+
+
+_sim_devices: Dict[str, SimDeviceState] = {}
+_sim_devices_lock = threading.Lock()
+
+
+def register_sim_device(name: str, state: SimDeviceState) -> SimDeviceState:
+    with _sim_devices_lock:
+        _sim_devices[name] = state
+    return state
+
+
+def get_sim_device(name: str) -> Union[SimDeviceState, None]:
+    with _sim_devices_lock:
+        return _sim_devices.get(name)
+
+
+def clear_sim_devices() -> None:
+    with _sim_devices_lock:
+        _sim_devices.clear()
+
+
+class SimSwitch(Switch):
+    # switch without hardware: each driver operation is applied to the in-memory state registered with the switch
+    # name. Switches not registered (e.g. reloaded from the database in a new process) start from their stored data,
+    # or with default_ports unconnected ports if they have none
+    _device: Union[SimDeviceState, None] = PrivateAttr(default=None)
+    default_ports: ClassVar[int] = 48
+
+    def _reinit_sbi_drivers(self) -> None:
+        device = get_sim_device(self.name)
+        if not device:
+            device = SimDeviceState(
+                phy_ports=[item.model_copy(deep=True) for item in self.phy_ports] or [
+                    PhyPort(index='Ethernet{}'.format(i), name='Ethernet{}'.format(i), trunk_vlans=[],
+                            mode=LinkModes.trunk, speed=100000, status='UP', admin_status='ENABLED')
+                    for i in range(self.default_ports)],
+                vlans=list(self.vlans),
+                vlan_l3_ports=[item.model_copy(deep=True) for item in self.vlan_l3_ports],
+                vrfs=[item.model_copy(deep=True) for item in self.vrfs]
+            )
+            device = register_sim_device(self.name, device)
+        with device._lock:
+            device.call('connect', self.name)
+        self._device = device
+
+    def _retrieve_info(self):
+        self.reinit_sbi_drivers()
+        self.update_info()
+
+    def _update_info(self):
+        device = self._device
+        with device._lock:
+            device.call('refresh', self.name)
+            self.phy_ports = [item.model_copy(deep=True) for item in device.phy_ports]
+            self.vlans = list(device.vlans)
+            self.vlan_l3_ports = [item.model_copy(deep=True) for item in device.vlan_l3_ports]
+            self.vrfs = [item.model_copy(deep=True) for item in device.vrfs]
+        # the vrf ports are the same objects as the vlan interfaces, as built by the other drivers
+        vlan_l3_ports = {item.vlan: item for item in self.vlan_l3_ports}
+        for vrf in self.vrfs:
+            vrf.ports = [vlan_l3_ports.get(item.vlan, item) for item in vrf.ports]
+        self.store_config(json.dumps({
+            'vlans': self.vlans,
+            'ports': [item.model_dump(mode='json', exclude={'neighbor', 'status', 'speed'}) for item in self.phy_ports],
+            'vrfs': [item.model_dump(mode='json') for item in self.vrfs]
+        }))
+
+    def _apply(self, operation: str, change: Callable[[SimDeviceState], None]) -> bool:
+        # the change is applied to the device state under its lock; the switch data are updated by the caller
+        if not self._device:
+            raise SwitchNotConnectedException()
+        with self._device._lock:
+            self._device.call(operation, self.name)
+            change(self._device)
+        return True
+
+    def commit_and_save(self):
+        self._apply('commit_and_save', lambda device: None)
+
+    def _add_vlan(self, vlan_ids: List[int]):
+        new_vlans = [vid for vid in dict.fromkeys(vlan_ids) if vid not in self.vlans]
+
+        def change(device: SimDeviceState):
+            device.vlans.extend(vid for vid in new_vlans if vid not in device.vlans)
+
+        self._apply('_add_vlan', change)
+        self.vlans.extend(new_vlans)
+        return True
+
+    def _del_vlan(self, vlan_ids: List[int]):
+        removed = set(vlan_ids)
+
+        def change(device: SimDeviceState):
+            device.vlans = [vid for vid in device.vlans if vid not in removed]
+            for port in device.phy_ports:
+                port.trunk_vlans = [vid for vid in port.trunk_vlans if vid not in removed]
+
+        self._apply('_del_vlan', change)
+        self.vlans = [vid for vid in self.vlans if vid not in removed]
+        for port in self.phy_ports:
+            port.trunk_vlans = [vid for vid in port.trunk_vlans if vid not in removed]
+        return True
+
+    def _set_port_mode(self, port: PhyPort, port_mode: LinkModes) -> bool:
+        self._apply('_set_port_mode', lambda device: setattr(device.get_port(port.name), 'mode', port_mode))
+        port.mode = port_mode
+        return True
+
+    def _add_vlan_to_port(self, vlan_id: int, port: PhyPort, pvid: bool = False) -> bool:
+        if pvid:
+            self._apply('_add_vlan_to_port', lambda device: setattr(device.get_port(port.name), 'access_vlan', vlan_id))
+            port.access_vlan = vlan_id
+            return True
+        return self._add_vlans_to_port([vlan_id], port)
+
+    def _add_vlans_to_port(self, vlan_ids: List[int], port: PhyPort) -> bool:
+        def change(device: SimDeviceState):
+            device_port = device.get_port(port.name)
+            device_port.trunk_vlans.extend(vid for vid in vlan_ids if vid not in device_port.trunk_vlans)
+
+        self._apply('_add_vlans_to_port', change)
+        port.trunk_vlans.extend(vid for vid in vlan_ids if vid not in port.trunk_vlans)
+        return True
+
+    def _del_vlan_to_port(self, vlan_ids: List[int], port: PhyPort) -> bool:
+        removed = set(vlan_ids)
+
+        def change(device: SimDeviceState):
+            device_port = device.get_port(port.name)
+            device_port.trunk_vlans = [vid for vid in device_port.trunk_vlans if vid not in removed]
+            if device_port.access_vlan in removed:
+                device_port.access_vlan = None
+
+        self._apply('_del_vlan_to_port', change)
+        port.trunk_vlans = [vid for vid in port.trunk_vlans if vid not in removed]
+        if port.access_vlan in removed:
+            port.access_vlan = None
+        return True
+
+    @staticmethod
+    def _set_binding(vrfs: List[Vrf], vrf1_name: str, vrf2_name: str, bound: bool) -> None:
+        vrf1 = next(item for item in vrfs if item.name == vrf1_name)
+        vrf2 = next(item for item in vrfs if item.name == vrf2_name)
+        for vrf, other in [(vrf1, vrf2), (vrf2, vrf1)]:
+            if bound:
+                if other.rd not in vrf.rd_import:
+                    vrf.rd_import.append(other.rd)
+                if other.rd not in vrf.rd_export:
+                    vrf.rd_export.append(other.rd)
+            else:
+                vrf.rd_import = [rd for rd in vrf.rd_import if rd != other.rd]
+                vrf.rd_export = [rd for rd in vrf.rd_export if rd != other.rd]
+
+    def _bind_vrf(self, vrf1: Vrf, vrf2: Vrf) -> bool:
+        self._apply('_bind_vrf', lambda device: self._set_binding(device.vrfs, vrf1.name, vrf2.name, True))
+        self._set_binding(self.vrfs, vrf1.name, vrf2.name, True)
+        return True
+
+    def _unbind_vrf(self, vrf1: Vrf, vrf2: Vrf) -> bool:
+        self._apply('_unbind_vrf', lambda device: self._set_binding(device.vrfs, vrf1.name, vrf2.name, False))
+        self._set_binding(self.vrfs, vrf1.name, vrf2.name, False)
+        return True
+
+    def _add_vlan_to_vrf(self, vrf: Vrf, vlan_interface: SwitchRequestVlanL3Port) -> bool:
+        if self.get_vlaninterface_from_vid(vlan_interface.vlan):
+            raise SwitchConfigurationException('vlan interface {} already existing on switch {}'.format(
+                vlan_interface.vlan, self.name))
+        l3_port = VlanL3Port(
+            index='Vlan{}'.format(vlan_interface.vlan),
+            name='Vlan{}'.format(vlan_interface.vlan),
+            vlan=vlan_interface.vlan,
+            ipaddress=vlan_interface.ipaddress.ip,
+            cidr='{}/{}'.format(vlan_interface.ipaddress.ip, vlan_interface.cidr.prefixlen),
+            vrf=vrf.name,
+            description=vlan_interface.description
+        )
+
+        def change(device: SimDeviceState):
+            device_l3_port = l3_port.model_copy(deep=True)
+            device.vlan_l3_ports.append(device_l3_port)
+            device.get_vrf(vrf.name).ports.append(device_l3_port)
+
+        self._apply('_add_vlan_to_vrf', change)
+        self.vlan_l3_ports.append(l3_port)
+        vrf.ports.append(l3_port)
+        return True
+
+    def _del_vlan_to_vrf(self, vrf: Vrf, vlan_interface: VlanL3Port) -> bool:
+        vid = vlan_interface.vlan
+
+        def change(device: SimDeviceState):
+            device.vlan_l3_ports = [item for item in device.vlan_l3_ports if item.vlan != vid]
+            device_vrf = device.get_vrf(vrf.name)
+            device_vrf.ports = [item for item in device_vrf.ports if item.vlan != vid]
+
+        self._apply('_del_vlan_to_vrf', change)
+        self.vlan_l3_ports = [item for item in self.vlan_l3_ports if item.vlan != vid]
+        vrf.ports = [item for item in vrf.ports if item.vlan != vid]
+        return True
+
+    def _add_vrf(self, vrf_msg: VrfRequest):
+        vrf = Vrf(name=vrf_msg.name, rd=vrf_msg.rd or '{}:{}'.format(self.name, vrf_msg.name),
+                  description=vrf_msg.description, ports=[], protocols=vrf_msg.protocols)
+        self._apply('_add_vrf', lambda device: device.vrfs.append(vrf.model_copy(deep=True)))
+        self.vrfs.append(vrf)
+        return True
+
+    def _del_vrf(self, vrf_name: str):
+        def change(device: SimDeviceState):
+            device.vrfs = [item for item in device.vrfs if item.name != vrf_name]
+
+        self._apply('_del_vrf', change)
+        self.vrfs = [item for item in self.vrfs if item.name != vrf_name]
+        return True
+
+    @staticmethod
+    def _set_route(vrf: Vrf, route: IpV4Route, present: bool) -> None:
+        if not vrf.protocols:
+            vrf.protocols = RoutingProtocols()
+        if not vrf.protocols.static:
+            vrf.protocols.static = StaticRoutingProtocol()
+        routes = [item for item in vrf.protocols.static.routes if item != route]
+        vrf.protocols.static.routes = routes + [route] if present else routes
+
+    def _add_route(self, vrf: Vrf, route: IpV4Route):
+        self._apply('_add_route', lambda device: self._set_route(device.get_vrf(vrf.name), route, True))
+        # add_route may leave the StaticRoutingProtocol class itself in place of an instance
+        if vrf.protocols and not isinstance(vrf.protocols.static, StaticRoutingProtocol):
+            vrf.protocols.static = None
+        self._set_route(vrf, route, True)
+        return True
+
+    def _del_route(self, vrf: Vrf, route: IpV4Route):
+        self._apply('_del_route', lambda device: self._set_route(device.get_vrf(vrf.name), route, False))
+        self._set_route(vrf, route, False)
+        return True
+
+
+def make_sim_fabric(leaves: int = 4, spines: int = 2, server_ports: int = 44, vlans: int = 64,
+                    vlans_per_port: int = 8, vrfs: int = 4, vlan_interfaces: int = 16, latency: float = 0.0,
+                    jitter: float = 0.0, failure_rate: float = 0.0) -> List[Device]:
+    # leaf/spine fabric: each leaf is wired to every spine through LLDP neighbors on its first ports, the other leaf
+    # ports are connected to servers. All the vlans are carried by the fabric links, the vlan interfaces are spread
+    # over the vrfs of the first spine. The device states are registered and the devices to onboard returned
+    vlan_ids = list(range(2, vlans + 2))
+    leaf_names = ['leaf{}'.format(i) for i in range(leaves)]
+    spine_names = ['spine{}'.format(j) for j in range(spines)]
+    options = dict(latency=latency, jitter=jitter, failure_rate=failure_rate)
+
+    def port(i: int, trunk_vlans: List[int], neighbor: str, remote_interface: str) -> PhyPort:
+        return PhyPort(index='Ethernet{}'.format(i), name='Ethernet{}'.format(i), trunk_vlans=trunk_vlans,
+                       access_vlan=1, neighbor=LldpNeighbor(neighbor=neighbor, remote_interface=remote_interface),
+                       speed=100000, mode=LinkModes.trunk, status='UP', admin_status='ENABLED')
+
+    for i, name in enumerate(leaf_names):
+        ports = [port(j, list(vlan_ids), spine, 'Ethernet{}'.format(i)) for j, spine in enumerate(spine_names)]
+        for k in range(server_ports):
+            trunk_vlans = sorted({vlan_ids[((i * server_ports + k) * vlans_per_port + n) % len(vlan_ids)]
+                                  for n in range(vlans_per_port)}) if vlan_ids else []
+            ports.append(port(spines + k, trunk_vlans, 'server-{}-{}'.format(i, k), 'eth0'))
+        register_sim_device(name, SimDeviceState(phy_ports=ports, vlans=list(vlan_ids), **options))
+
+    for j, name in enumerate(spine_names):
+        ports = [port(i, list(vlan_ids), leaf, 'Ethernet{}'.format(j)) for i, leaf in enumerate(leaf_names)]
+        state = SimDeviceState(phy_ports=ports, vlans=list(vlan_ids), **options)
+        if j == 0 and vrfs:
+            state.vrfs = [Vrf(name='vrf{}'.format(v), rd='65000:{}'.format(v + 1), ports=[]) for v in range(vrfs)]
+            for n, vid in enumerate(vlan_ids[:vlan_interfaces]):
+                vrf = state.vrfs[n % vrfs]
+                l3_port = VlanL3Port(index='Vlan{}'.format(vid), name='Vlan{}'.format(vid), vlan=vid,
+                                     ipaddress='10.{}.{}.1'.format(vid // 256, vid % 256),
+                                     cidr='10.{}.{}.1/24'.format(vid // 256, vid % 256), vrf=vrf.name)
+                state.vlan_l3_ports.append(l3_port)
+                vrf.ports.append(l3_port)
+        register_sim_device(name, state)
+
+    return [Device(name=name, model='sim', user='admin', passwd='admin', address='sim://{}'.format(name))
+            for name in leaf_names + spine_names]
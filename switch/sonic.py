@@ -3,8 +3,11 @@ import json
 from sbi.paramiko_sbi import ParamikoSbi
 from .switch_base import Switch
 from models import LldpNeighbor, PhyPort, VlanL3Port, Vrf, SwitchRequestVlanL3Port
-from ipaddress import IPv4Network
+from switch.sonic_decoding import decode_cfggen_ports, decode_cfggen_portchannel_members, decode_cfggen_vlans, \
+    decode_cfggen_vlan_interfaces, decode_cfggen_vrfs, map_vlan_ids, map_ports, apply_vlan_members, \
+    build_vlan_l3_ports, build_vrfs
 from utils import create_logger
+from utils.metrics import timed_refresh_phase
 from typing import List, Literal
 
 logger = create_logger('sonic')
@@ -34,19 +37,21 @@ class Sonic(Switch):
 
         print(self.model_dump())
 
+    @timed_refresh_phase('config')
     def retrieve_config(self) -> dict:
         _config = self._sbi_ssh_driver.send_command(["export"])
         res = self._sbi_ssh_driver.send_command(['/usr/local/bin/sonic-cfggen -d --print-data'], json_parse=True)
         self.store_config(json.dumps(res[0]['_stdout']))
         return res[0]['_stdout']
 
+    @timed_refresh_phase('lldp')
     def retrieve_neighbors(self):
         lldp_data = self._sbi_ssh_driver.send_command(['sudo lldpctl -f json'], json_parse=True)[0]['_stdout']
         if 'lldp' not in lldp_data.keys() or 'interface' not in lldp_data['lldp'].keys():
             raise ValueError('lldp data malformed')
         for itf in lldp_data['lldp']['interface']:
             itf_name = list(itf.keys())[0]
-            phy_port = next((item for item in self.phy_ports if item.name == itf_name), None)
+            phy_port = self.lookup('phy_ports', 'name', itf_name)
             if not phy_port:
                 continue
             phy_port.neighbor = LldpNeighbor.model_validate({
@@ -54,35 +59,30 @@ class Sonic(Switch):
                 'remote_interface': itf[itf_name]['port']['descr']
             })
 
+    @timed_refresh_phase('vlans')
     def retrieve_vlans(self, cfg):
-        if 'VLAN' not in self.last_config.config:
+        if 'VLAN' not in cfg:
             return False
+        vlans, _ = decode_cfggen_vlans(cfg)
+        self.vlans.extend(map_vlan_ids(vlans).values())
 
-        for vlan_name in cfg['VLAN'].keys():
-            self.vlans.append(int(cfg['VLAN'][vlan_name]['vlanid']))
-
+    @timed_refresh_phase('ports')
     def retrieve_ports(self, cfg: dict):
-        port_channels = {}
-
-        if 'PORTCHANNEL' and 'PORTCHANNEL_MEMBER' in cfg:
-            logger.debug('checking portchannels')
-            for member in cfg['PORTCHANNEL_MEMBER'].keys():
-                mdata = member.split('|')
-                pc_name = mdata[0]
-                itf_name = mdata[1]
-                port_channels[itf_name] = pc_name
+        logger.debug('checking portchannels')
+        port_channels = decode_cfggen_portchannel_members(cfg)
 
         if 'PORT' not in cfg:
             return False
 
         port_status_res = self._sbi_ssh_driver.send_command(['./dump_itf_status'], json_parse=True)[0]['_stdout']
-        for itf_name in cfg['PORT'].keys():
-            is_in_port_channel = itf_name in port_channels.keys()
-
-            port_name = port_channels[itf_name] if is_in_port_channel else itf_name
-            if next((item for item in self.phy_ports if item.name == port_name), None):
+        stored_ports = set()
+        for itf in decode_cfggen_ports(cfg):
+            itf_name = itf.ifname
+            port_name = port_channels.get(itf_name, itf_name)
+            if port_name in stored_ports:
                 # portchannel already stored
                 continue
+            stored_ports.add(port_name)
 
             if port_name not in port_status_res:
                 port_status_res[itf_name] = {'vlan': 'NA', 'oper': 'NA', 'admin': 'NA', 'speed': 'NA'}
@@ -99,7 +99,7 @@ class Sonic(Switch):
 
             self.phy_ports.append(
                 PhyPort(
-                    index=cfg['PORT'][itf_name]['index'],
+                    index=itf.index,
                     name=port_name,
                     trunk_vlans=[],
                     access_vlan=None,
@@ -112,26 +112,15 @@ class Sonic(Switch):
                 )
             )
 
+    @timed_refresh_phase('port_vlans')
     def retrieve_port_vlan(self, cfg) -> None:
         if 'VLAN_MEMBER' not in cfg:
-            logger.warn('no VLAN MEMBER node in Sonic DB!!')
+            logger.warning('no VLAN MEMBER node in Sonic DB!!')
             return
 
-        for member in cfg['VLAN_MEMBER'].keys():
-            inf_vlan_list = member.split('|')
-            itf_name = inf_vlan_list[1]
-            vlan_name = inf_vlan_list[0]
-            vid = int(cfg['VLAN'][vlan_name]['vlanid'])
-            phyport = next((item for item in self.phy_ports if item.name == itf_name), None)
-            if not phyport:
-                continue
-            match cfg['VLAN_MEMBER'][member]['tagging_mode']:
-                case 'tagged':
-                    phyport.trunk_vlans.append(vid)
-                case 'untagged':
-                    phyport.access_vlan = vid
-                case _:
-                    raise ValueError('vlan mode {} not supported'.format(cfg['VLAN_MEMBER'][member]['tagging_mode']))
+        vlans, vlan_members = decode_cfggen_vlans(cfg)
+        # members of ports not managed by NetCL (e.g. portchannel members) are skipped
+        apply_vlan_members(vlan_members, map_vlan_ids(vlans), map_ports(self.phy_ports), strict=False)
 
         for p in self.phy_ports:
             if p.mode == 'TRUNK' and len(p.trunk_vlans) == 0 and p.access_vlan:
@@ -139,53 +128,19 @@ class Sonic(Switch):
             elif p.mode == 'TRUNK' and p.access_vlan:
                 p.mode = 'HYBRID'
 
+    @timed_refresh_phase('vlan_interfaces')
     def retrieve_vlan_interfaces(self, cfg: dict) -> None:
         if 'VLAN_INTERFACE' not in cfg.keys():
             return
-        for member in cfg['VLAN_INTERFACE'].keys():
-            vdata = member.split('|')
-            vlan_name = vdata[0]
-            vid = cfg['VLAN'][vlan_name]['vlanid'] if vlan_name in cfg['VLAN'] else None
-
-            ip_addr_str = vdata[1] if len(vdata) > 1 else None
-            ip_addr = ip_addr_str.split('/')[0] if ip_addr_str else None
-            cidr = str(IPv4Network(ip_addr_str, strict=False)) if ip_addr_str else None
-
-            vrf = cfg['VLAN_INTERFACE'][member]['vrf_name'] if 'vrf_name' in cfg['VLAN_INTERFACE'][member] else None
-
-            vlan_port = next((item for item in self.vlan_l3_ports if item.name == vlan_name), None)
-            if vlan_port:
-                if ip_addr:
-                    vlan_port.ipaddress = ip_addr
-                    vlan_port.cidr = cidr
-                if vrf:
-                    vlan_port.vrf = vrf
-            else:
-                self.vlan_l3_ports.append(
-                    VlanL3Port.model_validate(
-                        {
-                            'index': vlan_name,
-                            'name': vlan_name,
-                            'vlan': int(vid),
-                            'ipaddress': ip_addr,
-                            'cidr': cidr,
-                            'vrf': vrf,
-                            'description': None
-                        }
-                    )
-                )
+        vlans, _ = decode_cfggen_vlans(cfg)
+        interfaces, ip_addresses = decode_cfggen_vlan_interfaces(cfg)
+        self.vlan_l3_ports.extend(build_vlan_l3_ports(interfaces, ip_addresses, map_vlan_ids(vlans)))
 
+    @timed_refresh_phase('vrfs')
     def retrieve_vrf(self, cfg: dict) -> None:
         if 'VRF' not in cfg:
             return
-        for vrf_name in cfg['VRF'].keys():
-            self.vrfs.append(
-                Vrf.model_validate({
-                    'name': vrf_name,
-                    'rd': vrf_name,
-                    'ports': [item for item in self.vlan_l3_ports if item.vrf == vrf_name]
-                })
-            )
+        self.vrfs.extend(build_vrfs(decode_cfggen_vrfs(cfg), self.vlan_l3_ports, rd_from_vni=False, add_default=False))
 
     def _add_vlan(self, vlan_ids: List[int]):
         for _id in vlan_ids:
@@ -0,0 +1,242 @@
+# Lightweight decoding of the SONiC configuration: only the fields used by NetCL are extracted from the RESTCONF
+# payloads (SonicNew) or from the sonic-cfggen dump (Sonic) into compact records, without building the generated
+# pydantic trees (sonic_*_model.py). The records are then joined through hash maps built once per refresh.
+from ipaddress import IPv4Network
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple, Union
+from models import PhyPort, VlanL3Port, Vrf
+from utils import create_logger
+
+logger = create_logger('sonic-decoding')
+
+PORT_KEY = 'sonic-port:sonic-port'
+PORTCHANNEL_KEY = 'sonic-portchannel:sonic-portchannel'
+VLAN_KEY = 'sonic-vlan:sonic-vlan'
+VLAN_INTERFACE_KEY = 'sonic-vlan-interface:sonic-vlan-interface'
+VRF_KEY = 'sonic-vrf:sonic-vrf'
+LLDP_KEY = 'openconfig-lldp:interfaces'
+
+
+class SonicPortRecord(NamedTuple):
+    ifname: str
+    index: Union[int, None]
+
+
+class SonicVlanRecord(NamedTuple):
+    name: str
+    vid: Union[int, None]
+
+
+class SonicVlanMemberRecord(NamedTuple):
+    name: str
+    ifname: str
+    tagging_mode: Union[str, None]
+
+
+class SonicVlanInterfaceRecord(NamedTuple):
+    name: str
+    vrf_name: Union[str, None]
+
+
+class SonicVlanIpRecord(NamedTuple):
+    name: str
+    ip_prefix: str
+
+
+class SonicVrfRecord(NamedTuple):
+    name: str
+    vni: Union[int, None]
+
+
+class SonicLldpRecord(NamedTuple):
+    ifname: str
+    system_name: str
+    port_description: str
+
+
+def _table(data: Dict[str, Any], *keys: str) -> List[Dict[str, Any]]:
+    # walks the nested containers, returning an empty list if any level is missing
+    for key in keys:
+        if not isinstance(data, dict):
+            return []
+        data = data.get(key)
+        if data is None:
+            return []
+    return data if isinstance(data, list) else []
+
+
+def decode_ports(data: Dict[str, Any]) -> List[SonicPortRecord]:
+    return [SonicPortRecord(item['ifname'], item.get('index')) for item in _table(data, PORT_KEY, 'PORT', 'PORT_LIST')]
+
+
+def decode_portchannel_members(data: Dict[str, Any]) -> Dict[str, str]:
+    # member interface name -> port channel name
+    return {item['ifname']: item['name'] for item in
+            _table(data, PORTCHANNEL_KEY, 'PORTCHANNEL_MEMBER', 'PORTCHANNEL_MEMBER_LIST')}
+
+
+def decode_vlans(data: Dict[str, Any]) -> Tuple[List[SonicVlanRecord], List[SonicVlanMemberRecord]]:
+    vlans = [SonicVlanRecord(item['name'], item.get('vlanid')) for item in
+             _table(data, VLAN_KEY, 'VLAN', 'VLAN_LIST')]
+    members = [SonicVlanMemberRecord(item['name'], item['ifname'], item.get('tagging_mode')) for item in
+               _table(data, VLAN_KEY, 'VLAN_MEMBER', 'VLAN_MEMBER_LIST')]
+    return vlans, members
+
+
+def decode_vlan_interfaces(data: Dict[str, Any]) -> Tuple[List[SonicVlanInterfaceRecord], List[SonicVlanIpRecord]]:
+    interfaces = [SonicVlanInterfaceRecord(item['vlanName'], item.get('vrf_name')) for item in
+                  _table(data, VLAN_INTERFACE_KEY, 'VLAN_INTERFACE', 'VLAN_INTERFACE_LIST')]
+    ip_addresses = [SonicVlanIpRecord(item['vlanName'], item['ip_prefix']) for item in
+                    _table(data, VLAN_INTERFACE_KEY, 'VLAN_INTERFACE', 'VLAN_INTERFACE_IPADDR_LIST')]
+    return interfaces, ip_addresses
+
+
+def decode_vrfs(data: Dict[str, Any]) -> List[SonicVrfRecord]:
+    return [SonicVrfRecord(item['vrf_name'], item.get('vni')) for item in _table(data, VRF_KEY, 'VRF', 'VRF_LIST')]
+
+
+def decode_lldp(data: Dict[str, Any]) -> List[SonicLldpRecord]:
+    res = []
+    for item in _table(data, LLDP_KEY, 'interface'):
+        neighbors = _table(item, 'neighbors', 'neighbor')
+        if not neighbors:
+            res.append(SonicLldpRecord(item['name'], None, None))
+            continue
+        state = neighbors[0].get('state', {})
+        res.append(SonicLldpRecord(item['name'], state.get('system-name'), state.get('port-description')))
+    return res
+
+
+# sonic-cfggen (CONFIG_DB) dump: the tables are dicts keyed by '|'-separated keys
+def decode_cfggen_ports(cfg: Dict[str, Any]) -> List[SonicPortRecord]:
+    return [SonicPortRecord(ifname, item.get('index')) for ifname, item in cfg.get('PORT', {}).items()]
+
+
+def decode_cfggen_portchannel_members(cfg: Dict[str, Any]) -> Dict[str, str]:
+    res = {}
+    for key in cfg.get('PORTCHANNEL_MEMBER', {}).keys():
+        pc_name, itf_name = key.split('|', 1)
+        res[itf_name] = pc_name
+    return res
+
+
+def decode_cfggen_vlans(cfg: Dict[str, Any]) -> Tuple[List[SonicVlanRecord], List[SonicVlanMemberRecord]]:
+    vlans = [SonicVlanRecord(name, item.get('vlanid')) for name, item in cfg.get('VLAN', {}).items()]
+    members = []
+    for key, item in cfg.get('VLAN_MEMBER', {}).items():
+        vlan_name, itf_name = key.split('|', 1)
+        members.append(SonicVlanMemberRecord(vlan_name, itf_name, item.get('tagging_mode')))
+    return vlans, members
+
+
+def decode_cfggen_vlan_interfaces(cfg: Dict[str, Any]) -> \
+        Tuple[List[SonicVlanInterfaceRecord], List[SonicVlanIpRecord]]:
+    interfaces = []
+    ip_addresses = []
+    for key, item in cfg.get('VLAN_INTERFACE', {}).items():
+        if '|' in key:
+            vlan_name, ip_prefix = key.split('|', 1)
+            ip_addresses.append(SonicVlanIpRecord(vlan_name, ip_prefix))
+        else:
+            interfaces.append(SonicVlanInterfaceRecord(key, item.get('vrf_name')))
+    return interfaces, ip_addresses
+
+
+def decode_cfggen_vrfs(cfg: Dict[str, Any]) -> List[SonicVrfRecord]:
+    return [SonicVrfRecord(name, item.get('vni')) for name, item in cfg.get('VRF', {}).items()]
+
+
+# hash maps used to join the records
+def map_vlan_ids(vlans: Iterable[SonicVlanRecord]) -> Dict[str, int]:
+    # vlan name -> vlan id
+    return {item.name: int(item.vid) for item in vlans if item.vid is not None}
+
+
+def map_ip_prefixes(ip_addresses: Iterable[SonicVlanIpRecord]) -> Dict[str, str]:
+    # vlan name -> first ip prefix configured on the vlan interface
+    res = {}
+    for item in ip_addresses:
+        res.setdefault(item.name, item.ip_prefix)
+    return res
+
+
+def map_ports(phy_ports: Iterable[PhyPort]) -> Dict[str, PhyPort]:
+    # port name -> port
+    res = {}
+    for item in phy_ports:
+        res.setdefault(item.name, item)
+    return res
+
+
+def map_l3_ports_by_vrf(vlan_l3_ports: Iterable[VlanL3Port]) -> Dict[str, List[VlanL3Port]]:
+    # vrf name -> vlan interfaces; interfaces not bound to any vrf belong to the default one
+    res = {}
+    for item in vlan_l3_ports:
+        res.setdefault(item.vrf or 'default', []).append(item)
+    return res
+
+
+def apply_vlan_members(members: Iterable[SonicVlanMemberRecord], vlan_ids: Dict[str, int],
+                       ports: Dict[str, PhyPort], strict: bool = True) -> None:
+    # sets access and trunk vlans on the ports. If strict, members referring to unknown vlans or ports raise a
+    # ValueError, otherwise they are skipped
+    trunks: Dict[str, Dict[int, None]] = {}
+    for member in members:
+        vid = vlan_ids.get(member.name)
+        port = ports.get(member.ifname)
+        if vid is None or port is None:
+            if strict:
+                raise ValueError("Vlan member {}|{} refers to an unknown {}".format(
+                    member.name, member.ifname, 'vlan' if vid is None else 'port'))
+            logger.warning("skipping vlan member %s|%s", member.name, member.ifname)
+            continue
+        match member.tagging_mode:
+            case 'untagged':
+                port.access_vlan = vid
+            case 'tagged':
+                # dicts keep the insertion order and deduplicate the vlans
+                trunks.setdefault(port.name, dict.fromkeys(port.trunk_vlans))[vid] = None
+            case _:
+                raise ValueError("Tagging mode {} not supported".format(member.tagging_mode))
+    for port_name, vids in trunks.items():
+        ports[port_name].trunk_vlans = list(vids)
+
+
+def build_vlan_l3_ports(interfaces: Iterable[SonicVlanInterfaceRecord], ip_addresses: Iterable[SonicVlanIpRecord],
+                        vlan_ids: Dict[str, int]) -> List[VlanL3Port]:
+    ip_prefixes = map_ip_prefixes(ip_addresses)
+    # vlan interfaces with an address but without an explicit entry are included as well
+    vrf_names = {item.name: item.vrf_name for item in interfaces}
+    for vlan_name in ip_prefixes.keys():
+        vrf_names.setdefault(vlan_name, None)
+
+    res = []
+    for vlan_name, vrf_name in vrf_names.items():
+        vid = vlan_ids.get(vlan_name)
+        if vid is None:
+            raise ValueError("Vlan {} not found in the VLAN list".format(vlan_name))
+        ip_prefix = ip_prefixes.get(vlan_name)
+        res.append(VlanL3Port.model_validate({
+            'index': vlan_name,
+            'name': vlan_name,
+            'vlan': vid,
+            'ipaddress': ip_prefix.split('/')[0] if ip_prefix else None,
+            'cidr': str(IPv4Network(ip_prefix, strict=False)) if ip_prefix else None,
+            'vrf': vrf_name or '',
+            'description': None
+        }))
+    return res
+
+
+def build_vrfs(vrfs: Iterable[SonicVrfRecord], vlan_l3_ports: Iterable[VlanL3Port], rd_from_vni: bool = True,
+               add_default: bool = True) -> List[Vrf]:
+    l3_ports_by_vrf = map_l3_ports_by_vrf(vlan_l3_ports)
+    res = []
+    for item in vrfs:
+        res.append(Vrf.model_validate({
+            'name': item.name,
+            'rd': str(item.vni) if rd_from_vni else item.name,
+            'ports': l3_ports_by_vrf.get(item.name, [])
+        }))
+    if add_default and 'default' not in {item.name for item in res}:
+        res.append(Vrf.model_validate({'name': 'default', 'rd': 'default', 'ports': l3_ports_by_vrf.get('default', [])}))
+    return res
@@ -1,40 +1,108 @@
+import hashlib
 import json
 from sbi.rest import RestSbi
 from sbi.paramiko_sbi import ParamikoSbi
 from .switch_base import Switch
 from models import LldpNeighbor, PhyPort, VlanL3Port, Vrf, SwitchRequestVlanL3Port, VrfRequest, IpV4Route
-from switch.sonic_portchannel_model import SonicPortchannelSonicPortchannel
-from switch.sonic_port_model import SonicPortSonicPort
-from switch.sonic_vlan_model import SonicVlanSonicVlan, TaggingMode, PostListSonicVlanList, SonicVlanListItem, \
-    SonicVlanMemberListItem, SonicVlanMemberList
-from switch.sonic_vlan_itf_model import SonicVlanInterfaceSonicVlanInterface, PostListSonicVlanInterface, \
-    SonicVlanInterfaceListItem, SonicVlanInterfaceIPAddrListItem
-from switch.sonic_vrf_model import SonicVrfSonicVrf, SonicVrfListItem
-from switch.sonic_lldp_model import SonicLLDPMsg
-from ipaddress import IPv4Network
+from switch.sonic_decoding import decode_ports, decode_portchannel_members, decode_vlans, decode_vlan_interfaces, \
+    decode_vrfs, decode_lldp, map_vlan_ids, map_ports, apply_vlan_members, build_vlan_l3_ports, build_vrfs, \
+    PORT_KEY, PORTCHANNEL_KEY, VLAN_KEY, VLAN_INTERFACE_KEY, VRF_KEY
 from utils import create_logger
-from typing import List, Literal
-import requests
-from sbi.frr_vtysh import FrrConfig
+from typing import List, Literal, Dict, Callable, Any, ClassVar, Type, Union
+import time
+from pydantic import BaseModel, PrivateAttr
+from utils.concurrency import run_concurrently
+from utils.metrics import observe_refresh_timings
+from sbi.frr_vtysh import FrrConfig, to_vtysh_command
 
 logger = create_logger('sonic')
 RESTPATH = 'restconf/data'
+# the generated sonic_*_model modules are large: they are imported by the methods using them, on first use
 
 
 class SonicNew(Switch):
     # double sbi driver to access to the FRR routing suite, while using REST for Sonic native info
     _sbi_rest_driver: RestSbi = None
     _sbi_ssh_driver: ParamikoSbi = None
+    # duration in seconds of each fetch and join phase of the last refresh
+    _refresh_timings: Dict[str, float] = PrivateAttr(default_factory=dict)
+    # digest of the raw configuration payloads of the last refresh
+    _config_digest: str = PrivateAttr(default=None)
+    # None until the first bulk deletion tells whether the switch accepts YANG PATCH requests
+    _yang_patch_supported: Union[bool, None] = PrivateAttr(default=None)
+    # parsed FRR running configuration, used to skip no-op routing changes
+    _frr_config: Union[FrrConfig, None] = PrivateAttr(default=None)
+    # if True the RESTCONF payloads are decoded directly into compact records, otherwise they are first validated
+    # against the generated YANG models
+    fast_decode: ClassVar[bool] = True
+    # fetch tasks whose payloads make up the stored switch configuration
+    config_tasks: ClassVar[List[str]] = ['portchannel', 'port', 'vlan', 'vlan_interface', 'vrf']
+    # port of the HTTP service exposing the operational status of the interfaces
+    ports_status_port: ClassVar[int] = 8123
+
+    def _get_fetch_tasks(self) -> Dict[str, Callable[[], Any]]:
+        # requests towards the switch needed to build the switch data; they do not depend on each other
+        return {
+            'portchannel': lambda: self._sbi_rest_driver.get_raw('{}/{}'.format(RESTPATH, PORTCHANNEL_KEY)),
+            'port': lambda: self._sbi_rest_driver.get_raw('{}/{}'.format(RESTPATH, PORT_KEY)),
+            'port_status': self._get_ports_status,
+            'vlan': lambda: self._sbi_rest_driver.get_raw('{}/{}'.format(RESTPATH, VLAN_KEY)),
+            'vlan_interface': lambda: self._sbi_rest_driver.get_raw('{}/{}'.format(RESTPATH, VLAN_INTERFACE_KEY)),
+            'vrf': lambda: self._sbi_rest_driver.get_raw('{}/{}'.format(RESTPATH, VRF_KEY)),
+            'routing': self._get_routing_config,
+            'lldp': lambda: self._sbi_rest_driver.get_raw("{}/openconfig-lldp:lldp/interfaces".format(RESTPATH))
+        }
+
+    def _fetch(self, *task_names: str) -> Dict[str, Any]:
+        tasks = self._get_fetch_tasks()
+        return {name: tasks[name]() for name in task_names}
+
+    def _load(self, raw: Dict[str, Any], task_name: str, model: Type[BaseModel]) -> Dict[str, Any]:
+        data = json.loads(raw[task_name])
+        if not self.fast_decode:
+            model.model_validate(data)
+        return data
+
+    def _get_config_digest(self, raw: Dict[str, Any]) -> str:
+        digest = hashlib.sha256()
+        for task_name in self.config_tasks:
+            digest.update(raw[task_name])
+            digest.update(b'\0')
+        return digest.hexdigest()
 
     def _update_info(self):
+        # all the requests are issued concurrently, then the results are joined following the dependencies among
+        # the objects: ports <- vlans and vlan interfaces <- vrfs <- routing, and ports <- neighbors
+        start = time.perf_counter()
+        raw, timings = run_concurrently(self._get_fetch_tasks(), name='{}-fetch'.format(self.name))
+        timings['fetch_total'] = time.perf_counter() - start
+
         cfg = dict()
-        cfg.update(self.retrieve_ports())
-        cfg.update(self.retrieve_vlans())
-        cfg.update(self.retrieve_vrf())
-        routing_config = self.retrieve_routing()
-        logger.debug("routing_config: {}".format(routing_config))
-        self.retrieve_neighbors()
-        self.store_config(json.dumps(cfg))
+        for phase, parse in [
+            ('join_ports', self.retrieve_ports),
+            ('join_vlans', self.retrieve_vlans),
+            ('join_vrfs', self.retrieve_vrf),
+            ('join_routing', self.retrieve_routing),
+            ('join_neighbors', self.retrieve_neighbors)
+        ]:
+            phase_start = time.perf_counter()
+            res = parse(raw)
+            if res:
+                cfg.update(res)
+            timings[phase] = time.perf_counter() - phase_start
+        # the configuration is serialized and compared with the stored one only if the raw payloads changed
+        config_digest = self._get_config_digest(raw)
+        if config_digest != self._config_digest or not self.last_config:
+            self.store_config(json.dumps(cfg))
+            self._config_digest = config_digest
+        timings['total'] = time.perf_counter() - start
+        self._refresh_timings = timings
+        observe_refresh_timings(type(self).__name__, self.name, timings)
+        logger.info('switch %s refreshed in %.3fs (%s)', self.name, timings['total'], ', '.join(
+            '{} {:.3f}s'.format(k, v) for k, v in timings.items() if k != 'total'))
+
+    def get_refresh_timings(self) -> Dict[str, float]:
+        return dict(self._refresh_timings)
 
     def _reinit_sbi_drivers(self) -> None:
         if not self._sbi_rest_driver:
@@ -48,123 +116,74 @@ class SonicNew(Switch):
         self.reinit_sbi_drivers()
         self.update_info()
 
-    def retrieve_routing(self) -> dict:
+    def _get_routing_config(self) -> str:
         msg = self._sbi_ssh_driver.send_command(commands=["vtysh -c \"show running-config\""], json_parse=False)
-        frr_obj = FrrConfig.from_raw_config(msg[0]['_stdout'])
+        return msg[0]['_stdout']
+
+    def retrieve_routing(self, raw: Dict[str, Any] = None) -> None:
+        raw = raw or self._fetch('routing')
+        frr_obj = FrrConfig.from_raw_config(raw['routing'])
+        self._frr_config = frr_obj
 
         frr_vrfs = frr_obj.to_switch_vrf_protocols()
         for frr_vrf_name in frr_vrfs.keys():
-            switch_vrf = next((item for item in self.vrfs if item.name == frr_vrf_name), None)
+            switch_vrf = self.lookup('vrfs', 'name', frr_vrf_name)
             if not switch_vrf:
                 raise ValueError("Vrf {} not found on the switch".format(frr_vrf_name))
             switch_vrf.protocols = frr_vrfs[frr_vrf_name]
 
-    def retrieve_neighbors(self):
-        rest_lldp = SonicLLDPMsg.model_validate(
-            self._sbi_rest_driver.get("{}/openconfig-lldp:lldp/interfaces".format(RESTPATH)))
-        for neigh_item in rest_lldp.openconfig_lldp_interfaces.interface:
-            phy_port = next((item for item in self.phy_ports if item.name == neigh_item.name), None)
+    def retrieve_neighbors(self, raw: Dict[str, Any] = None) -> None:
+        from switch.sonic_lldp_model import SonicLLDPMsg
+        raw = raw or self._fetch('lldp')
+        for neigh_item in decode_lldp(self._load(raw, 'lldp', SonicLLDPMsg)):
+            phy_port = self.lookup('phy_ports', 'name', neigh_item.ifname)
             if not phy_port:
-                logger.warning("Phyport {} not found".format(neigh_item.name))
+                logger.warning("Phyport %s not found", neigh_item.ifname)
                 continue
-
-            neigh_info = neigh_item.neighbors.neighbor[0] if len(neigh_item.neighbors.neighbor) > 0 else None
-            if not neigh_info:
-                logger.warning("No neighbour information for interface {}".format(neigh_item.name))
+            if not neigh_item.system_name:
+                logger.warning("No neighbour information for interface %s", neigh_item.ifname)
                 continue
-            logger.debug("Found neighbour {} remote port {} on local port {}".format(
-                neigh_info.state.system_name, neigh_info.state.port_description, phy_port.name))
+            logger.debug("Found neighbour %s remote port %s on local port %s",
+                neigh_item.system_name, neigh_item.port_description, phy_port.name)
             phy_port.neighbor = LldpNeighbor.model_validate({
-                'neighbor': neigh_info.state.system_name,
-                'remote_interface': neigh_info.state.port_description
+                'neighbor': neigh_item.system_name,
+                'remote_interface': neigh_item.port_description
             })
 
-    def retrieve_vlans(self) -> dict:
-        rest_vlan = SonicVlanSonicVlan.model_validate(
-            self._sbi_rest_driver.get('{}/sonic-vlan:sonic-vlan'.format(RESTPATH)))
-        for vlan_item in rest_vlan.sonic_vlan_sonic_vlan.VLAN.VLAN_LIST:
-            self.vlans.append(int(vlan_item.vlanid))
-
-        for vlan_member_item in rest_vlan.sonic_vlan_sonic_vlan.VLAN_MEMBER.VLAN_MEMBER_LIST:
-            vid = next((item.vlanid for item in rest_vlan.sonic_vlan_sonic_vlan.VLAN.VLAN_LIST if \
-                        item.name == vlan_member_item.name), None)
-            if not vid:
-                raise ValueError("Vlan {} not found in the VLAN list".format(vlan_member_item.name))
-            itf = next((item for item in self.phy_ports if item.name == vlan_member_item.ifname), None)
-            if not itf:
-                raise ValueError("Phy Port with name {} not found".format(vlan_member_item.ifname))
-            if vlan_member_item.tagging_mode == TaggingMode.untagged:
-                itf.access_vlan = int(vid)
-            elif vlan_member_item.tagging_mode == TaggingMode.tagged and vid not in itf.trunk_vlans:
-                itf.trunk_vlans.append(vid)
-            else:
-                raise ValueError("Tagging mode {} not supported".format(vlan_member_item.tagging_mode))
-
-        rest_vlan_itf = SonicVlanInterfaceSonicVlanInterface.model_validate(
-            self._sbi_rest_driver.get('{}/sonic-vlan-interface:sonic-vlan-interface'.format(RESTPATH))
-        )
-
-        for vlan_itf in rest_vlan_itf.sonic_vlan_interface_sonic_vlan_interface.VLAN_INTERFACE.VLAN_INTERFACE_LIST:
-            # find vlan id from vlan name
-            vid = next((item.vlanid for item in rest_vlan.sonic_vlan_sonic_vlan.VLAN.VLAN_LIST if \
-                        item.name == vlan_itf.vlanName), None)
-            ip_item = next(
-                (item for item in
-                 rest_vlan_itf.sonic_vlan_interface_sonic_vlan_interface.VLAN_INTERFACE.VLAN_INTERFACE_IPADDR_LIST if
-                 item.vlanName == vlan_itf.vlanName), None)
-
-            if ip_item:
-                ip_addr = ip_item.ip_prefix.split('/')[0]
-                cidr = str(IPv4Network(ip_item.ip_prefix, strict=False))
-            else:
-                ip_addr = None
-                cidr = None
-
-            self.vlan_l3_ports.append(
-                VlanL3Port.model_validate(
-                    {
-                        'index': vlan_itf.vlanName,
-                        'name': vlan_itf.vlanName,
-                        'vlan': int(vid),
-                        'ipaddress': ip_addr,
-                        'cidr': cidr,
-                        'vrf': vlan_itf.vrf_name,
-                        'description': None
-                    }
-                )
-            )
-        cfg = json.loads(rest_vlan.sonic_vlan_sonic_vlan.model_dump_json(by_alias=True))
-        cfg.update(json.loads(rest_vlan_itf.sonic_vlan_interface_sonic_vlan_interface.model_dump_json(by_alias=True)))
+    def retrieve_vlans(self, raw: Dict[str, Any] = None) -> dict:
+        from switch.sonic_vlan_model import SonicVlanSonicVlan
+        from switch.sonic_vlan_itf_model import SonicVlanInterfaceSonicVlanInterface
+        raw = raw or self._fetch('vlan', 'vlan_interface')
+        vlan_data = self._load(raw, 'vlan', SonicVlanSonicVlan)
+        vlans, vlan_members = decode_vlans(vlan_data)
+        vlan_ids = map_vlan_ids(vlans)
+        self.vlans.extend(vlan_ids.values())
+        apply_vlan_members(vlan_members, vlan_ids, map_ports(self.phy_ports))
+
+        vlan_itf_data = self._load(raw, 'vlan_interface', SonicVlanInterfaceSonicVlanInterface)
+        vlan_interfaces, vlan_ip_addresses = decode_vlan_interfaces(vlan_itf_data)
+        self.vlan_l3_ports.extend(build_vlan_l3_ports(vlan_interfaces, vlan_ip_addresses, vlan_ids))
+        cfg = dict(vlan_data.get(VLAN_KEY, {}))
+        cfg.update(vlan_itf_data.get(VLAN_INTERFACE_KEY, {}))
         return cfg
 
-    def retrieve_ports(self) -> dict:
-        port_channels = {}
-        rest_portchannel = SonicPortchannelSonicPortchannel.model_validate(
-            self._sbi_rest_driver.get('{}/sonic-portchannel:sonic-portchannel'.format(RESTPATH)))
+    def _get_ports_status(self) -> dict:
+        # served by a separate service on the switch, through the REST driver for its timeouts and circuit breaker
+        return self._sbi_rest_driver.get_service(self.ports_status_port, 'interfaces_status')
 
+    def retrieve_ports(self, raw: Dict[str, Any] = None) -> dict:
+        from switch.sonic_portchannel_model import SonicPortchannelSonicPortchannel
+        from switch.sonic_port_model import SonicPortSonicPort
+        raw = raw or self._fetch('portchannel', 'port', 'port_status')
         logger.debug('checking portchannels')
-        for member in rest_portchannel.sonic_portchannel_sonic_portchannel.PORTCHANNEL_MEMBER.PORTCHANNEL_MEMBER_LIST:
-            port_channels[member.ifname] = member.name  # name is the one of port channel
-
-        rest_port = SonicPortSonicPort.model_validate(self._sbi_rest_driver.get(
-            '{}/sonic-port:sonic-port'.format(RESTPATH)))
-
-        try:
-
-            alternative_rest_ports = requests.get("http://{}:8123/interfaces_status".format(self.address))
-            if not alternative_rest_ports.ok:
-                logger.error(alternative_rest_ports.text)
-                raise ValueError("ALTERNATIVE REST error!")
-        except requests.HTTPError as ex:
-            raise ex
-        except:
-            raise ValueError("ALTERNATIVE REST error!")
-        alternative_ports_state = alternative_rest_ports.json()
-        # port_status_res = {}
-        for itf in rest_port.sonic_port_sonic_port.PORT.PORT_LIST:
-            # port_status_res[itf.ifname] = {'vlan': 'NA', 'oper': 'NA', 'admin': 'NA', 'speed': 'NA'}
-            is_in_port_channel = itf.ifname in port_channels.keys()
-            port_name = port_channels[itf.ifname] if is_in_port_channel else itf.ifname
+        portchannel_data = self._load(raw, 'portchannel', SonicPortchannelSonicPortchannel)
+        # member interface name -> port channel name
+        port_channels = decode_portchannel_members(portchannel_data)
+
+        port_data = self._load(raw, 'port', SonicPortSonicPort)
+        alternative_ports_state = raw['port_status']
+        for itf in decode_ports(port_data):
+            port_name = port_channels.get(itf.ifname, itf.ifname)
 
             # ADD here code for dynamic state info
             match alternative_ports_state[port_name]['vlan']:
@@ -176,7 +195,7 @@ class SonicNew(Switch):
                     pmode = 'ACCESS'
                 case _:
                     pmode = 'NA'
-            logger.debug("adding port {} with index {}".format(port_name, str(itf.index)))
+            logger.debug("adding port %s with index %s", port_name, str(itf.index))
             self.phy_ports.append(
                 PhyPort(
                     index=str(itf.index),
@@ -192,70 +211,107 @@ class SonicNew(Switch):
                     duplex='NA'
                 )
             )
-        cfg = json.loads(rest_portchannel.sonic_portchannel_sonic_portchannel.model_dump_json(by_alias=True))
-        cfg.update(json.loads(rest_port.sonic_port_sonic_port.model_dump_json(by_alias=True)))
+        cfg = dict(portchannel_data.get(PORTCHANNEL_KEY, {}))
+        cfg.update(port_data.get(PORT_KEY, {}))
         return cfg
 
-    def retrieve_vrf(self) -> dict:
-        rest_vrf = SonicVrfSonicVrf.model_validate(self._sbi_rest_driver.get('{}/sonic-vrf:sonic-vrf'.format(RESTPATH)))
-
-        for vrf_item in rest_vrf.sonic_vrf_sonic_vrf.VRF.VRF_LIST:
-            self.vrfs.append(
-                Vrf.model_validate({
-                    'name': vrf_item.vrf_name,
-                    'rd': str(vrf_item.vni),
-                    'ports': [item for item in self.vlan_l3_ports if item.vrf == vrf_item.vrf_name]
-                })
-            )
-        if 'default' not in [item.name for item in self.vrfs]:
-            self.vrfs.append(
-                Vrf.model_validate({
-                    'name': 'default',
-                    'rd': "default",
-                    'ports': [item for item in self.vlan_l3_ports if item.vrf == None]
-                })
-            )
-        return json.loads(rest_vrf.model_dump_json(by_alias=True))
+    def retrieve_vrf(self, raw: Dict[str, Any] = None) -> dict:
+        from switch.sonic_vrf_model import SonicVrfSonicVrf
+        raw = raw or self._fetch('vrf')
+        vrf_data = self._load(raw, 'vrf', SonicVrfSonicVrf)
+
+        self.vrfs.extend(build_vrfs(decode_vrfs(vrf_data), self.vlan_l3_ports))
+        return vrf_data
+
+    def _bulk_delete(self, table: str, keys: List[str]) -> None:
+        # removes several entries of a sonic-vlan table: one YANG PATCH if the switch supports it, otherwise one
+        # DELETE per entry. Entries already missing are ignored in both cases
+        if not keys:
+            return
+        if self._yang_patch_supported is not False:
+            edits = [{'edit-id': str(i), 'operation': 'remove', 'target': '/{}/{}_LIST={}'.format(table, table, key)}
+                     for i, key in enumerate(keys)]
+            if self._sbi_rest_driver.yang_patch('{}/{}'.format(RESTPATH, VLAN_KEY), 'netcl-del-{}'.format(
+                    table.lower()), edits):
+                self._yang_patch_supported = True
+                return
+            logger.info('switch %s does not support YANG PATCH, deleting entries one by one', self.name)
+            self._yang_patch_supported = False
+        for key in keys:
+            self._sbi_rest_driver.delete('{}/{}/{}/{}_LIST={}'.format(RESTPATH, VLAN_KEY, table, table, key),
+                                         missing_ok=True)
 
     def _add_vlan(self, vlan_ids: List[int]):
-        msg = PostListSonicVlanList()
-        for vlan in vlan_ids:
-            item = SonicVlanListItem(name='Vlan{}'.format(vlan), vlanid=vlan)
-            msg.sonic_vlan_VLAN_LIST.append(item)
-            self._sbi_rest_driver.post('{}/sonic-vlan:sonic-vlan/VLAN'.format(RESTPATH), msg.model_dump(by_alias=True))
+        # one PATCH for the whole set: PATCH merges the entries, so vlans already present are left untouched
+        from switch.sonic_vlan_model import PatchListSonicVlanSonicVlanVlanVlanList, SonicVlanListItem
+        msg = PatchListSonicVlanSonicVlanVlanVlanList()
+        for vlan in dict.fromkeys(vlan_ids):
+            msg.sonic_vlan_VLAN_LIST.append(SonicVlanListItem(name='Vlan{}'.format(vlan), vlanid=vlan))
+        self._sbi_rest_driver.patch('{}/{}/VLAN/VLAN_LIST'.format(RESTPATH, VLAN_KEY),
+                                    msg.model_dump(mode='json', by_alias=True, exclude_none=True))
+        self.vlans.extend(vid for vid in dict.fromkeys(vlan_ids) if vid not in self.vlans)
+        return True
 
     def _del_vlan(self, vlan_ids: List[int]):
-        for _id in vlan_ids:
-            self._sbi_rest_driver.delete("{path}/sonic-vlan:sonic-vlan/VLAN/VLAN_LIST=Vlan{_id}".format(
-                path=RESTPATH, _id=_id))
+        self._bulk_delete('VLAN', ['Vlan{}'.format(_id) for _id in dict.fromkeys(vlan_ids)])
+        removed = set(vlan_ids)
+        self.vlans = [vid for vid in self.vlans if vid not in removed]
+        return True
 
     def _add_vlan_to_port(self, vlan_id: int, port: PhyPort, pvid: bool = False):
-        msg = SonicVlanMemberList()
+        return self._add_vlan_members({port.name: [vlan_id]}, pvid=pvid)
+
+    def _add_vlans_to_port(self, vlan_ids: List[int], port: PhyPort) -> bool:
+        return self._add_vlan_members({port.name: vlan_ids})
+
+    def _add_vlan_members(self, members: Dict[str, List[int]], pvid: bool = False) -> bool:
+        # vlan memberships for any number of ports in a single PATCH of the VLAN_MEMBER table
+        from switch.sonic_vlan_model import TaggingMode, SonicVlanMemberListItem, SonicVlanMemberList
         tag_mode = TaggingMode.untagged if pvid else TaggingMode.tagged
-        item = SonicVlanMemberListItem(name="Vlan{}".format(vlan_id), ifname=port.name, tagging_mode=tag_mode)
-        msg.sonic_vlan_VLAN_MEMBER_LIST.append(item)
-        self._sbi_rest_driver.post("{}/sonic-vlan:sonic-vlan/VLAN_MEMBER".format(RESTPATH),
-                                   msg.model_dump(by_alias=True))
+        msg = SonicVlanMemberList()
+        for port_name, vlan_ids in members.items():
+            for vlan_id in dict.fromkeys(vlan_ids):
+                msg.sonic_vlan_VLAN_MEMBER_LIST.append(SonicVlanMemberListItem(
+                    name="Vlan{}".format(vlan_id), ifname=port_name, tagging_mode=tag_mode))
+        if not msg.sonic_vlan_VLAN_MEMBER_LIST:
+            return True
+        self._sbi_rest_driver.patch('{}/{}/VLAN_MEMBER/VLAN_MEMBER_LIST'.format(RESTPATH, VLAN_KEY),
+                                    msg.model_dump(mode='json', by_alias=True, exclude_none=True))
+        for port_name, vlan_ids in members.items():
+            port = self.lookup('phy_ports', 'name', port_name)
+            if not port:
+                continue
+            if pvid:
+                port.access_vlan = vlan_ids[-1]
+            else:
+                port.trunk_vlans.extend(vid for vid in dict.fromkeys(vlan_ids) if vid not in port.trunk_vlans)
+        return True
 
     def _del_vlan_to_port(self, vlan_ids: List[int], port: PhyPort):
-        for _id in vlan_ids:
-            self._sbi_rest_driver.delete(
-                "{path}/sonic-vlan:sonic-vlan/VLAN_MEMBER/VLAN_MEMBER_LIST={name},{ifname}".format(
-                    path=RESTPATH,
-                    name="Vlan{}".format(_id),
-                    ifname=port.name
-                ))
+        self._bulk_delete('VLAN_MEMBER', ['Vlan{},{}'.format(_id, port.name) for _id in dict.fromkeys(vlan_ids)])
+        removed = set(vlan_ids)
+        port.trunk_vlans = [vid for vid in port.trunk_vlans if vid not in removed]
+        if port.access_vlan in removed:
+            port.access_vlan = None
+        return True
 
     def _set_port_mode(self, port: PhyPort, port_mode: Literal['ACCESS', 'HYBRID', 'TRUNK']):
         pass
 
     def _bind_vrf(self, vrf1: Vrf, vrf2: Vrf) -> bool:
-        pass
+        # route leaking between the two vrfs through bidirectional bgp vrf imports
+        bgp_vrf = next((item for item in [vrf1, vrf2] if item.protocols and item.protocols.bgp), None)
+        if not bgp_vrf:
+            raise ValueError("vrf binding needs a BGP instance in vrf {} or {}".format(vrf1.name, vrf2.name))
+        self._apply_frr(self._get_frr_config().vrf_import_lines(
+            vrf1.name, vrf2.name, as_number=bgp_vrf.protocols.bgp.as_number))
+        return True
 
     def _unbind_vrf(self, vrf1: Vrf, vrf2: Vrf) -> bool:
         pass
 
     def _add_vrf(self, vrf: VrfRequest):
+        from switch.sonic_vrf_model import SonicVrfSonicVrf, SonicVrfListItem
         data = SonicVrfSonicVrf()
         data.sonic_vrf_sonic_vrf.VRF.VRF_LIST = [SonicVrfListItem(vrf_name=vrf.name)]
         res = self._sbi_rest_driver.post(
@@ -272,6 +328,8 @@ class SonicNew(Switch):
 
     def _add_vlan_to_vrf(self, vrf: Vrf, vlan_interface: SwitchRequestVlanL3Port):
         # create a vlan L3 interface and associate it to the requested vrf
+        from switch.sonic_vlan_itf_model import PostListSonicVlanInterface, SonicVlanInterfaceListItem, \
+            SonicVlanInterfaceIPAddrListItem
 
         data = PostListSonicVlanInterface()
         item = SonicVlanInterfaceListItem(
@@ -296,35 +354,60 @@ class SonicNew(Switch):
                 vlanName=vlan_interface.name)
         )
 
-    def _add_bgp_instance(self, vrf_msg: VrfRequest):
-        frr_obj = FrrConfig()
+    def _get_frr_config(self) -> FrrConfig:
+        # running FRR configuration parsed at the last refresh, fetched again only after a change has been applied
+        if not self._frr_config:
+            self._frr_config = FrrConfig.from_raw_config(
+                self._sbi_ssh_driver.stream_command("vtysh -c \"show running-config\""))
+        return self._frr_config
+
+    def _apply_frr(self, commands: List[str]) -> List[str]:
+        # applies a consolidated list of configuration lines in a single vtysh session with a single write memory.
+        # Returns the applied lines, an empty list if the change was a no-op
+        if not commands:
+            logger.info("switch %s: FRR configuration already up to date", self.name)
+            return []
+        res = self._sbi_ssh_driver.send_command(commands=[to_vtysh_command(commands)], json_parse=False)
+        self._frr_config = None
+        if res[0]['_stderr']:
+            raise ValueError(res[0]['_stderr'])
+        return commands
+
+    def diff_vrf_routing(self, vrf_msg: VrfRequest) -> List[str]:
+        # dry run: FRR configuration lines that set_vrf_routing would apply
+        if not vrf_msg.protocols:
+            return []
+        return self._get_frr_config().vrf_routing_lines(
+            vrf_msg.name, bgp=vrf_msg.protocols.bgp,
+            static_routes=vrf_msg.protocols.static.routes if vrf_msg.protocols.static else [])
+
+    def _set_vrf_routing(self, vrf: Vrf, vrf_msg: VrfRequest):
+        # bgp instance, address families, neighbors and static routes are applied together
+        self._apply_frr(self.diff_vrf_routing(vrf_msg))
 
-        frr_cmds = frr_obj.add_bgp_instance_cmd(
+    def _add_bgp_instance(self, vrf_msg: VrfRequest):
+        bgp = vrf_msg.protocols.bgp
+        self._apply_frr(self._get_frr_config().bgp_instance_lines(
             vrfname=vrf_msg.name,
-            as_number=vrf_msg.protocols.bgp.as_number,
-            afs=vrf_msg.protocols.bgp.address_families
-        )
-        self._sbi_ssh_driver.send_command(commands=frr_cmds, json_parse=False)
-
-        for neighbor in vrf_msg.protocols.bgp.neighbors:
-            frr_cmds = frr_obj.add_bgp_peer_cmd(
-                neighbor=neighbor,
-                vrfname=vrf_msg.name,
-                as_number=vrf_msg.protocols.bgp.as_number
-            )
-            self._sbi_ssh_driver.send_command(commands=frr_cmds, json_parse=False)
+            as_number=bgp.as_number,
+            afs=bgp.address_families,
+            neighbors=bgp.neighbors
+        ))
 
     def _del_bgp_instance(self, vrf_name: str):
-        vrf_config = next(item for item in self.vrfs if item.name == vrf_name)
-        frr_obj = FrrConfig()
-        frr_cmds = frr_obj.del_bgp_instance_cmd(vrfname=vrf_name, as_number=vrf_config.protocols.bgp.as_number)
-        self._sbi_ssh_driver.send_command(commands=frr_cmds, json_parse=False)
-
-    def _add_static_route(self, route: IpV4Route, vrf_name: str = 'default'):
-        frr_obj = FrrConfig()
-
-    def _del_static_route(self, route: IpV4Route, vrf_name: str = 'default'):
-        pass
+        vrf_config = self.get_vrf_by_name(vrf_name)
+        frr_obj = self._get_frr_config()
+        if not frr_obj.get_router(vrf_name):
+            logger.info("switch %s: no BGP instance in vrf %s", self.name, vrf_name)
+            return
+        self._apply_frr(["no router bgp {}{}".format(
+            vrf_config.protocols.bgp.as_number, "" if vrf_name == 'default' else " vrf {}".format(vrf_name))])
+
+    def _add_route(self, vrf: Vrf, route: IpV4Route):
+        self._apply_frr(self._get_frr_config().static_route_lines([route], vrf.name))
+
+    def _del_route(self, vrf: Vrf, route: IpV4Route):
+        self._apply_frr(self._get_frr_config().static_route_lines([route], vrf.name, delete=True))
 
     def commit_and_save(self):
         pass
@@ -2,12 +2,18 @@ from __future__ import annotations  # needed to annotate class methods returning
 from models import *
 import abc
 import json
-from typing import List, Union, Tuple
+from typing import List, Union, Tuple, Dict, Any
 import traceback
 from importlib import import_module
 from utils import persistency, create_logger
+from utils.metrics import refresh_seconds
+from utils.tracing import traced
+from utils.operation_control import checkpointed
+from netdevice import changes_device
+from utils.device_events import DeviceStateEvent, device_events
 import datetime
 from threading import Thread
+from pydantic import PrivateAttr
 
 _db = persistency.DB()
 logger = create_logger('switch')
@@ -16,7 +22,8 @@ os_models = {
     'hp_comware': {'module': 'hp_comware', 'class': 'HpComware'},
     'mellanox': {'module': 'mellanox', 'class': 'Mellanox'},
     'microtik': {'module': 'microtik', 'class': 'Microtik'},
-    'sonic': {'module': 'sonic', 'class': 'Sonic'}
+    'sonic': {'module': 'sonic', 'class': 'Sonic'},
+    'sim': {'module': 'sim', 'class': 'SimSwitch'}
 }
 
 
@@ -33,6 +40,8 @@ class SwitchConfigurationException(Exception):
 
 
 class Switch(SwitchDataModel):
+    # (list attribute, key attribute) -> (indexed list, indexed list length, device revision, key -> item)
+    _lookup_indexes: Dict[Tuple[str, str], Tuple[list, int, int, Dict[Any, Any]]] = PrivateAttr(default_factory=dict)
 
     def __eq__(self, other: Switch):
         return self.name == other.name and \
@@ -40,12 +49,42 @@ class Switch(SwitchDataModel):
                self.vlans == other.vlans and self.vrfs == other.vrfs
 
 
+    def set_state(self, state: SwitchStates) -> None:
+        # every state transition is published on the device event bus
+        old_state = self.state
+        self.state = state
+        if old_state != state:
+            self.mark_changed()
+            device_events.publish(DeviceStateEvent(device=self.name, kind='switch', old_state=old_state,
+                                                   new_state=state))
+
+    def initialize(self) -> None:
+        # loads the information of a device restored from the database, run by the thread started by from_db. The
+        # device passes into the ready state only once its information is loaded
+        try:
+            self.retrieve_info()
+        except SwitchNotAuthenticatedException:
+            logger.error("switch %s passed into auth_error state", self.name)
+            self.set_state('auth_error')
+        except SwitchNotConnectedException:
+            logger.error("switch %s passed into net_error state", self.name)
+            self.set_state('net_error')
+        except Exception:
+            logger.error("switch %s initialization failed: %s", self.name, traceback.format_exc())
+            self.set_state('config_error')
+        else:
+            if self.state in INITIALIZING_STATES:
+                self.set_state('ready')
+                logger.info("switch %s passed into ready state", self.name)
+
+    @changes_device
     def retrieve_info(self):
         self.vlan_l3_ports = []
         self.phy_ports = []
         self.vlans = []
         self.vrfs = []
         self._retrieve_info()
+        self.rebuild_indexes()
         self.to_db()
 
 
@@ -53,14 +92,18 @@ class Switch(SwitchDataModel):
     def _retrieve_info(self):
         pass
 
+    @changes_device
+    @traced()
     def update_info(self):
-        logger.info('updating information for switch {}'.format(self.name))
+        logger.info('updating information for switch %s', self.name)
         self.vrfs = []
         self.vlans = []
         self.phy_ports = []
         self.vlan_l3_ports = []
 
-        self._update_info()
+        with refresh_seconds.time(driver=type(self).__name__, device=self.name):
+            self._update_info()
+        self.rebuild_indexes()
 
     @abc.abstractmethod
     def _update_info(self):
@@ -79,38 +122,39 @@ class Switch(SwitchDataModel):
         ).model_validate(input_data.model_dump())
         try:
             switch.retrieve_info()
-            switch.state = "ready"
+            if switch.state in INITIALIZING_STATES:
+                switch.set_state('ready')
         except SwitchNotAuthenticatedException:
-            logger.error("switch {} authentication failed".format(input_data.name))
-            switch.state = "auth_error"
+            logger.error("switch %s authentication failed", input_data.name)
+            switch.set_state('auth_error')
         except SwitchNotConnectedException:
-            logger.error("switch {} not reachable".format(input_data.name))
-            switch.state = "net_error"
+            logger.error("switch %s not reachable", input_data.name)
+            switch.set_state('net_error')
         return switch
 
     @classmethod
     def from_db(cls, device_name: str) -> Tuple[Switch, Thread]:
         db_data = _db.findone_DB("switches", {'name': device_name})
-        logger.debug("dbdata: {}".format(db_data))
+        logger.debug("dbdata: %s", db_data)
         if not db_data:
             raise ValueError('switch {}'.format(device_name))
 
         if db_data['model'] not in os_models:
             raise ValueError('OS type {} for switch {} not found'.format(db_data['model'], device_name))
         switch_os = os_models[db_data['model']]
-        logger.debug("trying to reinitialize object from os_model: {}".format(switch_os))
+        logger.debug("trying to reinitialize object from os_model: %s", switch_os)
         try:
-            logger.debug("module: {} data: {}".format(
+            logger.debug("module: %s data: %s",
                 getattr(import_module(
                     "switch.{}".format(switch_os['module'])
                 ), switch_os['class']),
                 db_data
-            ))
+            )
             switch_obj = getattr(import_module("switch.{}".format(switch_os['module'])), switch_os['class'])(**db_data)
-            switch_obj.state = "reinit"
+            switch_obj.set_state('reinit')
             switch_obj.to_db()
             # sbi_thread = Thread(target=switch_obj.reinit_sbi_drivers)
-            sbi_thread = Thread(target=switch_obj.retrieve_info, name=switch_obj.name)
+            sbi_thread = Thread(target=switch_obj.initialize, name=switch_obj.name)
             sbi_thread.start()
             # switch_obj.reinit_sbi_drivers()
             return switch_obj, sbi_thread
@@ -118,6 +162,7 @@ class Switch(SwitchDataModel):
             logger.error(traceback.format_exc())
             raise ValueError('re-initialization for switch {} failed'.format(device_name))
 
+    @traced()
     def to_db(self, backup: bool =False) -> None:
         if backup:
             collection = 'lastconfig'
@@ -142,7 +187,7 @@ class Switch(SwitchDataModel):
 
     def store_config(self, cfg: str) -> bool:
         if not self.last_config or cfg != self.last_config.config:
-            logger.info("switch {} changed its configuration. Updating data".format(self.name))
+            logger.info("switch %s changed its configuration. Updating data", self.name)
             self.last_config = ConfigItem(time=datetime.datetime.now(), config=cfg)
             self.config_history.append(self.last_config)
             if len(self.config_history) > 100:
@@ -153,16 +198,18 @@ class Switch(SwitchDataModel):
     def reinit_sbi_drivers(self) -> None:
         try:
             self._reinit_sbi_drivers()
-            self.state = 'ready'
-            logger.info("switch {} passed into ready state".format(self.name))
+            # the ready state is set once the information is retrieved, see initialize()
+            logger.info("switch %s drivers initialized", self.name)
         except SwitchNotConnectedException:
-            self.state = 'net_error'
-            logger.error("switch {} passed into net_error state".format(self.name))
+            self.set_state('net_error')
+            logger.error("switch %s passed into net_error state", self.name)
+            # the information cannot be retrieved without drivers: the caller (initialize, create) stops here
+            raise
         except SwitchNotAuthenticatedException:
-            self.state = 'auth_error'
-            logger.error("switch {} passed into auth_error state".format(self.name))
+            self.set_state('auth_error')
+            logger.error("switch %s passed into auth_error state", self.name)
+            raise
         finally:
-            # FixMe: do we need to raise an tread event to notify the network topology in case of errors?
             self.to_db()
 
     @abc.abstractmethod
@@ -173,36 +220,71 @@ class Switch(SwitchDataModel):
     def commit_and_save(self):
         pass
 
+    def rebuild_indexes(self) -> None:
+        self._lookup_indexes = {}
+        for list_name, key in [('phy_ports', 'name'), ('phy_ports', 'index'), ('vrfs', 'name'), ('vrfs', 'rd'),
+                               ('vlan_l3_ports', 'vlan')]:
+            self._get_index(list_name, key)
+
+    def _get_index(self, list_name: str, key: str) -> Dict[Any, Any]:
+        # the index is rebuilt if the list has been replaced or resized, or the device data changed (see
+        # changes_device), since the last build, so that the drivers can keep modifying the lists directly. A driver
+        # replacing items in place and looking them up within the same step calls mark_changed() in between
+        items = getattr(self, list_name)
+        cached = self._lookup_indexes.get((list_name, key))
+        if cached is not None and cached[0] is items and cached[1] == len(items) and cached[2] == self.revision:
+            return cached[3]
+        index = {}
+        for item in items:
+            index.setdefault(getattr(item, key, None), item)
+        self._lookup_indexes[(list_name, key)] = (items, len(items), self.revision, index)
+        return index
+
+    def lookup(self, list_name: str, key: str, value: Any) -> Any:
+        if not hasattr(self, list_name):
+            raise ValueError("Switch {} doesn't have attribute {}".format(self.name, list_name))
+        item = self._get_index(list_name, key).get(value)
+        if item is not None and getattr(item, key, None) != value:
+            # the key of an indexed item has been modified in place
+            self._lookup_indexes.pop((list_name, key), None)
+            item = self._get_index(list_name, key).get(value)
+        return item
+
     def get_port_by_name(self, port_name: str) -> Union[PhyPort, None]:
-        try:
-            return next(item for item in self.phy_ports if item.name == port_name)
-        except StopIteration:
-            logger.error("Port {} not found".format(port_name))
-            return None
+        port = self.lookup('phy_ports', 'name', port_name)
+        if port is None:
+            logger.error("Port %s not found", port_name)
+        return port
+
+    def get_port_by_index(self, port_index: str) -> Union[PhyPort, None]:
+        return self.lookup('phy_ports', 'index', port_index)
 
     def get_vlaninterface_from_vid(self, vid: int) -> VlanL3Port:
-        return next((item for item in self.vlan_l3_ports if item.vlan == vid), None)
+        return self.lookup('vlan_l3_ports', 'vlan', vid)
 
+    @changes_device
+    @checkpointed
+    @traced()
     def add_vlan(self, vlan_ids: List[int]) -> bool:
         # add only vlans not already configured in the switch
         vlan_to_add = [item for item in vlan_ids if item not in self.vlans]
         if not vlan_to_add:
-            logger.warn('all the vlan are already configured')
+            logger.warning('all the vlan are already configured')
             return True
         else:
-            logger.debug("adding vlans {}".format(vlan_to_add))
+            logger.debug("adding vlans %s", vlan_to_add)
             return self._add_vlan(vlan_to_add)
 
     def is_endpoint_for_vlan(self, vlan_id: int, managed_switches: List[str]) -> bool:
         # this function applies check to assess if the current switch is really part of the vlan overlay network
         # to this end, the switch is part if it has a vlan interface or if vlan is applied to any phy interface not
         # neighbouring with managed switches
-        if vlan_id in [item.vlan for item in self.vlan_l3_ports]:
-            logger.debug("switch {} has a vlan interface for vlan {}".format(self.name, vlan_id))
+        if self.get_vlaninterface_from_vid(vlan_id):
+            logger.debug("switch %s has a vlan interface for vlan %s", self.name, vlan_id)
             return True
         for p in self.phy_ports:
             if vlan_id in p.trunk_vlans and p.neighbor.neighbor not in managed_switches:
-                logger.debug("switch {} has at least a port connecting servers with vlan {}".format(self.name, vlan_id))
+                logger.debug("switch %s has at least a port connecting servers with vlan %s", self.name, vlan_id)
                 return True
         return False
 
@@ -210,17 +292,20 @@ class Switch(SwitchDataModel):
     def _add_vlan(self, vlan_ids: List[int]):
         pass
 
+    @changes_device
+    @checkpointed
+    @traced()
     def del_vlan(self, vlan_ids: List[int], force: bool = False):
-        logger.info('self.vlans: {}'.format(self.vlans))
+        logger.info('self.vlans: %s', self.vlans)
         existing_vlans = [item for item in vlan_ids if item in self.vlans]
-        logger.info('existing_vlans: {}'.format(existing_vlans))
+        logger.info('existing_vlans: %s', existing_vlans)
         missing_vlans = list(set(vlan_ids) - set(existing_vlans))
-        logger.info('missing_vlans: {}'.format(missing_vlans))
+        logger.info('missing_vlans: %s', missing_vlans)
         if missing_vlans:
             if force:
-                logger.warn('vlans {} are not configured in this switch. Skipping.'.format(missing_vlans))
+                logger.warning('vlans %s are not configured in this switch. Skipping.', missing_vlans)
             else:
-                logger.warn('vlans {} are not configured in this switch. Aborting.'.format(missing_vlans))
+                logger.warning('vlans %s are not configured in this switch. Aborting.', missing_vlans)
                 return False
         return self._del_vlan(existing_vlans)
 
@@ -232,10 +317,13 @@ class Switch(SwitchDataModel):
         return self.vlans
 
 
+    @changes_device
+    @checkpointed
+    @traced()
     def set_port_mode(self, port_name: str, port_mode: LinkModes):
         port = self.get_port_by_name(port_name)
         if port_mode == port.mode:
-            logger.warning("Port {} is already in {} mode".format(port.index, port_mode))
+            logger.warning("Port %s is already in %s mode", port.index, port_mode)
             return True
         return self._set_port_mode(port, port_mode)
 
@@ -243,16 +331,19 @@ class Switch(SwitchDataModel):
     def _set_port_mode(self, port: PhyPort, port_mode: LinkModes) -> bool:
         pass
 
+    @changes_device
+    @checkpointed
+    @traced()
     def add_vlan_to_port(self, vlan_id: int, port_name: str, port_mode: LinkModes = LinkModes.trunk,
                          pvid: bool = False) -> bool:
         port = self.get_port_by_name(port_name)
         if not port:
             return False
         if port.mode != port_mode:
-            logger.error("Port {} is not in mode {}. aborting!".format(port_name, port_mode))
+            logger.error("Port %s is not in mode %s. aborting!", port_name, port_mode)
             return False
         if vlan_id not in self.vlans:
-            logger.warn("vlan {} not found, adding to the switch vlans")
+            logger.warning("vlan %s not found, adding to the switch vlans", vlan_id)
             self.add_vlan([vlan_id])
         if not pvid and vlan_id not in port.trunk_vlans:
             return self._add_vlan_to_port(vlan_id, port, pvid)
@@ -265,16 +356,43 @@ class Switch(SwitchDataModel):
     def _add_vlan_to_port(self, vlan_id: int, port: PhyPort, pvid: bool = False) -> bool:
         pass
 
+    @changes_device
+    @checkpointed
+    @traced()
+    def add_vlans_to_port(self, vlan_ids: List[int], port_name: str, port_mode: LinkModes = LinkModes.trunk) -> bool:
+        # adds a set of trunk vlans to a port, creating the missing vlans in a single request
+        port = self.get_port_by_name(port_name)
+        if not port:
+            return False
+        if port.mode != port_mode:
+            logger.error("Port %s is not in mode %s. aborting!", port_name, port_mode)
+            return False
+        self.add_vlan(vlan_ids)
+        vlans_to_add = [vid for vid in dict.fromkeys(vlan_ids) if vid not in port.trunk_vlans]
+        if not vlans_to_add:
+            logger.debug('vlans %s already configured on port %s', vlan_ids, port_name)
+            return True
+        return self._add_vlans_to_port(vlans_to_add, port)
+
+    def _add_vlans_to_port(self, vlan_ids: List[int], port: PhyPort) -> bool:
+        # drivers supporting bulk operations should override this method
+        for vid in vlan_ids:
+            self._add_vlan_to_port(vid, port)
+        return True
+
+    @changes_device
+    @checkpointed
+    @traced()
     def del_vlan_to_port(self, vlan_ids: List[int], port_name: str, port_mode: LinkModes = LinkModes.trunk) -> bool:
         port = self.get_port_by_name(port_name)
         if not port:
             return False
         if port.mode != port_mode:
-            logger.error("Port {} is not in mode {}. aborting!".format(port_name, port_mode))
+            logger.error("Port %s is not in mode %s. aborting!", port_name, port_mode)
             return False
         for vid in vlan_ids:
             if vid not in self.vlans:
-                logger.warn("vlan {} not found, deletion aborted")
+                logger.warning("vlan %s not found, deletion aborted", vid)
                 return False
         return self._del_vlan_to_port(vlan_ids, port)
 
@@ -283,26 +401,36 @@ class Switch(SwitchDataModel):
         pass
 
     def get_vrf_by_rd(self, rd: str) -> Vrf:
-        return next(item for item in self.vrfs if item.rd == rd)
+        vrf = self.lookup('vrfs', 'rd', rd)
+        if vrf is None:
+            raise StopIteration
+        return vrf
 
     def get_vrf_by_name(self, name: str) -> Vrf:
-        return next(item for item in self.vrfs if item.rd == name)
+        vrf = self.lookup('vrfs', 'name', name)
+        if vrf is None:
+            raise StopIteration
+        return vrf
 
     def get_bound_vrfs(self, vrf_name: str) -> List[Vrf]:
         try:
-            vrf = next(item for item in self.vrfs if item.name == vrf_name)
+            vrf = self.get_vrf_by_name(vrf_name)
         except StopIteration:
-            logger.error("Vrf {} not found".format(vrf_name))
+            logger.error("Vrf %s not found", vrf_name)
             return []
         bound_vrf = []
         for bound_rd in vrf.rd_import:
             try:
-                logger.debug("checking RD {} bound to VRF {}".format(bound_rd, vrf_name))
+                logger.debug("checking RD %s bound to VRF %s", bound_rd, vrf_name)
                 vrf_to_add = self.get_vrf_by_rd(bound_rd)
                 bound_vrf.append(vrf_to_add)
             except StopIteration:
-                logger.warning("Route Descriptor {} not found in the switch".format(bound_rd))
+                logger.warning("Route Descriptor %s not found in the switch", bound_rd)
+        return bound_vrf
 
+    @changes_device
+    @checkpointed
+    @traced()
     def bind_vrf(self, vrf_name1: str, vrf_name2: str) -> bool:
         try:
             vrf1 = self.get_vrf_by_name(vrf_name1)
@@ -329,14 +457,17 @@ class Switch(SwitchDataModel):
         vrf2_to_vrf1 = True if [item for item in vrfs_bound_to_vrf1 if item == vrf2] else False
         vrf1_to_vrf2 = True if [item for item in vrfs_bound_to_vrf2 if item == vrf1] else False
         if vrf2_to_vrf1 and vrf1_to_vrf2:
-            logger.debug("VRFs {} and {} are bidirectionally bound".format(vrf1.name, vrf2.name))
+            logger.debug("VRFs %s and %s are bidirectionally bound", vrf1.name, vrf2.name)
             return True
         elif not vrf2_to_vrf1 and not vrf1_to_vrf2:
-            logger.debug("VRFs {} and {} are bidirectionally unbound".format(vrf1.name, vrf2.name))
+            logger.debug("VRFs %s and %s are bidirectionally unbound", vrf1.name, vrf2.name)
             return False
         else:
             raise ValueError("VRFs {} and {} are asymmetrically bound!".format(vrf1.name, vrf2.name))
 
+    @changes_device
+    @checkpointed
+    @traced()
     def unbind_vrf(self, vrf_name1, vrf_name2):
         try:
             vrf1 = self.get_vrf_by_name(vrf_name1)
@@ -358,11 +489,14 @@ class Switch(SwitchDataModel):
     def _unbind_vrf(self, vrf1: Vrf, vrf2: Vrf) -> bool:
         pass
 
+    @changes_device
+    @checkpointed
+    @traced()
     def add_vlan_to_vrf(self, vrf: Vrf, vlan_interface: SwitchRequestVlanL3Port) -> bool:
         if not self.check_status():
             raise ValueError("switch {} is in {} status".format(self.name, self.state))
         if vlan_interface.vlan not in self.vlans:
-            logger.warn("vlan {} not configured on switch {}. Adding it.".format(vlan_interface.vlan, self.name))
+            logger.warning("vlan %s not configured on switch %s. Adding it.", vlan_interface.vlan, self.name)
             self.add_vlan([vlan_interface.vlan])
 
         return self._add_vlan_to_vrf(vrf, vlan_interface)
@@ -371,26 +505,39 @@ class Switch(SwitchDataModel):
     def _add_vlan_to_vrf(self, vrf: Vrf, vlan_interface: SwitchRequestVlanL3Port) -> bool:
         pass
 
+    @changes_device
+    @checkpointed
+    @traced()
     def del_vlan_to_vrf(self, vrf_name: str, vlan_id: int) -> bool:
         if not self.check_status():
             raise ValueError("switch {} is in {} status".format(self.name, self.state))
-        vlan_interface = next((item for item in self.vlan_l3_ports if item.vlan == vlan_id), None)
+        vlan_interface = self.get_vlaninterface_from_vid(vlan_id)
         if not vlan_interface:
             raise ValueError('Vlan interface with vlan id {} non existing on switch {}'.format(
                 vlan_id, self.name))
-        selected_vrf = next(item for item in self.vrfs if item.name == vrf_name)
+        selected_vrf = self.get_vrf_by_name(vrf_name)
         if vlan_interface.vrf != vrf_name:
             raise ValueError('Vlan interface with vlan id {} is not associated to the vrf {} in switch {}'.format(
                 vlan_id, vrf_name, self.name))
         return self._del_vlan_to_vrf(selected_vrf, vlan_interface)
 
+    @changes_device
+    @checkpointed
+    @traced()
     def add_vrf(self, vrf_msg: VrfRequest):
         if vrf_msg.name in [item.name for item in self.vrfs]:
             raise ValueError("VRF {} already existing in switch {}. Vrf creation aborted.".format(
                 vrf_msg.name, self.name))
         self._add_vrf(vrf_msg)
 
+    @changes_device
+    @checkpointed
+    @traced()
     def set_vrf_routing(self, vrf: Vrf, vrf_msg: VrfRequest):
+        self._set_vrf_routing(vrf, vrf_msg)
+
+    def _set_vrf_routing(self, vrf: Vrf, vrf_msg: VrfRequest):
+        # drivers applying the whole routing configuration at once should override this method
         if vrf_msg.protocols:
             if vrf_msg.protocols.bgp:
                 self._add_bgp_instance(vrf_msg)
@@ -398,6 +545,9 @@ class Switch(SwitchDataModel):
                 for route in vrf_msg.protocols.static.routes:
                     self.add_route(vrf, route)
 
+    @changes_device
+    @checkpointed
+    @traced()
     def add_route(self, vrf: Vrf, route: IpV4Route):
         if not vrf.protocols:
             vrf.protocols = RoutingProtocols()
@@ -406,6 +556,9 @@ class Switch(SwitchDataModel):
 
         self._add_route(vrf, route)
 
+    @changes_device
+    @checkpointed
+    @traced()
     def del_route(self, vrf: Vrf, route: IpV4Route):
         self._del_route(vrf, route)
 
@@ -436,6 +589,9 @@ class Switch(SwitchDataModel):
     def _add_vrf(self, vrf_msg: VrfRequest):
         pass
 
+    @changes_device
+    @checkpointed
+    @traced()
     def del_vrf(self, vrf_name: str):
         vrf = next((item for item in self.vrfs if item.name == vrf_name), None)
         if not vrf:
@@ -465,8 +621,8 @@ class Switch(SwitchDataModel):
 
     def get_neighbors(self, port_name=None) -> Union[LldpNeighbor, List[LldpNeighbor]]:
         if port_name:
-            return next(
-                (item.neighbor for item in self.phy_ports if item.name == port_name or item.index == port_name), None)
+            port = self.lookup('phy_ports', 'name', port_name) or self.get_port_by_index(port_name)
+            return port.neighbor if port else None
         else:
             return [item.neighbor for item in self.phy_ports if item.neighbor]
 
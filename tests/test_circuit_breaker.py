@@ -0,0 +1,113 @@
+import threading
+
+import pytest
+
+from sbi.circuit_breaker import CircuitBreaker, CircuitOpenException
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def _breaker(clock: FakeClock) -> CircuitBreaker:
+    return CircuitBreaker('sw1', failure_threshold=3, open_timeout=10, open_timeout_max=35, clock=clock,
+                          jitter=lambda: 1.0)
+
+
+def _open(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        assert not breaker.before_call()
+        breaker.record_failure()
+
+
+def _in_other_thread(func):
+    res = []
+
+    def run():
+        try:
+            res.append(func())
+        except Exception as e:
+            res.append(e)
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    return res[0]
+
+
+def test_opens_after_failure_threshold():
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    for _ in range(breaker.failure_threshold - 1):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == 'closed' and not breaker.is_open()
+    # a success resets the consecutive failures
+    breaker.record_success()
+    _open(breaker)
+    assert breaker.state == 'open' and breaker.is_open()
+    with pytest.raises(CircuitOpenException) as e:
+        breaker.before_call()
+    assert e.value.retry_at is not None
+    clock.advance(9.9)
+    assert breaker.is_open()
+
+
+def test_single_probe_while_half_open():
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    _open(breaker)
+    clock.advance(10)
+    assert not breaker.is_open()
+    assert breaker.before_call()
+    assert breaker.state == 'half_open'
+    # the nested calls of the probe go through, the calls of the other threads fail fast
+    assert not breaker.before_call()
+    error = _in_other_thread(breaker.before_call)
+    assert isinstance(error, CircuitOpenException) and error.retry_at is None
+    # a probe ended without an outcome lets the next call probe the device
+    breaker.release_probe()
+    assert _in_other_thread(breaker.before_call) is True
+
+
+def test_probe_success_closes():
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    _open(breaker)
+    clock.advance(10)
+    assert breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0
+    assert not breaker.before_call()
+    assert not _in_other_thread(breaker.before_call)
+
+
+def test_probe_failure_doubles_open_time():
+    clock = FakeClock()
+    breaker = _breaker(clock)
+    _open(breaker)
+    clock.advance(10)
+    # doubled at each failed probe, up to open_timeout_max
+    for open_time in [20, 35, 35]:
+        assert breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == 'open'
+        clock.advance(open_time - 0.1)
+        with pytest.raises(CircuitOpenException):
+            breaker.before_call()
+        clock.advance(0.1)
+        assert not breaker.is_open()
+    # after a success, the open time starts again from open_timeout
+    assert breaker.before_call()
+    breaker.record_success()
+    _open(breaker)
+    clock.advance(9.9)
+    assert breaker.is_open()
+    clock.advance(0.1)
+    assert not breaker.is_open()
@@ -0,0 +1,95 @@
+import pytest
+
+from firewall.pfsense import PfSense
+from firewall.rules import FirewallRuleSet
+from models import FirewallRule, FirewallRuleEndpoint
+
+
+def _rule(rule_id, interfaces, description='', source='any'):
+    return FirewallRule(id=rule_id, description=description, interfaces=interfaces,
+                        source=FirewallRuleEndpoint(address=source))
+
+
+def _rule_set() -> FirewallRuleSet:
+    return FirewallRuleSet([
+        _rule('1', ['opt1'], 'web', source='10.0.0.1'),
+        _rule('2', ['opt1'], 'old'),
+        # shared with an interface which is not synced
+        _rule('3', ['opt1', 'opt2'], 'shared'),
+        _rule('4', ['opt2'], 'other')
+    ])
+
+
+def test_diff_unsynced_interfaces():
+    diff = _rule_set().diff([_rule(None, ['opt1'], 'web', source='10.0.0.2')], interfaces=['opt1'])
+    assert [rule.id for rule in diff.update] == ['1'] and diff.update[0].source.address == '10.0.0.2'
+    assert [rule.id for rule in diff.delete] == ['2']
+    assert diff.create == []
+
+
+def test_diff_shared_rule_not_matched():
+    # a desired rule equal to a rule applied also to an interface which is not synced is created
+    diff = _rule_set().diff([_rule(None, ['opt1', 'opt2'], 'shared')], interfaces=['opt1'])
+    assert [rule.description for rule in diff.create] == ['shared']
+    assert {rule.id for rule in diff.delete} == {'1', '2'}
+    # all the interfaces of the rule are synced
+    diff = _rule_set().diff([_rule(None, ['opt1', 'opt2'], 'shared')], interfaces=['opt1', 'opt2'])
+    assert diff.create == [] and {rule.id for rule in diff.delete} == {'1', '2', '4'}
+
+
+class FakePfSenseRest:
+    def __init__(self, fail_on=(), fail_reload=False):
+        self.fail_on = fail_on
+        self.fail_reload = fail_reload
+        self.requests = []
+
+    def _request(self, method, command):
+        self.requests.append((method, command))
+        if method in self.fail_on:
+            raise ValueError('{} {} failed'.format(method, command))
+
+    def delete(self, command):
+        self._request('delete', command)
+
+    def put(self, command, data):
+        self._request('put', command)
+
+    def post(self, command, data):
+        if command == 'firewall/apply':
+            self.requests.append(('apply', command))
+            if self.fail_reload:
+                raise ValueError('filter reload failed')
+            return
+        self._request('post', command)
+
+
+def _firewall(rest: FakePfSenseRest) -> PfSense:
+    firewall = PfSense(name='fw1', model='pfsense', user=None, passwd=None, address='127.0.0.1', state='ready')
+    firewall._sbi_rest_driver = rest
+    firewall._rule_set = _rule_set()
+    return firewall
+
+
+def test_sync_rules_unsynced_interfaces_survive():
+    rest = FakePfSenseRest()
+    firewall = _firewall(rest)
+    firewall.sync_rules([_rule(None, ['opt1'], 'web', source='10.0.0.1')], interfaces=['opt1'])
+    assert rest.requests == [('delete', 'firewall/rule?tracker=2&apply=false'), ('apply', 'firewall/apply')]
+    assert {rule.id for rule in firewall.get_rule_set()} == {'1', '3', '4'}
+
+
+def test_sync_rules_error_not_hidden_by_reload():
+    # the first delete is accepted, the update fails, the filter reload of the accepted change fails too: the error
+    # of the update is raised
+    rest = FakePfSenseRest(fail_on=('put',), fail_reload=True)
+    firewall = _firewall(rest)
+    with pytest.raises(ValueError, match='put firewall/rule failed'):
+        firewall.sync_rules([_rule(None, ['opt1'], 'web', source='10.0.0.2')], interfaces=['opt1'])
+    assert [request[0] for request in rest.requests] == ['delete', 'put', 'apply']
+
+
+def test_sync_rules_reload_error():
+    rest = FakePfSenseRest(fail_reload=True)
+    firewall = _firewall(rest)
+    with pytest.raises(ValueError, match='filter reload failed'):
+        firewall.sync_rules([], interfaces=['opt2'])
@@ -0,0 +1,72 @@
+import pytest
+import requests
+
+from models import LinkModes, PhyPort
+from switch.microtik import Microtik
+
+
+class FakeRosRest:
+    # bridge port table of the device: a PATCH on a missing row fails as RosRestSbi does on HTTP errors
+    def __init__(self, rows, error=ValueError):
+        self.rows = {row['.id']: row for row in rows}
+        self.error = error
+        self.patches = []
+
+    def get(self, command):
+        assert command == '/interface/bridge/port'
+        return [dict(row) for row in self.rows.values()]
+
+    def patch(self, command, data):
+        row_id = command.rsplit('/', 1)[1]
+        self.patches.append(row_id)
+        if row_id not in self.rows:
+            raise self.error('[RouterOS: got other error with code 404')
+        self.rows[row_id].update(data)
+        return dict(self.rows[row_id])
+
+
+class RouterOsSwitch(Microtik):
+    # the driver does not support vrfs and static routes
+    def _add_vrf(self, vrf): raise NotImplementedError
+    def _del_vrf(self, vrf): raise NotImplementedError
+    def _add_route(self, vrf, route): raise NotImplementedError
+    def _del_route(self, vrf, route): raise NotImplementedError
+
+
+def _switch(rest: FakeRosRest, cached_rows) -> Microtik:
+    switch = RouterOsSwitch(name='mt1', model='microtik', user=None, passwd=None, address='127.0.0.1', phy_ports=[
+        PhyPort(index='*1', name='ether1', trunk_vlans=[], mode=LinkModes.access)])
+    switch._sbi_rest_driver = rest
+    switch._bridge_ports = {row['interface']: dict(row) for row in cached_rows}
+    return switch
+
+
+def test_set_port_mode():
+    rest = FakeRosRest([{'.id': '*A', 'interface': 'ether1'}])
+    switch = _switch(rest, [{'.id': '*A', 'interface': 'ether1'}])
+    port = switch.get_port_by_name('ether1')
+    switch._set_port_mode(port, 'TRUNK')
+    assert rest.patches == ['*A']
+    assert rest.rows['*A']['frame-types'] == 'admit-only-vlan-tagged'
+    assert port.mode == 'TRUNK'
+
+
+@pytest.mark.parametrize('error', [ValueError, requests.HTTPError])
+def test_set_port_mode_stale_cache(error):
+    # the port row was recreated on the device with another id: the bridge ports are read again and the write retried
+    rest = FakeRosRest([{'.id': '*B', 'interface': 'ether1'}], error=error)
+    switch = _switch(rest, [{'.id': '*A', 'interface': 'ether1'}])
+    port = switch.get_port_by_name('ether1')
+    switch._set_port_mode(port, 'HYBRID')
+    assert rest.patches == ['*A', '*B']
+    assert rest.rows['*B']['frame-types'] == 'admit-all'
+    assert switch._bridge_ports['ether1']['frame-types'] == 'admit-all'
+    assert port.mode == 'HYBRID'
+
+
+def test_set_port_mode_missing_port():
+    rest = FakeRosRest([{'.id': '*B', 'interface': 'ether2'}])
+    switch = _switch(rest, [])
+    with pytest.raises(ValueError, match='ether1 is not a bridge port'):
+        switch._set_port_mode(switch.get_port_by_name('ether1'), 'TRUNK')
+    assert rest.patches == []
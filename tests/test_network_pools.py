@@ -0,0 +1,187 @@
+import random
+from ipaddress import IPv4Network
+
+import pytest
+
+from network.network_models import NetworkState
+from network.network_pools import LEGACY_EMPTY_POOL_PREFIXLEN, MAX_VLAN_ID, SubnetPool, VlanBitmap
+
+# randomized model checks: each pool is driven by a seeded random sequence of operations and compared, after every
+# operation, with a plain set of the free items; the handed out items are tracked to check that none of them is
+# allocated twice
+SEEDS = range(20)
+STEPS = 400
+
+# /30 blocks of a /24
+UNIVERSE = IPv4Network('10.0.0.0/24')
+PREFIXLEN = 30
+BLOCKS = list(UNIVERSE.subnets(new_prefix=PREFIXLEN))
+
+
+def _check_vlan_pool(pool: VlanBitmap, free: set) -> None:
+    assert list(pool) == sorted(free)
+    assert len(pool) == len(free)
+    assert VlanBitmap.from_ranges(pool.to_ranges()) == pool
+
+
+def _check_subnet_pool(pool: SubnetPool, free: set) -> None:
+    assert list(pool) == sorted(free)
+    assert len(pool) == len(free)
+    assert bool(pool) == bool(free)
+    # sorted, disjoint and not adjacent intervals
+    for i in range(len(pool._starts) - 1):
+        assert pool._ends[i] + 1 < pool._starts[i + 1]
+    assert SubnetPool.validate(pool.to_dict()) == pool
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_vlan_bitmap_model(seed):
+    rnd = random.Random(seed)
+    vids = range(1, 64)
+    free = set(rnd.sample(vids, 32))
+    pool = VlanBitmap(free)
+    allocated = set(vids) - free
+    for _ in range(STEPS):
+        vid = rnd.choice(vids)
+        op = rnd.choice(['pop_first', 'remove', 'add', 'discard'])
+        if op == 'pop_first':
+            if free:
+                vid = pool.pop_first()
+                assert vid == min(free) and vid not in allocated
+                free.remove(vid)
+                allocated.add(vid)
+            else:
+                with pytest.raises(ValueError):
+                    pool.pop_first()
+        elif op == 'remove':
+            if vid in free:
+                pool.remove(vid)
+                free.remove(vid)
+                allocated.add(vid)
+            else:
+                with pytest.raises(ValueError):
+                    pool.remove(vid)
+        elif op == 'add':
+            # release of an allocated vlan
+            pool.add(vid)
+            free.add(vid)
+            allocated.discard(vid)
+        else:
+            # vlan found in use on a device
+            pool.discard(vid)
+            if vid in free:
+                free.remove(vid)
+                allocated.add(vid)
+        assert not free & allocated
+        _check_vlan_pool(pool, free)
+
+
+def test_vlan_bitmap_bounds():
+    pool = VlanBitmap()
+    with pytest.raises(ValueError):
+        pool.add(MAX_VLAN_ID)
+    with pytest.raises(ValueError):
+        pool.pop_first()
+    assert MAX_VLAN_ID not in pool and -1 not in pool
+    pool = VlanBitmap.from_ranges('10-20,30, 40-41')
+    assert list(pool) == list(range(10, 21)) + [30, 40, 41]
+    assert pool.to_ranges() == '10-20,30,40-41'
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_subnet_pool_model(seed):
+    rnd = random.Random(seed)
+    free = set(rnd.sample(BLOCKS, len(BLOCKS) // 2))
+    pool = SubnetPool.from_networks(rnd.sample(sorted(free), len(free)), PREFIXLEN)
+    allocated = set(BLOCKS) - free
+    for _ in range(STEPS):
+        block = rnd.choice(BLOCKS)
+        op = rnd.choice(['pop_first', 'reserve', 'release', 'release_supernet', 'remove_overlapping'])
+        if op == 'pop_first':
+            if free:
+                block = pool.pop_first()
+                assert block == min(free) and block not in allocated
+                free.remove(block)
+                allocated.add(block)
+            else:
+                with pytest.raises(ValueError):
+                    pool.pop_first()
+        elif op == 'reserve':
+            if block in free:
+                assert pool.reserve(block) == block
+                free.remove(block)
+                allocated.add(block)
+            else:
+                with pytest.raises(ValueError):
+                    pool.reserve(block)
+        elif op == 'release':
+            if block in free:
+                # a free subnet cannot be released twice
+                with pytest.raises(ValueError):
+                    pool.add(block)
+            else:
+                pool.add(block)
+                free.add(block)
+                allocated.remove(block)
+        elif op == 'release_supernet':
+            # a subnet larger than the block size is released as all its blocks
+            supernet = block.supernet(new_prefix=rnd.randint(PREFIXLEN - 3, PREFIXLEN - 1))
+            blocks = set(supernet.subnets(new_prefix=PREFIXLEN))
+            if blocks & free:
+                with pytest.raises(ValueError):
+                    pool.add(supernet)
+            else:
+                pool.add(supernet)
+                free |= blocks
+                allocated -= blocks
+        else:
+            # subnet found in use on a device, of any size
+            network = IPv4Network((int(block.network_address) + rnd.randrange(4), rnd.randint(26, 32)), strict=False)
+            pool.remove_overlapping(network)
+            overlapping = {item for item in free if item.overlaps(network)}
+            free -= overlapping
+            allocated |= overlapping
+        assert not free & allocated
+        _check_subnet_pool(pool, free)
+
+
+def test_subnet_pool_from_networks():
+    with pytest.raises(ValueError):
+        SubnetPool.from_networks([])
+    pool = SubnetPool.from_networks([], 30)
+    assert pool.prefixlen == 30 and not pool
+    with pytest.raises(ValueError):
+        pool.pop_first()
+    with pytest.raises(ValueError):
+        SubnetPool.from_networks(['10.0.0.0/30', '10.0.0.8/29'])
+    # the networks of the pool are split in blocks of the given size, but cannot be smaller
+    pool = SubnetPool.from_networks(['10.0.0.0/29'], 30)
+    assert list(pool) == [IPv4Network('10.0.0.0/30'), IPv4Network('10.0.0.4/30')]
+    with pytest.raises(ValueError):
+        SubnetPool.from_networks(['10.0.0.0/31'], 30)
+
+
+def test_network_state_legacy_lists():
+    # status document saved before the introduction of the pools, with exhausted subnet lists
+    document = {
+        'available_vrf_uplink_vlans': [10, 11],
+        'available_vrf_uplink_subnets': ['10.0.0.0/30', '10.0.0.4/30'],
+        'available_pnf_vlans': [],
+        'available_pnf_subnets': []
+    }
+    state = NetworkState.model_validate(document)
+    assert list(state.available_vrf_uplink_vlans) == [10, 11]
+    assert state.available_vrf_uplink_subnets.prefixlen == 30 and len(state.available_vrf_uplink_subnets) == 2
+    assert not state.available_pnf_subnets and not state.available_pnf_vlans
+    assert state.available_pnf_subnets.prefixlen == LEGACY_EMPTY_POOL_PREFIXLEN
+    with pytest.raises(ValueError):
+        state.get_and_reserve_pnf_subnet()
+
+    # the block size of the exhausted pools is taken from the network configuration, when given
+    state = NetworkState.model_validate(document, context={'subnet_prefixlens': {'available_pnf_subnets': 29}})
+    assert state.available_pnf_subnets.prefixlen == 29
+    state.available_pnf_subnets.add('10.1.0.0/28')
+    assert list(state.available_pnf_subnets) == [IPv4Network('10.1.0.0/29'), IPv4Network('10.1.0.8/29')]
+
+    # the current format round trips
+    assert NetworkState.model_validate(state.model_dump()) == state
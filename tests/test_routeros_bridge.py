@@ -0,0 +1,124 @@
+import random
+
+import pytest
+
+from switch.routeros_bridge import BridgeRowOp, BridgeVlanTable, format_vlan_ids, parse_vlan_ids
+
+SEEDS = range(20)
+STEPS = 50
+VIDS = range(10, 30)
+PORTS = ['tnt', 'ether1', 'ether2', 'ether3']
+
+
+def _table() -> BridgeVlanTable:
+    table = BridgeVlanTable('tnt')
+    table.load([
+        {'.id': '*1', 'bridge': 'tnt', 'vlan-ids': '10,20', 'tagged': 'ether1,tnt', 'untagged': ''},
+        {'.id': '*2', 'bridge': 'tnt', 'vlan-ids': '30', 'tagged': 'tnt', 'untagged': ''}
+    ])
+    return table
+
+
+def test_plan_moves_vlan_to_new_row():
+    table = _table()
+    table.add_port(20, 'ether2')
+    assert table.plan() == [
+        BridgeRowOp('patch', '*1', {'vlan-ids': '10'}),
+        BridgeRowOp('put', None, {'bridge': 'tnt', 'vlan-ids': '20', 'tagged': 'ether1,ether2,tnt', 'untagged': ''})
+    ]
+
+
+def test_plan_merges_into_row_with_same_membership():
+    # the emptied row is deleted before the vlan is declared in the other row
+    table = _table()
+    table.add_port(30, 'ether1')
+    assert table.plan() == [BridgeRowOp('delete', '*2', {}), BridgeRowOp('patch', '*1', {'vlan-ids': '10,20,30'})]
+
+
+def test_plan_reuses_emptied_row():
+    table = _table()
+    table.add_port(30, 'ether2')
+    assert table.plan() == [BridgeRowOp('patch', '*2', {'vlan-ids': '30', 'tagged': 'ether2,tnt', 'untagged': ''})]
+    table = _table()
+    table.del_vlan(30)
+    table.add_vlan(40, tagged=['tnt'])
+    assert table.plan() == [BridgeRowOp('patch', '*2', {'vlan-ids': '40', 'tagged': 'tnt', 'untagged': ''})]
+
+
+def test_plan_unchanged_membership():
+    table = _table()
+    table.add_port(10, 'ether1')
+    table.add_vlan(30)
+    assert table.plan() == []
+    with pytest.raises(ValueError):
+        table.add_port(50, 'ether1')
+    with pytest.raises(ValueError):
+        table.add_port(10, 'ether1', untagged=True)
+
+
+def _apply(rows: dict, op: BridgeRowOp, next_id: int) -> dict:
+    # bridge vlan table of the device: a vlan declared in two rows is rejected
+    if op.method == 'delete':
+        rows.pop(op.row_id)
+        return None
+    if op.method == 'patch':
+        row = dict(rows[op.row_id], **op.data)
+        row_id = op.row_id
+    else:
+        row_id = '*{:X}'.format(next_id)
+        row = dict(op.data, **{'.id': row_id})
+    for other_id, other in rows.items():
+        if other_id != row_id:
+            assert not set(parse_vlan_ids(row['vlan-ids'])) & set(parse_vlan_ids(other['vlan-ids']))
+    rows[row_id] = row
+    return row
+
+
+def _device_membership(rows: dict) -> dict:
+    res = {}
+    for row in rows.values():
+        for vid in parse_vlan_ids(row['vlan-ids']):
+            res[vid] = (frozenset(p for p in row['tagged'].split(',') if p),
+                        frozenset(p for p in row['untagged'].split(',') if p))
+    return res
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_plan_model(seed):
+    # each batch of random changes is planned and applied to a simulated device table, which must end up with the
+    # desired membership of all the vlans, and the cache aligned with it
+    rnd = random.Random(seed)
+    rows = {}
+    for i, vids in enumerate([rnd.sample(VIDS, 4) for _ in range(3)]):
+        rows['*{}'.format(i + 1)] = {'.id': '*{}'.format(i + 1), 'bridge': 'tnt', 'vlan-ids': format_vlan_ids(vids),
+                                     'tagged': 'tnt', 'untagged': ''}
+    # vlans declared in two rows are not expected on the device
+    seen = set()
+    for row in rows.values():
+        vids = [vid for vid in parse_vlan_ids(row['vlan-ids']) if vid not in seen]
+        seen.update(vids)
+        row['vlan-ids'] = format_vlan_ids(vids)
+    table = BridgeVlanTable('tnt')
+    table.load([dict(row) for row in rows.values()])
+    next_id = 100
+    for _ in range(STEPS):
+        for _ in range(rnd.randint(1, 4)):
+            vid = rnd.choice(VIDS)
+            op = rnd.choice(['add_vlan', 'del_vlan', 'add_port', 'del_port'])
+            if op == 'add_vlan':
+                table.add_vlan(vid, tagged=['tnt'])
+            elif op == 'del_vlan':
+                table.del_vlan(vid)
+            elif table.has_vlan(vid):
+                if op == 'add_port':
+                    table.add_port(vid, rnd.choice(PORTS[1:]))
+                else:
+                    table.del_port(vid, rnd.choice(PORTS[1:]))
+        desired = {vid: table.get_membership(vid) for vid in table.get_vlans()}
+        for op in table.plan():
+            next_id += 1
+            table.applied(op, _apply(rows, op, next_id))
+        table.committed()
+        assert _device_membership(rows) == desired
+        assert {vid: table.get_membership(vid) for vid in table.get_vlans()} == desired
+        assert table.plan() == []
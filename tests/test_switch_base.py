@@ -0,0 +1,86 @@
+from typing import List
+
+import pytest
+from pydantic import PrivateAttr
+
+from models import LinkModes, PhyPort, Vrf, VrfRequest
+from switch.switch_base import Switch
+
+
+class FakeSwitch(Switch):
+    # in-memory driver: the configuration requests are recorded and applied to the switch data
+    _requests: list = PrivateAttr(default_factory=list)
+
+    def _add_vlan(self, vlan_ids: List[int]):
+        self._requests.append(('add_vlan', vlan_ids))
+        self.vlans.extend(vlan_ids)
+        return True
+
+    def _add_vlan_to_port(self, vlan_id: int, port: PhyPort):
+        self._requests.append(('add_vlan_to_port', vlan_id, port.name))
+        port.trunk_vlans.append(vlan_id)
+
+    def _add_vrf(self, vrf_msg: VrfRequest):
+        self.vrfs.append(Vrf(name=vrf_msg.name, rd=vrf_msg.rd or vrf_msg.name, ports=[]))
+
+    def _del_vrf(self, vrf_name: str):
+        del self.vrfs[[item.name for item in self.vrfs].index(vrf_name)]
+
+    def _reinit_sbi_drivers(self): pass
+    def _retrieve_info(self): pass
+    def _update_info(self): pass
+    def commit_and_save(self): pass
+    def _del_vlan(self, vlan_ids): pass
+    def _set_port_mode(self, port, port_mode): pass
+    def _del_vlan_to_port(self, vlan_id, port): pass
+    def _bind_vrf(self, vrf1, vrf2): pass
+    def _unbind_vrf(self, vrf1, vrf2): pass
+    def _add_vlan_to_vrf(self, vrf, vlan_interface): pass
+    def _del_vlan_to_vrf(self, vrf, vlan_interface): pass
+    def _add_route(self, vrf, route): pass
+    def _del_route(self, vrf, route): pass
+
+
+def _switch() -> FakeSwitch:
+    switch = FakeSwitch(name='leaf1', model='fake', user=None, passwd=None, address='127.0.0.1', vlans=[1, 10],
+                        phy_ports=[PhyPort(index='1', name='Ethernet1', trunk_vlans=[10], mode=LinkModes.trunk)])
+    switch.rebuild_indexes()
+    return switch
+
+
+def test_add_vlans_to_port():
+    switch = _switch()
+    assert switch.add_vlans_to_port([10, 20], 'Ethernet1')
+    assert switch._requests == [('add_vlan', [20]), ('add_vlan_to_port', 20, 'Ethernet1')]
+    assert switch.get_port_by_name('Ethernet1').trunk_vlans == [10, 20]
+
+
+def test_add_vlans_to_port_already_present():
+    # vlans already on the port: nothing to configure, but the request is satisfied
+    switch = _switch()
+    assert switch.add_vlans_to_port([10], 'Ethernet1')
+    assert switch._requests == []
+    assert not switch.add_vlans_to_port([10], 'Ethernet2')
+    assert not switch.add_vlans_to_port([10], 'Ethernet1', port_mode=LinkModes.access)
+
+
+def test_lookup_after_same_length_replacement():
+    switch = _switch()
+    switch.add_vrf(VrfRequest(name='red'))
+    assert switch.get_vrf_by_name('red').rd == 'red'
+    # the list keeps its identity and length
+    vrfs = switch.vrfs
+    switch.del_vrf('red')
+    switch.add_vrf(VrfRequest(name='blue'))
+    assert switch.vrfs is vrfs and len(switch.vrfs) == 1
+    assert switch.get_vrf_by_name('blue').rd == 'blue'
+    with pytest.raises(StopIteration):
+        switch.get_vrf_by_name('red')
+
+    # item replaced directly by a driver, which marks the device as changed
+    old_port = switch.get_port_by_index('1')
+    switch.phy_ports[0] = PhyPort(index='1', name='Ethernet9', trunk_vlans=[], mode=LinkModes.trunk)
+    switch.mark_changed()
+    assert switch.get_port_by_index('1') is not old_port
+    assert switch.get_port_by_name('Ethernet9') is switch.phy_ports[0]
+    assert switch.get_port_by_name('Ethernet1') is None
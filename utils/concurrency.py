@@ -0,0 +1,43 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+from .util import create_logger
+
+logger = create_logger('concurrency')
+
+
+def run_concurrently(tasks: Dict[str, Callable[[], Any]], max_workers: int = 8,
+                     name: str = 'fetch') -> Tuple[Dict[str, Any], Dict[str, float]]:
+    # executes independent tasks in a thread pool and waits for all of them. Returns the results and the duration
+    # (in seconds) of each task, keyed by task name. If any task fails, the exception of the first failed task
+    # (in the order of the tasks dict) is raised once all the tasks are terminated.
+    if not tasks:
+        return {}, {}
+    timings = {}
+
+    def _timed(task_name: str, func: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return func()
+        finally:
+            timings[task_name] = time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks)), thread_name_prefix=name) as executor:
+        # each task runs in a copy of the caller context, so that it belongs to the same operation trace
+        futures = {task_name: executor.submit(contextvars.copy_context().run, _timed, task_name, func)
+                   for task_name, func in tasks.items()}
+
+    results = {}
+    first_exception = None
+    for task_name, future in futures.items():
+        exception = future.exception()
+        if exception:
+            logger.error('task %s failed: %s', task_name, repr(exception))
+            first_exception = first_exception or exception
+        else:
+            results[task_name] = future.result()
+    if first_exception:
+        raise first_exception
+    return results, timings
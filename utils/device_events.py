@@ -0,0 +1,49 @@
+import threading
+import traceback
+from datetime import datetime
+from typing import Callable, List, Literal
+
+from pydantic import BaseModel, Field
+
+from .util import create_logger
+
+logger = create_logger('device-events')
+
+
+class DeviceStateEvent(BaseModel):
+    device: str
+    kind: Literal['switch', 'firewall']
+    old_state: str
+    new_state: str
+    time: datetime = Field(default_factory=datetime.now)
+
+
+class DeviceEventBus:
+    # internal bus of the device state transitions (init -> reinit -> ready/net_error/auth_error...), published by
+    # the devices through set_state. The network worker subscribes to it to know when the devices become available
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[[DeviceStateEvent], None]] = []
+
+    def publish(self, event: DeviceStateEvent) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception:
+                logger.error('error notifying the state of device %s to a subscriber', event.device)
+                logger.error(traceback.format_exc())
+
+    def subscribe(self, callback: Callable[[DeviceStateEvent], None]) -> None:
+        # callbacks are executed by the thread changing the device state, they should only hand over the event
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[DeviceStateEvent], None]) -> None:
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+
+device_events = DeviceEventBus()
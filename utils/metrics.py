@@ -0,0 +1,283 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from .tracing import span
+
+# in-process metrics exposed in the Prometheus text format. Updates only take a lock and touch a list or a float, so
+# that the instrumentation can stay always on; the exposition is rendered at scrape time
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    type_name = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError('metric {} expects the labels {}, got {}'.format(
+                self.name, self.labelnames, sorted(labels)))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return ['# HELP {} {}'.format(self.name, _escape(self.documentation)),
+                '# TYPE {} {}'.format(self.name, self.type_name)]
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return super().render() + ['{}{} {}'.format(self.name, _format_labels(self.labelnames, key),
+                                                    _format_value(value)) for key, value in values]
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        # values read at scrape time, e.g. the size of a queue
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, func: Callable[[], float], **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = func
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, func in functions:
+            try:
+                values[key] = func()
+            except Exception:
+                continue
+        return super().render() + ['{}{} {}'.format(self.name, _format_labels(self.labelnames, key),
+                                                    _format_value(value)) for key, value in values.items()]
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: count of each bucket (not cumulative, the last one is +Inf) and sum of the observations
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+        lines = super().render()
+        bucket_labelnames = self.labelnames + ('le',)
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, _format_labels(bucket_labelnames, key + (_format_value(bound),)), cumulative))
+            labels = _format_labels(self.labelnames, key)
+            lines.append('{}_sum{} {}'.format(self.name, labels, _format_value(total)))
+            lines.append('{}_count{} {}'.format(self.name, labels, cumulative))
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError('metric {} already registered'.format(metric.name))
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+sbi_call_seconds = REGISTRY.register(Histogram(
+    'netcl_sbi_call_seconds', 'Duration of the southbound driver calls, retries included',
+    ['driver', 'method', 'device']))
+sbi_call_errors = REGISTRY.register(Counter(
+    'netcl_sbi_call_errors_total', 'Southbound driver calls terminated with an exception',
+    ['driver', 'method', 'device']))
+sbi_circuit_state = REGISTRY.register(Gauge(
+    'netcl_sbi_circuit_state', 'State of the device circuit breakers: 0 closed, 1 half-open, 2 open', ['device']))
+refresh_seconds = REGISTRY.register(Histogram(
+    'netcl_refresh_seconds', 'Duration of the device information refresh', ['driver', 'device']))
+refresh_phase_seconds = REGISTRY.register(Histogram(
+    'netcl_refresh_phase_seconds', 'Duration of each phase of the device information refresh',
+    ['driver', 'device', 'phase']))
+worker_queue_depth = REGISTRY.register(Gauge(
+    'netcl_worker_queue_depth', 'Operations waiting in the network worker queue'))
+worker_parked_operations = REGISTRY.register(Gauge(
+    'netcl_worker_parked_operations', 'Operations waiting for the initialization of their devices'))
+worker_operation_seconds = REGISTRY.register(Histogram(
+    'netcl_worker_operation_seconds', 'Processing time of the network worker operations', ['operation']))
+worker_operations = REGISTRY.register(Counter(
+    'netcl_worker_operations_total', 'Operations processed by the network worker', ['operation', 'result']))
+mongodb_call_seconds = REGISTRY.register(Histogram(
+    'netcl_mongodb_call_seconds', 'Duration of the MongoDB calls', ['collection', 'method'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)))
+graph_build_seconds = REGISTRY.register(Histogram(
+    'netcl_graph_build_seconds', 'Duration of the network graph and vlan data rebuilds', ['kind']))
+
+
+def _device_name(sbi: Any) -> str:
+    device = getattr(sbi, 'device', None)
+    return getattr(device, 'name', None) or getattr(device, 'address', None) or 'unknown'
+
+
+def timed_sbi_call(func: Callable) -> Callable:
+    # latency of a southbound driver method, labelled with the driver class, the method and the device, also recorded
+    # as a span of the active operation trace. Generators (streamed outputs) are timed until they are exhausted or
+    # closed
+    method = func.__name__
+
+    def observe(self, start: float, failed: bool) -> None:
+        labels = {'driver': type(self).__name__, 'method': method, 'device': _device_name(self)}
+        sbi_call_seconds.observe(time.perf_counter() - start, **labels)
+        if failed:
+            sbi_call_errors.inc(**labels)
+
+    if inspect.isgeneratorfunction(func):
+        @functools.wraps(func)
+        def generator_wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            failed = False
+            try:
+                with span('{}.{}'.format(type(self).__name__, method), device=_device_name(self), activate=False):
+                    yield from func(self, *args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                observe(self, start, failed)
+        return generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        failed = False
+        try:
+            with span('{}.{}'.format(type(self).__name__, method), device=_device_name(self)):
+                return func(self, *args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            observe(self, start, failed)
+    return wrapper
+
+
+def timed_refresh_phase(phase: str) -> Callable[[Callable], Callable]:
+    # duration of a refresh phase (config, ports, vlans, vrfs, lldp, bgp) of a device driver, also traced
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with refresh_phase_seconds.time(driver=type(self).__name__, device=self.name, phase=phase), \
+                    span('refresh.{}'.format(phase), device=self.name):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_db_call(func: Callable) -> Callable:
+    # latency of a persistency call, labelled with its collection (first argument)
+    method = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(collection, *args, **kwargs):
+        with mongodb_call_seconds.time(collection=collection, method=method):
+            return func(collection, *args, **kwargs)
+    return wrapper
+
+
+def observe_refresh_timings(driver: str, device: str, timings: Dict[str, float]) -> None:
+    # drivers fetching concurrently already collect the duration of each task and phase
+    for phase, duration in timings.items():
+        if phase != 'total':
+            refresh_phase_seconds.observe(duration, driver=driver, device=device, phase=phase)
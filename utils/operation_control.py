@@ -0,0 +1,102 @@
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Iterator, Optional, TypeVar, Union
+
+# deadline and cancellation of the running worker operation. As for the traces, the control of the operation is kept
+# in a context variable, so that the checkpoints of the devices and the timeouts of the southbound drivers find it
+# without being passed as argument; outside of an operation (e.g. device initialization) they have no effect
+
+# lower bound of the driver timeouts derived from the remaining time
+MIN_TIMEOUT = 1.0
+
+T = TypeVar('T')
+
+
+class OperationAbortedException(Exception):
+    # final status of the aborted operation
+    status = 'Failed'
+
+
+class OperationCancelledException(OperationAbortedException):
+    status = 'Cancelled'
+
+
+class OperationExpiredException(OperationAbortedException):
+    status = 'Expired'
+
+
+class OperationControl:
+    def __init__(self, operation_id: str, deadline: Union[datetime, None] = None):
+        self.operation_id = operation_id
+        self.deadline = deadline
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        # may be called by any thread, the operation stops at its next checkpoint
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Union[float, None]:
+        if self.deadline is None:
+            return None
+        return (self.deadline - datetime.now()).total_seconds()
+
+    def check(self) -> None:
+        if self._cancelled.is_set():
+            raise OperationCancelledException('operation {} cancelled'.format(self.operation_id))
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise OperationExpiredException('operation {} expired at {}'.format(
+                self.operation_id, self.deadline.isoformat(timespec='seconds')))
+
+
+_active_control: ContextVar[Optional[OperationControl]] = ContextVar('netcl_operation_control', default=None)
+
+
+@contextmanager
+def operation_control(control: OperationControl) -> Iterator[OperationControl]:
+    token = _active_control.set(control)
+    try:
+        yield control
+    finally:
+        _active_control.reset(token)
+
+
+def checkpoint() -> None:
+    # raises if the active operation has been cancelled or its deadline has passed
+    control = _active_control.get()
+    if control is not None:
+        control.check()
+
+
+def checkpointed(func: Callable) -> Callable:
+    # decorator of the device configuration steps: an aborted operation does not start new steps, the running ones
+    # are completed
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        checkpoint()
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def remaining_time() -> Union[float, None]:
+    control = _active_control.get()
+    return control.remaining() if control is not None else None
+
+
+def bounded_timeout(timeout: T) -> T:
+    # driver timeout (seconds, a (connect, read) tuple or None) reduced to the time left to the active operation
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    remaining = max(remaining, MIN_TIMEOUT)
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(min(item, remaining) for item in timeout)
+    return min(timeout, remaining)
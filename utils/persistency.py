@@ -1,45 +1,64 @@
-from pymongo import MongoClient
-from utils.util import *
+import threading
+from typing import Any, Union
+from utils.util import get_config
+from utils.metrics import timed_db_call
 
-url_str = ""
-if netcl_conf.mongodb.user:
-    url_str = "mongodb://{}:{}@{}:{}/".format(
-        netcl_conf.mongodb.user, netcl_conf.mongodb.password, netcl_conf.mongodb.host, netcl_conf.mongodb.port)
-else:
-    url_str = "mongodb://{}:{}/".format(netcl_conf.mongodb.host, netcl_conf.mongodb.port)
+_client: Union[Any, None] = None
+_client_lock = threading.Lock()
 
-persLayer = MongoClient(url_str)
-OSSdb = persLayer[netcl_conf.mongodb.db]
+
+def get_database():
+    # the MongoDB client (and pymongo itself) is created on the first call instead of at import
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from pymongo import MongoClient
+                conf = get_config().mongodb
+                if conf.user:
+                    url_str = "mongodb://{}:{}@{}:{}/".format(conf.user, conf.password, conf.host, conf.port)
+                else:
+                    url_str = "mongodb://{}:{}/".format(conf.host, conf.port)
+                _client = MongoClient(url_str)
+    return _client[get_config().mongodb.db]
 
 
 class DB:
     @staticmethod
+    @timed_db_call
     def insert_DB(collection, data):
-        db = OSSdb[collection]
+        db = get_database()[collection]
         return db.insert_one(data)
 
     @staticmethod
+    @timed_db_call
     def exists_DB(collection, data):
-        db = OSSdb[collection]
+        db = get_database()[collection]
         #return db.find(data).count() >= 1
         return db.count_documents(data) > 0
 
     @staticmethod
+    @timed_db_call
     def find_DB(collection, data):
-        db = OSSdb[collection]
-        return db.find(data)
+        # the cursor is consumed here, so that the timing covers the fetch of the documents and not only the
+        # creation of the lazy cursor
+        db = get_database()[collection]
+        return list(db.find(data))
 
     @staticmethod
+    @timed_db_call
     def findone_DB(collection, data):
-        db = OSSdb[collection]
+        db = get_database()[collection]
         return db.find_one(data)
 
     @staticmethod
+    @timed_db_call
     def update_DB(table, data, filter):
-        db = OSSdb[table]
+        db = get_database()[table]
         db.update_one(filter, {"$set": data}, upsert=True)
 
     @staticmethod
+    @timed_db_call
     def delete_DB(table, filter):
-        db = OSSdb[table]
+        db = get_database()[table]
         return db.delete_many(filter)
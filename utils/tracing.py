@@ -0,0 +1,158 @@
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, Union
+from uuid import uuid4
+
+from pydantic import BaseModel, PrivateAttr
+
+from .util import create_logger, get_config
+
+logger = create_logger('tracing')
+
+# lightweight span tracing of the worker operations. The active trace and span are kept in context variables, so that
+# they follow the call chain worker -> network -> switch -> southbound driver (and the tasks of run_concurrently)
+# without being passed as arguments; outside of a trace each span costs a single context variable lookup
+
+
+class TraceSpan(BaseModel):
+    span_id: str
+    parent_id: Union[str, None] = None
+    name: str
+    device: Union[str, None] = None
+    start_time: datetime
+    # seconds, set when the span ends
+    duration: Union[float, None] = None
+    status: Literal['ok', 'error'] = 'ok'
+    error: Union[str, None] = None
+    attributes: Dict[str, str] = {}
+
+
+class OperationTrace(BaseModel):
+    trace_id: str
+    spans: List[TraceSpan] = []
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def add(self, span_item: TraceSpan) -> None:
+        with self._lock:
+            self.spans.append(span_item)
+
+    def to_otlp(self, service_name: str = 'netcl') -> Dict[str, Any]:
+        # OTLP/JSON (ExportTraceServiceRequest) representation of the trace
+        def nanos(value: datetime) -> str:
+            return str(int(value.timestamp() * 1e9))
+
+        def otlp_span(item: TraceSpan) -> Dict[str, Any]:
+            attributes = dict(item.attributes)
+            if item.device:
+                attributes['device'] = item.device
+            res = {
+                'traceId': self.trace_id,
+                'spanId': item.span_id,
+                'name': item.name,
+                'kind': 1,
+                'startTimeUnixNano': nanos(item.start_time),
+                'endTimeUnixNano': str(int(item.start_time.timestamp() * 1e9 + (item.duration or 0) * 1e9)),
+                'attributes': [{'key': k, 'value': {'stringValue': v}} for k, v in attributes.items()],
+                'status': {'code': 2, 'message': item.error or ''} if item.status == 'error' else {'code': 1}
+            }
+            if item.parent_id:
+                res['parentSpanId'] = item.parent_id
+            return res
+
+        with self._lock:
+            spans = list(self.spans)
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service_name}}]},
+            'scopeSpans': [{'scope': {'name': 'netcl.tracing'}, 'spans': [otlp_span(item) for item in spans]}]
+        }]}
+
+
+_active_trace: ContextVar[Optional[OperationTrace]] = ContextVar('netcl_active_trace', default=None)
+_active_span: ContextVar[Optional[str]] = ContextVar('netcl_active_span', default=None)
+_export_lock = threading.Lock()
+
+
+def get_active_trace() -> Union[OperationTrace, None]:
+    return _active_trace.get()
+
+
+@contextmanager
+def span(name: str, device: str = None, activate: bool = True, **attributes) -> Iterator[Optional[TraceSpan]]:
+    # records a span in the active trace, if any. With activate=False the span does not become the parent of the
+    # spans opened meanwhile: needed for generators, which are suspended while the caller runs
+    trace = _active_trace.get()
+    if trace is None:
+        yield None
+        return
+    item = TraceSpan(span_id=uuid4().hex[:16], parent_id=_active_span.get(), name=name, device=device,
+                     start_time=datetime.now(), attributes={k: str(v) for k, v in attributes.items()})
+    trace.add(item)
+    token = _active_span.set(item.span_id) if activate else None
+    start = time.perf_counter()
+    try:
+        yield item
+    except BaseException as e:
+        item.status = 'error'
+        item.error = repr(e)
+        raise
+    finally:
+        item.duration = time.perf_counter() - start
+        if token is not None:
+            _active_span.reset(token)
+
+
+@contextmanager
+def start_trace(name: str, **attributes) -> Iterator[OperationTrace]:
+    # opens a new trace with its root span; the trace is exported when the root span ends
+    trace = OperationTrace(trace_id=uuid4().hex)
+    trace_token = _active_trace.set(trace)
+    span_token = _active_span.set(None)
+    try:
+        with span(name, **attributes):
+            yield trace
+    finally:
+        _active_span.reset(span_token)
+        _active_trace.reset(trace_token)
+        export_trace(trace)
+
+
+def _device_of(obj: Any) -> Union[str, None]:
+    # switches and firewalls have a name, southbound drivers hold the device
+    name = getattr(obj, 'name', None)
+    if isinstance(name, str):
+        return name
+    device = getattr(obj, 'device', None)
+    return getattr(device, 'name', None)
+
+
+def traced(name: str = None) -> Callable[[Callable], Callable]:
+    # decorator of methods: the span is named after the method and carries the device of the instance, if any
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if _active_trace.get() is None:
+                return func(self, *args, **kwargs)
+            with span(span_name, device=_device_of(self)):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def export_trace(trace: OperationTrace) -> None:
+    # one OTLP/JSON document per line, appended to the file set in the "tracing" section of the configuration
+    otlp_file = get_config().tracing.otlp_file
+    if not otlp_file:
+        return
+    try:
+        line = json.dumps(trace.to_otlp())
+        with _export_lock, open(otlp_file, 'a') as stream:
+            stream.write(line + '\n')
+    except Exception as e:
+        logger.error('error exporting trace %s: %s', trace.trace_id, repr(e))
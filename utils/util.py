@@ -1,9 +1,13 @@
+import atexit
 import logging
+import queue
 import string
+import threading
 import random
 import json
+from logging.handlers import QueueHandler, QueueListener
 from pydantic import BaseModel
-from typing import Union
+from typing import Any, Dict, Union
 import traceback
 
 
@@ -15,32 +19,121 @@ class MongoDbConfig(BaseModel):
     password: Union[str, None] = None
 
 
+class TracingConfig(BaseModel):
+    # file where the operation traces are appended in OTLP/JSON format, one per line
+    otlp_file: Union[str, None] = None
+
+
+class LoggingConfig(BaseModel):
+    level: str = 'INFO'
+    # per logger levels, e.g. {"switch": "DEBUG"}
+    levels: Dict[str, str] = {}
+    # records are written by a background thread instead of the logging one (the message is rendered by the logging
+    # thread, so that the arguments modified after the call are logged as they were)
+    use_queue: bool = True
+
+
+class SbiConfig(BaseModel):
+    # attempts of a southbound call on connection errors, spaced by an exponential backoff with jitter (seconds)
+    attempts: int = 3
+    backoff_initial: float = 1.0
+    backoff_max: float = 20.0
+    # timeout of the TCP reachability check and of the connection establishment
+    connect_timeout: float = 5.0
+    # consecutive connection failures opening the circuit of a device, and seconds before a new attempt is allowed;
+    # the open time doubles at each failed attempt, up to open_timeout_max
+    failure_threshold: int = 3
+    open_timeout: float = 30.0
+    open_timeout_max: float = 600.0
+
+
+class OperationsConfig(BaseModel):
+    # seconds granted to the worker operations from their submission, per operation type, unless set in the request
+    default_timeout: float = 600.0
+    timeouts: Dict[str, float] = {'add_switch': 900.0, 'add_net_vlan': 900.0, 'mod_net_vlan': 900.0}
+
+    def get_timeout(self, operation: str) -> float:
+        return self.timeouts.get(operation, self.default_timeout)
+
+
 class ConfigFile(BaseModel):
     mongodb: MongoDbConfig
+    tracing: TracingConfig = TracingConfig()
+    logging: LoggingConfig = LoggingConfig()
+    sbi: SbiConfig = SbiConfig()
+    operations: OperationsConfig = OperationsConfig()
+
+
+_log_config = LoggingConfig()
+# loggers created by create_logger, reconfigured when the configuration is loaded
+_loggers: Dict[str, logging.Logger] = {}
+_handler: Union[logging.Handler, None] = None
+_listener: Union[QueueListener, None] = None
+
+
+def _build_handler(config: LoggingConfig) -> logging.Handler:
+    global _listener
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    if not config.use_queue:
+        return stream_handler
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    return QueueHandler(log_queue)
 
 
-def create_logger(name: str) -> logging.getLogger:
-    # create logger
+@atexit.register
+def _stop_listener() -> None:
+    # the records still in the queue are written before exiting
+    if _listener:
+        _listener.stop()
+
+
+def _apply_config(_logger: logging.Logger) -> None:
+    _logger.setLevel(_log_config.levels.get(_logger.name, _log_config.level).upper())
+    _logger.propagate = False
+    if _handler not in _logger.handlers:
+        _logger.addHandler(_handler)
+
+
+def create_logger(name: str) -> logging.Logger:
+    # all the loggers share a single handler and take their level from the logging section of config.json
+    global _handler
+    if _handler is None:
+        _handler = _build_handler(_log_config)
     _logger = logging.getLogger(name)
-    _logger.setLevel(logging.DEBUG)
-    # create console handler and set level to debug
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.DEBUG)
-    # create formatter
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    # add formatter to ch
-    ch.setFormatter(formatter)
-    # add ch to logger
-    _logger.addHandler(ch)
+    _loggers[name] = _logger
+    _apply_config(_logger)
     return _logger
 
 
+def configure_logging(config: LoggingConfig) -> None:
+    global _log_config, _handler, _listener
+    if config.use_queue != _log_config.use_queue and _handler is not None:
+        for _logger in _loggers.values():
+            _logger.removeHandler(_handler)
+        if _listener:
+            _listener.stop()
+            _listener = None
+        _handler = _build_handler(config)
+    _log_config = config
+    for _logger in _loggers.values():
+        _apply_config(_logger)
+
+
 logger = create_logger('utils')
 
-with open("config.json", 'r') as stream:
+CONFIG_FILE = 'config.json'
+_config: Union[ConfigFile, None] = None
+_config_lock = threading.Lock()
+
+
+def load_config(path: str = CONFIG_FILE) -> ConfigFile:
     try:
-        json_conf = json.load(stream)
-    except json.JSONDecodeError as exc:
+        with open(path, 'r') as stream:
+            json_conf = json.load(stream)
+    except json.JSONDecodeError:
         logger.error("invalid JSON format in the config file")
         raise ValueError('configuration file problem')
     except FileNotFoundError:
@@ -49,13 +142,31 @@ with open("config.json", 'r') as stream:
 
     # Parsing the config file
     try:
-        netcl_conf = ConfigFile.model_validate(json_conf)
-
-    except Exception as exception:
+        return ConfigFile.model_validate(json_conf)
+    except Exception:
         logger.error('exception in the configuration file parsing')
         logger.error(traceback.format_exc())
         raise ValueError('configuration file problem')
 
 
+def get_config() -> ConfigFile:
+    # the configuration file is read on first use instead of at import, and then applied to the logging
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                config = load_config()
+                configure_logging(config.logging)
+                _config = config
+    return _config
+
+
+def __getattr__(name: str) -> Any:
+    # netcl_conf is kept as a lazily loaded module attribute
+    if name == 'netcl_conf':
+        return get_config()
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
+
+
 def id_generator(size=6, chars=string.ascii_uppercase + string.digits):
     return ''.join(random.choice(chars) for _ in range(size))